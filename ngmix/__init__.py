@@ -1,7 +1,17 @@
 """
 todo:
     - add ability to have priors
+
+The core modules are imported with the package.  The other submodules, and
+the names taken from them such as Bootstrapper, are imported on first
+access, so that processes that only need part of ngmix start quickly.
+Optional dependencies such as galsim, scipy and emcee are only imported
+when the code that needs them is run.
 """
+import sys
+import types
+import importlib
+
 from . import gmix
 from .gmix import GMix
 from .gmix import GMixModel
@@ -11,11 +21,6 @@ from . import jacobian
 from .jacobian import Jacobian, UnitJacobian, DiagonalJacobian
 from . import fastmath
 
-from . import priors
-from .priors import srandu
-
-from . import joint_prior
-
 from . import shape
 from .shape import Shape
 from . import moments
@@ -23,31 +28,91 @@ from . import moments
 from . import gexceptions
 from .gexceptions import GMixRangeError, GMixFatalError, GMixMaxIterEM
 
-from . import fitting
-from .fitting import print_pars
-from . import simplex
-
-from . import bootstrap
-from . import btest
-from .bootstrap import Bootstrapper, CompositeBootstrapper
-
-from . import em
-
 from . import observation
 from .observation import Observation, ObsList, MultiBandObsList
 
-from . import lensfit
-from . import pqr
-
-from . import stats
-
-from . import guessers
-
-from . import roundify
-
-from . import metacal
-
-from . import simobs
-
-from . import test
-
+# submodules imported on first access
+_LAZY_MODULES = [
+    'priors',
+    'joint_prior',
+    'fitting',
+    'simplex',
+    'bootstrap',
+    'btest',
+    'batch',
+    'records',
+    'counters',
+    'psfcache',
+    'lut',
+    'artifact',
+    'threads',
+    'em',
+    'lensfit',
+    'pqr',
+    'stats',
+    'guessers',
+    'roundify',
+    'metacal',
+    'simobs',
+    'test',
+]
+
+# names imported from submodules on first access
+_LAZY_NAMES = {
+    'srandu':'priors',
+    'print_pars':'fitting',
+    'Bootstrapper':'bootstrap',
+    'CompositeBootstrapper':'bootstrap',
+}
+
+def _import_lazy(name):
+    """
+    import a lazy submodule or name, setting it as an attribute of the
+    package so later access does not come back here
+    """
+    if name in _LAZY_MODULES:
+        return importlib.import_module('.'+name, __name__)
+
+    if name in _LAZY_NAMES:
+        mod=importlib.import_module('.'+_LAZY_NAMES[name], __name__)
+        val=getattr(mod, name)
+        setattr(sys.modules[__name__], name, val)
+        return val
+
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+class _LazyModule(types.ModuleType):
+    """
+    The package module, importing the lazy submodules and names on first
+    access.  __getattr__ is only called for attributes that are not found
+    normally
+    """
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _import_lazy(name)
+
+    def __dir__(self):
+        return sorted( set(self.__dict__) | set(_LAZY_MODULES) | set(_LAZY_NAMES) )
+
+def _set_lazy_module():
+    """
+    make the package a _LazyModule.  Module level __getattr__ needs
+    python 3.7, and setting the class of a module needs python 3.5, so on
+    python 2 the module is replaced in sys.modules by a _LazyModule with the
+    same contents
+    """
+    module=sys.modules[__name__]
+    try:
+        module.__class__ = _LazyModule
+    except TypeError:
+        lazy=_LazyModule(__name__, __doc__)
+        lazy.__dict__.update(module.__dict__)
+
+        # on python 2 the globals of a module are set to None when it is
+        # deleted, and the functions here still use those globals
+        lazy._original_module = module
+
+        sys.modules[__name__] = lazy
+
+_set_lazy_module()
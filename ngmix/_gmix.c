@@ -2652,6 +2652,49 @@ static PyObject * PyGMix_fill_fdiff_sub(PyObject* self, PyObject* args) {
  */
 
 
+/*
+   The em functions do not set exceptions or otherwise use the python api,
+   so they can be run without the GIL.  Failures are reported with these
+   error codes, which are converted to exceptions by the callers
+*/
+#define PYGMIX_EM_ERR_GTOT 1
+#define PYGMIX_EM_ERR_DET 2
+
+/*
+   the pixels of an image to be fit with em
+*/
+struct PyGMix_EM_Image {
+    const char *data;
+    npy_intp n_row;
+    npy_intp n_col;
+    npy_intp row_stride;
+    npy_intp col_stride;
+};
+
+#define PYGMIX_EM_IMAGE_GET(image, row, col) \
+    ( *(const double *) ((image)->data \
+                         + (row)*(image)->row_stride \
+                         + (col)*(image)->col_stride) )
+
+static void em_image_set(struct PyGMix_EM_Image *image,
+                         PyObject* image_obj)
+{
+    image->data = (const char *) PyArray_DATA(image_obj);
+    image->n_row = PyArray_DIM(image_obj, 0);
+    image->n_col = PyArray_DIM(image_obj, 1);
+    image->row_stride = PyArray_STRIDE(image_obj, 0);
+    image->col_stride = PyArray_STRIDE(image_obj, 1);
+}
+
+static void em_set_exception(int err)
+{
+    if (err == PYGMIX_EM_ERR_GTOT) {
+        PyErr_Format(GMixRangeError, "em gtot = 0");
+    } else {
+        PyErr_Format(GMixRangeError, "em gauss2d det too low");
+    }
+}
+
 static void em_clear_sums(struct PyGMix_EM_Sums *sums, npy_intp n_gauss)
 {
     memset(sums, 0, n_gauss*sizeof(struct PyGMix_EM_Sums));
@@ -2689,13 +2732,14 @@ static void em_sums_print(const struct PyGMix_EM_Sums *sums, npy_intp n_gauss)
    note for em we immediately set the normalization, unlike shear measurements
    where we allow T <= 0.0
 
+   returns 0 if a determinant is too low, without setting an exception
+
 */
 static 
 int em_set_gmix_from_sums(struct PyGMix_Gauss2D *gmix,
                            npy_intp n_gauss,
                            const struct PyGMix_EM_Sums *sums)
 {
-    int status=0;
     npy_intp i=0;
     for (i=0; i<n_gauss; i++) {
         const struct PyGMix_EM_Sums *sum=&sums[i];
@@ -2704,147 +2748,188 @@ int em_set_gmix_from_sums(struct PyGMix_Gauss2D *gmix,
         double p=sum->pnew;
         double pinv=1.0/p;
 
-        status=gauss2d_set(gauss,
-                           p,
-                           sum->rowsum*pinv,
-                           sum->colsum*pinv,
-                           sum->u2sum*pinv,
-                           sum->uvsum*pinv,
-                           sum->v2sum*pinv);
+        gauss2d_set(gauss,
+                    p,
+                    sum->rowsum*pinv,
+                    sum->colsum*pinv,
+                    sum->u2sum*pinv,
+                    sum->uvsum*pinv,
+                    sum->v2sum*pinv);
 
-        status=gauss2d_set_norm(gauss);
-
-        // an exception will be set
-        if (!status) {
-            goto _em_set_gmix_from_sums_bail;
+        // same limit as gauss2d_set_norm, which cannot fail after this
+        if (!(gauss->det >= 1.0e-200)) {
+            return 0;
         }
+        gauss2d_set_norm(gauss);
     }
-    status=1;
-
-_em_set_gmix_from_sums_bail:
-    return status;
+    return 1;
 }
 
 
 /*
-   input gmix is guess and will eventually hold the final
-   stage of the iteration
+   one step of the em algorithm, the expectation and maximization
+
+   The gmix is updated in place, as is the normalized sky, nsky.  If loglike
+   is not NULL, it is set to the log likelihood of the input gmix and sky,
+   sum(imnorm*log(gtot))
+
+   returns 0 on failure, with the reason in err
 */
-static int em_run(PyObject* image_obj,
-                  double sky,
-                  double counts,
-                  const struct PyGMix_Jacobian* jacob,
-                  struct PyGMix_Gauss2D *gmix, // holds the guess
-                  npy_intp n_gauss,
-                  struct PyGMix_EM_Sums *sums,
-                  double tol,
-                  long maxiter,
-                  long *numiter,
-                  double *frac_diff)
+static int em_step(const struct PyGMix_EM_Image *image,
+                   double counts,
+                   double area,
+                   const struct PyGMix_Jacobian* jacob,
+                   struct PyGMix_Gauss2D *gmix,
+                   npy_intp n_gauss,
+                   struct PyGMix_EM_Sums *sums,
+                   double *nsky,
+                   double *loglike,
+                   int *err)
 {
     int status=0;
-    double skysum=0;
+    double skysum=0, psky=0, igrat=0, lnlike=0;
     npy_intp row=0, col=0, i=0;
 
-    npy_intp n_row=PyArray_DIM(image_obj, 0);
-    npy_intp n_col=PyArray_DIM(image_obj, 1);
-    npy_intp n_points=PyArray_SIZE(image_obj);
+    npy_intp n_row=image->n_row;
+    npy_intp n_col=image->n_col;
 
-    double scale=jacob->sdet;
-    double area = n_points*scale*scale;
+    skysum=0.0;
+    em_clear_sums(sums, n_gauss);
 
-    double nsky = sky/counts;
-    double psky = sky/(counts/area);
+    for (row=0; row<n_row; row++) {
 
-    double T=0, T_last=-9999.0, igrat=0;
+        double u=PYGMIX_JACOB_GETU(jacob, row, 0);
+        double v=PYGMIX_JACOB_GETV(jacob, row, 0);
 
-    (*numiter)=0;
-    while ( (*numiter) < maxiter) {
-        skysum=0.0;
-        em_clear_sums(sums, n_gauss);
+        for (col=0; col<n_col; col++) {
 
-        for (row=0; row<n_row; row++) {
+            double gtot=0.0;
+            double imnorm=PYGMIX_EM_IMAGE_GET(image,row,col);
 
-            double u=PYGMIX_JACOB_GETU(jacob, row, 0);
-            double v=PYGMIX_JACOB_GETV(jacob, row, 0);
+            imnorm /= counts;
 
-            for (col=0; col<n_col; col++) {
+            for (i=0; i<n_gauss; i++) {
+                struct PyGMix_EM_Sums *sum=&sums[i];
+                const struct PyGMix_Gauss2D *gauss=&gmix[i];
 
-                double gtot=0.0;
-                double imnorm=*(double*)PyArray_GETPTR2(image_obj,row,col);
+                double udiff = u-gauss->row;
+                double vdiff = v-gauss->col;
 
-                imnorm /= counts;
+                double u2 = udiff*udiff;
+                double v2 = vdiff*vdiff;
+                double uv = udiff*vdiff;
 
-                for (i=0; i<n_gauss; i++) {
-                    struct PyGMix_EM_Sums *sum=&sums[i];
-                    const struct PyGMix_Gauss2D *gauss=&gmix[i];
+                double chi2=
+                    gauss->dcc*u2 + gauss->drr*v2 - 2.0*gauss->drc*uv;
 
-                    double udiff = u-gauss->row;
-                    double vdiff = v-gauss->col;
+                if (chi2 < PYGMIX_MAX_CHI2 && chi2 >= 0.0) {
+                    sum->gi = gauss->pnorm*expd( -0.5*chi2 );
+                } else {
+                    sum->gi = 0.0;
+                }
+                gtot += sum->gi;
+                sum->trowsum = u*sum->gi;
+                sum->tcolsum = v*sum->gi;
+                sum->tu2sum  = u2*sum->gi;
+                sum->tuvsum  = uv*sum->gi;
+                sum->tv2sum  = v2*sum->gi;
 
-                    double u2 = udiff*udiff;
-                    double v2 = vdiff*vdiff;
-                    double uv = udiff*vdiff;
+            } // gaussians
 
-                    double chi2=
-                        gauss->dcc*u2 + gauss->drr*v2 - 2.0*gauss->drc*uv;
+            gtot += (*nsky);
 
-                    if (chi2 < PYGMIX_MAX_CHI2 && chi2 >= 0.0) {
-                        sum->gi = gauss->pnorm*expd( -0.5*chi2 );
-                    } else {
-                        sum->gi = 0.0;
-                    }
-                    gtot += sum->gi;
-                    sum->trowsum = u*sum->gi;
-                    sum->tcolsum = v*sum->gi;
-                    sum->tu2sum  = u2*sum->gi;
-                    sum->tuvsum  = uv*sum->gi;
-                    sum->tv2sum  = v2*sum->gi;
+            if (gtot == 0) {
+                (*err) = PYGMIX_EM_ERR_GTOT;
+                goto _em_step_bail;
+            }
 
-                } // gaussians
+            if (loglike) {
+                lnlike += imnorm*log(gtot);
+            }
 
-                gtot += nsky;
+            igrat = imnorm/gtot;
+            for (i=0; i<n_gauss; i++) {
+                struct PyGMix_EM_Sums *sum=&sums[i];
 
-                if (gtot == 0) {
-                    PyErr_Format(GMixRangeError, "em gtot = 0");
-                    goto _em_run_bail;
-                }
+                // wtau is gi[pix]/gtot[pix]*imnorm[pix]
+                // which is Dave's tau*imnorm = wtau
+                double wtau = sum->gi*igrat;
 
-                igrat = imnorm/gtot;
-                for (i=0; i<n_gauss; i++) {
-                    struct PyGMix_EM_Sums *sum=&sums[i];
+                sum->pnew += wtau;
 
-                    // wtau is gi[pix]/gtot[pix]*imnorm[pix]
-                    // which is Dave's tau*imnorm = wtau
-                    double wtau = sum->gi*igrat;
+                // row*gi/gtot*imnorm;
+                sum->rowsum += sum->trowsum*igrat;
+                sum->colsum += sum->tcolsum*igrat;
+                sum->u2sum  += sum->tu2sum*igrat;
+                sum->uvsum  += sum->tuvsum*igrat;
+                sum->v2sum  += sum->tv2sum*igrat;
+
+            }
 
-                    sum->pnew += wtau;
+            skysum += (*nsky)*imnorm/gtot;
+            u += jacob->dudcol;
+            v += jacob->dvdcol;
+        } //cols
+    } // rows
 
-                    // row*gi/gtot*imnorm;
-                    sum->rowsum += sum->trowsum*igrat;
-                    sum->colsum += sum->tcolsum*igrat;
-                    sum->u2sum  += sum->tu2sum*igrat;
-                    sum->uvsum  += sum->tuvsum*igrat;
-                    sum->v2sum  += sum->tv2sum*igrat;
 
-                }
+    status=em_set_gmix_from_sums(gmix, n_gauss, sums);
+    if (!status) {
+        (*err) = PYGMIX_EM_ERR_DET;
+        goto _em_step_bail;
+    }
+
+    psky = skysum;
+    (*nsky) = psky/area;
+
+    if (loglike) {
+        (*loglike) = lnlike;
+    }
+
+    status=1;
+_em_step_bail:
+    return status;
+}
+
+/*
+   input gmix is guess and will eventually hold the final
+   stage of the iteration
+
+   returns 0 on failure, with the reason in err
+*/
+static int em_run(const struct PyGMix_EM_Image *image,
+                  double sky,
+                  double counts,
+                  const struct PyGMix_Jacobian* jacob,
+                  struct PyGMix_Gauss2D *gmix, // holds the guess
+                  npy_intp n_gauss,
+                  struct PyGMix_EM_Sums *sums,
+                  double tol,
+                  long maxiter,
+                  long *numiter,
+                  double *frac_diff,
+                  int *err)
+{
+    int status=0;
+
+    npy_intp n_points=image->n_row*image->n_col;
+
+    double scale=jacob->sdet;
+    double area = n_points*scale*scale;
+
+    double nsky = sky/counts;
 
-                skysum += nsky*imnorm/gtot;
-                u += jacob->dudcol;
-                v += jacob->dvdcol;
-            } //cols
-        } // rows
+    double T=0, T_last=-9999.0;
 
+    (*numiter)=0;
+    while ( (*numiter) < maxiter) {
 
-        status=em_set_gmix_from_sums(gmix, n_gauss, sums);
+        status=em_step(image, counts, area, jacob,
+                       gmix, n_gauss, sums, &nsky, NULL, err);
         if (!status) {
             goto _em_run_bail;
-            break;
         }
 
-        psky = skysum;
-        nsky = psky/area;
-
         T = gmix_get_T(gmix, n_gauss);
         (*frac_diff) = fabs((T-T_last)/T);
 
@@ -2863,449 +2948,1398 @@ _em_run_bail:
     return status;
 }
 
-static PyObject * PyGMix_em_run(PyObject* self, PyObject* args) {
+/*
+   check an extrapolated mixture can be used as a starting point,
+   without setting an exception
+*/
+static int em_accel_check(const struct PyGMix_Gauss2D *gmix,
+                          npy_intp n_gauss,
+                          double nsky)
+{
+    npy_intp i=0;
 
-    PyObject* gmix_obj=NULL;
-    PyObject* image_obj=NULL;
-    //PyObject* weight_obj=NULL;
-    PyObject* jacob_obj=NULL;
-    PyObject* sums_obj=NULL;
-    double sky=0, counts=0, tol=0;
-    long maxiter=0;
-    npy_intp n_gauss=0;
+    if (!isfinite(nsky) || nsky < 0.0) {
+        return 0;
+    }
+    for (i=0; i<n_gauss; i++) {
+        const struct PyGMix_Gauss2D *gauss=&gmix[i];
+        double det = gauss->irr*gauss->icc - gauss->irc*gauss->irc;
 
-    struct PyGMix_Gauss2D *gmix=NULL;//, *gauss=NULL;
-    struct PyGMix_Jacobian *jacob=NULL;
-    struct PyGMix_EM_Sums* sums=NULL;
-    long numiter=0;
-    double frac_diff=0;
-    int status=0;
+        if (!isfinite(gauss->p) || !isfinite(gauss->row)
+                || !isfinite(gauss->col) || !isfinite(det)) {
+            return 0;
+        }
+        if (gauss->p <= 0.0 || gauss->irr <= 0.0 || gauss->icc <= 0.0
+                || det < 1.0e-200) {
+            return 0;
+        }
+    }
+    return 1;
+}
 
+/*
+   set gmix_ex = x0 - 2*alpha*r + alpha^2*v, where r = x1-x0 and
+   v = x2-2*x1+x0, for the parameters p,row,col,irr,irc,icc and the sky
 
-    // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OOOOdddl", 
-                          &gmix_obj,
-                          &image_obj,
-                          //&weight_obj,
-                          &jacob_obj,
-                          &sums_obj,
-                          &sky, &counts, &tol, &maxiter)) {
-        return NULL;
-    }
+   returns 0 if the result is not a valid mixture
+*/
+static int em_accel_extrapolate(const struct PyGMix_Gauss2D *gmix0,
+                                const struct PyGMix_Gauss2D *gmix1,
+                                const struct PyGMix_Gauss2D *gmix2,
+                                struct PyGMix_Gauss2D *gmix_ex,
+                                npy_intp n_gauss,
+                                double nsky0,
+                                double nsky1,
+                                double nsky2,
+                                double alpha,
+                                double *nsky_ex)
+{
+    npy_intp i=0;
+    double a2=alpha*alpha;
 
-    gmix=(struct PyGMix_Gauss2D* ) PyArray_DATA(gmix_obj);
-    n_gauss=PyArray_SIZE(gmix_obj);
+#define PYGMIX_EM_EXTRAP(x0, x1, x2) \
+    ( (x0) - 2.0*alpha*((x1)-(x0)) + a2*((x2) - 2.0*(x1) + (x0)) )
 
-    if (!gmix_set_norms_if_needed(gmix, n_gauss)) {
-        return NULL;
+    for (i=0; i<n_gauss; i++) {
+        const struct PyGMix_Gauss2D *g0=&gmix0[i];
+        const struct PyGMix_Gauss2D *g1=&gmix1[i];
+        const struct PyGMix_Gauss2D *g2=&gmix2[i];
+
+        gauss2d_set(&gmix_ex[i],
+                    PYGMIX_EM_EXTRAP(g0->p, g1->p, g2->p),
+                    PYGMIX_EM_EXTRAP(g0->row, g1->row, g2->row),
+                    PYGMIX_EM_EXTRAP(g0->col, g1->col, g2->col),
+                    PYGMIX_EM_EXTRAP(g0->irr, g1->irr, g2->irr),
+                    PYGMIX_EM_EXTRAP(g0->irc, g1->irc, g2->irc),
+                    PYGMIX_EM_EXTRAP(g0->icc, g1->icc, g2->icc));
     }
+    (*nsky_ex) = PYGMIX_EM_EXTRAP(nsky0, nsky1, nsky2);
 
-    jacob=(struct PyGMix_Jacobian* ) PyArray_DATA(jacob_obj);
-    sums=(struct PyGMix_EM_Sums* )  PyArray_DATA(sums_obj);
+#undef PYGMIX_EM_EXTRAP
 
-    status=em_run(image_obj,
-                  sky,
-                  counts,
-                  jacob,
-                  gmix,
-                  n_gauss,
-                  sums,
-                  tol,
-                  maxiter,
-                  &numiter,
-                  &frac_diff);
+    if (!em_accel_check(gmix_ex, n_gauss, *nsky_ex)) {
+        return 0;
+    }
 
-    if (!status) {
-        // raise an exception
-        return NULL;
-    } else {
-        PyObject* retval=PyTuple_New(2);
-        PyTuple_SetItem(retval,0,PyLong_FromLong(numiter));
-        PyTuple_SetItem(retval,1,PyFloat_FromDouble(frac_diff));
-        return retval;
+    for (i=0; i<n_gauss; i++) {
+        // cannot fail after the check above
+        gauss2d_set_norm(&gmix_ex[i]);
     }
+
+    return 1;
 }
 
 /*
-   convert log pars to linear pars
-   pars 4: are converted
+   squared distance between the parameters of two mixtures
 */
-static 
-PyObject * PyGMix_convert_simple_double_logpars(PyObject* self, PyObject* args) {
+static double em_accel_dist2(const struct PyGMix_Gauss2D *gmix_a,
+                             const struct PyGMix_Gauss2D *gmix_b,
+                             const struct PyGMix_Gauss2D *gmix_c,
+                             npy_intp n_gauss,
+                             double nsky_a,
+                             double nsky_b,
+                             double nsky_c)
+{
+    // sum of (a - 2*b + c)^2 if gmix_c is not NULL, else (a-b)^2
+    npy_intp i=0;
+    double d=0, dsum=0;
 
-    PyObject* logpars_obj=NULL;
-    PyObject* pars_obj=NULL;
-    int i, npars;
-    double *logpars=NULL, *pars=NULL;
+#define PYGMIX_EM_DIFF(field) \
+    d = gmix_c ? \
+        gmix_a[i].field - 2.0*gmix_b[i].field + gmix_c[i].field \
+        : gmix_a[i].field - gmix_b[i].field; \
+    dsum += d*d;
 
-    // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OO", 
-                          &logpars_obj,
-                          &pars_obj)) {
-        return NULL;
+    for (i=0; i<n_gauss; i++) {
+        PYGMIX_EM_DIFF(p)
+        PYGMIX_EM_DIFF(row)
+        PYGMIX_EM_DIFF(col)
+        PYGMIX_EM_DIFF(irr)
+        PYGMIX_EM_DIFF(irc)
+        PYGMIX_EM_DIFF(icc)
     }
+#undef PYGMIX_EM_DIFF
 
-    logpars=PyArray_DATA(logpars_obj);
-    pars=PyArray_DATA(pars_obj);
-
-    npars=PyArray_SIZE(logpars_obj);
+    d = gmix_c ? nsky_a - 2.0*nsky_b + nsky_c : nsky_a - nsky_b;
+    dsum += d*d;
 
-    for (i=0; i<npars; i++) {
-        if (i < 4) {
-        //if (i != 4) {
-            pars[i] = logpars[i];
-        } else {
-            pars[i] = pow(10.0, logpars[i]);
-        }
-    }
-    Py_RETURN_NONE;
+    return dsum;
 }
 
 /*
-   convert log pars to linear pars, pulling out a specific band
-
-   no error checking done here
+   check convergence for a single em step, as in em_run
 */
-static 
-PyObject * PyGMix_convert_simple_double_logpars_band(PyObject* self, PyObject* args) {
+static int em_accel_converged(const struct PyGMix_Gauss2D *gmix_old,
+                              struct PyGMix_Gauss2D *gmix_new,
+                              npy_intp n_gauss,
+                              double tol,
+                              double *frac_diff)
+{
+    double T_old=gmix_get_T((struct PyGMix_Gauss2D *)gmix_old, n_gauss);
+    double T=gmix_get_T(gmix_new, n_gauss);
 
-    PyObject* logpars_obj=NULL;
-    PyObject* pars_obj=NULL;
-    int band=0;
-    double *logpars=NULL, *pars=NULL;
+    (*frac_diff) = fabs((T-T_old)/T);
+    return ( (*frac_diff) < tol );
+}
 
-    // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OOi", 
-                          &logpars_obj,
-                          &pars_obj,
-                          &band)) {
-        return NULL;
-    }
+/*
+   em accelerated with the SQUAREM method (Varadhan & Roland 2008, scheme
+   S3).  Each cycle takes two em steps x1=F(x0), x2=F(x1) and jumps to
 
-    logpars=PyArray_DATA(logpars_obj);
-    pars=PyArray_DATA(pars_obj);
+        x' = x0 - 2*alpha*r + alpha^2*v
 
-    pars[0] = logpars[0];
-    pars[1] = logpars[1];
-    pars[2] = logpars[2];
-    pars[3] = logpars[3];
-    pars[4] = exp( logpars[4] );
-    pars[5] = exp( logpars[5+band] );
-    //pars[5] = logpars[5+band];
+   where r = x1-x0, v = x2-2*x1+x0, alpha = -|r|/|v|, followed by a
+   stabilizing em step from x'.  If x' is not a valid mixture or the log
+   likelihood at x' is below that at x1, the jump is rejected and the
+   cycle ends at x2, so the likelihood never decreases relative to plain em.
 
-    Py_RETURN_NONE;
-}
+   Convergence is tested with the same criterion as em_run, but two
+   successive em steps must both pass.
 
+   gmix_work must hold 3*n_gauss gaussians, and is used for scratch space
 
-/*
-   convert eta pars to g1,g2 pars
+   numiter is the number of em steps, naccel the number of accepted
+   jumps and nreject the number of rejected jumps.  nmap is the number
+   of passes over the image, which is numiter plus the stabilizing steps
+   abandoned because the jump went out of range; this is the cost to
+   compare with numiter from em_run
 
-   no error checking done here
+   returns 0 on failure, with the reason in err
 */
-static 
-PyObject * PyGMix_convert_simple_eta2g_band(PyObject* self, PyObject* args) {
+static int em_run_accel(const struct PyGMix_EM_Image *image,
+                        double sky,
+                        double counts,
+                        const struct PyGMix_Jacobian* jacob,
+                        struct PyGMix_Gauss2D *gmix, // holds the guess
+                        npy_intp n_gauss,
+                        struct PyGMix_EM_Sums *sums,
+                        struct PyGMix_Gauss2D *gmix_work,
+                        double tol,
+                        long maxiter,
+                        long *numiter,
+                        double *frac_diff,
+                        long *naccel,
+                        long *nreject,
+                        long *nmap,
+                        int *err)
+{
+    int status=0, ok=0, conv1=0, err_ex=0;
+    size_t gsize=n_gauss*sizeof(struct PyGMix_Gauss2D);
 
-    PyObject* etapars_obj=NULL;
-    PyObject* gpars_obj=NULL;
-    int band=0;
-    double *etapars=NULL, *gpars=NULL;
-    double g1=0, g2=0;
-    int status=0;
+    npy_intp n_points=image->n_row*image->n_col;
 
-    // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OOi", 
-                          &etapars_obj,
-                          &gpars_obj,
-                          &band)) {
-        return NULL;
-    }
+    double scale=jacob->sdet;
+    double area = n_points*scale*scale;
 
-    etapars=PyArray_DATA(etapars_obj);
-    gpars=PyArray_DATA(gpars_obj);
+    struct PyGMix_Gauss2D *gmix1=gmix_work;
+    struct PyGMix_Gauss2D *gmix2=gmix_work + n_gauss;
+    struct PyGMix_Gauss2D *gmix_ex=gmix_work + 2*n_gauss;
 
-    status=eta1eta2_to_g1g2(etapars[2], etapars[3], &g1, &g2);
+    double nsky0 = sky/counts, nsky1=0, nsky2=0, nsky_ex=0;
+    double lnlike1=0, lnlike_ex=0;
+    double sr2=0, sv2=0, alpha=0, stepmax=4.0;
 
+    (*numiter)=0;
+    (*naccel)=0;
+    (*nreject)=0;
+    (*nmap)=0;
+    (*frac_diff)=9999.0;
 
-    gpars[0] = etapars[0];
-    gpars[1] = etapars[1];
-    gpars[2] = g1;
-    gpars[3] = g2;
-    gpars[4] = etapars[4];
-    gpars[5] = etapars[5+band];
-
-    return Py_BuildValue("i", status);
-}
-
+    while ( (*numiter) < maxiter) {
 
+        // x1 = F(x0)
+        memcpy(gmix1, gmix, gsize);
+        nsky1=nsky0;
+        status=em_step(image, counts, area, jacob,
+                       gmix1, n_gauss, sums, &nsky1, NULL, err);
+        (*nmap) += 1;
+        if (!status) {
+            goto _em_run_accel_bail;
+        }
+        (*numiter) += 1;
 
-/*
+        if ((*numiter) >= maxiter) {
+            memcpy(gmix, gmix1, gsize);
+            break;
+        }
+        conv1=em_accel_converged(gmix, gmix1, n_gauss, tol, frac_diff);
+
+        // x2 = F(x1)
+        memcpy(gmix2, gmix1, gsize);
+        nsky2=nsky1;
+        status=em_step(image, counts, area, jacob,
+                       gmix2, n_gauss, sums, &nsky2, &lnlike1, err);
+        (*nmap) += 1;
+        if (!status) {
+            goto _em_run_accel_bail;
+        }
+        (*numiter) += 1;
 
-   full-covariance, nd-gaussian evaluations
+        // the changes can be small for a single step far from the
+        // peak, so require two small steps in a row
+        if ((em_accel_converged(gmix1, gmix2, n_gauss, tol, frac_diff)
+                    && conv1)
+                || (*numiter) >= maxiter) {
+            memcpy(gmix, gmix2, gsize);
+            break;
+        }
 
-   can do either log or linear
-       log_pnorms, means, icovars, tmp_lnprob, x, dolog
+        sr2 = em_accel_dist2(gmix1, gmix, NULL, n_gauss, nsky1, nsky0, 0.0);
+        sv2 = em_accel_dist2(gmix2, gmix1, gmix, n_gauss, nsky2, nsky1, nsky0);
 
-   make sure they are arrays from python
-*/
+        ok=0;
+        if (sv2 > 0.0) {
+            alpha = -sqrt(sr2/sv2);
+            if (alpha > -1.0) {
+                alpha = -1.0;
+            }
+            if (alpha < -stepmax) {
+                alpha = -stepmax;
+            }
 
-static int gmixnd_get_prob_args_check(PyObject* log_pnorms,
-                                      PyObject* means,
-                                      PyObject* icovars,
-                                      PyObject* tmp_lnprob,
-                                      PyObject* pars,
-                                      npy_intp *n_gauss,
-                                      int *n_dim)
-{
-    int status=0, n_dim_means=0, n_dim_icovars=0;
-    npy_intp n_pars=0, n_tmp=0;
+            // alpha == -1 is just x2
+            if (alpha < -1.0) {
+                ok=em_accel_extrapolate(gmix, gmix1, gmix2, gmix_ex,
+                                        n_gauss, nsky0, nsky1, nsky2,
+                                        alpha, &nsky_ex);
+            }
+        }
 
-    n_dim_means=PyArray_NDIM(means);
-    if (n_dim_means != 2) {
-        PyErr_Format(GMixFatalError, "means dim must be 2, got %d", n_dim_means);
-        goto _gmixnd_get_prob_args_check_bail;
-    }
-    n_dim_icovars=PyArray_NDIM(icovars);
-    if (n_dim_icovars != 3) {
-        PyErr_Format(GMixFatalError, "icovars dim must be 3, got %d", n_dim_icovars);
-        goto _gmixnd_get_prob_args_check_bail;
-    }
+        if (ok) {
+            // stabilizing step from x', which also gives the likelihood
+            // at x'
+            memcpy(gmix1, gmix_ex, gsize);
+            nsky1=nsky_ex;
+            status=em_step(image, counts, area, jacob,
+                           gmix1, n_gauss, sums, &nsky1, &lnlike_ex, &err_ex);
+            (*nmap) += 1;
+            if (!status) {
+                // the jump went out of range; not an error for the fit
+                ok=0;
+            } else {
+                (*numiter) += 1;
+                if (!isfinite(lnlike_ex) || lnlike_ex < lnlike1) {
+                    ok=0;
+                }
+            }
+        }
 
-    (*n_gauss)=PyArray_SIZE(log_pnorms);
-    (*n_dim)=PyArray_DIM(means,1);
+        if (ok) {
+            (*naccel) += 1;
+            if (alpha == -stepmax) {
+                stepmax *= 4.0;
+            }
 
-    if (*n_dim > 10) {
-        PyErr_Format(GMixFatalError, "dim must be <= 10, got %d", *n_dim);
-        goto _gmixnd_get_prob_args_check_bail;
-    }
+            memcpy(gmix, gmix1, gsize);
+            nsky0=nsky1;
+        } else {
+            if (alpha < -1.0) {
+                (*nreject) += 1;
+                stepmax = stepmax/4.0 > 4.0 ? stepmax/4.0 : 4.0;
+            }
+            memcpy(gmix, gmix2, gsize);
+            nsky0=nsky2;
+        }
 
-    n_pars=PyArray_SIZE(pars);
-    if (n_pars != (*n_dim)) {
-        PyErr_Format(GMixFatalError, "n_dim is %d but n_pars is %ld",
-                     (*n_dim), n_pars);
-        goto _gmixnd_get_prob_args_check_bail;
-    }
-    n_tmp=PyArray_SIZE(tmp_lnprob);
-    if (n_tmp != (*n_gauss)) {
-        PyErr_Format(GMixFatalError, "n_gauss is %ld but n_tmp_lnprob is %ld",
-                     (*n_gauss), n_tmp);
-        goto _gmixnd_get_prob_args_check_bail;
-    }
+    } // iteration
 
     status=1;
-_gmixnd_get_prob_args_check_bail:
+_em_run_accel_bail:
     return status;
 }
 
-static 
-PyObject * PyGMix_gmixnd_get_prob_scalar(PyObject* self, PyObject* args) {
+/*
+   one step of the em algorithm for a single epoch of a multi-epoch fit,
+   see em_run_multi.  The sums for the shared centers and covariances are
+   added to, and the new mixing weights and sky for this epoch are set
 
-    PyObject* log_pnorms=NULL;
-    PyObject* means=NULL;
-    PyObject* icovars=NULL;
-    PyObject* tmp_lnprob=NULL;
-    PyObject* pars=NULL;
-    double* tmp_lnprob_ptr=NULL;
+   returns 0 on failure, with the reason in err
+*/
+static int em_multi_epoch_step(const struct PyGMix_EM_Image *image,
+                               double counts,
+                               const struct PyGMix_Jacobian* jacob,
+                               const struct PyGMix_Gauss2D *psf,
+                               npy_intp n_psf,
+                               const struct PyGMix_Gauss2D *gmix,
+                               npy_intp n_gauss,
+                               double *epoch_p,
+                               double *nsky,
+                               struct PyGMix_Gauss2D *conv,
+                               struct PyGMix_EM_Sums *sums,
+                               struct PyGMix_EM_Sums *scratch,
+                               int *err)
+{
+    int status=0;
+    double skysum=0, igrat=0;
+    double psf_rowcen=0, psf_colcen=0, psf_psum=0, psf_ipsum=0;
+    npy_intp row=0, col=0, k=0, j=0, i=0, n_conv=n_gauss*n_psf;
 
-    // up to 10 dims allowed
-    double xdiff[10];
-    int dolog=0;
-    npy_intp i=0, n_gauss=0;
-    double p=0.0, retval=0;
-    double lnpmax=-9.99e9, logpnorm=0, chi2=0, lnp=0, par=0, mean=0, icov=0;
-    int n_dim=0, idim1=0, idim2=0;
+    npy_intp n_row=image->n_row;
+    npy_intp n_col=image->n_col;
 
-    // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OOOOOi", 
-                          &log_pnorms,
-                          &means,
-                          &icovars,
-                          &tmp_lnprob,
-                          &pars,
-                          &dolog)) {
-        return NULL;
-    }
+    double scale=jacob->sdet;
+    double area = n_row*n_col*scale*scale;
 
+    // the current mixture convolved with the psf, with this epoch's
+    // mixing weights
+    gmix_get_cen(psf, n_psf, &psf_rowcen, &psf_colcen, &psf_psum);
+    psf_ipsum=1.0/psf_psum;
 
-    if (!gmixnd_get_prob_args_check(log_pnorms,
-                                    means,
-                                    icovars,
-                                    tmp_lnprob,
-                                    pars,
-                                    &n_gauss,
-                                    &n_dim)) {
-        return NULL;
+    for (k=0; k<n_gauss; k++) {
+        const struct PyGMix_Gauss2D *gauss=&gmix[k];
+        for (j=0; j<n_psf; j++) {
+            const struct PyGMix_Gauss2D *pgauss=&psf[j];
+            struct PyGMix_Gauss2D *cgauss=&conv[k*n_psf+j];
+
+            gauss2d_set(cgauss,
+                        epoch_p[k]*pgauss->p*psf_ipsum,
+                        gauss->row + (pgauss->row-psf_rowcen),
+                        gauss->col + (pgauss->col-psf_colcen),
+                        gauss->irr + pgauss->irr,
+                        gauss->irc + pgauss->irc,
+                        gauss->icc + pgauss->icc);
+
+            if (!(cgauss->det >= 1.0e-200)) {
+                (*err) = PYGMIX_EM_ERR_DET;
+                goto _em_multi_epoch_step_bail;
+            }
+            gauss2d_set_norm(cgauss);
+        }
     }
 
-    tmp_lnprob_ptr = (double *) PyArray_DATA(tmp_lnprob);
+    em_clear_sums(scratch, n_conv);
 
-    for (i=0; i<n_gauss; i++) {
+    for (row=0; row<n_row; row++) {
 
-        logpnorm = *(double *) PyArray_GETPTR1(log_pnorms, i);
+        double u=PYGMIX_JACOB_GETU(jacob, row, 0);
+        double v=PYGMIX_JACOB_GETV(jacob, row, 0);
 
-        for (idim1=0; idim1<n_dim; idim1++) {
-            par=*(double *) PyArray_GETPTR1(pars, idim1);
-            mean=*(double *) PyArray_GETPTR2(means, i, idim1);
+        for (col=0; col<n_col; col++) {
 
-            xdiff[idim1] = par-mean;
-        }
+            double gtot=0.0;
+            double imnorm=PYGMIX_EM_IMAGE_GET(image,row,col);
 
-        chi2=0;
-        for (idim1=0; idim1<n_dim; idim1++) {
-            for (idim2=0; idim2<n_dim; idim2++) {
-                icov=*(double *) PyArray_GETPTR3(icovars, i, idim1, idim2);
+            imnorm /= counts;
 
-                chi2 += xdiff[idim1]*xdiff[idim2]*icov;
-            }
-        }
+            for (i=0; i<n_conv; i++) {
+                struct PyGMix_EM_Sums *sum=&scratch[i];
+                const struct PyGMix_Gauss2D *cgauss=&conv[i];
+                const struct PyGMix_Gauss2D *gauss=&gmix[i/n_psf];
 
-        lnp = -0.5*chi2 + logpnorm;
-        if (lnp > lnpmax) {
-            lnpmax=lnp;
-        }
-        tmp_lnprob_ptr[i] = lnp;
-    }    
+                double udiff = u-cgauss->row;
+                double vdiff = v-cgauss->col;
 
-    p=0;
-    for (i=0; i<n_gauss; i++) {
-        p += exp(tmp_lnprob_ptr[i] - lnpmax);
-    }
+                double chi2=
+                    cgauss->dcc*udiff*udiff
+                    + cgauss->drr*vdiff*vdiff
+                    - 2.0*cgauss->drc*udiff*vdiff;
 
-    if (dolog) {
-        retval = log(p) + lnpmax;
-    } else {
-        retval = p*exp(lnpmax);
-    }
+                // the expected offset of the intrinsic position from the
+                // center of the intrinsic gaussian, C S^{-1} (x - m)
+                double qu = cgauss->dcc*udiff - cgauss->drc*vdiff;
+                double qv = cgauss->drr*vdiff - cgauss->drc*udiff;
+                double du = gauss->irr*qu + gauss->irc*qv;
+                double dv = gauss->irc*qu + gauss->icc*qv;
 
-    return PyFloat_FromDouble(retval);
+                if (chi2 < PYGMIX_MAX_CHI2 && chi2 >= 0.0) {
+                    sum->gi = cgauss->pnorm*expd( -0.5*chi2 );
+                } else {
+                    sum->gi = 0.0;
+                }
+                gtot += sum->gi;
+                sum->trowsum = du*sum->gi;
+                sum->tcolsum = dv*sum->gi;
+                sum->tu2sum  = du*du*sum->gi;
+                sum->tuvsum  = du*dv*sum->gi;
+                sum->tv2sum  = dv*dv*sum->gi;
+            }
 
-}
+            gtot += (*nsky);
 
+            if (gtot == 0) {
+                (*err) = PYGMIX_EM_ERR_GTOT;
+                goto _em_multi_epoch_step_bail;
+            }
 
-/*
+            igrat = imnorm/gtot;
+            for (i=0; i<n_conv; i++) {
+                struct PyGMix_EM_Sums *ssum=&scratch[i];
+                struct PyGMix_EM_Sums *sum=&sums[i/n_psf];
 
-   Difference between mean of the distribution
-   and parameters from the template set
+                double wtau = ssum->gi*igrat;
 
-       mean - template_pars
+                ssum->pnew += wtau;
 
-*/
-static void get_mom_xdiff(const PyObject* mean_obj,
-                          const PyObject* pars_obj,
-                          npy_intp i,
-                          double *xdiff,
-                          npy_intp ndim)
-{
-    npy_intp dim=0;
-    double mean=0, par=0;
-    for (dim=0; dim<ndim; dim++) {
+                sum->pnew   += wtau;
+                sum->rowsum += ssum->trowsum*igrat;
+                sum->colsum += ssum->tcolsum*igrat;
+                sum->u2sum  += ssum->tu2sum*igrat;
+                sum->uvsum  += ssum->tuvsum*igrat;
+                sum->v2sum  += ssum->tv2sum*igrat;
+            }
 
-        mean = *(double *)PyArray_GETPTR1(mean_obj, dim);
-        par  = *(double *)PyArray_GETPTR2(pars_obj, i, dim);
+            skysum += (*nsky)*imnorm/gtot;
+            u += jacob->dudcol;
+            v += jacob->dvdcol;
+        } //cols
+    } // rows
 
-        xdiff[dim] = mean-par;
+    // the conditional covariance of the intrinsic position,
+    // B = C - C S^{-1} C, is the same for all pixels
+    for (k=0; k<n_gauss; k++) {
+        const struct PyGMix_Gauss2D *gauss=&gmix[k];
+        struct PyGMix_EM_Sums *sum=&sums[k];
 
-    }
-}
+        epoch_p[k] = 0.0;
+        for (j=0; j<n_psf; j++) {
+            const struct PyGMix_Gauss2D *cgauss=&conv[k*n_psf+j];
+            double wsum=scratch[k*n_psf+j].pnew;
 
-// xdiff should already be filled out for the non-sheared pars
-// only the slots for M1,M2,T are updated
-static void get_mom_xdiff_sheared(const PyObject* mean_obj,
-                                  const PyObject* sheared_pars_obj,
-                                  npy_intp i,
-                                  double *xdiff)
-{
-    npy_intp dim=0;
-    double mean=0, par=0;
-    for (dim=PYGMIX_DOFFSET; dim<PYGMIX_DOFFSET+3; dim++) {
+            // M = S^{-1} C
+            double mrr = cgauss->dcc*gauss->irr - cgauss->drc*gauss->irc;
+            double mrc = cgauss->dcc*gauss->irc - cgauss->drc*gauss->icc;
+            double mcr = cgauss->drr*gauss->irc - cgauss->drc*gauss->irr;
+            double mcc = cgauss->drr*gauss->icc - cgauss->drc*gauss->irc;
 
-        mean = *(double *)PyArray_GETPTR1(mean_obj, dim);
-        par  = *(double *)PyArray_GETPTR2(sheared_pars_obj, i, dim-PYGMIX_DOFFSET);
+            double brr = gauss->irr - (gauss->irr*mrr + gauss->irc*mcr);
+            double brc = gauss->irc - (gauss->irr*mrc + gauss->irc*mcc);
+            double bcc = gauss->icc - (gauss->irc*mrc + gauss->icc*mcc);
+
+            sum->u2sum += brr*wsum;
+            sum->uvsum += brc*wsum;
+            sum->v2sum += bcc*wsum;
 
-        xdiff[dim] = mean-par;
+            epoch_p[k] += wsum;
+        }
     }
-}
 
+    (*nsky) = skysum/area;
+
+    status=1;
+_em_multi_epoch_step_bail:
+    return status;
+}
 
 /*
+   set the shared centers and covariances from sums over all epochs
 
-   (xmean - x) C^{-1} (xmean - x)
+   the p for each gaussian is set to the mean mixing weight over epochs
 
+   returns 0 if a determinant is too low, without setting an exception
 */
-static double get_mom_chi2(const PyObject* icovar_obj,
-                           const double *xdiff,
-                           npy_intp ndim)
+static int em_multi_set_gmix_from_sums(struct PyGMix_Gauss2D *gmix,
+                                       npy_intp n_gauss,
+                                       npy_intp n_epoch,
+                                       const struct PyGMix_EM_Sums *sums)
 {
-    npy_intp dim1=0, dim2=0;
-    double icov=0, chi2=0, tchi2=0;
-
-    for (dim1=0; dim1<ndim; dim1++) {
-        for (dim2=0; dim2<ndim; dim2++) {
-            icov=*(double *) PyArray_GETPTR2(icovar_obj, dim1, dim2);
-
-            tchi2 = xdiff[dim1]*xdiff[dim2]*icov;
-            chi2 += tchi2;
+    npy_intp k=0;
+    for (k=0; k<n_gauss; k++) {
+        const struct PyGMix_EM_Sums *sum=&sums[k];
+        struct PyGMix_Gauss2D *gauss=&gmix[k];
+
+        double pinv=1.0/sum->pnew;
+        double du=sum->rowsum*pinv;
+        double dv=sum->colsum*pinv;
+
+        gauss2d_set(gauss,
+                    sum->pnew/n_epoch,
+                    gauss->row + du,
+                    gauss->col + dv,
+                    sum->u2sum*pinv - du*du,
+                    sum->uvsum*pinv - du*dv,
+                    sum->v2sum*pinv - dv*dv);
+
+        if (!(gauss->det >= 1.0e-200)) {
+            return 0;
         }
+        gauss2d_set_norm(gauss);
     }
-
-    return chi2;
+    return 1;
 }
 
 /*
+   em for a set of images of the same object, each with its own jacobian
+   and psf, fitting for the mixture before convolution with the psf
 
-   use nsigma to limit the range evaluated,
-   saves time calling exp
+   This is the extreme deconvolution algorithm (Bovy, Hogg & Roweis 2011)
+   with the pixels as data points weighted by the image.  The centers and
+   covariances of the gaussians are shared by all epochs, while the mixing
+   weights epoch_p [n_epoch, n_gauss] and the normalized sky nsky [n_epoch]
+   are found separately for each epoch, since the images can have different
+   sky levels.  The sums from all epochs are accumulated before each update
+   of the mixture
 
-   if dolog is true, the points are always evaluated
-   and nsigma is ignored. Also norm is log(norm)
+   images, jacobs and psfs are lists with an entry for each epoch.  conv
+   and scratch are used for scratch space and must hold n_gauss times the
+   largest number of psf gaussians
 
+   Convergence is tested on T as in em_run, after at least miniter
+   iterations
 
-   all error checking should be done in python
+   returns 0 on failure, with the reason in err
 */
-static 
-PyObject * PyGMix_mvn_calc_prob(PyObject* self, PyObject* args) {
+static int em_run_multi(PyObject* images_list,
+                        PyObject* jacobs_list,
+                        PyObject* psfs_list,
+                        const double *counts,
+                        struct PyGMix_Gauss2D *gmix, // holds the guess
+                        npy_intp n_gauss,
+                        double *epoch_p,
+                        double *nsky,
+                        struct PyGMix_Gauss2D *conv,
+                        struct PyGMix_EM_Sums *sums,
+                        struct PyGMix_EM_Sums *scratch,
+                        double tol,
+                        long miniter,
+                        long maxiter,
+                        long *numiter,
+                        double *frac_diff,
+                        int *err)
+{
+    int status=0;
+    npy_intp n_epoch=PyList_Size(images_list), iepoch=0;
+    double T=0, T_last=-9999.0;
 
-    PyObject* mean_obj=NULL;
-    PyObject* icovar_obj=NULL;
-    double nsigma=0, nsigma2=0, norm=0;
-    int dolog=0;
-    PyObject* allpars_obj=NULL;
-    PyObject* prob_obj=NULL;
+    struct PyGMix_EM_Image image;
+    const struct PyGMix_Jacobian *jacob=NULL;
+    const struct PyGMix_Gauss2D *psf=NULL;
+    PyObject *psf_obj=NULL;
 
-    // up to 10 dimensions
-    double xdiff[10];
-    double chi2=0, arg=0;
-    double prob=0, *ptr=NULL;
-    npy_intp ndim=0, npoints=0, i=0;
+    (*numiter)=0;
+    (*frac_diff)=9999.0;
+    while ( (*numiter) < maxiter) {
 
-    // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OOddOiO", 
-                          &mean_obj,
-                          &icovar_obj,
-                          &norm,
-                          &nsigma,
-                          &allpars_obj,
-                          &dolog,
-                          &prob_obj)) {
-        return NULL;
-    }
+        em_clear_sums(sums, n_gauss);
 
-    nsigma2=nsigma*nsigma;
- 
-    ndim=PyArray_SIZE(mean_obj);
-    npoints = PyArray_DIM(allpars_obj,0);
+        for (iepoch=0; iepoch<n_epoch; iepoch++) {
+            em_image_set(&image, PyList_GET_ITEM(images_list, iepoch));
+            jacob=(const struct PyGMix_Jacobian *)
+                PyArray_DATA(PyList_GET_ITEM(jacobs_list, iepoch));
+
+            psf_obj=PyList_GET_ITEM(psfs_list, iepoch);
+            psf=(const struct PyGMix_Gauss2D *) PyArray_DATA(psf_obj);
+
+            status=em_multi_epoch_step(&image,
+                                       counts[iepoch],
+                                       jacob,
+                                       psf,
+                                       PyArray_SIZE(psf_obj),
+                                       gmix,
+                                       n_gauss,
+                                       &epoch_p[iepoch*n_gauss],
+                                       &nsky[iepoch],
+                                       conv,
+                                       sums,
+                                       scratch,
+                                       err);
+            if (!status) {
+                goto _em_run_multi_bail;
+            }
+        }
 
-    for (i=0; i<npoints; i++) {
-        get_mom_xdiff(mean_obj, allpars_obj,i,xdiff,ndim);
+        status=em_multi_set_gmix_from_sums(gmix, n_gauss, n_epoch, sums);
+        if (!status) {
+            (*err) = PYGMIX_EM_ERR_DET;
+            goto _em_run_multi_bail;
+        }
 
-        chi2=get_mom_chi2(icovar_obj,xdiff,ndim);
+        T = gmix_get_T(gmix, n_gauss);
+        (*frac_diff) = fabs((T-T_last)/T);
 
-        arg = -0.5*chi2;
+        (*numiter) += 1;
 
-        if (dolog) {
-            // norm is really log(norm)
-            // and this is really the log prob
-            prob = norm + arg;
-        } else {
+        if ( (*frac_diff) < tol && (*numiter) >= miniter) {
+            break;
+        }
+
+        T_last = T;
+
+    } // iteration
+
+    status=1;
+_em_run_multi_bail:
+    return status;
+}
+
+static PyObject * PyGMix_em_run(PyObject* self, PyObject* args) {
+
+    PyObject* gmix_obj=NULL;
+    PyObject* image_obj=NULL;
+    //PyObject* weight_obj=NULL;
+    PyObject* jacob_obj=NULL;
+    PyObject* sums_obj=NULL;
+    double sky=0, counts=0, tol=0;
+    long maxiter=0;
+    npy_intp n_gauss=0;
+
+    struct PyGMix_Gauss2D *gmix=NULL;//, *gauss=NULL;
+    struct PyGMix_Jacobian *jacob=NULL;
+    struct PyGMix_EM_Sums* sums=NULL;
+    long numiter=0;
+    double frac_diff=0;
+    int status=0, err=0;
+    struct PyGMix_EM_Image image;
+
+
+    // weight object is currently ignored
+    if (!PyArg_ParseTuple(args, (char*)"OOOOdddl", 
+                          &gmix_obj,
+                          &image_obj,
+                          //&weight_obj,
+                          &jacob_obj,
+                          &sums_obj,
+                          &sky, &counts, &tol, &maxiter)) {
+        return NULL;
+    }
+
+    gmix=(struct PyGMix_Gauss2D* ) PyArray_DATA(gmix_obj);
+    n_gauss=PyArray_SIZE(gmix_obj);
+
+    if (!gmix_set_norms_if_needed(gmix, n_gauss)) {
+        return NULL;
+    }
+
+    jacob=(struct PyGMix_Jacobian* ) PyArray_DATA(jacob_obj);
+    sums=(struct PyGMix_EM_Sums* )  PyArray_DATA(sums_obj);
+    em_image_set(&image, image_obj);
+
+    // the iteration does not use the python api
+    Py_BEGIN_ALLOW_THREADS
+    status=em_run(&image,
+                  sky,
+                  counts,
+                  jacob,
+                  gmix,
+                  n_gauss,
+                  sums,
+                  tol,
+                  maxiter,
+                  &numiter,
+                  &frac_diff,
+                  &err);
+    Py_END_ALLOW_THREADS
+
+    if (!status) {
+        // raise an exception
+        em_set_exception(err);
+        return NULL;
+    } else {
+        PyObject* retval=PyTuple_New(2);
+        PyTuple_SetItem(retval,0,PyLong_FromLong(numiter));
+        PyTuple_SetItem(retval,1,PyFloat_FromDouble(frac_diff));
+        return retval;
+    }
+}
+
+/*
+   run the accelerated em algorithm, see em_run_accel
+*/
+static PyObject * PyGMix_em_run_accel(PyObject* self, PyObject* args) {
+
+    PyObject* gmix_obj=NULL;
+    PyObject* image_obj=NULL;
+    PyObject* jacob_obj=NULL;
+    PyObject* sums_obj=NULL;
+    PyObject* work_obj=NULL;
+    double sky=0, counts=0, tol=0;
+    long maxiter=0;
+    npy_intp n_gauss=0;
+
+    struct PyGMix_Gauss2D *gmix=NULL, *gmix_work=NULL;
+    struct PyGMix_Jacobian *jacob=NULL;
+    struct PyGMix_EM_Sums* sums=NULL;
+    long numiter=0, naccel=0, nreject=0, nmap=0;
+    double frac_diff=0;
+    int status=0, err=0;
+    struct PyGMix_EM_Image image;
+
+    if (!PyArg_ParseTuple(args, (char*)"OOOOOdddl", 
+                          &gmix_obj,
+                          &image_obj,
+                          &jacob_obj,
+                          &sums_obj,
+                          &work_obj,
+                          &sky, &counts, &tol, &maxiter)) {
+        return NULL;
+    }
+
+    gmix=(struct PyGMix_Gauss2D* ) PyArray_DATA(gmix_obj);
+    n_gauss=PyArray_SIZE(gmix_obj);
+
+    if (PyArray_SIZE(work_obj) < 3*n_gauss) {
+        PyErr_Format(PyExc_ValueError,
+                     "work gmix must have at least %ld gaussians",
+                     (long) (3*n_gauss));
+        return NULL;
+    }
+
+    if (!gmix_set_norms_if_needed(gmix, n_gauss)) {
+        return NULL;
+    }
+
+    jacob=(struct PyGMix_Jacobian* ) PyArray_DATA(jacob_obj);
+    sums=(struct PyGMix_EM_Sums* )  PyArray_DATA(sums_obj);
+    gmix_work=(struct PyGMix_Gauss2D* ) PyArray_DATA(work_obj);
+    em_image_set(&image, image_obj);
+
+    Py_BEGIN_ALLOW_THREADS
+    status=em_run_accel(&image,
+                        sky,
+                        counts,
+                        jacob,
+                        gmix,
+                        n_gauss,
+                        sums,
+                        gmix_work,
+                        tol,
+                        maxiter,
+                        &numiter,
+                        &frac_diff,
+                        &naccel,
+                        &nreject,
+                        &nmap,
+                        &err);
+    Py_END_ALLOW_THREADS
+
+    if (!status) {
+        // raise an exception
+        em_set_exception(err);
+        return NULL;
+    } else {
+        PyObject* retval=PyTuple_New(5);
+        PyTuple_SetItem(retval,0,PyLong_FromLong(numiter));
+        PyTuple_SetItem(retval,1,PyFloat_FromDouble(frac_diff));
+        PyTuple_SetItem(retval,2,PyLong_FromLong(naccel));
+        PyTuple_SetItem(retval,3,PyLong_FromLong(nreject));
+        PyTuple_SetItem(retval,4,PyLong_FromLong(nmap));
+        return retval;
+    }
+}
+
+/*
+   run em for a stack of images with the same shape, each with its own
+   jacobian, guess, sky and counts
+
+   gmix_obj is [n_stamp, n_gauss] and holds the guesses, which are replaced
+   by the results.  images_obj is [n_stamp, n_row, n_col].  The number of
+   iterations, the final fractional difference in T and the status are
+   set for each stamp, where the status is zero for success or one of the
+   PYGMIX_EM_ERR_* codes.  A failure for one stamp does not stop the others
+
+   All the iterations are run without the GIL
+*/
+static PyObject * PyGMix_em_run_batch(PyObject* self, PyObject* args) {
+
+    PyObject* gmix_obj=NULL;
+    PyObject* images_obj=NULL;
+    PyObject* jacobs_obj=NULL;
+    PyObject* sums_obj=NULL;
+    PyObject* sky_obj=NULL;
+    PyObject* counts_obj=NULL;
+    PyObject* numiter_obj=NULL;
+    PyObject* fdiff_obj=NULL;
+    PyObject* status_obj=NULL;
+    double tol=0;
+    long maxiter=0;
+
+    npy_intp n_stamp=0, n_gauss=0, istamp=0;
+
+    struct PyGMix_Gauss2D *gmix=NULL;
+    struct PyGMix_Jacobian *jacob=NULL;
+    struct PyGMix_EM_Sums* sums=NULL;
+    struct PyGMix_EM_Image image;
+    const char *images_data=NULL;
+    npy_intp stamp_stride=0;
+
+    long numiter=0;
+    double frac_diff=0, sky=0, counts=0;
+    int status=0, err=0;
+
+    if (!PyArg_ParseTuple(args, (char*)"OOOOOOOOOdl", 
+                          &gmix_obj,
+                          &images_obj,
+                          &jacobs_obj,
+                          &sums_obj,
+                          &sky_obj,
+                          &counts_obj,
+                          &numiter_obj,
+                          &fdiff_obj,
+                          &status_obj,
+                          &tol, &maxiter)) {
+        return NULL;
+    }
+
+    if (PyArray_NDIM(gmix_obj) != 2 || PyArray_NDIM(images_obj) != 3) {
+        PyErr_Format(PyExc_ValueError,
+                     "gmix must be 2d and images must be 3d");
+        return NULL;
+    }
+
+    n_stamp=PyArray_DIM(images_obj, 0);
+    n_gauss=PyArray_DIM(gmix_obj, 1);
+
+    if (PyArray_DIM(gmix_obj, 0) != n_stamp
+            || PyArray_SIZE(jacobs_obj) != n_stamp
+            || PyArray_SIZE(sky_obj) != n_stamp
+            || PyArray_SIZE(counts_obj) != n_stamp
+            || PyArray_SIZE(numiter_obj) != n_stamp
+            || PyArray_SIZE(fdiff_obj) != n_stamp
+            || PyArray_SIZE(status_obj) != n_stamp) {
+        PyErr_Format(PyExc_ValueError,
+                     "all inputs must have %ld stamps", (long) n_stamp);
+        return NULL;
+    }
+
+    sums=(struct PyGMix_EM_Sums* )  PyArray_DATA(sums_obj);
+
+    images_data = (const char *) PyArray_DATA(images_obj);
+    stamp_stride = PyArray_STRIDE(images_obj, 0);
+
+    image.n_row = PyArray_DIM(images_obj, 1);
+    image.n_col = PyArray_DIM(images_obj, 2);
+    image.row_stride = PyArray_STRIDE(images_obj, 1);
+    image.col_stride = PyArray_STRIDE(images_obj, 2);
+
+    // bad guesses are flagged here, while we have the GIL
+    for (istamp=0; istamp<n_stamp; istamp++) {
+        gmix=(struct PyGMix_Gauss2D* ) PyArray_GETPTR2(gmix_obj, istamp, 0);
+        if (!gmix_set_norms_if_needed(gmix, n_gauss)) {
+            PyErr_Clear();
+            *(npy_int32 *) PyArray_GETPTR1(status_obj, istamp) = PYGMIX_EM_ERR_DET;
+        } else {
+            *(npy_int32 *) PyArray_GETPTR1(status_obj, istamp) = 0;
+        }
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (istamp=0; istamp<n_stamp; istamp++) {
+
+        *(npy_int64 *) PyArray_GETPTR1(numiter_obj, istamp) = 0;
+        *(double *) PyArray_GETPTR1(fdiff_obj, istamp) = 9999.0;
+
+        if (*(npy_int32 *) PyArray_GETPTR1(status_obj, istamp) != 0) {
+            continue;
+        }
+
+        gmix=(struct PyGMix_Gauss2D* ) PyArray_GETPTR2(gmix_obj, istamp, 0);
+        jacob=(struct PyGMix_Jacobian* ) PyArray_GETPTR1(jacobs_obj, istamp);
+        sky = *(double *) PyArray_GETPTR1(sky_obj, istamp);
+        counts = *(double *) PyArray_GETPTR1(counts_obj, istamp);
+
+        image.data = images_data + istamp*stamp_stride;
+
+        numiter=0;
+        frac_diff=9999.0;
+        err=0;
+        status=em_run(&image,
+                      sky,
+                      counts,
+                      jacob,
+                      gmix,
+                      n_gauss,
+                      sums,
+                      tol,
+                      maxiter,
+                      &numiter,
+                      &frac_diff,
+                      &err);
+
+        *(npy_int64 *) PyArray_GETPTR1(numiter_obj, istamp) = numiter;
+        *(double *) PyArray_GETPTR1(fdiff_obj, istamp) = frac_diff;
+        if (!status) {
+            *(npy_int32 *) PyArray_GETPTR1(status_obj, istamp) = err;
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_RETURN_NONE;
+}
+
+/*
+   run em for a set of images of the same object, see em_run_multi
+*/
+static PyObject * PyGMix_em_run_multi(PyObject* self, PyObject* args) {
+
+    PyObject* gmix_obj=NULL;
+    PyObject* images_list=NULL;
+    PyObject* jacobs_list=NULL;
+    PyObject* psfs_list=NULL;
+    PyObject* counts_obj=NULL;
+    PyObject* epoch_p_obj=NULL;
+    PyObject* nsky_obj=NULL;
+    PyObject* conv_obj=NULL;
+    PyObject* sums_obj=NULL;
+    PyObject* scratch_obj=NULL;
+    double tol=0;
+    long miniter=0, maxiter=0;
+
+    npy_intp n_gauss=0, n_epoch=0, n_psf_max=0, n_psf=0, i=0;
+
+    struct PyGMix_Gauss2D *gmix=NULL;
+    long numiter=0;
+    double frac_diff=0;
+    int status=0, err=0;
+
+    if (!PyArg_ParseTuple(args, (char*)"OO!O!O!OOOOOOdll", 
+                          &gmix_obj,
+                          &PyList_Type, &images_list,
+                          &PyList_Type, &jacobs_list,
+                          &PyList_Type, &psfs_list,
+                          &counts_obj,
+                          &epoch_p_obj,
+                          &nsky_obj,
+                          &conv_obj,
+                          &sums_obj,
+                          &scratch_obj,
+                          &tol, &miniter, &maxiter)) {
+        return NULL;
+    }
+
+    gmix=(struct PyGMix_Gauss2D* ) PyArray_DATA(gmix_obj);
+    n_gauss=PyArray_SIZE(gmix_obj);
+    n_epoch=PyList_Size(images_list);
+
+    if (n_epoch == 0
+            || PyList_Size(jacobs_list) != n_epoch
+            || PyList_Size(psfs_list) != n_epoch
+            || PyArray_SIZE(counts_obj) != n_epoch
+            || PyArray_SIZE(nsky_obj) != n_epoch
+            || PyArray_SIZE(epoch_p_obj) != n_epoch*n_gauss) {
+        PyErr_Format(PyExc_ValueError,
+                     "all inputs must have the same number of epochs");
+        return NULL;
+    }
+
+    for (i=0; i<n_epoch; i++) {
+        n_psf=PyArray_SIZE(PyList_GET_ITEM(psfs_list, i));
+        if (n_psf > n_psf_max) {
+            n_psf_max=n_psf;
+        }
+    }
+    if (PyArray_SIZE(conv_obj) < n_gauss*n_psf_max
+            || PyArray_SIZE(scratch_obj) < n_gauss*n_psf_max
+            || PyArray_SIZE(sums_obj) < n_gauss) {
+        PyErr_Format(PyExc_ValueError,
+                     "scratch space must hold at least %ld gaussians",
+                     (long) (n_gauss*n_psf_max));
+        return NULL;
+    }
+
+    status=em_run_multi(images_list,
+                        jacobs_list,
+                        psfs_list,
+                        (const double *) PyArray_DATA(counts_obj),
+                        gmix,
+                        n_gauss,
+                        (double *) PyArray_DATA(epoch_p_obj),
+                        (double *) PyArray_DATA(nsky_obj),
+                        (struct PyGMix_Gauss2D* ) PyArray_DATA(conv_obj),
+                        (struct PyGMix_EM_Sums* ) PyArray_DATA(sums_obj),
+                        (struct PyGMix_EM_Sums* ) PyArray_DATA(scratch_obj),
+                        tol,
+                        miniter,
+                        maxiter,
+                        &numiter,
+                        &frac_diff,
+                        &err);
+
+    if (!status) {
+        // raise an exception
+        em_set_exception(err);
+        return NULL;
+    } else {
+        PyObject* retval=PyTuple_New(2);
+        PyTuple_SetItem(retval,0,PyLong_FromLong(numiter));
+        PyTuple_SetItem(retval,1,PyFloat_FromDouble(frac_diff));
+        return retval;
+    }
+}
+
+/*
+   convert log pars to linear pars
+   pars 4: are converted
+*/
+static 
+PyObject * PyGMix_convert_simple_double_logpars(PyObject* self, PyObject* args) {
+
+    PyObject* logpars_obj=NULL;
+    PyObject* pars_obj=NULL;
+    int i, npars;
+    double *logpars=NULL, *pars=NULL;
+
+    // weight object is currently ignored
+    if (!PyArg_ParseTuple(args, (char*)"OO", 
+                          &logpars_obj,
+                          &pars_obj)) {
+        return NULL;
+    }
+
+    logpars=PyArray_DATA(logpars_obj);
+    pars=PyArray_DATA(pars_obj);
+
+    npars=PyArray_SIZE(logpars_obj);
+
+    for (i=0; i<npars; i++) {
+        if (i < 4) {
+        //if (i != 4) {
+            pars[i] = logpars[i];
+        } else {
+            pars[i] = pow(10.0, logpars[i]);
+        }
+    }
+    Py_RETURN_NONE;
+}
+
+/*
+   convert log pars to linear pars, pulling out a specific band
+
+   no error checking done here
+*/
+static 
+PyObject * PyGMix_convert_simple_double_logpars_band(PyObject* self, PyObject* args) {
+
+    PyObject* logpars_obj=NULL;
+    PyObject* pars_obj=NULL;
+    int band=0;
+    double *logpars=NULL, *pars=NULL;
+
+    // weight object is currently ignored
+    if (!PyArg_ParseTuple(args, (char*)"OOi", 
+                          &logpars_obj,
+                          &pars_obj,
+                          &band)) {
+        return NULL;
+    }
+
+    logpars=PyArray_DATA(logpars_obj);
+    pars=PyArray_DATA(pars_obj);
+
+    pars[0] = logpars[0];
+    pars[1] = logpars[1];
+    pars[2] = logpars[2];
+    pars[3] = logpars[3];
+    pars[4] = exp( logpars[4] );
+    pars[5] = exp( logpars[5+band] );
+    //pars[5] = logpars[5+band];
+
+    Py_RETURN_NONE;
+}
+
+
+/*
+   convert eta pars to g1,g2 pars
+
+   no error checking done here
+*/
+static 
+PyObject * PyGMix_convert_simple_eta2g_band(PyObject* self, PyObject* args) {
+
+    PyObject* etapars_obj=NULL;
+    PyObject* gpars_obj=NULL;
+    int band=0;
+    double *etapars=NULL, *gpars=NULL;
+    double g1=0, g2=0;
+    int status=0;
+
+    // weight object is currently ignored
+    if (!PyArg_ParseTuple(args, (char*)"OOi", 
+                          &etapars_obj,
+                          &gpars_obj,
+                          &band)) {
+        return NULL;
+    }
+
+    etapars=PyArray_DATA(etapars_obj);
+    gpars=PyArray_DATA(gpars_obj);
+
+    status=eta1eta2_to_g1g2(etapars[2], etapars[3], &g1, &g2);
+
+
+    gpars[0] = etapars[0];
+    gpars[1] = etapars[1];
+    gpars[2] = g1;
+    gpars[3] = g2;
+    gpars[4] = etapars[4];
+    gpars[5] = etapars[5+band];
+
+    return Py_BuildValue("i", status);
+}
+
+
+
+/*
+
+   full-covariance, nd-gaussian evaluations
+
+   can do either log or linear
+       log_pnorms, means, icovars, tmp_lnprob, x, dolog
+
+   make sure they are arrays from python
+*/
+
+static int gmixnd_get_prob_args_check(PyObject* log_pnorms,
+                                      PyObject* means,
+                                      PyObject* icovars,
+                                      PyObject* tmp_lnprob,
+                                      PyObject* pars,
+                                      npy_intp *n_gauss,
+                                      int *n_dim)
+{
+    int status=0, n_dim_means=0, n_dim_icovars=0;
+    npy_intp n_pars=0, n_tmp=0;
+
+    n_dim_means=PyArray_NDIM(means);
+    if (n_dim_means != 2) {
+        PyErr_Format(GMixFatalError, "means dim must be 2, got %d", n_dim_means);
+        goto _gmixnd_get_prob_args_check_bail;
+    }
+    n_dim_icovars=PyArray_NDIM(icovars);
+    if (n_dim_icovars != 3) {
+        PyErr_Format(GMixFatalError, "icovars dim must be 3, got %d", n_dim_icovars);
+        goto _gmixnd_get_prob_args_check_bail;
+    }
+
+    (*n_gauss)=PyArray_SIZE(log_pnorms);
+    (*n_dim)=PyArray_DIM(means,1);
+
+    if (*n_dim > 10) {
+        PyErr_Format(GMixFatalError, "dim must be <= 10, got %d", *n_dim);
+        goto _gmixnd_get_prob_args_check_bail;
+    }
+
+    n_pars=PyArray_SIZE(pars);
+    if (n_pars != (*n_dim)) {
+        PyErr_Format(GMixFatalError, "n_dim is %d but n_pars is %ld",
+                     (*n_dim), n_pars);
+        goto _gmixnd_get_prob_args_check_bail;
+    }
+    n_tmp=PyArray_SIZE(tmp_lnprob);
+    if (n_tmp != (*n_gauss)) {
+        PyErr_Format(GMixFatalError, "n_gauss is %ld but n_tmp_lnprob is %ld",
+                     (*n_gauss), n_tmp);
+        goto _gmixnd_get_prob_args_check_bail;
+    }
+
+    status=1;
+_gmixnd_get_prob_args_check_bail:
+    return status;
+}
+
+static 
+PyObject * PyGMix_gmixnd_get_prob_scalar(PyObject* self, PyObject* args) {
+
+    PyObject* log_pnorms=NULL;
+    PyObject* means=NULL;
+    PyObject* icovars=NULL;
+    PyObject* tmp_lnprob=NULL;
+    PyObject* pars=NULL;
+    double* tmp_lnprob_ptr=NULL;
+
+    // up to 10 dims allowed
+    double xdiff[10];
+    int dolog=0;
+    npy_intp i=0, n_gauss=0;
+    double p=0.0, retval=0;
+    double lnpmax=-9.99e9, logpnorm=0, chi2=0, lnp=0, par=0, mean=0, icov=0;
+    int n_dim=0, idim1=0, idim2=0;
+
+    // weight object is currently ignored
+    if (!PyArg_ParseTuple(args, (char*)"OOOOOi", 
+                          &log_pnorms,
+                          &means,
+                          &icovars,
+                          &tmp_lnprob,
+                          &pars,
+                          &dolog)) {
+        return NULL;
+    }
+
+
+    if (!gmixnd_get_prob_args_check(log_pnorms,
+                                    means,
+                                    icovars,
+                                    tmp_lnprob,
+                                    pars,
+                                    &n_gauss,
+                                    &n_dim)) {
+        return NULL;
+    }
+
+    tmp_lnprob_ptr = (double *) PyArray_DATA(tmp_lnprob);
+
+    for (i=0; i<n_gauss; i++) {
+
+        logpnorm = *(double *) PyArray_GETPTR1(log_pnorms, i);
+
+        for (idim1=0; idim1<n_dim; idim1++) {
+            par=*(double *) PyArray_GETPTR1(pars, idim1);
+            mean=*(double *) PyArray_GETPTR2(means, i, idim1);
+
+            xdiff[idim1] = par-mean;
+        }
+
+        chi2=0;
+        for (idim1=0; idim1<n_dim; idim1++) {
+            for (idim2=0; idim2<n_dim; idim2++) {
+                icov=*(double *) PyArray_GETPTR3(icovars, i, idim1, idim2);
+
+                chi2 += xdiff[idim1]*xdiff[idim2]*icov;
+            }
+        }
+
+        lnp = -0.5*chi2 + logpnorm;
+        if (lnp > lnpmax) {
+            lnpmax=lnp;
+        }
+        tmp_lnprob_ptr[i] = lnp;
+    }    
+
+    p=0;
+    for (i=0; i<n_gauss; i++) {
+        p += exp(tmp_lnprob_ptr[i] - lnpmax);
+    }
+
+    if (dolog) {
+        retval = log(p) + lnpmax;
+    } else {
+        retval = p*exp(lnpmax);
+    }
+
+    return PyFloat_FromDouble(retval);
+
+}
+
+
+/*
+
+   Difference between mean of the distribution
+   and parameters from the template set
+
+       mean - template_pars
+
+*/
+static void get_mom_xdiff(const double *mean,
+                          const PyObject* pars_obj,
+                          npy_intp i,
+                          double *xdiff,
+                          npy_intp ndim)
+{
+    npy_intp dim=0;
+    double par=0;
+    for (dim=0; dim<ndim; dim++) {
+
+        par  = *(double *)PyArray_GETPTR2(pars_obj, i, dim);
+
+        xdiff[dim] = mean[dim]-par;
+
+    }
+}
+
+// xdiff should already be filled out for the non-sheared pars
+// only the slots for M1,M2,T are updated
+static void get_mom_xdiff_sheared(const double *mean,
+                                  const PyObject* sheared_pars_obj,
+                                  npy_intp i,
+                                  double *xdiff)
+{
+    npy_intp dim=0;
+    double par=0;
+    for (dim=PYGMIX_DOFFSET; dim<PYGMIX_DOFFSET+3; dim++) {
+
+        par  = *(double *)PyArray_GETPTR2(sheared_pars_obj, i, dim-PYGMIX_DOFFSET);
+
+        xdiff[dim] = mean[dim]-par;
+    }
+}
+
+
+/*
+
+   (xmean - x) C^{-1} (xmean - x)
+
+   the mean and inverse covariance are contiguous, the latter
+   [ndim,ndim] in row-major order
+
+*/
+static double get_mom_chi2(const double *icovar,
+                           const double *xdiff,
+                           npy_intp ndim)
+{
+    npy_intp dim1=0, dim2=0;
+    double icov=0, chi2=0, tchi2=0;
+
+    for (dim1=0; dim1<ndim; dim1++) {
+        for (dim2=0; dim2<ndim; dim2++) {
+            icov=icovar[dim1*ndim + dim2];
+
+            tchi2 = xdiff[dim1]*xdiff[dim2]*icov;
+            chi2 += tchi2;
+        }
+    }
+
+    return chi2;
+}
+
+/*
+
+   use nsigma to limit the range evaluated,
+   saves time calling exp
+
+   if dolog is true, the points are always evaluated
+   and nsigma is ignored. Also norm is log(norm)
+
+
+   all error checking should be done in python
+*/
+static 
+PyObject * PyGMix_mvn_calc_prob(PyObject* self, PyObject* args) {
+
+    PyObject* mean_obj=NULL;
+    PyObject* icovar_obj=NULL;
+    double nsigma=0, nsigma2=0, norm=0;
+    int dolog=0;
+    PyObject* allpars_obj=NULL;
+    PyObject* prob_obj=NULL;
+
+    // up to 10 dimensions
+    double xdiff[10];
+    double chi2=0, arg=0;
+    double prob=0, *ptr=NULL;
+    const double *mean=NULL, *icovar=NULL;
+    npy_intp ndim=0, npoints=0, i=0;
+
+    // weight object is currently ignored
+    if (!PyArg_ParseTuple(args, (char*)"OOddOiO", 
+                          &mean_obj,
+                          &icovar_obj,
+                          &norm,
+                          &nsigma,
+                          &allpars_obj,
+                          &dolog,
+                          &prob_obj)) {
+        return NULL;
+    }
+
+    nsigma2=nsigma*nsigma;
+ 
+    ndim=PyArray_SIZE(mean_obj);
+    npoints = PyArray_DIM(allpars_obj,0);
+
+    mean=PyArray_DATA(mean_obj);
+    icovar=PyArray_DATA(icovar_obj);
+
+    for (i=0; i<npoints; i++) {
+        get_mom_xdiff(mean, allpars_obj,i,xdiff,ndim);
+
+        chi2=get_mom_chi2(icovar,xdiff,ndim);
+
+        arg = -0.5*chi2;
+
+        if (dolog) {
+            // norm is really log(norm)
+            // and this is really the log prob
+            prob = norm + arg;
+        } else {
             if (chi2 < nsigma2) {
                 prob = norm*exp(arg);
             } else {
@@ -3313,203 +4347,729 @@ PyObject * PyGMix_mvn_calc_prob(PyObject* self, PyObject* args) {
             }
         }
 
-        ptr = PyArray_GETPTR1(prob_obj,i);
-        *ptr = prob;
+        ptr = PyArray_GETPTR1(prob_obj,i);
+        *ptr = prob;
+
+    }
+
+    Py_RETURN_NONE;
+}
+
+static void get_mom_Qsums(const double *icovar,
+                          const PyObject* Qderiv,
+                          const double *xdiff,
+                          npy_intp ndim,
+                          double prob,
+                          npy_intp i,
+                          double *icov_dot_Qd_1, // [PYGMIX_MAXDIMS]
+                          double *icov_dot_Qd_2, // [PYGMIX_MAXDIMS]
+                          double *Q1sum,
+                          double *Q2sum) {
+
+    npy_intp dim1=1,dim2=0;
+    double icov=0, deriv1=0, deriv2=0;
+
+    *Q1sum=0;
+    *Q2sum=0;
+
+    memset(icov_dot_Qd_1, 0, ndim*sizeof(double));
+    memset(icov_dot_Qd_2, 0, ndim*sizeof(double));
+
+    // Q1temp3 = Cinv dot derivatives
+    for (dim1=0; dim1<ndim; dim1++) {
+
+        for (dim2=0; dim2<ndim; dim2++) {
+
+            if (dim2 >= 2 && dim2 <= 4) {
+                // derivatives non-zero for these dimensions
+                icov=icovar[dim1*ndim + dim2];
+
+                deriv1 = *(double *)PyArray_GETPTR3(Qderiv, i, dim2-PYGMIX_DOFFSET, 0);
+                deriv2 = *(double *)PyArray_GETPTR3(Qderiv, i, dim2-PYGMIX_DOFFSET, 1);
+
+                icov_dot_Qd_1[dim1] += deriv1*icov;
+                icov_dot_Qd_2[dim1] += deriv2*icov;
+            }
+        } 
+    }
+    // xdiff dot Q1temp3
+    for (dim1=0; dim1<ndim; dim1++) {
+        *Q1sum += xdiff[dim1]*icov_dot_Qd_1[dim1];
+        *Q2sum += xdiff[dim1]*icov_dot_Qd_2[dim1];
+    }
+
+    *Q1sum *= prob;
+    *Q2sum *= prob;
+
+}
+
+/*
+   currently only implements the d^2L/d^2M terms
+*/
+static void get_mom_Rsums(const double *icovar,
+                          const PyObject* Qderiv,
+                          const PyObject* Rderiv,
+                          const double *xdiff,
+                          npy_intp ndim,
+                          const double *icov_dot_Qd_1,
+                          const double *icov_dot_Qd_2,
+                          double prob,
+                          npy_intp i,
+                          double *R11sum,
+                          double *R12sum,
+                          double *R22sum) {
+
+    double R11temp3[PYGMIX_MAXDIMS]={0};
+    double R12temp3[PYGMIX_MAXDIMS]={0};
+    double R22temp3[PYGMIX_MAXDIMS]={0};
+    npy_intp dim1=1,dim2=0;
+    double icov=0,
+           deriv1=0, deriv2=0,
+           deriv11=0, deriv12=0,deriv22;
+
+    *R11sum=0;
+    *R12sum=0;
+    *R22sum=0;
+
+    // R11temp3 = Cinv dot derivatives
+    for (dim1=0; dim1<ndim; dim1++) {
+
+        for (dim2=0; dim2<3; dim2++) {
+
+            if (dim2 >= 2 && dim2 <= 4) {
+                // derivatives are only non-zero for a subset of the dimensions
+
+                icov=icovar[dim1*ndim + dim2];
+
+                deriv11 = *(double *)PyArray_GETPTR4(Rderiv, i, dim2-PYGMIX_DOFFSET, 0, 0);
+                deriv12 = *(double *)PyArray_GETPTR4(Rderiv, i, dim2-PYGMIX_DOFFSET, 0, 1);
+                deriv22 = *(double *)PyArray_GETPTR4(Rderiv, i, dim2-PYGMIX_DOFFSET, 1, 1);
+
+                R11temp3[dim1] += icov*deriv11;
+                R12temp3[dim1] += icov*deriv12;
+                R22temp3[dim1] += icov*deriv22;
+            }
+        } 
+    }
+    for (dim1=0; dim1<ndim; dim1++) {
+
+        // xdiff dot R11temp3
+        *R11sum += xdiff[dim1]*R11temp3[dim1];
+        *R12sum += xdiff[dim1]*R12temp3[dim1];
+        *R22sum += xdiff[dim1]*R22temp3[dim1];
+
+        // Qderiv dot icov_dot_Qd
+        if (dim1 >= 2 && dim1 <= 4) {
+            // derivatives non-zero for these dimensions
+            deriv1 = *(double *)PyArray_GETPTR3(Qderiv, i, dim1-PYGMIX_DOFFSET, 0);
+            deriv2 = *(double *)PyArray_GETPTR3(Qderiv, i, dim1-PYGMIX_DOFFSET, 1);
+
+            *R11sum += deriv1*icov_dot_Qd_1[dim1];
+            *R12sum += deriv1*icov_dot_Qd_2[dim1];
+            *R22sum += deriv2*icov_dot_Qd_2[dim1];
+        }
+    }
+
+    *R11sum *= prob;
+    *R12sum *= prob;
+    *R22sum *= prob;
+
+}
+
+/* Returns an integer in the range [0, n).
+ *
+ * Uses rand(), and so is affected-by/affects the same seed.
+ */
+
+/*
+static int randint(int n) {
+  if ((n - 1) == RAND_MAX) {
+    return rand();
+  } else {
+    // Chop off all of the values that would cause skew...
+    long end = RAND_MAX / n; // truncate skew
+    assert (end > 0L);
+    end *= n;
+
+    // ... and ignore results from rand() that fall above that limit.
+    // (Worst case the loop condition should succeed 50% of the time,
+    // so we can expect to bail out of this loop pretty quickly.)
+    int r;
+    while ((r = rand()) >= end);
+
+    return r % n;
+  }
+}
+*/
+
+/*
+   the templates and the quantities derived from them, as used in the
+   pqr loops.  Qderiv and Rderiv are used for the derivative version,
+   the sheared M1,M2,T for the full version, in the order
+   p0, m0, 0p, 0m, pp, mm
+
+   If rows is not NULL, template i is row rows[i] of the templates and
+   derivatives, with the center replaced by cens[i]
+*/
+struct pqr_templates {
+    PyObject *templates;
+    PyObject *rows;
+    PyObject *cens;
+    PyObject *Qderiv;
+    PyObject *Rderiv;
+    PyObject *sheared[6];
+    double h;
+};
+
+/*
+   None for the rows and cens means the templates are used as is
+*/
+static void pqr_templates_set_rows(struct pqr_templates *tset,
+                                   PyObject *rows_obj,
+                                   PyObject *cens_obj)
+{
+    if (rows_obj == Py_None) {
+        tset->rows=NULL;
+        tset->cens=NULL;
+    } else {
+        tset->rows=rows_obj;
+        tset->cens=cens_obj;
+    }
+}
+
+static npy_intp pqr_templates_get_npoints(const struct pqr_templates *tset)
+{
+    if (tset->rows == NULL) {
+        return PyArray_DIM(tset->templates,0);
+    } else {
+        return PyArray_SIZE(tset->rows);
+    }
+}
+
+static inline npy_intp pqr_templates_get_row(const struct pqr_templates *tset,
+                                             npy_intp i)
+{
+    if (tset->rows == NULL) {
+        return i;
+    } else {
+        return (npy_intp) *(npy_int64 *) PyArray_GETPTR1(tset->rows, i);
+    }
+}
+
+static inline double pqr_templates_get_value(const struct pqr_templates *tset,
+                                             npy_intp i,
+                                             npy_intp dim)
+{
+    if (tset->rows != NULL && dim < 2) {
+        return *(double *) PyArray_GETPTR2(tset->cens, i, dim);
+    } else {
+        return *(double *) PyArray_GETPTR2(tset->templates,
+                                           pqr_templates_get_row(tset, i),
+                                           dim);
+    }
+}
+
+/*
+   mean - template_pars for template i, stored in row
+*/
+static void pqr_templates_get_xdiff(const struct pqr_templates *tset,
+                                    const double *mean,
+                                    npy_intp i,
+                                    npy_intp row,
+                                    double *xdiff,
+                                    npy_intp ndim)
+{
+    get_mom_xdiff(mean,tset->templates,row,xdiff,ndim);
+
+    if (tset->cens != NULL) {
+        xdiff[0] = mean[0] - *(double *) PyArray_GETPTR2(tset->cens, i, 0);
+        xdiff[1] = mean[1] - *(double *) PyArray_GETPTR2(tset->cens, i, 1);
+    }
+}
+
+/*
+   The templates can be restricted to a list of candidates, sorted in
+   increasing order, outside of which the templates are known to be
+   beyond nsigma.  The results are then the same as looping over all
+   templates, as long as the check for stopping early is done for the
+   templates that are skipped.  Since neff does not change for those,
+   it is enough to check at the template before each candidate, i-1
+
+   send index=NULL to use all templates
+
+   The sums are accumulated locally and no python objects are created,
+   so these can be run without the GIL, from multiple threads
+
+   P gets the sum, Q[2], R[4] the 2x2 matrix in row-major order
+
+   returns the number of templates used
+*/
+static long pqr_templates_sums(const struct pqr_templates *tset,
+                               const double *mean,
+                               const double *icovar,
+                               npy_intp ndim,
+                               double norm,
+                               double nsigma2,
+                               long nmin,
+                               double neff_max,
+                               const npy_int64 *index,
+                               npy_intp nindex,
+                               double *P,
+                               double *Q,
+                               double *R,
+                               double *neff_out)
+{
+    double xdiff[PYGMIX_MAXDIMS]={0};
+    double icov_dot_Qd_1[PYGMIX_MAXDIMS]={0};
+    double icov_dot_Qd_2[PYGMIX_MAXDIMS]={0};
+
+    double chi2=0, prob=0;
+    npy_intp npoints=0, nloop=0, i=0, ii=0, row=0;
+    double Psum=0, Q1=0, Q2=0, R11=0, R12=0, R22=0;
+    double Q1sum=0, Q2sum=0;
+    double R11sum=0, R12sum=0, R22sum=0;
+
+    double Pmax=0, neff=0;
+
+    long nuse=0;
+
+    npoints = pqr_templates_get_npoints(tset);
+
+    if (index == NULL) {
+        nloop=npoints;
+    } else {
+        nloop=nindex;
+        // the value the full loop would have had before the first
+        // template used, 0/0
+        if (npoints > 0) {
+            neff = Psum/Pmax;
+        }
+    }
+
+    for (ii=0; ii<nloop; ii++) {
+        
+        // randomizing seriously messes up the cache locality
+        // but if we are stopping early for neff cut it is probably ok
+        //
+        // check a random template, since we might bail early
+        // if our neff. check is met
+        //i=randint(npoints);
+        if (index == NULL) {
+            i=ii;
+        } else {
+            i=(npy_intp) index[ii];
+            if ((i-1) > nmin && neff > neff_max) {
+                break;
+            }
+        }
+        row=pqr_templates_get_row(tset, i);
+        pqr_templates_get_xdiff(tset,mean,i,row,xdiff,ndim);
+
+        chi2=get_mom_chi2(icovar, xdiff, ndim);
+
+        if (chi2 < nsigma2) {
+            nuse += 1;
+            prob = norm*exp(-0.5*chi2);
+
+            if (prob > Pmax) {
+                Pmax=prob;
+            }
+
+            Psum += prob;
+
+            get_mom_Qsums(icovar,
+                          tset->Qderiv,
+                          xdiff,
+                          ndim,
+                          prob,
+                          row,
+                          icov_dot_Qd_1,
+                          icov_dot_Qd_2,
+                          &Q1sum,&Q2sum);
+
+            Q1 += Q1sum;
+            Q2 += Q2sum;
+
+            get_mom_Rsums(icovar,
+                          tset->Qderiv,
+                          tset->Rderiv,
+                          xdiff,
+                          ndim,
+                          icov_dot_Qd_1,
+                          icov_dot_Qd_2,
+                          prob,
+                          row,
+                          &R11sum,&R12sum,&R22sum);
+
+            R11 += R11sum;
+            R12 += R12sum;
+            R22 += R22sum;
+        }
+
+        neff = Psum/Pmax;
+        if ( (i > nmin) && (neff > neff_max) ) {
+            break;
+        }
+    }
+
+    *P = Psum;
+    Q[0] = Q1;
+    Q[1] = Q2;
+    R[0] = R11;
+    R[1] = R12;
+    R[2] = R12;
+    R[3] = R22;
+
+    *neff_out = neff;
+    return nuse;
+}
+
+static 
+PyObject * PyGMix_mvn_calc_pqr_templates(PyObject* self, PyObject* args) {
+
+    PyObject* mean_obj=NULL;
+    PyObject *icovar_obj=NULL, *ierror_obj=NULL;
+    double nsigma=0, norm=0;
+    int nmin=0, seed=0;
+    double neff_max=0;
+    PyObject *rows_obj=NULL, *cens_obj=NULL, *index_obj=NULL;
+    PyObject *P_obj=NULL, *Q_obj=NULL, *R_obj=NULL;
+
+    struct pqr_templates tset={0};
+    const npy_int64 *index=NULL;
+    npy_intp nindex=0;
+
+    double P=0, Q[2]={0}, R[4]={0};
+    double neff=0;
+
+    long nuse=0;
+
+    // weight object is currently ignored
+    if (!PyArg_ParseTuple(args, (char*)"OOOddidOOOOOOiOOO", 
+                          &mean_obj,
+                          &icovar_obj,
+                          &ierror_obj,
+                          &norm,
+                          &nsigma,
+                          &nmin,  // always sample from at least this many
+                          &neff_max,  // stop if neff > this number
+                          &tset.templates,
+                          &rows_obj, // template rows, or None
+                          &cens_obj, // centers for the rows
+                          &tset.Qderiv,
+                          &tset.Rderiv,
+                          &index_obj, // candidate templates, or None for all
+                          &seed,
+                          &P_obj,
+                          &Q_obj,
+                          &R_obj)) {
+        return NULL;
+    }
+
+    if (seed > 0) {
+        srand(seed);
+    }
+
+    pqr_templates_set_rows(&tset, rows_obj, cens_obj);
+
+    if (index_obj != Py_None) {
+        index=PyArray_DATA(index_obj);
+        nindex=PyArray_SIZE(index_obj);
+    }
+
+    nuse=pqr_templates_sums(&tset,
+                            PyArray_DATA(mean_obj),
+                            PyArray_DATA(icovar_obj),
+                            PyArray_SIZE(mean_obj),
+                            norm,
+                            nsigma*nsigma,
+                            nmin,
+                            neff_max,
+                            index,
+                            nindex,
+                            &P, Q, R,
+                            &neff);
+
+    *(double *)PyArray_GETPTR1(P_obj,0) += P;
+
+    *(double *)PyArray_GETPTR1(Q_obj,0) += Q[0];
+    *(double *)PyArray_GETPTR1(Q_obj,1) += Q[1];
+
+    *(double *)PyArray_GETPTR2(R_obj,0,0) += R[0];
+    *(double *)PyArray_GETPTR2(R_obj,0,1) += R[1];
+    *(double *)PyArray_GETPTR2(R_obj,1,1) += R[3];
+    *(double *)PyArray_GETPTR2(R_obj,1,0) = *(double *)PyArray_GETPTR2(R_obj,0,1);
+
+    return Py_BuildValue("ld", nuse, neff);
+}
+
+/*
+static int get_pvals(const PyObject* mean_obj,
+                     const PyObject* icovar_obj,
+                     const PyObject* templates_obj,
+                     const PyObject* sheared_p0,
+                     const PyObject* sheared_m0,
+                     const PyObject* sheared_0p,
+                     const PyObject* sheared_0m,
+                     const PyObject* sheared_pp,
+                     const PyObject* sheared_mm,
+                     double norm,
+                     double *xdiff,
+                     npy_intp ndim,
+                     npy_intp i,
+                     double nsigma2,
+                     double *prob,
+                     double *P,
+                     double *P_p0,
+                     double *P_m0,
+                     double *P_0p,
+                     double *P_0m,
+                     double *P_pp,
+                     double *P_mm)
+{
+
+    int used=0;
+    double chi2=0;
+    double tP, tP_p0, tP_m0, tP_0p, tP_0m, tP_pp, tP_mm;
+
+    get_mom_xdiff(mean_obj,templates_obj,i,xdiff,ndim);
+
+    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+
+    if (chi2 > nsigma2) {
+        goto _bail;
+    }
+
+    tP = norm*exp(-0.5*chi2);
+    *prob = tP;
+
+    // update the pars that respond to shear
+
+    get_mom_xdiff_sheared(mean_obj,sheared_p0,i,xdiff);
+    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+    if (chi2 > nsigma2 || !isfinite(chi2)) {
+        goto _bail;
+    }
+    tP_p0 = norm*exp(-0.5*chi2);
+
+    get_mom_xdiff_sheared(mean_obj,sheared_m0,i,xdiff);
+    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+    if (chi2 > nsigma2 || !isfinite(chi2)) {
+        goto _bail;
+    }
+    tP_m0 = norm*exp(-0.5*chi2);
+
+    get_mom_xdiff_sheared(mean_obj,sheared_0p,i,xdiff);
+    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+    if (chi2 > nsigma2 || !isfinite(chi2)) {
+        goto _bail;
+    }
+    tP_0p = norm*exp(-0.5*chi2);
+
+    get_mom_xdiff_sheared(mean_obj,sheared_0m,i,xdiff);
+    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+    if (chi2 > nsigma2 || !isfinite(chi2)) {
+        goto _bail;
+    }
+    tP_0m = norm*exp(-0.5*chi2);
 
+    get_mom_xdiff_sheared(mean_obj,sheared_pp,i,xdiff);
+    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+    if (chi2 > nsigma2 || !isfinite(chi2)) {
+        goto _bail;
     }
+    tP_pp = norm*exp(-0.5*chi2);
 
-    Py_RETURN_NONE;
-}
+    get_mom_xdiff_sheared(mean_obj,sheared_mm,i,xdiff);
+    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+    if (chi2 > nsigma2 || !isfinite(chi2)) {
+        goto _bail;
+    }
+    tP_mm = norm*exp(-0.5*chi2);
 
-static void get_mom_Qsums(const PyObject* icovar,
-                          const PyObject* Qderiv,
-                          const double *xdiff,
-                          npy_intp ndim,
-                          double prob,
-                          npy_intp i,
-                          double *icov_dot_Qd_1, // [PYGMIX_MAXDIMS]
-                          double *icov_dot_Qd_2, // [PYGMIX_MAXDIMS]
-                          double *Q1sum,
-                          double *Q2sum) {
+    *P += tP;
+    *P_p0 += tP_p0;
+    *P_m0 += tP_m0;
+    *P_0p += tP_0p;
+    *P_0m += tP_0m;
+    *P_pp += tP_pp;
+    *P_mm += tP_mm;
 
-    npy_intp dim1=1,dim2=0;
-    double icov=0, deriv1=0, deriv2=0;
+    used = 1;
 
-    *Q1sum=0;
-    *Q2sum=0;
+_bail:
+    return used;
+ 
+}
+*/             
 
-    memset(icov_dot_Qd_1, 0, ndim*sizeof(double));
-    memset(icov_dot_Qd_2, 0, ndim*sizeof(double));
+/*
+   the full version of pqr_templates_sums, using the sheared templates
 
-    // Q1temp3 = Cinv dot derivatives
-    for (dim1=0; dim1<ndim; dim1++) {
+   the derivatives are taken numerically from the sums of the likelihood
+   for the templates sheared by +/- h
+*/
+static long pqr_templates_full_sums(const struct pqr_templates *tset,
+                                    const double *mean,
+                                    const double *icovar,
+                                    npy_intp ndim,
+                                    double norm,
+                                    double nsigma2,
+                                    long nmin,
+                                    double neff_max,
+                                    const npy_int64 *index,
+                                    npy_intp nindex,
+                                    double *Pout,
+                                    double *Q,
+                                    double *R,
+                                    double *neff_out)
+{
+    double xdiff[PYGMIX_MAXDIMS]={0};
 
-        for (dim2=0; dim2<ndim; dim2++) {
+    double h2inv=0, hsqinv=0;
+    double chi2=0;
+    double prob=0;
+    double P=0,
+           P_p0=0, P_m0=0,
+           P_0p=0, P_0m=0,
+           P_pp=0, P_mm=0;
+    npy_intp npoints=0, nloop=0, i=0, ii=0, row=0;
+    double Pmax=0, neff=0;
 
-            if (dim2 >= 2 && dim2 <= 4) {
-                // derivatives non-zero for these dimensions
-                icov=*(double *) PyArray_GETPTR2(icovar, dim1, dim2);
+    long nuse=0;
 
-                deriv1 = *(double *)PyArray_GETPTR3(Qderiv, i, dim2-PYGMIX_DOFFSET, 0);
-                deriv2 = *(double *)PyArray_GETPTR3(Qderiv, i, dim2-PYGMIX_DOFFSET, 1);
+    h2inv=1.0/(2.0*tset->h);
+    hsqinv=1.0/(tset->h*tset->h);
 
-                icov_dot_Qd_1[dim1] += deriv1*icov;
-                icov_dot_Qd_2[dim1] += deriv2*icov;
-            }
-        } 
-    }
-    // xdiff dot Q1temp3
-    for (dim1=0; dim1<ndim; dim1++) {
-        *Q1sum += xdiff[dim1]*icov_dot_Qd_1[dim1];
-        *Q2sum += xdiff[dim1]*icov_dot_Qd_2[dim1];
+    npoints = pqr_templates_get_npoints(tset);
+
+    if (index == NULL) {
+        nloop=npoints;
+    } else {
+        nloop=nindex;
+        if (npoints > 0) {
+            neff = P/Pmax;
+        }
     }
 
-    *Q1sum *= prob;
-    *Q2sum *= prob;
+    for (ii=0; ii<nloop; ii++) {
+        // check a random template, since we might bail early
+        // if our neff. check is met
+        //i=randint(npoints);
+        if (index == NULL) {
+            i=ii;
+        } else {
+            i=(npy_intp) index[ii];
+            if ((i-1) > nmin && neff > neff_max) {
+                break;
+            }
+        }
 
-}
+        row=pqr_templates_get_row(tset, i);
+        pqr_templates_get_xdiff(tset,mean,i,row,xdiff,ndim);
 
-/*
-   currently only implements the d^2L/d^2M terms
-*/
-static void get_mom_Rsums(const PyObject* icovar,
-                          const PyObject* Qderiv,
-                          const PyObject* Rderiv,
-                          const double *xdiff,
-                          npy_intp ndim,
-                          const double *icov_dot_Qd_1,
-                          const double *icov_dot_Qd_2,
-                          double prob,
-                          npy_intp i,
-                          double *R11sum,
-                          double *R12sum,
-                          double *R22sum) {
+        chi2=get_mom_chi2(icovar, xdiff, ndim);
 
-    double R11temp3[PYGMIX_MAXDIMS]={0};
-    double R12temp3[PYGMIX_MAXDIMS]={0};
-    double R22temp3[PYGMIX_MAXDIMS]={0};
-    npy_intp dim1=1,dim2=0;
-    double icov=0,
-           deriv1=0, deriv2=0,
-           deriv11=0, deriv12=0,deriv22;
+        if (chi2 < nsigma2 && isfinite(chi2)) {
+            nuse += 1;
+            prob = norm*exp(-0.5*chi2);
 
-    *R11sum=0;
-    *R12sum=0;
-    *R22sum=0;
+            if (prob > Pmax) {
+                Pmax=prob;
+            }
 
-    // R11temp3 = Cinv dot derivatives
-    for (dim1=0; dim1<ndim; dim1++) {
+            P += prob;
 
-        for (dim2=0; dim2<3; dim2++) {
+            // These calls only update the parameters that respond to shear
 
-            if (dim2 >= 2 && dim2 <= 4) {
-                // derivatives are only non-zero for a subset of the dimensions
+            get_mom_xdiff_sheared(mean,tset->sheared[0],row,xdiff);
+            chi2=get_mom_chi2(icovar, xdiff, ndim);
+            P_p0 += norm*exp(-0.5*chi2);
 
-                icov=*(double *) PyArray_GETPTR2(icovar, dim1, dim2);
+            get_mom_xdiff_sheared(mean,tset->sheared[1],row,xdiff);
+            chi2=get_mom_chi2(icovar, xdiff, ndim);
+            P_m0 += norm*exp(-0.5*chi2);
 
-                deriv11 = *(double *)PyArray_GETPTR4(Rderiv, i, dim2-PYGMIX_DOFFSET, 0, 0);
-                deriv12 = *(double *)PyArray_GETPTR4(Rderiv, i, dim2-PYGMIX_DOFFSET, 0, 1);
-                deriv22 = *(double *)PyArray_GETPTR4(Rderiv, i, dim2-PYGMIX_DOFFSET, 1, 1);
+            get_mom_xdiff_sheared(mean,tset->sheared[2],row,xdiff);
+            chi2=get_mom_chi2(icovar, xdiff, ndim);
+            P_0p += norm*exp(-0.5*chi2);
 
-                R11temp3[dim1] += icov*deriv11;
-                R12temp3[dim1] += icov*deriv12;
-                R22temp3[dim1] += icov*deriv22;
-            }
-        } 
-    }
-    for (dim1=0; dim1<ndim; dim1++) {
+            get_mom_xdiff_sheared(mean,tset->sheared[3],row,xdiff);
+            chi2=get_mom_chi2(icovar, xdiff, ndim);
+            P_0m += norm*exp(-0.5*chi2);
 
-        // xdiff dot R11temp3
-        *R11sum += xdiff[dim1]*R11temp3[dim1];
-        *R12sum += xdiff[dim1]*R12temp3[dim1];
-        *R22sum += xdiff[dim1]*R22temp3[dim1];
+            get_mom_xdiff_sheared(mean,tset->sheared[4],row,xdiff);
+            chi2=get_mom_chi2(icovar, xdiff, ndim);
+            P_pp += norm*exp(-0.5*chi2);
 
-        // Qderiv dot icov_dot_Qd
-        if (dim1 >= 2 && dim1 <= 4) {
-            // derivatives non-zero for these dimensions
-            deriv1 = *(double *)PyArray_GETPTR3(Qderiv, i, dim1-PYGMIX_DOFFSET, 0);
-            deriv2 = *(double *)PyArray_GETPTR3(Qderiv, i, dim1-PYGMIX_DOFFSET, 1);
+            get_mom_xdiff_sheared(mean,tset->sheared[5],row,xdiff);
+            chi2=get_mom_chi2(icovar, xdiff, ndim);
+            P_mm += norm*exp(-0.5*chi2);
 
-            *R11sum += deriv1*icov_dot_Qd_1[dim1];
-            *R12sum += deriv1*icov_dot_Qd_2[dim1];
-            *R22sum += deriv2*icov_dot_Qd_2[dim1];
         }
-    }
 
-    *R11sum *= prob;
-    *R12sum *= prob;
-    *R22sum *= prob;
+        // P is sum(prob)
+        neff = P/Pmax;
+        if ( (i > nmin) && (neff > neff_max) ) {
+            break;
+        }
+    }
 
-}
+    *Pout=P;
 
-/* Returns an integer in the range [0, n).
- *
- * Uses rand(), and so is affected-by/affects the same seed.
- */
+    Q[0] = (P_p0 - P_m0)*h2inv;
+    Q[1] = (P_0p - P_0m)*h2inv;
 
-/*
-static int randint(int n) {
-  if ((n - 1) == RAND_MAX) {
-    return rand();
-  } else {
-    // Chop off all of the values that would cause skew...
-    long end = RAND_MAX / n; // truncate skew
-    assert (end > 0L);
-    end *= n;
+    R[0] = (P_p0 - 2*P + P_m0)*hsqinv;
+    R[1] = (P_pp - P_p0 - P_0p + 2*P - P_m0 - P_0m + P_mm)*hsqinv*0.5;
+    R[3] = (P_0p - 2*P + P_0m)*hsqinv;
 
-    // ... and ignore results from rand() that fall above that limit.
-    // (Worst case the loop condition should succeed 50% of the time,
-    // so we can expect to bail out of this loop pretty quickly.)
-    int r;
-    while ((r = rand()) >= end);
+    R[2] = R[1];
 
-    return r % n;
-  }
+    *neff_out = neff;
+    return nuse;
 }
-*/
 
 static 
-PyObject * PyGMix_mvn_calc_pqr_templates(PyObject* self, PyObject* args) {
+PyObject * PyGMix_mvn_calc_pqr_templates_full(PyObject* self, PyObject* args) {
 
     PyObject* mean_obj=NULL;
-    PyObject *icovar_obj=NULL, *ierror_obj=NULL;
-    double nsigma=0, nsigma2=0, norm=0;
+    PyObject *icovar_obj=NULL;
+    double nsigma=0, norm=0;
     int nmin=0, seed=0;
     double neff_max=0;
-    PyObject *Qderiv_obj=NULL, *Rderiv_obj=NULL;
-    PyObject *templates_obj=NULL;
-    PyObject *P_obj=NULL, *Q_obj=NULL, *R_obj=NULL;
-
-    double *Pptr=NULL,
-           *Q1ptr=NULL, *Q2ptr=NULL,
-           *R11ptr=NULL,*R12ptr=NULL,
-           *R21ptr=NULL,*R22ptr=NULL;
 
-    double xdiff[PYGMIX_MAXDIMS]={0};
-    double icov_dot_Qd_1[PYGMIX_MAXDIMS]={0};
-    double icov_dot_Qd_2[PYGMIX_MAXDIMS]={0};
+    PyObject *rows_obj=NULL, *cens_obj=NULL, *index_obj=NULL;
+    PyObject *P_obj=NULL, *Q_obj=NULL, *R_obj=NULL;
 
-    double chi2=0, prob=0;
-    npy_intp ndim=0, npoints=0, i=0, ii=0;
-    double Q1sum=0, Q2sum=0;
-    double R11sum=0, R12sum=0, R22sum=0;
+    struct pqr_templates tset={0};
+    const npy_int64 *index=NULL;
+    npy_intp nindex=0;
 
-    double Pmax=0, neff=0;
+    double P=0, Q[2]={0}, R[4]={0};
+    double neff=0;
 
     long nuse=0;
 
     // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OOOddidOOOiOOO", 
+    if (!PyArg_ParseTuple(args, (char*)"OOddidOOOOOOOOOOdiOOO", 
                           &mean_obj,
                           &icovar_obj,
-                          &ierror_obj,
                           &norm,
                           &nsigma,
                           &nmin,  // always sample from at least this many
                           &neff_max,  // stop if neff > this number
-                          &templates_obj,
-                          &Qderiv_obj,
-                          &Rderiv_obj,
+                          &tset.templates,
+                          &rows_obj, // template rows, or None
+                          &cens_obj, // centers for the rows
+                          &tset.sheared[0],
+                          &tset.sheared[1],
+                          &tset.sheared[2],
+                          &tset.sheared[3],
+                          &tset.sheared[4],
+                          &tset.sheared[5],
+                          &index_obj, // candidate templates, or None for all
+                          &tset.h,
                           &seed,
                           &P_obj,
                           &Q_obj,
@@ -3521,347 +5081,705 @@ PyObject * PyGMix_mvn_calc_pqr_templates(PyObject* self, PyObject* args) {
         srand(seed);
     }
 
-    nsigma2=nsigma*nsigma;
- 
-    ndim=PyArray_SIZE(mean_obj);
-    npoints = PyArray_DIM(templates_obj,0);
+    pqr_templates_set_rows(&tset, rows_obj, cens_obj);
 
-    Pptr=PyArray_GETPTR1(P_obj,0);
+    if (index_obj != Py_None) {
+        index=PyArray_DATA(index_obj);
+        nindex=PyArray_SIZE(index_obj);
+    }
 
-    Q1ptr=PyArray_GETPTR1(Q_obj,0);
-    Q2ptr=PyArray_GETPTR1(Q_obj,1);
+    nuse=pqr_templates_full_sums(&tset,
+                                 PyArray_DATA(mean_obj),
+                                 PyArray_DATA(icovar_obj),
+                                 PyArray_SIZE(mean_obj),
+                                 norm,
+                                 nsigma*nsigma,
+                                 nmin,
+                                 neff_max,
+                                 index,
+                                 nindex,
+                                 &P, Q, R,
+                                 &neff);
 
-    R11ptr=PyArray_GETPTR2(R_obj,0,0);
-    R12ptr=PyArray_GETPTR2(R_obj,0,1);
-    R21ptr=PyArray_GETPTR2(R_obj,1,0);
-    R22ptr=PyArray_GETPTR2(R_obj,1,1);
+    *(double *)PyArray_GETPTR1(P_obj,0) = P;
 
-    for (ii=0; ii<npoints; ii++) {
-        
-        // randomizing seriously messes up the cache locality
-        // but if we are stopping early for neff cut it is probably ok
-        //
-        // check a random template, since we might bail early
-        // if our neff. check is met
-        //i=randint(npoints);
-        i=ii;
-        get_mom_xdiff(mean_obj,templates_obj,i,xdiff,ndim);
+    *(double *)PyArray_GETPTR1(Q_obj,0) = Q[0];
+    *(double *)PyArray_GETPTR1(Q_obj,1) = Q[1];
 
-        chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+    *(double *)PyArray_GETPTR2(R_obj,0,0) = R[0];
+    *(double *)PyArray_GETPTR2(R_obj,0,1) = R[1];
+    *(double *)PyArray_GETPTR2(R_obj,1,0) = R[2];
+    *(double *)PyArray_GETPTR2(R_obj,1,1) = R[3];
 
-        if (chi2 < nsigma2) {
-            nuse += 1;
-            prob = norm*exp(-0.5*chi2);
+    return Py_BuildValue("ld", nuse, neff);
+}
 
-            if (prob > Pmax) {
-                Pmax=prob;
-            }
+/*
+   the TemplateIndex grid, see moments.py.  The templates are sorted by
+   cell in order; the templates in cell c are order[starts[c]:starts[c+1]]
+*/
+struct pqr_grid {
+    npy_intp nidx;
+    const npy_int64 *dims;
+    const double *lows;
+    const double *highs;
+    const double *binv;
+    npy_intp nbin;
+    npy_intp ncell;
+    const npy_int64 *order;
+    const npy_int64 *starts;
+    double maxfrac;
+};
 
-            *Pptr += prob;
+static npy_intp pqr_grid_get_bin(const struct pqr_grid *grid,
+                                 npy_intp i,
+                                 double val)
+{
+    double fbin = floor( (val-grid->lows[i])*grid->binv[i] );
 
-            get_mom_Qsums(icovar_obj,
-                          Qderiv_obj,
-                          xdiff,
-                          ndim,
-                          prob,
-                          i,
-                          icov_dot_Qd_1,
-                          icov_dot_Qd_2,
-                          &Q1sum,&Q2sum);
+    if (fbin < 0) {
+        return 0;
+    } else if (fbin > grid->nbin-1) {
+        return grid->nbin-1;
+    } else {
+        return (npy_intp) fbin;
+    }
+}
+
+static int pqr_compare_index(const void *a, const void *b)
+{
+    npy_int64 ia = *(const npy_int64 *)a;
+    npy_int64 ib = *(const npy_int64 *)b;
+    return (ia > ib) - (ia < ib);
+}
+
+/*
+   the same as TemplateIndex.get_candidates
+
+   returns 1 if all templates should be used, in which case index is set
+   to NULL.  Otherwise returns 0 and index gets an array of nindex sorted
+   template indices, allocated with malloc, or NULL if nindex is zero.
+
+   returns -1 if memory could not be allocated
+*/
+static int pqr_grid_get_candidates(const struct pqr_grid *grid,
+                                   const struct pqr_templates *tset,
+                                   const double *lows,
+                                   const double *highs,
+                                   npy_int64 **index,
+                                   npy_intp *nindex)
+{
+    npy_intp b0[PYGMIX_MAXDIMS]={0}, b1[PYGMIX_MAXDIMS]={0};
+    npy_intp bins[PYGMIX_MAXDIMS]={0};
+    npy_intp i=0, ntot=0, cellid=0, k=0, ind=0, dim=0;
+    double ncell_box=1, val=0;
+    int keep=0;
+
+    *index=NULL;
+    *nindex=0;
+
+    for (i=0; i<grid->nidx; i++) {
+        if (!isfinite(lows[i]) || !isfinite(highs[i])) {
+            return 1;
+        }
+        if (highs[i] < grid->lows[i] || lows[i] > grid->highs[i]) {
+            return 0;
+        }
 
-            *Q1ptr += Q1sum;
-            *Q2ptr += Q2sum;
+        b0[i]=pqr_grid_get_bin(grid, i, lows[i]);
+        b1[i]=pqr_grid_get_bin(grid, i, highs[i]);
+        ncell_box *= (b1[i]-b0[i]+1);
+    }
+
+    if (ncell_box > grid->maxfrac*grid->ncell) {
+        return 1;
+    }
+
+    // first count the templates in the cells, looping over the cells
+    // like an odometer, with the last dimension changing fastest
+    for (k=0; k<2; k++) {
+
+        for (i=0; i<grid->nidx; i++) {
+            bins[i]=b0[i];
+        }
+
+        while (1) {
+            cellid=0;
+            for (i=0; i<grid->nidx; i++) {
+                cellid = cellid*grid->nbin + bins[i];
+            }
 
-            get_mom_Rsums(icovar_obj,
-                          Qderiv_obj,
-                          Rderiv_obj,
-                          xdiff,
-                          ndim,
-                          icov_dot_Qd_1,
-                          icov_dot_Qd_2,
-                          prob,
-                          i,
-                          &R11sum,&R12sum,&R22sum);
+            if (k==0) {
+                ntot += grid->starts[cellid+1]-grid->starts[cellid];
+            } else {
+                // exact cut on the box
+                for (ind=grid->starts[cellid]; ind<grid->starts[cellid+1]; ind++) {
+                    npy_int64 tind=grid->order[ind];
+
+                    keep=1;
+                    for (i=0; i<grid->nidx; i++) {
+                        dim=grid->dims[i];
+                        val=pqr_templates_get_value(tset, tind, dim);
+                        if (!(val >= lows[i] && val <= highs[i])) {
+                            keep=0;
+                            break;
+                        }
+                    }
+                    if (keep) {
+                        (*index)[*nindex] = tind;
+                        *nindex += 1;
+                    }
+                }
+            }
 
-            *R11ptr += R11sum;
-            *R12ptr += R12sum;
-            *R22ptr += R22sum;
+            for (i=grid->nidx-1; i>=0; i--) {
+                bins[i] += 1;
+                if (bins[i] <= b1[i]) {
+                    break;
+                }
+                bins[i] = b0[i];
+            }
+            if (i < 0) {
+                break;
+            }
         }
 
-        neff = *Pptr/Pmax;
-        if ( (i > nmin) && (neff > neff_max) ) {
-            break;
+        if (k==0) {
+            if (ntot == 0) {
+                return 0;
+            } else if (ntot > grid->maxfrac*pqr_templates_get_npoints(tset)) {
+                return 1;
+            }
+
+            *index=malloc(ntot*sizeof(npy_int64));
+            if (*index==NULL) {
+                return -1;
+            }
         }
     }
-    *R21ptr = *R12ptr;
-
-    /*
-    *Q1ptr *= -1;
-    *Q2ptr *= -1;
-    *R11ptr *= -1;
-    *R12ptr *= -1;
-    *R21ptr *= -1;
-    *R22ptr *= -1;
-    */
 
+    if (*nindex == 0) {
+        free(*index);
+        *index=NULL;
+    } else {
+        qsort(*index, *nindex, sizeof(npy_int64), pqr_compare_index);
+    }
 
-    //Py_RETURN_NONE;
-    return Py_BuildValue("ld", nuse, neff);
+    return 0;
 }
 
 /*
-static int get_pvals(const PyObject* mean_obj,
-                     const PyObject* icovar_obj,
-                     const PyObject* templates_obj,
-                     const PyObject* sheared_p0,
-                     const PyObject* sheared_m0,
-                     const PyObject* sheared_0p,
-                     const PyObject* sheared_0m,
-                     const PyObject* sheared_pp,
-                     const PyObject* sheared_mm,
-                     double norm,
-                     double *xdiff,
-                     npy_intp ndim,
-                     npy_intp i,
-                     double nsigma2,
-                     double *prob,
-                     double *P,
-                     double *P_p0,
-                     double *P_m0,
-                     double *P_0p,
-                     double *P_0m,
-                     double *P_pp,
-                     double *P_mm)
-{
+   loop over objects, running the pqr sums for each
 
-    int used=0;
-    double chi2=0;
-    double tP, tP_p0, tP_m0, tP_0p, tP_0m, tP_pp, tP_mm;
+   the inputs and outputs are contiguous arrays,
+       means[nobj,ndim], icovars[nobj,ndim,ndim], norms[nobj]
+       P[nobj], Q[nobj,2], R[nobj,2,2], nuse[nobj], neff[nobj]
 
-    get_mom_xdiff(mean_obj,templates_obj,i,xdiff,ndim);
+   If grid is not NULL, the templates for each object are restricted to
+   the candidates in the box boxes[nobj,2,nidx], lows then highs.
 
-    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+   The GIL is released, so no python objects may be created here.  The
+   templates are only read, so separate threads can each run a subset of
+   the objects
 
-    if (chi2 > nsigma2) {
-        goto _bail;
-    }
+   returns 0 on success, -1 if memory could not be allocated
+*/
+static int pqr_templates_batch(const struct pqr_templates *tset,
+                               int full,
+                               npy_intp nobj,
+                               npy_intp ndim,
+                               const double *means,
+                               const double *icovars,
+                               const double *norms,
+                               double nsigma2,
+                               long nmin,
+                               double neff_max,
+                               const struct pqr_grid *grid,
+                               const double *boxes,
+                               double *P,
+                               double *Q,
+                               double *R,
+                               npy_int64 *nuse,
+                               double *neff)
+{
+    npy_intp iobj=0;
+    int status=0;
 
-    tP = norm*exp(-0.5*chi2);
-    *prob = tP;
+    for (iobj=0; iobj<nobj; iobj++) {
+        npy_int64 *index=NULL;
+        npy_intp nindex=0;
+        int res=1;
+
+        if (grid != NULL) {
+            res=pqr_grid_get_candidates(grid,
+                                        tset,
+                                        boxes + iobj*2*grid->nidx,
+                                        boxes + iobj*2*grid->nidx + grid->nidx,
+                                        &index,
+                                        &nindex);
+            if (res < 0) {
+                status=-1;
+                continue;
+            }
+        }
 
-    // update the pars that respond to shear
+        if (res == 1) {
+            // use all templates
+            index=NULL;
+        }
 
-    get_mom_xdiff_sheared(mean_obj,sheared_p0,i,xdiff);
-    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-    if (chi2 > nsigma2 || !isfinite(chi2)) {
-        goto _bail;
-    }
-    tP_p0 = norm*exp(-0.5*chi2);
+        if (full) {
+            nuse[iobj]=pqr_templates_full_sums(tset,
+                                               means + iobj*ndim,
+                                               icovars + iobj*ndim*ndim,
+                                               ndim,
+                                               norms[iobj],
+                                               nsigma2,
+                                               nmin,
+                                               neff_max,
+                                               (res == 1) ? NULL : index,
+                                               nindex,
+                                               P + iobj,
+                                               Q + iobj*2,
+                                               R + iobj*4,
+                                               neff + iobj);
+        } else {
+            nuse[iobj]=pqr_templates_sums(tset,
+                                          means + iobj*ndim,
+                                          icovars + iobj*ndim*ndim,
+                                          ndim,
+                                          norms[iobj],
+                                          nsigma2,
+                                          nmin,
+                                          neff_max,
+                                          (res == 1) ? NULL : index,
+                                          nindex,
+                                          P + iobj,
+                                          Q + iobj*2,
+                                          R + iobj*4,
+                                          neff + iobj);
+        }
 
-    get_mom_xdiff_sheared(mean_obj,sheared_m0,i,xdiff);
-    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-    if (chi2 > nsigma2 || !isfinite(chi2)) {
-        goto _bail;
+        free(index);
     }
-    tP_m0 = norm*exp(-0.5*chi2);
 
-    get_mom_xdiff_sheared(mean_obj,sheared_0p,i,xdiff);
-    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-    if (chi2 > nsigma2 || !isfinite(chi2)) {
-        goto _bail;
-    }
-    tP_0p = norm*exp(-0.5*chi2);
+    return status;
+}
 
-    get_mom_xdiff_sheared(mean_obj,sheared_0m,i,xdiff);
-    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-    if (chi2 > nsigma2 || !isfinite(chi2)) {
-        goto _bail;
-    }
-    tP_0m = norm*exp(-0.5*chi2);
+/*
+   parse the grid tuple from TemplateIndex.get_grid_data(), or None
 
-    get_mom_xdiff_sheared(mean_obj,sheared_pp,i,xdiff);
-    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-    if (chi2 > nsigma2 || !isfinite(chi2)) {
-        goto _bail;
+   returns 1 if a grid was sent, 0 for None, -1 on error
+*/
+static int pqr_parse_grid(PyObject *grid_obj, struct pqr_grid *grid)
+{
+    PyObject *dims_obj=NULL, *lows_obj=NULL, *highs_obj=NULL,
+             *binv_obj=NULL, *order_obj=NULL, *starts_obj=NULL;
+
+    if (grid_obj == Py_None) {
+        return 0;
     }
-    tP_pp = norm*exp(-0.5*chi2);
 
-    get_mom_xdiff_sheared(mean_obj,sheared_mm,i,xdiff);
-    chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-    if (chi2 > nsigma2 || !isfinite(chi2)) {
-        goto _bail;
+    if (!PyArg_ParseTuple(grid_obj, (char*)"OOOOnOOd",
+                          &dims_obj,
+                          &lows_obj,
+                          &highs_obj,
+                          &binv_obj,
+                          &grid->nbin,
+                          &order_obj,
+                          &starts_obj,
+                          &grid->maxfrac)) {
+        return -1;
     }
-    tP_mm = norm*exp(-0.5*chi2);
 
-    *P += tP;
-    *P_p0 += tP_p0;
-    *P_m0 += tP_m0;
-    *P_0p += tP_0p;
-    *P_0m += tP_0m;
-    *P_pp += tP_pp;
-    *P_mm += tP_mm;
+    grid->nidx=PyArray_SIZE(dims_obj);
+    if (grid->nidx > PYGMIX_MAXDIMS) {
+        PyErr_Format(GMixFatalError, 
+                     "at most %d indexed dimensions, got %ld",
+                     PYGMIX_MAXDIMS, (long)grid->nidx);
+        return -1;
+    }
 
-    used = 1;
+    grid->dims=PyArray_DATA(dims_obj);
+    grid->lows=PyArray_DATA(lows_obj);
+    grid->highs=PyArray_DATA(highs_obj);
+    grid->binv=PyArray_DATA(binv_obj);
+    grid->order=PyArray_DATA(order_obj);
+    grid->starts=PyArray_DATA(starts_obj);
+    grid->ncell=PyArray_SIZE(starts_obj)-1;
 
-_bail:
-    return used;
- 
+    return 1;
 }
-*/             
 
+/*
+   run the pqr sums for many objects; see pqr_templates_batch
+*/
 static 
-PyObject * PyGMix_mvn_calc_pqr_templates_full(PyObject* self, PyObject* args) {
-
-    PyObject* mean_obj=NULL;
-    PyObject *icovar_obj=NULL;
-    double nsigma=0, nsigma2=0, norm=0;
-    int nmin=0, seed=0;
-    double h=0, h2inv=0, hsqinv=0;
-    double neff_max=0;
-    PyObject *sheared_p0=NULL,
-             *sheared_m0=NULL,
-             *sheared_0m=NULL,
-             *sheared_0p=NULL,
-             *sheared_pp=NULL,
-             *sheared_mm=NULL;
-
-    PyObject *templates_obj=NULL;
-    PyObject *P_obj=NULL, *Q_obj=NULL, *R_obj=NULL;
+PyObject * PyGMix_mvn_calc_pqr_templates_batch(PyObject* self, PyObject* args) {
+
+    PyObject *means_obj=NULL, *icovars_obj=NULL, *norms_obj=NULL;
+    double nsigma=0, neff_max=0;
+    int nmin=0;
+    PyObject *rows_obj=NULL, *cens_obj=NULL;
+    PyObject *grid_obj=NULL, *boxes_obj=NULL;
+    PyObject *P_obj=NULL, *Q_obj=NULL, *R_obj=NULL,
+             *nuse_obj=NULL, *neff_obj=NULL;
+
+    struct pqr_templates tset={0};
+    struct pqr_grid grid={0};
+    int have_grid=0, status=0;
+
+    if (!PyArg_ParseTuple(args, (char*)"OOOdidOOOOOOOOOOOO", 
+                          &means_obj,
+                          &icovars_obj,
+                          &norms_obj,
+                          &nsigma,
+                          &nmin,
+                          &neff_max,
+                          &tset.templates,
+                          &rows_obj, // template rows, or None
+                          &cens_obj, // centers for the rows
+                          &tset.Qderiv,
+                          &tset.Rderiv,
+                          &grid_obj, // TemplateIndex grid, or None
+                          &boxes_obj,
+                          &P_obj,
+                          &Q_obj,
+                          &R_obj,
+                          &nuse_obj,
+                          &neff_obj)) {
+        return NULL;
+    }
 
-    double *Pptr=NULL,
-           *Q1ptr=NULL, *Q2ptr=NULL,
-           *R11ptr=NULL,*R12ptr=NULL,
-           *R21ptr=NULL,*R22ptr=NULL;
+    pqr_templates_set_rows(&tset, rows_obj, cens_obj);
 
-    double xdiff[PYGMIX_MAXDIMS]={0};
+    have_grid=pqr_parse_grid(grid_obj, &grid);
+    if (have_grid < 0) {
+        return NULL;
+    }
 
-    double chi2=0;
-    double prob=0;
-    double P=0,
-           P_p0=0, P_m0=0,
-           P_0p=0, P_0m=0,
-           P_pp=0, P_mm=0;
-    npy_intp ndim=0, npoints=0, i=0, ii=0;
-    double Pmax=0, neff=0;
+    Py_BEGIN_ALLOW_THREADS
+    status=pqr_templates_batch(&tset,
+                               0,
+                               PyArray_DIM(means_obj,0),
+                               PyArray_DIM(means_obj,1),
+                               PyArray_DATA(means_obj),
+                               PyArray_DATA(icovars_obj),
+                               PyArray_DATA(norms_obj),
+                               nsigma*nsigma,
+                               nmin,
+                               neff_max,
+                               have_grid ? &grid : NULL,
+                               have_grid ? PyArray_DATA(boxes_obj) : NULL,
+                               PyArray_DATA(P_obj),
+                               PyArray_DATA(Q_obj),
+                               PyArray_DATA(R_obj),
+                               PyArray_DATA(nuse_obj),
+                               PyArray_DATA(neff_obj));
+    Py_END_ALLOW_THREADS
+
+    if (status != 0) {
+        return PyErr_NoMemory();
+    }
 
-    //int used=0;
-    long nuse=0;
+    Py_RETURN_NONE;
+}
 
-    // weight object is currently ignored
-    if (!PyArg_ParseTuple(args, (char*)"OOddidOOOOOOOdiOOO", 
-                          &mean_obj,
-                          &icovar_obj,
-                          &norm,
+/*
+   run the full pqr sums for many objects; see pqr_templates_batch
+*/
+static 
+PyObject * PyGMix_mvn_calc_pqr_templates_full_batch(PyObject* self, PyObject* args) {
+
+    PyObject *means_obj=NULL, *icovars_obj=NULL, *norms_obj=NULL;
+    double nsigma=0, neff_max=0;
+    int nmin=0;
+    PyObject *rows_obj=NULL, *cens_obj=NULL;
+    PyObject *grid_obj=NULL, *boxes_obj=NULL;
+    PyObject *P_obj=NULL, *Q_obj=NULL, *R_obj=NULL,
+             *nuse_obj=NULL, *neff_obj=NULL;
+
+    struct pqr_templates tset={0};
+    struct pqr_grid grid={0};
+    int have_grid=0, status=0;
+
+    if (!PyArg_ParseTuple(args, (char*)"OOOdidOOOOOOOOOOOdOOOOO", 
+                          &means_obj,
+                          &icovars_obj,
+                          &norms_obj,
                           &nsigma,
-                          &nmin,  // always sample from at least this many
-                          &neff_max,  // stop if neff > this number
-                          &templates_obj,
-                          &sheared_p0,
-                          &sheared_m0,
-                          &sheared_0p,
-                          &sheared_0m,
-                          &sheared_pp,
-                          &sheared_mm,
-                          &h,
-                          &seed,
+                          &nmin,
+                          &neff_max,
+                          &tset.templates,
+                          &rows_obj, // template rows, or None
+                          &cens_obj, // centers for the rows
+                          &tset.sheared[0],
+                          &tset.sheared[1],
+                          &tset.sheared[2],
+                          &tset.sheared[3],
+                          &tset.sheared[4],
+                          &tset.sheared[5],
+                          &grid_obj, // TemplateIndex grid, or None
+                          &boxes_obj,
+                          &tset.h,
                           &P_obj,
                           &Q_obj,
-                          &R_obj)) {
+                          &R_obj,
+                          &nuse_obj,
+                          &neff_obj)) {
         return NULL;
     }
 
-    if (seed > 0) {
-        srand(seed);
+    pqr_templates_set_rows(&tset, rows_obj, cens_obj);
+
+    have_grid=pqr_parse_grid(grid_obj, &grid);
+    if (have_grid < 0) {
+        return NULL;
     }
 
-    nsigma2=nsigma*nsigma;
-    h2inv=1.0/(2.0*h);
-    hsqinv=1.0/(h*h);
- 
-    ndim=PyArray_SIZE(mean_obj);
-    npoints = PyArray_DIM(templates_obj,0);
+    Py_BEGIN_ALLOW_THREADS
+    status=pqr_templates_batch(&tset,
+                               1,
+                               PyArray_DIM(means_obj,0),
+                               PyArray_DIM(means_obj,1),
+                               PyArray_DATA(means_obj),
+                               PyArray_DATA(icovars_obj),
+                               PyArray_DATA(norms_obj),
+                               nsigma*nsigma,
+                               nmin,
+                               neff_max,
+                               have_grid ? &grid : NULL,
+                               have_grid ? PyArray_DATA(boxes_obj) : NULL,
+                               PyArray_DATA(P_obj),
+                               PyArray_DATA(Q_obj),
+                               PyArray_DATA(R_obj),
+                               PyArray_DATA(nuse_obj),
+                               PyArray_DATA(neff_obj));
+    Py_END_ALLOW_THREADS
+
+    if (status != 0) {
+        return PyErr_NoMemory();
+    }
 
-    Pptr=PyArray_GETPTR1(P_obj,0);
+    Py_RETURN_NONE;
+}
 
-    Q1ptr=PyArray_GETPTR1(Q_obj,0);
-    Q2ptr=PyArray_GETPTR1(Q_obj,1);
 
-    R11ptr=PyArray_GETPTR2(R_obj,0,0);
-    R12ptr=PyArray_GETPTR2(R_obj,0,1);
-    R21ptr=PyArray_GETPTR2(R_obj,1,0);
-    R22ptr=PyArray_GETPTR2(R_obj,1,1);
 
-    for (ii=0; ii<npoints; ii++) {
-        // check a random template, since we might bail early
-        // if our neff. check is met
-        //i=randint(npoints);
-        i=ii;
+/*
+ *
+ * compiled priors
+ *
+ * A prior is sent as an array of PyGMix_PriorComp, each component applying
+ * to one or two of the parameters.  Each component produces one ln(prob)
+ * except NORMAL2D, which produces one for each dimension
+ *
+ * the same formulas as the python/C prior classes are used, and the same
+ * range errors are raised
+ *
+ */
 
-        get_mom_xdiff(mean_obj,templates_obj,i,xdiff,ndim);
+/*
+   evaluate a single component, setting lnp[0] and possibly lnp[1]
 
-        chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
+   returns the number of outputs, or -1 if the parameters are out of range,
+   in which case a GMixRangeError is set
+*/
+static int prior_comp_eval(const struct PyGMix_PriorComp* comp,
+                           PyObject* pars_obj,
+                           double *lnp)
+{
+    const double *p=comp->pars;
+    double x=0, y=0, diff=0, d1=0, d2=0, gsq=0, omgsq=0, pval=0, logx=0, chi2=0;
+    long double lval=0;
+    npy_intp nlast=comp->index;
 
-        if (chi2 < nsigma2 && isfinite(chi2)) {
-            nuse += 1;
-            prob = norm*exp(-0.5*chi2);
+    if (comp->type==PYGMIX_PRIOR_NORMAL2D
+            || comp->type==PYGMIX_PRIOR_GPRIOR_BA
+            || comp->type==PYGMIX_PRIOR_ZDISK2D) {
+        nlast += 1;
+    }
+    if (comp->index < 0 || nlast >= PyArray_SIZE(pars_obj)) {
+        PyErr_Format(PyExc_ValueError,
+                     "prior index %d out of bounds for %ld pars",
+                     comp->index, (long) PyArray_SIZE(pars_obj));
+        return -1;
+    }
 
-            if (prob > Pmax) {
-                Pmax=prob;
+    x=*(double *) PyArray_GETPTR1(pars_obj, comp->index);
+
+    switch (comp->type) {
+        case PYGMIX_PRIOR_NORMAL:
+            diff = p[0]-x;
+            lnp[0] = -0.5*diff*diff*p[1];
+            return 1;
+
+        case PYGMIX_PRIOR_NORMAL2D:
+            y=*(double *) PyArray_GETPTR1(pars_obj, comp->index+1);
+            d1 = p[0]-x;
+            d2 = p[1]-y;
+            lnp[0] = -0.5*d1*d1*p[2];
+            lnp[1] = -0.5*d2*d2*p[3];
+            return 2;
+
+        case PYGMIX_PRIOR_GPRIOR_BA:
+            y=*(double *) PyArray_GETPTR1(pars_obj, comp->index+1);
+            gsq = x*x + y*y;
+            omgsq = 1.0 - gsq;
+            if (omgsq <= 0.0) {
+                PyErr_Format(GMixRangeError, "g^2 too big: %g", gsq);
+                return -1;
             }
+            lnp[0] = 2*log(omgsq) - 0.5*gsq*p[0];
+            return 1;
 
-            P += prob;
+        case PYGMIX_PRIOR_TWOSIDED_ERF:
+            lval = (long double) ( (p[2]-x)/p[3] );
+            pval = 0.5*( (double) erfl(lval) );
+            lval = (long double) ( (x-p[0])/p[1] );
+            pval += 0.5*( (double) erfl(lval) );
 
-            // These calls only update the parameters that respond to shear
+            if (pval <= 0.0) {
+                lnp[0] = -INFINITY;
+            } else {
+                lnp[0] = log(pval);
+            }
+            return 1;
 
-            get_mom_xdiff_sheared(mean_obj,sheared_p0,i,xdiff);
-            chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-            P_p0 += norm*exp(-0.5*chi2);
+        case PYGMIX_PRIOR_FLAT:
+            if (x < p[0] || x > p[1]) {
+                PyErr_Format(GMixRangeError,
+                             "value %g out of range: [%g,%g]",x,p[0],p[1]);
+                return -1;
+            }
+            lnp[0] = 0.0;
+            return 1;
 
-            get_mom_xdiff_sheared(mean_obj,sheared_m0,i,xdiff);
-            chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-            P_m0 += norm*exp(-0.5*chi2);
+        case PYGMIX_PRIOR_LOGNORMAL:
+            if (x <= 0) {
+                PyErr_Format(GMixRangeError, "values of x must be > 0");
+                return -1;
+            }
+            logx = log(x);
+            diff = logx-p[0];
+            chi2 = p[1]*(diff*diff);
+            lnp[0] = -0.5*chi2 - logx;
+            return 1;
+
+        case PYGMIX_PRIOR_ZDISK2D:
+            y=*(double *) PyArray_GETPTR1(pars_obj, comp->index+1);
+            if (x*x + y*y >= p[0]) {
+                PyErr_Format(GMixRangeError, "position out of bounds");
+                return -1;
+            }
+            lnp[0] = 0.0;
+            return 1;
 
-            get_mom_xdiff_sheared(mean_obj,sheared_0p,i,xdiff);
-            chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-            P_0p += norm*exp(-0.5*chi2);
+        default:
+            PyErr_Format(PyExc_ValueError, "bad prior type: %d", comp->type);
+            return -1;
+    }
+}
 
-            get_mom_xdiff_sheared(mean_obj,sheared_0m,i,xdiff);
-            chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-            P_0m += norm*exp(-0.5*chi2);
+/*
+   fill fdiff with sqrt(-2 ln(p)) for each output of the prior,
+   starting at the beginning of the array
 
-            get_mom_xdiff_sheared(mean_obj,sheared_pp,i,xdiff);
-            chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-            P_pp += norm*exp(-0.5*chi2);
+   returns the number filled
+*/
+static PyObject * PyGMix_prior_fill_fdiff(PyObject* self, PyObject* args) {
 
-            get_mom_xdiff_sheared(mean_obj,sheared_mm,i,xdiff);
-            chi2=get_mom_chi2(icovar_obj, xdiff, ndim);
-            P_mm += norm*exp(-0.5*chi2);
+    PyObject* comps_obj=NULL;
+    PyObject* pars_obj=NULL;
+    PyObject* fdiff_obj=NULL;
+
+    const struct PyGMix_PriorComp* comps=NULL;
+    npy_intp ncomp=0, i=0;
+    int index=0, nout=0, j=0;
+    double lnp[2], chi2=0, *fdiff=NULL;
+
+    if (!PyArg_ParseTuple(args, (char*)"OOO", 
+                          &comps_obj, &pars_obj, &fdiff_obj)) {
+        return NULL;
+    }
+
+    if (!PyArray_Check(pars_obj) || PyArray_TYPE((PyArrayObject*)pars_obj) != NPY_FLOAT64) {
+        PyErr_Format(PyExc_TypeError, "pars must be a float64 array");
+        return NULL;
+    }
+    if (!PyArray_Check(fdiff_obj) || PyArray_TYPE((PyArrayObject*)fdiff_obj) != NPY_FLOAT64) {
+        PyErr_Format(PyExc_TypeError, "fdiff must be a float64 array");
+        return NULL;
+    }
 
+    comps=(const struct PyGMix_PriorComp* ) PyArray_DATA(comps_obj);
+    ncomp=PyArray_SIZE(comps_obj);
+
+    for (i=0; i<ncomp; i++) {
+        nout=prior_comp_eval(&comps[i], pars_obj, lnp);
+        if (nout < 0) {
+            return NULL;
         }
 
-        // P is sum(prob)
-        neff = P/Pmax;
-        if ( (i > nmin) && (neff > neff_max) ) {
-            break;
+        if (index+nout > PyArray_SIZE(fdiff_obj)) {
+            PyErr_Format(PyExc_ValueError, "fdiff is too small for the prior");
+            return NULL;
+        }
+
+        for (j=0; j<nout; j++) {
+            chi2 = -2*lnp[j];
+            if (chi2 < 0.0) {
+                chi2=0.0;
+            }
+            fdiff=(double *) PyArray_GETPTR1(fdiff_obj, index);
+            *fdiff = sqrt(chi2);
+            index += 1;
         }
     }
 
-    *Pptr=P;
+    return Py_BuildValue("i", index);
+}
+
+/*
+   get the total ln(prob) for the prior
+*/
+static PyObject * PyGMix_prior_get_lnprob_scalar(PyObject* self, PyObject* args) {
+
+    PyObject* comps_obj=NULL;
+    PyObject* pars_obj=NULL;
+
+    const struct PyGMix_PriorComp* comps=NULL;
+    npy_intp ncomp=0, i=0;
+    int nout=0, j=0;
+    double lnp[2], lnp_tot=0;
+
+    if (!PyArg_ParseTuple(args, (char*)"OO", &comps_obj, &pars_obj)) {
+        return NULL;
+    }
+
+    if (!PyArray_Check(pars_obj) || PyArray_TYPE((PyArrayObject*)pars_obj) != NPY_FLOAT64) {
+        PyErr_Format(PyExc_TypeError, "pars must be a float64 array");
+        return NULL;
+    }
 
-    *Q1ptr = (P_p0 - P_m0)*h2inv;
-    *Q2ptr = (P_0p - P_0m)*h2inv;
+    comps=(const struct PyGMix_PriorComp* ) PyArray_DATA(comps_obj);
+    ncomp=PyArray_SIZE(comps_obj);
 
-    *R11ptr = (P_p0 - 2*P + P_m0)*hsqinv;
-    *R12ptr = (P_pp - P_p0 - P_0p + 2*P - P_m0 - P_0m + P_mm)*hsqinv*0.5;
-    *R22ptr = (P_0p - 2*P + P_0m)*hsqinv;
+    for (i=0; i<ncomp; i++) {
+        nout=prior_comp_eval(&comps[i], pars_obj, lnp);
+        if (nout < 0) {
+            return NULL;
+        }
 
-    *R21ptr = *R12ptr;
+        for (j=0; j<nout; j++) {
+            lnp_tot += lnp[j];
+        }
+    }
 
-    return Py_BuildValue("ld", nuse, neff);
+    return PyFloat_FromDouble(lnp_tot);
 }
 
 
-
 static PyObject * PyGMix_test(PyObject* self, PyObject* args) {
     PyErr_Format(GMixRangeError, "testing GMixRangeError");
     return NULL;
@@ -3946,6 +5864,9 @@ static PyMethodDef pygauss2d_funcs[] = {
     {"set_norms",(PyCFunction)PyGMix_gmix_set_norms, METH_VARARGS,  "set the normalizations used during evaluation of the gaussians\n"},
 
     {"em_run",(PyCFunction)PyGMix_em_run, METH_VARARGS,  "run the em algorithm\n"},
+    {"em_run_accel",(PyCFunction)PyGMix_em_run_accel, METH_VARARGS,  "run the em algorithm with SQUAREM acceleration\n"},
+    {"em_run_batch",(PyCFunction)PyGMix_em_run_batch, METH_VARARGS,  "run the em algorithm for a stack of images\n"},
+    {"em_run_multi",(PyCFunction)PyGMix_em_run_multi, METH_VARARGS,  "run the em algorithm for multiple images of an object, with psfs\n"},
 
     {"get_cm_Tfactor",        (PyCFunction)PyGMix_get_cm_Tfactor,         METH_VARARGS,  "get T factor for composite model\n"},
 
@@ -3959,6 +5880,11 @@ static PyMethodDef pygauss2d_funcs[] = {
     {"mvn_calc_prob",        (PyCFunction)PyGMix_mvn_calc_prob,         METH_VARARGS,  "get prob for the specified multivariate gaussian"},
     {"mvn_calc_pqr_templates",        (PyCFunction)PyGMix_mvn_calc_pqr_templates,         METH_VARARGS,  "get pqr for specified likelihood and templates"},
     {"mvn_calc_pqr_templates_full",        (PyCFunction)PyGMix_mvn_calc_pqr_templates_full,         METH_VARARGS,  "get pqr for specified likelihood and templates"},
+    {"mvn_calc_pqr_templates_batch",        (PyCFunction)PyGMix_mvn_calc_pqr_templates_batch,         METH_VARARGS,  "get pqr for many likelihoods and the templates"},
+    {"mvn_calc_pqr_templates_full_batch",        (PyCFunction)PyGMix_mvn_calc_pqr_templates_full_batch,         METH_VARARGS,  "get pqr for many likelihoods and the templates"},
+
+    {"prior_fill_fdiff",        (PyCFunction)PyGMix_prior_fill_fdiff,         METH_VARARGS,  "fill fdiff for a compiled prior"},
+    {"prior_get_lnprob_scalar",        (PyCFunction)PyGMix_prior_get_lnprob_scalar,         METH_VARARGS,  "get ln(prob) for a compiled prior"},
 
     {"test",        (PyCFunction)PyGMix_test,         METH_VARARGS,  "test\n\nprint and return."},
     {"erf",         (PyCFunction)PyGMix_erf,         METH_VARARGS,  "erf with better precision."},
@@ -79,6 +79,35 @@ struct __attribute__((__packed__)) PyGMix_EM_Sums {
     double v2sum;
 };
 
+/*
+   one component of a compiled prior.  index is the position of the first
+   parameter it applies to.  The meaning of pars depends on the type
+
+     NORMAL:        cen, s2inv
+     NORMAL2D:      cen1, cen2, s2inv1, s2inv2  (two outputs, one per dim)
+     GPRIOR_BA:     sig2inv                     (uses g1,g2)
+     TWOSIDED_ERF:  minval, width_at_min, maxval, width_at_max
+     FLAT:          minval, maxval
+     LOGNORMAL:     logmean, logivar
+     ZDISK2D:       radius_sq                   (uses two pars)
+*/
+
+#define PYGMIX_PRIOR_NORMAL 1
+#define PYGMIX_PRIOR_NORMAL2D 2
+#define PYGMIX_PRIOR_GPRIOR_BA 3
+#define PYGMIX_PRIOR_TWOSIDED_ERF 4
+#define PYGMIX_PRIOR_FLAT 5
+#define PYGMIX_PRIOR_LOGNORMAL 6
+#define PYGMIX_PRIOR_ZDISK2D 7
+
+// not packed: the natural layout already matches _prior_comp_dtype, and
+// the pars are read through a pointer
+struct PyGMix_PriorComp {
+    npy_int32 type;
+    npy_int32 index;
+    double pars[4];
+};
+
 
 /*
  *
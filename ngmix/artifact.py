@@ -0,0 +1,177 @@
+"""
+Binary files holding precomputed arrays, such as the inverse covariances
+of a GMixND or the shear derivatives of the pqr templates, that can be
+memory mapped read-only
+
+Reading a file with mmap=True does not copy the data, so many processes on
+a node that read the same file share a single copy in the page cache, and
+none of them need to redo the setup work.
+
+The file starts with an 8 byte magic string and the length of a json
+header, followed by the header and the raw array data.  The header holds
+a key identifying the content, optional meta data, and the name, dtype,
+shape and offset of each array.  Each array starts on a 64 byte boundary.
+
+examples
+--------
+
+write_artifact('/path/to/file.ngart', {'x':x, 'y':y}, key='my arrays')
+
+data=read_artifact('/path/to/file.ngart', key='my arrays')
+x=data['arrays']['x']
+"""
+from __future__ import print_function
+
+import os
+import json
+import mmap as _mmap
+import struct
+
+import numpy
+
+MAGIC=b'NGMIXART'
+VERSION=1
+ALIGN=64
+
+_PREAMBLE_SIZE=len(MAGIC)+8
+_MAX_OFFSET=2**63-1
+
+def write_artifact(fname, arrays, key='', meta=None):
+    """
+    write arrays to an artifact file
+
+    The file is written under a temporary name and then renamed, so
+    processes reading the file never see a partial file
+
+    parameters
+    ----------
+    fname: string
+        The file name
+    arrays: dict
+        Dictionary of numpy arrays, keyed by name
+    key: string, optional
+        Identifies the content, checked by read_artifact
+    meta: dict, optional
+        Extra information to store; must be serializable as json
+    """
+
+    names=sorted(arrays)
+    arrlist=[]
+    for name in names:
+        arr=numpy.ascontiguousarray(arrays[name])
+        if not arr.dtype.isnative:
+            arr=arr.astype(arr.dtype.newbyteorder('='))
+        if arr.dtype.hasobject:
+            raise ValueError("array '%s' has object dtype" % name)
+        arrlist.append(arr)
+
+    # the header size depends on the offsets and vice versa, so first
+    # get an upper bound on the header size using the largest offset
+    # possible, then fix the data start
+    entries=[]
+    for name,arr in zip(names,arrlist):
+        entries.append({'name':name,
+                        'dtype':arr.dtype.str,
+                        'shape':list(arr.shape),
+                        'offset':_MAX_OFFSET})
+    header={'version':VERSION,
+            'key':key,
+            'meta':meta,
+            'arrays':entries}
+
+    hbytes=json.dumps(header).encode('utf-8')
+    data_start=_align(_PREAMBLE_SIZE + len(hbytes))
+
+    offset=data_start
+    for entry,arr in zip(entries,arrlist):
+        entry['offset']=offset
+        offset += _align(arr.nbytes)
+
+    hbytes=json.dumps(header).encode('utf-8')
+    hbytes += b' '*(data_start - _PREAMBLE_SIZE - len(hbytes))
+
+    tmpname='%s.%d.tmp' % (fname, os.getpid())
+    with open(tmpname, 'wb') as fobj:
+        fobj.write(MAGIC)
+        fobj.write( struct.pack('<Q', len(hbytes)) )
+        fobj.write(hbytes)
+
+        for entry,arr in zip(entries,arrlist):
+            assert fobj.tell()==entry['offset']
+            fobj.write( arr.tobytes() )
+
+            npad=_align(arr.nbytes)-arr.nbytes
+            if npad > 0:
+                fobj.write(b'\0'*npad)
+
+    os.rename(tmpname, fname)
+
+def read_artifact(fname, key=None, mmap=True):
+    """
+    read the arrays from an artifact file
+
+    parameters
+    ----------
+    fname: string
+        The file name
+    key: string, optional
+        If sent, it must match the key stored in the file, otherwise
+        a ValueError is raised
+    mmap: bool, optional
+        If True, the default, the arrays are memory mapped read-only.
+        If False the data are read into memory
+
+    returns
+    -------
+    data: dict
+        With entries 'key', 'meta' and 'arrays', the last a dict
+        of arrays keyed by name.  The arrays are read-only
+    """
+
+    with open(fname, 'rb') as fobj:
+        magic=fobj.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError("file '%s' is not an ngmix artifact" % fname)
+
+        hsize,=struct.unpack('<Q', fobj.read(8))
+        header=json.loads( fobj.read(hsize).decode('utf-8') )
+
+        if header['version'] != VERSION:
+            raise ValueError("artifact '%s' has version %s, "
+                             "expected %s" % (fname, header['version'], VERSION))
+
+        if key is not None and header['key'] != key:
+            raise ValueError("artifact '%s' has key '%s', "
+                             "expected '%s'" % (fname, header['key'], key))
+
+        if mmap:
+            # the map stays open as long as any of the arrays exist
+            buf=_mmap.mmap(fobj.fileno(), 0, access=_mmap.ACCESS_READ)
+        else:
+            fobj.seek(0)
+            buf=fobj.read()
+
+    arrays={}
+    for entry in header['arrays']:
+        dtype=numpy.dtype(entry['dtype'])
+        shape=tuple(entry['shape'])
+        count=int(numpy.prod(shape, dtype='i8'))
+
+        if count == 0:
+            arr=numpy.zeros(shape, dtype=dtype)
+            arr.flags.writeable=False
+        else:
+            arr=numpy.frombuffer(buf, dtype=dtype, count=count,
+                                 offset=entry['offset']).reshape(shape)
+
+        arrays[entry['name']] = arr
+
+    return {'key':header['key'],
+            'meta':header['meta'],
+            'arrays':arrays}
+
+def _align(nbytes):
+    """
+    round up to a multiple of ALIGN
+    """
+    return ((nbytes + ALIGN - 1)//ALIGN)*ALIGN
@@ -0,0 +1,646 @@
+"""
+Run the bootstrapper over many objects, for example all the objects in
+a tile, optionally using a pool of worker processes
+
+The objects are read from an iterator, sent to the workers in chunks, and
+the results are yielded back in input order.
+
+Long runs can be checkpointed to a local file with go_records; when the
+run is restarted with the same file, objects that were already processed
+are skipped.
+"""
+from __future__ import print_function
+
+try:
+    xrange = xrange
+    # We have Python 2
+except:
+    xrange = range
+    # We have Python 3
+
+import os
+import hashlib
+from collections import deque
+
+import numpy
+
+
+from .bootstrap import Bootstrapper, CompositeBootstrapper
+from .gmix import get_model_npars
+from . import records
+from .counters import StageCounters
+from .psfcache import PSFFitCache
+from .gexceptions import BootPSFFailure, BootGalFailure, BootPrescreenFailure
+from .gexceptions import GMixRangeError, GMixFatalError, GMixMaxIterEM
+
+BATCH_PSF_FAILURE = 2**0
+BATCH_GAL_FAILURE = 2**1
+BATCH_MEMORY_ERROR = 2**2
+BATCH_PRESCREEN_FAILURE = 2**3
+BATCH_NUMERICAL_ERROR = 2**4
+
+BATCH_DEFAULTS = {
+    'boot_type':'simple',
+    'use_logpars':False,
+    'psf_ntry':4,
+    'psf_fit_pars':None,
+    'ntry':1,
+    'prior':None,
+    'extra_priors':None,
+    'fracdev_prior':None,
+    'fracdev_grid':None,
+    'metacal_pars':None,
+    'seed':None,
+    'instrument':False,
+    'prescreen':None,
+    'psf_cache_size':None,
+}
+
+class BatchBootstrapper(object):
+    """
+    Run a Bootstrapper or CompositeBootstrapper over many objects
+
+    parameters
+    ----------
+    config: dict
+        Configuration for the processing.  Required entries are
+            psf_model: e.g. 'em3', 'gauss'
+            psf_Tguess: guess for the psf T
+            gal_model: e.g. 'exp', or 'cm' for the composite bootstrapper
+            max_pars: parameters for the max like fitter, e.g.
+                {'method':'lm', 'lm_pars':{'maxfev':4000}}
+        Optional entries, see BATCH_DEFAULTS for the defaults, are
+            boot_type: 'simple' or 'composite'
+            use_logpars: fit in log(T), log(flux)
+            psf_ntry, psf_fit_pars: sent to fit_psfs
+            ntry: number of tries for the max like fit
+            prior, extra_priors: priors for the max like fit
+            fracdev_prior, fracdev_grid: for the composite bootstrapper
+            metacal_pars: if not None, run fit_metacal_max with these
+                metacal parameters
+            seed: if not None, each object gets its own numpy RandomState,
+                seeded with get_object_seed(seed, index), so the results
+                do not depend on the number of processes or on restarts
+            instrument: if True, record timing and counters for each
+                stage; the totals for the run are in the counters
+                attribute
+            prescreen: if not None, a dict of keywords for
+                Bootstrapper.prescreen, e.g. {'min_s2n':5.0}.  Objects
+                that fail are not fit and are flagged with
+                BATCH_PRESCREEN_FAILURE
+            psf_cache_size: if not None, each process keeps a PSFFitCache
+                of this size, so psf images shared between objects are
+                only fit once.  For serial processing the cache is in
+                the psf_cache attribute; with instrument set the number
+                of hits is counted as ncache_hit in the psf stage
+
+        The config, including the priors, is sent to each worker
+        process only once, when the process starts
+    nproc: int, optional
+        Number of worker processes.  If 1, the default, the objects
+        are processed serially with no pool
+    chunksize: int, optional
+        Number of objects sent to a worker at once, default 10
+    max_worker_mem: int, optional
+        Limit on the address space of each worker in bytes.  Objects for
+        which the limit is hit are flagged with BATCH_MEMORY_ERROR.
+        Only supported on unix systems.
+    maxtasksperchild: int, optional
+        Restart each worker after it has processed this many chunks,
+        releasing any memory it has accumulated
+
+    examples
+    --------
+
+    batch=BatchBootstrapper(config, nproc=8)
+    for res in batch.go(obs_iterator):
+        if res['flags'] == 0:
+            print(res['max_res']['pars'])
+    """
+    def __init__(self, config,
+                 nproc=1,
+                 chunksize=10,
+                 max_worker_mem=None,
+                 maxtasksperchild=None):
+
+        self.config=get_batch_config(config)
+        self.counters=StageCounters()
+        self.nproc=nproc
+        self.chunksize=chunksize
+        self.max_worker_mem=max_worker_mem
+        self.maxtasksperchild=maxtasksperchild
+
+        if self.config['psf_cache_size'] is not None:
+            self.psf_cache=PSFFitCache(maxsize=self.config['psf_cache_size'])
+        else:
+            self.psf_cache=None
+
+    def go(self, obs_iter, skip=None):
+        """
+        process the observations, yielding results in input order
+
+        parameters
+        ----------
+        obs_iter: iterable
+            An iterable of Observation, ObsList, or MultiBandObsList
+        skip: set, optional
+            Indices of objects to skip
+
+        yields
+        ------
+        A result dict for each object, see process_one
+        """
+
+        if self.nproc == 1:
+            reslist=self._go_serial(obs_iter, skip)
+        else:
+            reslist=self._go_pool(obs_iter, skip)
+
+        for res in reslist:
+            if res['counters'] is not None:
+                self.counters.merge(res['counters'])
+            yield res
+
+    def go_records(self, obs_iter, nobj, nband=1,
+                   checkpoint_file=None,
+                   checkpoint_interval=100):
+        """
+        process the observations, writing the results into a structured
+        array rather than keeping the result dicts
+
+        parameters
+        ----------
+        obs_iter: iterable
+            An iterable of Observation, ObsList, or MultiBandObsList
+        nobj: int
+            The number of objects in obs_iter
+        nband: int, optional
+            Number of bands in each observation, default 1
+        checkpoint_file: string, optional
+            If sent, the completed rows are written to this file every
+            checkpoint_interval objects and at the end of the run.  If the
+            file already exists, the rows are read from it and the objects
+            already processed are skipped.  Set a seed in the config for
+            the resumed run to reproduce an uninterrupted run exactly;
+            the seed used for each object is recorded in the seed column
+        checkpoint_interval: int, optional
+            Number of objects processed between checkpoints, default 100
+
+        returns
+        -------
+        structured array with a row for each object; see get_batch_schemas
+        for the columns
+        """
+
+        schemas=get_batch_schemas(self.config, nband=nband)
+
+        if checkpoint_file is not None and os.path.exists(checkpoint_file):
+            data, done = read_checkpoint(checkpoint_file)
+
+            dt=make_batch_array(schemas, 1).dtype
+            if data.dtype != dt or data.size != nobj:
+                raise ValueError("checkpoint file '%s' does not match "
+                                 "this run" % checkpoint_file)
+        else:
+            data=make_batch_array(schemas, nobj)
+            done=numpy.zeros(nobj, dtype=bool)
+
+        skip=set(numpy.where(done)[0])
+
+        nnew=0
+        for res in self.go(obs_iter, skip=skip):
+            index=res['index']
+            if index >= nobj:
+                raise ValueError("got more than nobj=%d objects" % nobj)
+
+            fill_batch_record(data[index], res, schemas)
+            done[index]=True
+            nnew += 1
+
+            if checkpoint_file is not None and nnew % checkpoint_interval == 0:
+                write_checkpoint(checkpoint_file, data, done)
+
+        ndone=done.sum()
+        if ndone != nobj:
+            raise ValueError("expected %d objects, got %d" % (nobj,ndone))
+
+        if checkpoint_file is not None:
+            write_checkpoint(checkpoint_file, data, done)
+
+        return data
+
+    def _go_serial(self, obs_iter, skip):
+        for index,obs in enumerate(obs_iter):
+            if skip and index in skip:
+                continue
+
+            yield _process_index(index, obs, self.config,
+                                 psf_cache=self.psf_cache)
+
+    def _go_pool(self, obs_iter, skip):
+        """
+        a limited number of chunks are in flight at any given time,
+        so the memory used for pending observations is bounded
+        """
+        import multiprocessing
+
+        pool=multiprocessing.Pool(
+            processes=self.nproc,
+            initializer=_init_worker,
+            initargs=(self.config, self.max_worker_mem),
+            maxtasksperchild=self.maxtasksperchild,
+        )
+
+        max_pending = 2*self.nproc
+        pending=deque()
+
+        try:
+            for chunk in _iter_chunks(obs_iter, self.chunksize, skip):
+                pending.append( pool.apply_async(_process_chunk, (chunk,)) )
+
+                if len(pending) >= max_pending:
+                    for res in pending.popleft().get():
+                        yield res
+
+            while len(pending) > 0:
+                for res in pending.popleft().get():
+                    yield res
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+def get_batch_config(config):
+    """
+    check the config and fill in defaults
+
+    parameters
+    ----------
+    config: dict
+        See BatchBootstrapper
+    """
+    for key in ['psf_model','psf_Tguess','gal_model','max_pars']:
+        if key not in config:
+            raise ValueError("config must contain '%s'" % key)
+
+    conf={}
+    conf.update(BATCH_DEFAULTS)
+    conf.update(config)
+
+    if conf['boot_type'] not in ['simple','composite']:
+        raise ValueError("boot_type should be 'simple' or 'composite', "
+                         "got '%s'" % conf['boot_type'])
+    return conf
+
+def get_batch_schemas(config, nband=1):
+    """
+    get the schemas for writing the results from process_one into
+    a structured array
+
+    The columns are flags and index, psf_ for the psf flux result, max_ for
+    the max like result, round_ for the round result, the mcal_
+    columns if metacal_pars is set in the config, and the prescreen_
+    columns if prescreen is set in the config
+
+    parameters
+    ----------
+    config: dict
+        See BatchBootstrapper
+    nband: int, optional
+        Number of bands, default 1
+
+    returns
+    -------
+    list of (key, schema), where key is the entry in the result dict
+    and is None for the top level entries
+    """
+    config=get_batch_config(config)
+
+    npars=get_model_npars(config['gal_model']) + nband-1
+
+    if config['boot_type']=='composite':
+        max_schema=records.get_composite_schema(npars, prefix='max_')
+    else:
+        max_schema=records.get_max_schema(npars, prefix='max_')
+
+    top_fields=[('index','i8'), ('flags','i4'), ('seed','i8')]
+
+    schemas=[
+        (None, records.ResultSchema(top_fields)),
+        ('psf_flux_res', records.get_psf_flux_schema(nband, prefix='psf_')),
+        ('max_res', max_schema),
+        ('round_res', records.get_round_schema(prefix='round_')),
+    ]
+
+    if config['metacal_pars'] is not None:
+        schemas.append( ('mcal_res', records.get_metacal_schema(npars)) )
+
+    if config['prescreen'] is not None:
+        schemas.append( ('prescreen_res',
+                         records.get_prescreen_schema(prefix='prescreen_')) )
+
+    return schemas
+
+def make_batch_array(schemas, n):
+    """
+    make a structured array for the results, with defaults set
+
+    parameters
+    ----------
+    schemas: list
+        As returned by get_batch_schemas
+    n: int
+        Number of rows
+    """
+    schema=schemas[0][1]
+    for key,tschema in schemas[1:]:
+        schema = schema + tschema
+
+    return schema.make_array(n)
+
+def fill_batch_record(row, res, schemas):
+    """
+    write a result from process_one into a row of the array
+
+    parameters
+    ----------
+    row: row of a structured array
+        Made by make_batch_array
+    res: dict
+        Result from process_one
+    schemas: list
+        As returned by get_batch_schemas
+    """
+    for key,schema in schemas:
+        if key is None:
+            schema.fill(row, res)
+        elif res[key] is not None:
+            schema.fill(row, res[key])
+
+def write_checkpoint(fname, data, done):
+    """
+    write the result rows and the mask of completed objects
+
+    The file is first written under a temporary name and then renamed, so
+    an existing checkpoint is never left partially written
+
+    parameters
+    ----------
+    fname: string
+        Path to the checkpoint file
+    data: structured array
+        The result rows
+    done: bool array
+        True for the objects that have been processed
+    """
+    tmpname = fname+'.tmp'
+    with open(tmpname,'wb') as fobj:
+        numpy.savez(fobj, data=data, done=done)
+        fobj.flush()
+        os.fsync(fobj.fileno())
+
+    os.rename(tmpname, fname)
+
+def read_checkpoint(fname):
+    """
+    read the result rows and the mask of completed objects
+
+    parameters
+    ----------
+    fname: string
+        Path to the checkpoint file
+
+    returns
+    -------
+    data, done
+    """
+    with numpy.load(fname) as fobj:
+        data=fobj['data']
+        done=fobj['done']
+
+    return data, done
+
+def get_object_seed(*ids):
+    """
+    get a seed derived from a set of identifiers, for example the
+    seed for the run and the index of the object, or a tile name and
+    object id
+
+    Seeds for different identifiers are effectively independent, so each
+    object can be given its own random number stream, and the results do
+    not depend on how the objects are scheduled
+
+    parameters
+    ----------
+    *ids: ints or strings
+        The identifiers
+
+    returns
+    -------
+    seed in [0, 2**32)
+
+    examples
+    --------
+    seed=get_object_seed('DES0123-4567', object_id)
+    rng=numpy.random.RandomState(seed)
+    boot=Bootstrapper(obs, rng=rng)
+    """
+    key = '-'.join([str(tid) for tid in ids]).encode('utf-8')
+    digest=hashlib.sha256(key).hexdigest()
+    return int(digest[0:8], 16)
+
+def process_one(obs, config, seed=None, psf_cache=None):
+    """
+    Run the bootstrapper on a single object
+
+    BootPSFFailure, BootGalFailure, BootPrescreenFailure and MemoryError
+    are caught and recorded in the flags.  Numerical errors not handled
+    by the bootstrapper, GMixRangeError, GMixFatalError, GMixMaxIterEM and
+    numpy LinAlgError, are also caught and flagged with
+    BATCH_NUMERICAL_ERROR, so one bad object does not stop a run
+
+    parameters
+    ----------
+    obs: Observation, ObsList, or MultiBandObsList
+        The data for the object
+    config: dict
+        See BatchBootstrapper
+    seed: int, optional
+        If sent, a numpy RandomState with this seed is used for all random
+        numbers, otherwise the global numpy random state is used
+    psf_cache: PSFFitCache, optional
+        Cache for the psf fits
+
+    returns
+    -------
+    result dict, with entries
+        flags: BATCH_PSF_FAILURE, BATCH_GAL_FAILURE, BATCH_MEMORY_ERROR,
+            BATCH_PRESCREEN_FAILURE or BATCH_NUMERICAL_ERROR
+        errmsg: message for the error, if any
+        prescreen_res: result of prescreen, if prescreen was set
+            in the config
+        psf_flux_res: result of fit_gal_psf_flux
+        max_res: result dict from the max like fitter
+        round_res: result of set_round_s2n
+        mcal_res: result of fit_metacal_max, without the obs_dict,
+            if metacal_pars were sent
+        seed: the seed, if sent
+        counters: timing and counters for each stage if instrument
+            is set in the config, otherwise None
+    """
+
+    res={'flags':0,
+         'errmsg':'',
+         'psf_flux_res':None,
+         'max_res':None,
+         'round_res':None,
+         'mcal_res':None,
+         'prescreen_res':None,
+         'counters':None}
+
+    if seed is not None:
+        rng=numpy.random.RandomState(seed)
+        res['seed'] = seed
+    else:
+        rng=None
+
+    boot=None
+    try:
+        boot=_make_bootstrapper(obs, config, rng, psf_cache)
+
+        if config['prescreen'] is not None:
+            boot.prescreen(**config['prescreen'])
+            res['prescreen_res'] = boot.get_prescreen_result()
+
+        # always fit, the psf gmix may be left over from an earlier run
+        # on the same observations, which would change the random numbers
+        # used and thus the result
+        boot.fit_psfs(config['psf_model'],
+                      config['psf_Tguess'],
+                      ntry=config['psf_ntry'],
+                      fit_pars=config['psf_fit_pars'],
+                      skip_already_done=False)
+
+        boot.fit_max(config['gal_model'],
+                     config['max_pars'],
+                     prior=config['prior'],
+                     extra_priors=config['extra_priors'],
+                     ntry=config['ntry'])
+        res['psf_flux_res'] = boot.get_psf_flux_result()
+        res['max_res'] = boot.get_max_fitter().get_result()
+
+        boot.set_round_s2n()
+        res['round_res'] = boot.get_round_result()
+
+        if config['metacal_pars'] is not None:
+            boot.fit_metacal_max(config['psf_model'],
+                                 config['gal_model'],
+                                 config['max_pars'],
+                                 config['psf_Tguess'],
+                                 psf_fit_pars=config['psf_fit_pars'],
+                                 metacal_pars=config['metacal_pars'],
+                                 prior=config['prior'],
+                                 psf_ntry=config['psf_ntry'],
+                                 ntry=config['ntry'])
+
+            mres=boot.get_metacal_max_result()
+            # the observations are large and not needed downstream
+            res['mcal_res'] = \
+                dict([(k,v) for k,v in mres.items() if k != 'obs_dict'])
+
+    except BootPrescreenFailure as err:
+        res['flags'] |= BATCH_PRESCREEN_FAILURE
+        res['errmsg'] = str(err)
+    except BootPSFFailure as err:
+        res['flags'] |= BATCH_PSF_FAILURE
+        res['errmsg'] = str(err)
+    except BootGalFailure as err:
+        res['flags'] |= BATCH_GAL_FAILURE
+        res['errmsg'] = str(err)
+    except MemoryError as err:
+        res['flags'] |= BATCH_MEMORY_ERROR
+        res['errmsg'] = 'MemoryError'
+    except (GMixRangeError,
+            GMixFatalError,
+            GMixMaxIterEM,
+            numpy.linalg.LinAlgError) as err:
+        res['flags'] |= BATCH_NUMERICAL_ERROR
+        res['errmsg'] = '%s: %s' % (err.__class__.__name__, err)
+
+    if boot is not None:
+        res['counters'] = boot.get_counters()
+
+    return res
+
+def _make_bootstrapper(obs, config, rng, psf_cache):
+    if config['boot_type']=='composite':
+        boot=CompositeBootstrapper(obs,
+                                   use_logpars=config['use_logpars'],
+                                   fracdev_prior=config['fracdev_prior'],
+                                   fracdev_grid=config['fracdev_grid'],
+                                   rng=rng,
+                                   instrument=config['instrument'],
+                                   psf_cache=psf_cache)
+    else:
+        boot=Bootstrapper(obs,
+                          use_logpars=config['use_logpars'],
+                          rng=rng,
+                          instrument=config['instrument'],
+                          psf_cache=psf_cache)
+
+    return boot
+
+def _process_index(index, obs, config, psf_cache=None):
+    if config['seed'] is not None:
+        seed=get_object_seed(config['seed'], index)
+    else:
+        seed=None
+
+    res=process_one(obs, config, seed=seed, psf_cache=psf_cache)
+    res['index'] = index
+    return res
+
+def _iter_chunks(obs_iter, chunksize, skip=None):
+    """
+    yield lists of (index, obs), leaving out indices in skip
+    """
+    chunk=[]
+    for index,obs in enumerate(obs_iter):
+        if skip and index in skip:
+            continue
+
+        chunk.append( (index, obs) )
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk=[]
+
+    if len(chunk) > 0:
+        yield chunk
+
+# set once in each worker process by _init_worker
+_worker_config=None
+_worker_psf_cache=None
+
+def _init_worker(config, max_worker_mem):
+    global _worker_config, _worker_psf_cache
+    _worker_config=config
+
+    if config['psf_cache_size'] is not None:
+        _worker_psf_cache=PSFFitCache(maxsize=config['psf_cache_size'])
+
+    if max_worker_mem is not None:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS,
+                           (max_worker_mem, max_worker_mem))
+
+def _process_chunk(chunk):
+    reslist=[]
+    for index,obs in chunk:
+        res=_process_index(index, obs, _worker_config,
+                           psf_cache=_worker_psf_cache)
+        reslist.append(res)
+
+    return reslist
@@ -0,0 +1,941 @@
+"""
+Benchmarks for the core kernels and end-to-end fits
+
+Each benchmark times a set of cases built from simulated data, so no
+external data are needed.  The results are returned as a dict that can be
+written to a JSON file, so the numbers can be compared across commits.
+
+examples
+--------
+
+from ngmix import benchmarks
+
+# run everything and write the results
+data=benchmarks.run_benchmarks(output='bench.json')
+
+# run a subset
+data=benchmarks.run_benchmarks(names=['render','loglike'])
+
+# compare two runs
+benchmarks.compare('bench-old.json', 'bench-new.json')
+
+The benchmarks are not imported with the package; import the module as
+above, or run it from the command line
+
+    python -m ngmix.benchmarks bench.json
+
+The available benchmarks are
+
+    render: GMix rendering with render, render_jacob, render_gauleg and
+        render_jacob_gauleg
+    loglike: get_loglike for a range of stamp sizes and ngauss
+    fdiff: fill_fdiff for a range of stamp sizes and ngauss
+    em: em_run for the GMixEM fitter
+    em_batch: a set of psf stamps fit one at a time with GMixEM, and
+        together with GMixEMBatch
+    lm: LMSimple fits for each model
+    prior: PriorSimpleSep.fill_fdiff, in python and compiled
+    max_runner: MaxRunner fits for each model
+    metacal: a full Bootstrapper metacal, requires galsim
+    gmixnd: GMixND.get_lnprob_array
+    pqr_templates: mvn_calc_pqr_templates via PQRMomTemplatesGauss
+    startup: time to import ngmix, and then the bootstrap and metacal
+        modules, in a new python process
+"""
+from __future__ import print_function
+
+try:
+    xrange = xrange
+    # We have Python 2
+except:
+    xrange = range
+    # We have Python 3
+
+import sys
+import time
+import json
+import platform
+
+import numpy
+
+from .gmix import GMix, GMixModel, GMixND
+from .jacobian import Jacobian, UnitJacobian
+from .observation import Observation
+
+BENCH_VERSION=1
+
+DEFAULT_STAMP_SIZES=[25, 48, 64]
+DEFAULT_MODELS=['gauss','exp','dev']
+
+def run_benchmarks(names=None,
+                   nrepeat=3,
+                   seed=8712,
+                   output=None,
+                   verbose=True):
+    """
+    run the benchmarks
+
+    parameters
+    ----------
+    names: list, optional
+        Names of benchmarks to run, default all.  See BENCHMARKS.keys()
+    nrepeat: int, optional
+        Number of times to repeat each timing; the minimum time is
+        reported.  Default 3
+    seed: int, optional
+        Seed for the simulated data, default 8712
+    output: string, optional
+        If sent, write the results to this file in JSON format
+    verbose: bool, optional
+        If True, print results as they are run
+
+    returns
+    -------
+    data: dict
+        Dictionary with entries
+            'info': information about the machine and software versions
+            'results': list of dicts for each case, with entries
+                'benchmark','case','ncall','nrepeat','time','time_per_call'
+                and the parameters for the case
+            'skipped': dict keyed by benchmark name of benchmarks that
+                could not be run, e.g. missing galsim, with the reason
+    """
+
+    if names is None:
+        names=BENCHMARK_NAMES
+
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError("bad benchmark name '%s', "
+                             "should be one of %s" % (name, BENCHMARK_NAMES))
+
+    results=[]
+    skipped={}
+    for name in names:
+        if verbose:
+            print("running benchmark:",name)
+
+        rng=numpy.random.RandomState(seed)
+        func=BENCHMARKS[name]
+        try:
+            bres=func(rng, nrepeat)
+        except ImportError as err:
+            skipped[name] = str(err)
+            if verbose:
+                print("    skipping:",str(err))
+            continue
+
+        for r in bres:
+            r['benchmark'] = name
+            if verbose:
+                print("    %-40s %12.6g s" % (r['case'], r['time_per_call']))
+
+        results += bres
+
+    data={
+        'info':get_info(nrepeat=nrepeat, seed=seed),
+        'results':results,
+        'skipped':skipped,
+    }
+
+    if output is not None:
+        write_json(output, data)
+
+    return data
+
+def get_info(**keys):
+    """
+    get information about the machine and software versions
+
+    parameters
+    ----------
+    **keys:
+        Extra entries for the dict
+    """
+    info={
+        'bench_version':BENCH_VERSION,
+        'date':time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python_version':platform.python_version(),
+        'numpy_version':numpy.__version__,
+        'platform':platform.platform(),
+        'machine':platform.machine(),
+        'git_commit':_get_git_commit(),
+    }
+    info.update(keys)
+    return info
+
+def write_json(fname, data):
+    """
+    write benchmark results to a JSON file
+
+    parameters
+    ----------
+    fname: string
+        Output file name
+    data: dict
+        As returned by run_benchmarks
+    """
+    with open(fname,'w') as fobj:
+        json.dump(data, fobj, indent=1, sort_keys=True)
+
+def read_json(fname):
+    """
+    read benchmark results from a JSON file
+
+    parameters
+    ----------
+    fname: string
+        Input file name
+    """
+    with open(fname) as fobj:
+        data=json.load(fobj)
+    return data
+
+def compare(old, new, verbose=True):
+    """
+    compare two sets of benchmark results
+
+    parameters
+    ----------
+    old: dict or string
+        Results or a JSON file name for the reference run
+    new: dict or string
+        Results or a JSON file name for the new run
+    verbose: bool, optional
+        If True, print the comparison
+
+    returns
+    -------
+    ratios: dict
+        new/old time per call, keyed by (benchmark, case), for cases
+        present in both
+    """
+    if not isinstance(old, dict):
+        old=read_json(old)
+    if not isinstance(new, dict):
+        new=read_json(new)
+
+    old_times={}
+    for r in old['results']:
+        old_times[ (r['benchmark'], r['case']) ] = r['time_per_call']
+
+    ratios={}
+    for r in new['results']:
+        key=(r['benchmark'], r['case'])
+        if key in old_times:
+            ratio = r['time_per_call']/old_times[key]
+            ratios[key] = ratio
+            if verbose:
+                print("%-14s %-40s %12.6g %12.6g %8.3f" % \
+                        (key[0], key[1], old_times[key],
+                         r['time_per_call'], ratio))
+
+    return ratios
+
+#
+# the benchmarks
+#
+
+def bench_render(rng, nrepeat):
+    """
+    time rendering of mixtures with render, render_jacob,
+    render_gauleg and render_jacob_gauleg
+    """
+
+    results=[]
+    for dim in DEFAULT_STAMP_SIZES:
+        jacob=_get_jacobian(dim)
+        image=numpy.zeros( (dim,dim) )
+
+        for model in DEFAULT_MODELS:
+            gm=_get_convolved_gmix(rng, model, dim)
+
+            for kernel in ['render','render_jacob','render_gauleg',
+                           'render_jacob_gauleg']:
+
+                keys={}
+                if 'jacob' in kernel:
+                    keys['jacobian']=jacob
+                if 'gauleg' in kernel:
+                    keys['npoints']=10
+
+                def func():
+                    gm._fill_image(image, **keys)
+
+                case='%s-%s-dim%d' % (kernel, model, dim)
+                r=_time_func(func, case, nrepeat, ncall=_get_ncall(dim))
+                r.update( {'kernel':kernel,
+                           'model':model,
+                           'ngauss':len(gm),
+                           'dim':dim} )
+                results.append(r)
+
+    return results
+
+def bench_loglike(rng, nrepeat):
+    """
+    time get_loglike for a range of stamp sizes and number of gaussians
+    """
+    results=[]
+    for dim in DEFAULT_STAMP_SIZES:
+        for model in DEFAULT_MODELS:
+            gm=_get_convolved_gmix(rng, model, dim)
+            obs=_make_obs(rng, gm, dim)
+
+            for npoints in [None, 10]:
+                def func():
+                    gm.get_loglike(obs, npoints=npoints)
+
+                kernel = 'get_loglike' if npoints is None else 'get_loglike_gauleg'
+                case='%s-%s-dim%d' % (kernel, model, dim)
+                r=_time_func(func, case, nrepeat, ncall=_get_ncall(dim))
+                r.update( {'kernel':kernel,
+                           'model':model,
+                           'ngauss':len(gm),
+                           'dim':dim} )
+                results.append(r)
+
+    return results
+
+def bench_fdiff(rng, nrepeat):
+    """
+    time fill_fdiff for a range of stamp sizes and number of gaussians
+    """
+    results=[]
+    for dim in DEFAULT_STAMP_SIZES:
+        for model in DEFAULT_MODELS:
+            gm=_get_convolved_gmix(rng, model, dim)
+            obs=_make_obs(rng, gm, dim)
+            fdiff=numpy.zeros(dim*dim)
+
+            for npoints in [None, 10]:
+                def func():
+                    gm.fill_fdiff(obs, fdiff, npoints=npoints)
+
+                kernel = 'fill_fdiff' if npoints is None else 'fill_fdiff_gauleg'
+                case='%s-%s-dim%d' % (kernel, model, dim)
+                r=_time_func(func, case, nrepeat, ncall=_get_ncall(dim))
+                r.update( {'kernel':kernel,
+                           'model':model,
+                           'ngauss':len(gm),
+                           'dim':dim} )
+                results.append(r)
+
+    return results
+
+def bench_em(rng, nrepeat):
+    """
+    time the EM fitter, which calls em_run, for 1,2,3 gaussians, with
+    and without acceleration.  The accelerated cases also have the
+    number of iterations saved relative to plain em
+    """
+    from .em import GMixEM, prep_image
+
+    results=[]
+    for dim in DEFAULT_STAMP_SIZES:
+        jacob=_get_jacobian(dim)
+
+        # turbulent psf, well represented by three gaussians
+        pars=numpy.array([0.0, 0.0, 0.02, -0.01, 4.0, 1.0])
+        gm_psf=GMixModel(pars, 'turb')
+        im0=gm_psf.make_image( (dim,dim), jacobian=jacob)
+        im0 += 1.0e-5*rng.normal(size=im0.shape)
+        im,sky=prep_image(im0)
+        obs=Observation(im, jacobian=jacob)
+
+        for ngauss in [1,2,3]:
+            guess=_get_em_guess(rng, ngauss)
+
+            numiter_plain=None
+            for accelerate in [False, True]:
+
+                def func():
+                    fitter=GMixEM(obs)
+                    fitter.run_em(guess.copy(), sky, maxiter=2000, tol=1.0e-6,
+                                  accelerate=accelerate)
+                    return fitter
+
+                if accelerate:
+                    kernel='em_run_accel'
+                else:
+                    kernel='em_run'
+
+                case='%s-ngauss%d-dim%d' % (kernel, ngauss, dim)
+                r=_time_func(func, case, nrepeat, ncall=1)
+
+                res=func().get_result()
+
+                r.update( {'kernel':kernel,
+                           'ngauss':ngauss,
+                           'dim':dim,
+                           'flags':res['flags'],
+                           'numiter':res.get('numiter',0),
+                           'nmap':res.get('nmap',0)} )
+
+                if accelerate:
+                    # em steps saved relative to plain em
+                    r['naccel'] = res.get('naccel',0)
+                    r['nreject'] = res.get('nreject',0)
+                    r['numiter_saved'] = numiter_plain - r['nmap']
+                else:
+                    numiter_plain=r['numiter']
+
+                results.append(r)
+
+    return results
+
+def bench_em_batch(rng, nrepeat):
+    """
+    time fitting a set of psf stamps with em, one at a time and with
+    GMixEMBatch, using one thread and then one thread per cpu
+    """
+    import multiprocessing
+    from .em import GMixEM, GMixEMBatch, prep_image
+
+    nstamp=200
+    dim=25
+    ngauss=2
+    maxiter=2000
+    tol=1.0e-6
+
+    images=numpy.zeros( (nstamp, dim, dim) )
+    sky=numpy.zeros(nstamp)
+    jacobians=[]
+    for i in xrange(nstamp):
+        cen=(dim-1.0)/2.0 + 0.5*rng.uniform(low=-1.0, high=1.0, size=2)
+        jacob=UnitJacobian(cen[0], cen[1])
+        pars=numpy.array([0.0, 0.0,
+                          0.05*rng.normal(), 0.05*rng.normal(),
+                          4.0*(1.0 + 0.1*rng.normal()), 1.0])
+        gm_psf=GMixModel(pars, 'turb')
+        im0=gm_psf.make_image( (dim,dim), jacobian=jacob)
+        im0 += 1.0e-5*rng.normal(size=im0.shape)
+        images[i],sky[i] = prep_image(im0)
+        jacobians.append(jacob)
+
+    guess=_get_em_guess(rng, ngauss)
+
+    def func_single():
+        for i in xrange(nstamp):
+            obs=Observation(images[i], jacobian=jacobians[i])
+            fitter=GMixEM(obs)
+            fitter.run_em(guess.copy(), sky[i], maxiter=maxiter, tol=tol)
+
+    case='GMixEM-nstamp%d-dim%d' % (nstamp, dim)
+    r=_time_func(func_single, case, nrepeat, ncall=1)
+    r.update( {'kernel':'em_run', 'nstamp':nstamp, 'dim':dim,
+               'ngauss':ngauss, 'nthreads':1} )
+    results=[r]
+
+    nthreads_list=[1]
+    ncpu=multiprocessing.cpu_count()
+    if ncpu > 1:
+        nthreads_list.append(ncpu)
+
+    for nthreads in nthreads_list:
+        def func_batch():
+            fitter=GMixEMBatch(images, jacobians)
+            fitter.run_em(guess, sky, maxiter=maxiter, tol=tol,
+                          nthreads=nthreads)
+
+        case='GMixEMBatch-nstamp%d-dim%d-nthreads%d' % (nstamp, dim, nthreads)
+        r=_time_func(func_batch, case, nrepeat, ncall=1)
+        r.update( {'kernel':'em_run_batch', 'nstamp':nstamp, 'dim':dim,
+                   'ngauss':ngauss, 'nthreads':nthreads} )
+        results.append(r)
+
+    return results
+
+def bench_lm(rng, nrepeat):
+    """
+    time the LMSimple fitter for each model
+    """
+    from .fitting import LMSimple
+
+    dim=48
+    results=[]
+    for model in DEFAULT_MODELS:
+        obs, pars_true=_make_gal_obs(rng, model, dim)
+
+        guess=pars_true.copy()
+        guess[0:0+2] += 0.1*rng.uniform(low=-1.0, high=1.0, size=2)
+        guess[2:2+2] += 0.02*rng.uniform(low=-1.0, high=1.0, size=2)
+        guess[4:] *= (1.0 + 0.05*rng.uniform(low=-1.0, high=1.0, size=2))
+
+        def func():
+            fitter=LMSimple(obs, model, lm_pars=_lm_pars)
+            fitter.go(guess)
+            return fitter
+
+        case='LMSimple-%s-dim%d' % (model, dim)
+        r=_time_func(func, case, nrepeat, ncall=1)
+
+        res=func().get_result()
+        r.update( {'model':model,
+                   'dim':dim,
+                   'flags':res['flags'],
+                   'nfev':res.get('nfev',0)} )
+        results.append(r)
+
+    return results
+
+def bench_prior(rng, nrepeat):
+    """
+    time PriorSimpleSep.fill_fdiff, using the python priors and
+    the compiled priors
+    """
+    from . import priors
+    from .joint_prior import PriorSimpleSep
+
+    results=[]
+    for nband in [1, 4]:
+        for compiled in [False, True]:
+            prior=PriorSimpleSep(
+                priors.CenPrior(0.0, 0.0, 0.263, 0.263),
+                priors.GPriorBA(0.3),
+                priors.TwoSidedErf(-10.0, 0.03, 1.0e6, 1.0e5),
+                [priors.TwoSidedErf(-100.0, 1.0, 1.0e9, 1.0e8)]*nband,
+            )
+            if compiled:
+                prior.compile()
+
+            pars=numpy.zeros(5+nband)
+            pars[0:0+2] = rng.normal(scale=0.1, size=2)
+            pars[2:2+2] = rng.normal(scale=0.2, size=2)
+            pars[4:] = rng.uniform(low=1.0, high=100.0, size=1+nband)
+            fdiff=numpy.zeros(pars.size+1)
+
+            def func():
+                prior.fill_fdiff(pars, fdiff)
+
+            kernel = 'compiled' if compiled else 'python'
+            case='PriorSimpleSep-%s-nband%d' % (kernel, nband)
+            r=_time_func(func, case, nrepeat, ncall=1000)
+            r.update( {'kernel':kernel,
+                       'nband':nband} )
+            results.append(r)
+
+    return results
+
+def bench_max_runner(rng, nrepeat):
+    """
+    time the MaxRunner for each model, including psf fitting
+    """
+    from .bootstrap import MaxRunner
+    from .guessers import TFluxGuesser
+
+    dim=48
+    max_pars={'method':'lm', 'lm_pars':_lm_pars}
+    ntry=2
+
+    results=[]
+    for model in DEFAULT_MODELS:
+        obs, pars_true=_make_gal_obs(rng, model, dim)
+        T=pars_true[4]
+        flux=pars_true[5]
+
+        runner_rng=numpy.random.RandomState(rng.randint(0,2**30))
+        def func():
+            guesser=TFluxGuesser(T, flux, rng=runner_rng)
+            runner=MaxRunner(obs, model, max_pars, guesser)
+            runner.go(ntry=ntry)
+            return runner
+
+        case='MaxRunner-%s-dim%d' % (model, dim)
+        r=_time_func(func, case, nrepeat, ncall=1)
+
+        res=func().fitter.get_result()
+        r.update( {'model':model,
+                   'dim':dim,
+                   'ntry':ntry,
+                   'flags':res['flags']} )
+        results.append(r)
+
+    return results
+
+def bench_metacal(rng, nrepeat):
+    """
+    time a full metacal run with the Bootstrapper: psf fitting, metacal
+    image generation and the fits to the sheared images.  Requires galsim
+    """
+    import galsim
+    from .bootstrap import Bootstrapper
+
+    dim=48
+    model='exp'
+    max_pars={'method':'lm', 'lm_pars':_lm_pars}
+    metacal_pars={'step':0.01}
+
+    obs, pars_true=_make_gal_obs(rng, model, dim)
+
+    def func():
+        boot=Bootstrapper(obs, rng=numpy.random.RandomState(rng.randint(0,2**30)))
+        boot.fit_metacal_max('gauss',
+                             model,
+                             max_pars,
+                             4.0,
+                             metacal_pars=metacal_pars,
+                             psf_ntry=4,
+                             ntry=2)
+        return boot
+
+    case='metacal-%s-dim%d' % (model, dim)
+    r=_time_func(func, case, nrepeat, ncall=1)
+    r.update( {'model':model,
+               'psf_model':'gauss',
+               'dim':dim} )
+
+    return [r]
+
+def bench_gmixnd(rng, nrepeat):
+    """
+    time GMixND.get_lnprob_array for a range of dimensions and number
+    of gaussians
+    """
+    npts=10000
+
+    results=[]
+    for ndim in [2,3]:
+        for ngauss in [5,20]:
+            gmnd=_make_gmixnd(rng, ndim, ngauss)
+            pars=rng.normal(size=(npts,ndim))
+
+            def func():
+                gmnd.get_lnprob_array(pars)
+
+            case='get_lnprob_array-ndim%d-ngauss%d' % (ndim, ngauss)
+            r=_time_func(func, case, nrepeat, ncall=1)
+            r.update( {'ndim':ndim,
+                       'ngauss':ngauss,
+                       'npts':npts} )
+            results.append(r)
+
+    return results
+
+def bench_pqr_templates(rng, nrepeat):
+    """
+    time mvn_calc_pqr_templates via PQRMomTemplatesGauss.calc_pqr
+    """
+    from .moments import PQRMomTemplatesGauss
+    from .priors import MultivariateNormal, ZDisk2D
+
+    mean=numpy.array([0.15, -0.052, -1.96, 2.86, 4.85, 92.0])
+    cov=numpy.array([
+        [+6.790897e-03, +1.451707e-03, +1.860157e-03, -1.059367e-03, -1.901166e-03, -1.461303e-03],
+        [+1.451707e-03, +4.352388e-03, +6.346465e-04, +3.439475e-04, +5.323073e-04, +6.906006e-03],
+        [+1.860157e-03, +6.346465e-04, +1.867478e-01, -2.282856e-02, -6.030356e-02, -5.251863e-02],
+        [-1.059367e-03, +3.439475e-04, -2.282856e-02, +2.054771e-01, +1.194138e-01, +3.461798e-01],
+        [-1.901166e-03, +5.323073e-04, -6.030356e-02, +1.194138e-01, +2.243873e-01, +1.039051e+00],
+        [-1.461303e-03, +6.906006e-03, -5.251863e-02, +3.461798e-01, +1.039051e+00, +1.063436e+01],
+    ])
+
+    # the template code uses the global generator
+    state=numpy.random.get_state()
+    numpy.random.seed(rng.randint(0,2**30))
+
+    try:
+        mvn=MultivariateNormal(mean, cov)
+        cen_dist=ZDisk2D(2.0)
+
+        results=[]
+        for ntemplate in [1000, 10000]:
+            for nrand_cen in [10, 100]:
+                templates=mvn.sample(ntemplate)
+                pqrt=PQRMomTemplatesGauss(templates,
+                                          cen_dist,
+                                          nrand_cen,
+                                          neff_max=1.0e9)
+
+                def func():
+                    pqrt.calc_pqr(mean, cov)
+
+                case='calc_pqr-ntemplate%d-nrand%d' % (ntemplate, nrand_cen)
+                r=_time_func(func, case, nrepeat, ncall=1)
+                r.update( {'kernel':'mvn_calc_pqr_templates',
+                           'ntemplate':ntemplate,
+                           'nrand_cen':nrand_cen,
+                           'nuse':int(pqrt.get_result()['nuse'])} )
+                results.append(r)
+    finally:
+        numpy.random.set_state(state)
+
+    return results
+
+def bench_startup(rng, nrepeat):
+    """
+    time importing ngmix in a new python process, as is done when worker
+    processes start, and then importing the bootstrap and metacal modules.
+    Also record the number of ngmix submodules loaded by importing ngmix,
+    and which of the slow optional dependencies were imported
+    """
+    import os
+    import subprocess
+
+    code='''
+import sys, time, json
+tm0=time.time()
+import ngmix
+tm1=time.time()
+nsub=len([m for m in sys.modules if m.startswith('ngmix.')])
+import ngmix.bootstrap
+tm2=time.time()
+import ngmix.metacal
+tm3=time.time()
+mods=sys.modules
+print(json.dumps({
+    'ngmix':tm1-tm0,
+    'ngmix.bootstrap':tm2-tm1,
+    'ngmix.metacal':tm3-tm2,
+    'nsubmodules':nsub,
+    'loaded':[m for m in ['galsim','scipy','emcee'] if m in mods],
+}))
+'''
+
+    # make sure the new process sees this copy of ngmix
+    env=dict(os.environ)
+    topdir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if 'PYTHONPATH' in env:
+        env['PYTHONPATH'] = topdir + os.pathsep + env['PYTHONPATH']
+    else:
+        env['PYTHONPATH'] = topdir
+
+    times={}
+    for i in xrange(nrepeat):
+        out=subprocess.check_output([sys.executable, '-c', code], env=env)
+        data=json.loads(out.decode('utf-8').strip().split('\n')[-1])
+
+        for name in ['ngmix','ngmix.bootstrap','ngmix.metacal']:
+            times.setdefault(name, []).append(data[name])
+
+    results=[]
+    for name in ['ngmix','ngmix.bootstrap','ngmix.metacal']:
+        ntimes=numpy.array(times[name])
+        tmin=ntimes.min()
+        results.append({
+            'case':'import-%s' % name,
+            'ncall':1,
+            'nrepeat':nrepeat,
+            'time':tmin,
+            'time_per_call':tmin,
+            'time_median':numpy.median(ntimes),
+            'module':name,
+            'nsubmodules_ngmix':data['nsubmodules'],
+            'loaded_after_all':data['loaded'],
+        })
+
+    return results
+
+BENCHMARKS={
+    'render':bench_render,
+    'loglike':bench_loglike,
+    'fdiff':bench_fdiff,
+    'em':bench_em,
+    'em_batch':bench_em_batch,
+    'lm':bench_lm,
+    'prior':bench_prior,
+    'max_runner':bench_max_runner,
+    'metacal':bench_metacal,
+    'gmixnd':bench_gmixnd,
+    'pqr_templates':bench_pqr_templates,
+    'startup':bench_startup,
+}
+BENCHMARK_NAMES=[
+    'render',
+    'loglike',
+    'fdiff',
+    'em',
+    'em_batch',
+    'lm',
+    'prior',
+    'max_runner',
+    'metacal',
+    'gmixnd',
+    'pqr_templates',
+    'startup',
+]
+
+#
+# helpers
+#
+
+_lm_pars={'maxfev':4000, 'ftol':1.0e-5, 'xtol':1.0e-5}
+
+def _time_func(func, case, nrepeat, ncall=1):
+    """
+    call the function ncall times, repeated nrepeat times, and
+    record the minimum time
+
+    The function is called once before timing, so one-time costs such as
+    imports are not included
+    """
+
+    func()
+
+    times=numpy.zeros(nrepeat)
+    for i in xrange(nrepeat):
+        tm0=time.time()
+        for j in xrange(ncall):
+            func()
+        times[i] = time.time()-tm0
+
+    tmin=times.min()
+    return {
+        'case':case,
+        'ncall':ncall,
+        'nrepeat':nrepeat,
+        'time':tmin,
+        'time_per_call':tmin/ncall,
+        'time_median':numpy.median(times)/ncall,
+    }
+
+def _get_ncall(dim):
+    """
+    more calls for the smaller stamps, so the timings are well above
+    the clock resolution
+    """
+    return max(10, int(200*(25.0/dim)**2))
+
+def _get_jacobian(dim):
+    """
+    a jacobian close to unity with the origin at the corner, so the same
+    mixture can be rendered with and without the jacobian
+    """
+    return Jacobian(0.0, 0.0,
+                    1.0, 0.01,
+                    -0.02, 0.99)
+
+def _get_convolved_gmix(rng, model, dim):
+    """
+    get a mixture convolved with a two gaussian psf, placed
+    near the center of the stamp in pixel coordinates
+    """
+    cen=(dim-1.0)/2.0
+    psf_pars=numpy.array([0.6, 0.0, 0.0, 1.0, 0.0, 1.0,
+                          0.4, 0.0, 0.0, 3.0, 0.0, 3.0])
+    gm_psf=GMix(pars=psf_pars)
+
+    pars=numpy.array([cen+rng.uniform(low=-0.5, high=0.5),
+                      cen+rng.uniform(low=-0.5, high=0.5),
+                      0.1*rng.uniform(low=-1.0, high=1.0),
+                      0.1*rng.uniform(low=-1.0, high=1.0),
+                      8.0,
+                      100.0])
+    gm0=GMixModel(pars, model)
+    return gm0.convolve(gm_psf)
+
+def _make_obs(rng, gm, dim, noise=0.1):
+    """
+    make an observation from the mixture, with no jacobian
+    """
+    im=gm.make_image( (dim,dim) )
+    im += noise*rng.normal(size=im.shape)
+    weight=numpy.zeros(im.shape) + 1.0/noise**2
+    return Observation(im, weight=weight, jacobian=UnitJacobian(0.0, 0.0))
+
+def _make_gal_obs(rng, model, dim, noise=0.01):
+    """
+    make an observation of a galaxy convolved with a gaussian psf, with an
+    attached psf observation and psf gmix
+    """
+    cen=(dim-1.0)/2.0
+    jacob=UnitJacobian(cen, cen)
+
+    psf_pars=numpy.array([0.0, 0.0, 0.02, -0.01, 4.0, 1.0])
+    gm_psf=GMixModel(psf_pars, 'gauss')
+
+    pars=numpy.array([0.1*rng.uniform(low=-1.0, high=1.0),
+                      0.1*rng.uniform(low=-1.0, high=1.0),
+                      0.2*rng.uniform(low=-1.0, high=1.0),
+                      0.2*rng.uniform(low=-1.0, high=1.0),
+                      8.0,
+                      100.0])
+
+    gm0=GMixModel(pars, model)
+    gm=gm0.convolve(gm_psf)
+
+    im=gm.make_image( (dim,dim), jacobian=jacob)
+    im += noise*rng.normal(size=im.shape)
+    weight=numpy.zeros(im.shape) + 1.0/noise**2
+
+    psf_noise=1.0e-5
+    psf_im=gm_psf.make_image( (dim,dim), jacobian=jacob)
+    psf_im += psf_noise*rng.normal(size=psf_im.shape)
+    psf_weight=numpy.zeros(psf_im.shape) + 1.0/psf_noise**2
+
+    psf_obs=Observation(psf_im, weight=psf_weight, jacobian=jacob)
+    psf_obs.set_gmix(gm_psf)
+
+    obs=Observation(im, weight=weight, jacobian=jacob, psf=psf_obs)
+
+    return obs, pars
+
+def _get_em_guess(rng, ngauss):
+    """
+    guess for the EM fitter, in sky coordinates
+    """
+    pars=numpy.zeros(ngauss*6)
+    for i in xrange(ngauss):
+        beg=i*6
+        pars[beg+0] = 1.0/ngauss
+        pars[beg+1] = 0.1*rng.uniform(low=-1.0, high=1.0)
+        pars[beg+2] = 0.1*rng.uniform(low=-1.0, high=1.0)
+        pars[beg+3] = 2.0*(i+1)*(1.0 + 0.1*rng.uniform(low=-1.0, high=1.0))
+        pars[beg+4] = 0.0
+        pars[beg+5] = 2.0*(i+1)*(1.0 + 0.1*rng.uniform(low=-1.0, high=1.0))
+
+    return GMix(pars=pars)
+
+def _make_gmixnd(rng, ndim, ngauss):
+    """
+    random mixture with well conditioned covariance matrices
+    """
+    weights=rng.uniform(low=0.5, high=1.0, size=ngauss)
+    weights /= weights.sum()
+
+    means=rng.normal(size=(ngauss,ndim))
+
+    covars=numpy.zeros( (ngauss,ndim,ndim) )
+    for i in xrange(ngauss):
+        a=0.3*rng.normal(size=(ndim,ndim))
+        covars[i,:,:] = numpy.dot(a, a.T) + 0.1*numpy.eye(ndim)
+
+    return GMixND(weights=weights, means=means, covars=covars)
+
+def _get_git_commit():
+    """
+    get the git commit of the source tree, or None if it cannot
+    be determined
+    """
+    import os
+    import subprocess
+
+    dir=os.path.dirname(os.path.abspath(__file__))
+    try:
+        proc=subprocess.Popen(['git','rev-parse','HEAD'],
+                              cwd=dir,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+        out,err=proc.communicate()
+        if proc.returncode != 0:
+            return None
+        return out.decode('ascii').strip()
+    except OSError:
+        return None
+
+def main():
+    """
+    run the benchmarks from the command line
+
+        python -m ngmix.benchmarks [output.json] [name1 name2 ...]
+    """
+    output=None
+    names=None
+    if len(sys.argv) > 1:
+        output=sys.argv[1]
+    if len(sys.argv) > 2:
+        names=sys.argv[2:]
+
+    run_benchmarks(names=names, output=output)
+
+if __name__=="__main__":
+    main()
@@ -19,13 +19,16 @@ from .fitting import print_pars
 from .gmix import GMix, GMixModel, GMixCM, get_coellip_npars
 from .em import GMixEM, prep_image
 from .observation import Observation, ObsList, MultiBandObsList, get_mb_obs
-from .priors import srandu
+from .priors import srandu, _get_rng
 from .shape import get_round_factor
 from .guessers import TFluxGuesser, TFluxAndPriorGuesser, ParsGuesser, RoundParsGuesser
 from .gexceptions import GMixRangeError, BootPSFFailure, BootGalFailure
+from .gexceptions import BootPrescreenFailure
 
 from . import roundify
 from . import metacal
+from . import records
+from .counters import StageCounters, get_timer
 
 BOOT_S2N_LOW = 2**0
 BOOT_R2_LOW = 2**1
@@ -34,12 +37,22 @@ BOOT_TS2N_ROUND_FAIL = 2**3
 BOOT_ROUND_CONVOLVE_FAIL = 2**4
 BOOT_WEIGHTS_LOW= 2**5
 
+# flags from the prescreen
+BOOT_PRESCREEN_S2N_LOW = 2**6
+BOOT_PRESCREEN_COVERAGE_LOW = 2**7
+BOOT_PRESCREEN_TRATIO_LOW = 2**8
+BOOT_PRESCREEN_EM_FAIL = 2**9
+
 
 
 class Bootstrapper(object):
     def __init__(self, obs,
                  use_logpars=False, intpars=None, find_cen=False,
                  verbose=False,
+                 rng=None,
+                 instrument=False,
+                 psf_cache=None,
+                 psf_guesses=None,
                  **kw):
         """
         The data can be mutated: If a PSF fit is performed, the gmix will be
@@ -53,12 +66,34 @@ class Bootstrapper(object):
             
             If the psf observations already have gmix objects set, there is no
             need to run fit_psfs()
+        rng: numpy RandomState or Generator, optional
+            Used for all random guesses, prior samples and noise.  If
+            not sent, the global numpy random state is used
+        instrument: bool, optional
+            If True, record the wall time and counters such as nfev, ntry
+            and EM iterations for each stage; see get_counters
+        psf_cache: PSFFitCache, optional
+            If sent, psf fits are looked up in and added to this cache,
+            so psf images that were already fit are not fit again.
+            See the psfcache module
+        psf_guesses: PSFGuessRegistry, optional
+            If sent, each psf fit starts from the last successful fit for
+            the same exposure, falling back to random guesses if that
+            fails.  See the psfcache module
         """
 
         self.use_logpars=use_logpars
         self.intpars=intpars
         self.find_cen=find_cen
         self.verbose=verbose
+        self.rng=rng
+        self.psf_cache=psf_cache
+        self.psf_guesses=psf_guesses
+
+        if instrument:
+            self.counters=StageCounters()
+        else:
+            self.counters=None
 
         # this never gets modified in any way
         self.mb_obs_list_orig = get_mb_obs(obs)
@@ -71,6 +106,16 @@ class Bootstrapper(object):
 
         self.model_fits={}
 
+    def get_counters(self):
+        """
+        get the timing and counters for each stage, as a dict keyed
+        by stage; see the counters module.  Returns None if the
+        bootstrapper was not created with instrument=True
+        """
+        if self.counters is None:
+            return None
+        return self.counters.get_dict()
+
     def get_isampler(self):
         """
         get the importance sampler
@@ -130,6 +175,184 @@ class Bootstrapper(object):
             raise RuntimeError("you need to run set_round_s2n")
         return self.round_res
 
+    def get_prescreen_result(self):
+        """
+        get result of prescreen()
+        """
+        if not hasattr(self, 'prescreen_res'):
+            raise RuntimeError("you need to run prescreen")
+        return self.prescreen_res
+
+    def prescreen(self,
+                  min_s2n=None,
+                  min_coverage=None,
+                  min_Tratio=None,
+                  Tguess=4.0,
+                  em_pars=None):
+        """
+        cheap checks to decide if the object is worth the full processing
+
+        The simple s/n, sum(I)/sqrt( sum(1/w) ) over all observations, and
+        the fraction of pixels with weight > 0 are always calculated.  If
+        min_Tratio is sent, a single gaussian is fit with EM to the first
+        observation in each band and to its psf, and the mean ratio of the
+        sizes is calculated.
+
+        If any check fails, the flags are set in the result and subsequent
+        calls to fit_psfs, fit_max, fit_metacal_max and fit_metacal_regauss
+        raise BootPrescreenFailure, which is a BootGalFailure
+
+        parameters
+        ----------
+        min_s2n: float, optional
+            Minimum simple s/n
+        min_coverage: float, optional
+            Minimum fraction of pixels with weight > 0
+        min_Tratio: float, optional
+            Minimum ratio of the T of the object to that of the psf, from
+            the single gaussian EM fits.  Objects consistent with a point
+            source have Tratio near one
+        Tguess: float, optional
+            Guess for T in the EM fits, default 4.0
+        em_pars: dict, optional
+            Parameters for the EM fits, default
+            {'maxiter':200, 'tol':1.0e-4}
+
+        returns
+        -------
+        flags: int
+            Zero if the object passed all checks.  The full result
+            is available from get_prescreen_result()
+        """
+
+        with get_timer(self.counters, 'prescreen'):
+            res=self._do_prescreen(min_s2n, min_coverage, min_Tratio,
+                                   Tguess, em_pars)
+
+        if self.counters is not None:
+            self.counters.count('prescreen',
+                                nreject=int(res['flags'] != 0))
+
+        if self.verbose and res['flags'] != 0:
+            print("    failed prescreen:",res['flags'])
+
+        self.prescreen_res=res
+        return res['flags']
+
+    def _do_prescreen(self, min_s2n, min_coverage, min_Tratio,
+                      Tguess, em_pars):
+
+        flags=0
+        res={'s2n':-9999.0,
+             'coverage':-9999.0,
+             'T':-9999.0,
+             'psf_T':-9999.0,
+             'Tratio':-9999.0}
+
+        Isum=0.0
+        Vsum=0.0
+        npix_good=0
+        npix=0
+        for obslist in self.mb_obs_list:
+            for obs in obslist:
+                tIsum,tVsum,tnpix=obs.get_s2n_sums()
+                Isum += tIsum
+                Vsum += tVsum
+                npix_good += tnpix
+                npix += obs.weight.size
+
+        if npix > 0:
+            res['coverage'] = npix_good/float(npix)
+        if Vsum > 0.0:
+            res['s2n'] = Isum/sqrt(Vsum)
+
+        if min_coverage is not None and res['coverage'] < min_coverage:
+            flags |= BOOT_PRESCREEN_COVERAGE_LOW
+
+        if min_s2n is not None and res['s2n'] < min_s2n:
+            flags |= BOOT_PRESCREEN_S2N_LOW
+
+        if min_Tratio is not None and flags == 0:
+            T, psf_T, tflags = self._get_prescreen_T(Tguess, em_pars)
+            flags |= tflags
+            if tflags == 0:
+                res['T'] = T
+                res['psf_T'] = psf_T
+                res['Tratio'] = T/psf_T
+
+                if res['Tratio'] < min_Tratio:
+                    flags |= BOOT_PRESCREEN_TRATIO_LOW
+
+        res['flags']=flags
+        return res
+
+    def _get_prescreen_T(self, Tguess, em_pars):
+        """
+        mean T of the object and psf from single gaussian EM fits to the
+        first observation in each band
+        """
+
+        epars={'maxiter':200, 'tol':1.0e-4}
+        if em_pars is not None:
+            epars.update(em_pars)
+
+        flags=0
+        Tsum=0.0
+        psf_Tsum=0.0
+        nband=0
+        for obslist in self.mb_obs_list:
+            if len(obslist) == 0:
+                continue
+
+            obs=obslist[0]
+            try:
+                T = self._get_prescreen_em_T(obs, Tguess, epars)
+
+                psf_obs=obs.get_psf()
+                if psf_obs.has_gmix():
+                    psf_T = psf_obs.gmix.get_T()
+                else:
+                    psf_T = self._get_prescreen_em_T(psf_obs, Tguess, epars)
+            except (BootGalFailure, GMixRangeError):
+                flags |= BOOT_PRESCREEN_EM_FAIL
+                break
+
+            if psf_T <= 0.0:
+                flags |= BOOT_PRESCREEN_EM_FAIL
+                break
+
+            Tsum += T
+            psf_Tsum += psf_T
+            nband += 1
+
+        if flags != 0 or nband == 0:
+            return -9999.0, -9999.0, flags | BOOT_PRESCREEN_EM_FAIL
+
+        return Tsum/nband, psf_Tsum/nband, flags
+
+    def _get_prescreen_em_T(self, obs, Tguess, em_pars):
+        runner=EMRunner(obs, Tguess, 1, em_pars, rng=self.rng)
+        runner.go(ntry=2)
+
+        res=runner.fitter.get_result()
+        if self.counters is not None:
+            self.counters.count_fit('prescreen', res, npix=obs.image.size,
+                                    try_results=runner.try_results)
+
+        if res['flags'] != 0:
+            raise BootGalFailure("prescreen em failed")
+
+        return runner.fitter.get_gmix().get_T()
+
+    def _check_prescreen(self):
+        """
+        raise BootPrescreenFailure if the object failed the prescreen
+        """
+        res=getattr(self, 'prescreen_res', None)
+        if res is not None and res['flags'] != 0:
+            raise BootPrescreenFailure("failed prescreen: %d" % res['flags'],
+                                       flags=res['flags'])
+
 
     def set_round_s2n(self, fitter_type='max'):
         """
@@ -147,7 +370,8 @@ class Bootstrapper(object):
 
         pars, pars_lin = self._get_round_pars(res['pars'])
 
-        s2n, psf_T, flags = self._get_s2n_round(pars)
+        with get_timer(self.counters, 'round'):
+            s2n, psf_T, flags = self._get_s2n_round(pars)
 
         T_r = pars_lin[4]
         self.round_res={'pars':pars,
@@ -224,7 +448,8 @@ class Bootstrapper(object):
         # now get roundified observations
         print("    getting round obs")
         mb_obs_list = roundify.get_round_mb_obs_list(self.mb_obs_list,
-                                                     sim_image=True)
+                                                     sim_image=True,
+                                                     rng=self.rng)
 
         print("    getting s2n")
         s2n_sum=0.0
@@ -298,7 +523,8 @@ class Bootstrapper(object):
                               res['model'],
                               max_pars,
                               prior=round_prior,
-                              use_logpars=self.use_logpars)
+                              use_logpars=self.use_logpars,
+                              rng=self.rng)
 
         runner.go(ntry=ntry)
 
@@ -524,12 +750,13 @@ class Bootstrapper(object):
         T0=8.0
 
         for i in xrange(ntry):
-            guess=[1.0*(1.0 + 0.01*srandu()),
-                   row0*(1.0+0.5*srandu()),
-                   col0*(1.0+0.5*srandu()),
-                   T0/2.0*(1.0 + 0.1*srandu()),
-                   0.1*srandu(),
-                   T0/2.0*(1.0 + 0.1*srandu())]
+            rng=self.rng
+            guess=[1.0*(1.0 + 0.01*srandu(rng=rng)),
+                   row0*(1.0+0.5*srandu(rng=rng)),
+                   col0*(1.0+0.5*srandu(rng=rng)),
+                   T0/2.0*(1.0 + 0.1*srandu(rng=rng)),
+                   0.1*srandu(rng=rng),
+                   T0/2.0*(1.0 + 0.1*srandu(rng=rng))]
 
             gm_guess = GMix(pars=guess)
 
@@ -538,9 +765,12 @@ class Bootstrapper(object):
             obs = Observation(im)
 
             fitter=GMixEM(obs)
-            fitter.go(gm_guess, sky, maxiter=4000) 
+            with get_timer(self.counters, 'find_cen'):
+                fitter.go(gm_guess, sky, maxiter=4000) 
 
             res=fitter.get_result()
+            if self.counters is not None:
+                self.counters.count_fit('find_cen', res, npix=im.size)
 
             if res['flags']==0:
                 break
@@ -579,7 +809,8 @@ class Bootstrapper(object):
         ntry: integer
             Number of retries if the psf fit fails
         fit_pars: dict
-            Fitting parameters for psf.
+            Fitting parameters for psf.  For the em models these are
+            sent to GMixEM.go, e.g. {'accelerate':True}
         skip_already_done: bool
             Skip psfs with a gmix already set
         norm_key: will use this key in the PSF meta data to fudge the normalization 
@@ -587,6 +818,8 @@ class Bootstrapper(object):
             (usually 1)
         """
 
+        self._check_prescreen()
+
         ntot=0
         new_mb_obslist=MultiBandObsList()
 
@@ -645,21 +878,66 @@ class Bootstrapper(object):
         TODO: add bootstrapping T guess as well, from unweighted moments
         """
 
-        if 'em' in psf_model:
-            assert self.intpars is None,"pixel integration only for max like fitting"
-            runner=self._fit_one_psf_em(psf_obs, psf_model, Tguess, ntry, fit_pars)
-        elif 'coellip' in psf_model:
-            runner=self._fit_one_psf_coellip(psf_obs, psf_model, Tguess, ntry, fit_pars)
-        else:
-            runner=self._fit_one_psf_max(psf_obs, psf_model, Tguess, ntry, fit_pars)
+        psf_fitter=None
+        rng=self.rng
+        if self.psf_cache is not None:
+            key=self.psf_cache.get_key(psf_obs, psf_model, Tguess, ntry,
+                                       fit_pars, intpars=self.intpars)
+            psf_fitter=self.psf_cache.get(key)
+
+            # the guesses depend only on the key, so the result does not
+            # depend on which object the psf was first seen with
+            rng=self.psf_cache.get_rng(key)
+
+            if psf_fitter is not None and self.counters is not None:
+                self.counters.count('psf', ncache_hit=1)
+
+        if self.psf_guesses is not None:
+            guess_key=self.psf_guesses.get_key(psf_obs, psf_model)
+
+        if psf_fitter is None:
+            guess=None
+            if self.psf_guesses is not None:
+                guess=self.psf_guesses.get(guess_key)
+
+            with get_timer(self.counters, 'psf'):
+                if 'em' in psf_model:
+                    assert self.intpars is None,"pixel integration only for max like fitting"
+                    runner=self._fit_one_psf_em(psf_obs, psf_model, Tguess, ntry, fit_pars, rng,
+                                                guess=guess)
+                elif 'coellip' in psf_model:
+                    runner=self._fit_one_psf_coellip(psf_obs, psf_model, Tguess, ntry, fit_pars, rng,
+                                                     guess=guess)
+                else:
+                    runner=self._fit_one_psf_max(psf_obs, psf_model, Tguess, ntry, fit_pars, rng,
+                                                 guess=guess)
+
+            psf_fitter = runner.fitter
+
+            if self.counters is not None:
+                self.counters.count_fit('psf', psf_fitter.get_result(),
+                                        npix=psf_obs.image.size,
+                                        try_results=runner.try_results)
+                if psf_fitter.get_result().get('warm_start',False):
+                    self.counters.count('psf', nwarm_start=1)
+
+            if self.psf_cache is not None:
+                self.psf_cache.put(key, psf_fitter)
 
-        psf_fitter = runner.fitter
         res=psf_fitter.get_result()
         psf_obs.update_meta_data({'fitter':psf_fitter})
         
         if res['flags']==0:
             self.psf_fitter=psf_fitter
-            gmix=self.psf_fitter.get_gmix()
+
+            if self.psf_guesses is not None:
+                if 'em' in psf_model:
+                    self.psf_guesses.put(guess_key, psf_fitter.get_gmix())
+                else:
+                    self.psf_guesses.put(guess_key, res['pars'])
+
+            # copy, since the fitter may be shared through the cache
+            gmix=self.psf_fitter.get_gmix().copy()
             
             if norm_key is not None:
                 gmix.set_psum(psf_obs.meta[norm_key])
@@ -669,19 +947,21 @@ class Bootstrapper(object):
         else:
             raise BootPSFFailure("failed to fit psfs")
 
-    def _fit_one_psf_em(self, psf_obs, psf_model, Tguess, ntry, fit_pars):
+    def _fit_one_psf_em(self, psf_obs, psf_model, Tguess, ntry, fit_pars, rng,
+                        guess=None):
 
         ngauss=get_em_ngauss(psf_model)
         em_pars={'tol': 1.0e-6, 'maxiter': 50000}
         if fit_pars is not None:
             em_pars.update(fit_pars)
         
-        runner=EMRunner(psf_obs, Tguess, ngauss, em_pars)
-        runner.go(ntry=ntry)
+        runner=EMRunner(psf_obs, Tguess, ngauss, em_pars, rng=rng)
+        runner.go(ntry=ntry, guess=guess)
 
         return runner
     
-    def _fit_one_psf_coellip(self, psf_obs, psf_model, Tguess, ntry, fit_pars):
+    def _fit_one_psf_coellip(self, psf_obs, psf_model, Tguess, ntry, fit_pars, rng,
+                             guess=None):
 
         ngauss=get_coellip_ngauss(psf_model)
         lm_pars={'maxfev': 4000}
@@ -689,20 +969,23 @@ class Bootstrapper(object):
         if fit_pars is not None:
             lm_pars.update(fit_pars)
         
-        runner=PSFRunnerCoellip(psf_obs, Tguess, ngauss, lm_pars, intpars=self.intpars)
-        runner.go(ntry=ntry)
+        runner=PSFRunnerCoellip(psf_obs, Tguess, ngauss, lm_pars,
+                                intpars=self.intpars, rng=rng)
+        runner.go(ntry=ntry, guess=guess)
 
         return runner
     
  
-    def _fit_one_psf_max(self, psf_obs, psf_model, Tguess, ntry, fit_pars):
+    def _fit_one_psf_max(self, psf_obs, psf_model, Tguess, ntry, fit_pars, rng,
+                         guess=None):
         lm_pars={'maxfev': 4000}
 
         if fit_pars is not None:
             lm_pars.update(fit_pars)
 
-        runner=PSFRunner(psf_obs, psf_model, Tguess, lm_pars, intpars=self.intpars)
-        runner.go(ntry=ntry)
+        runner=PSFRunner(psf_obs, psf_model, Tguess, lm_pars,
+                         intpars=self.intpars, rng=rng)
+        runner.go(ntry=ntry, guess=guess)
 
         return runner
 
@@ -721,6 +1004,8 @@ class Bootstrapper(object):
         extra_priors is ignored here but used in composite
         """
 
+        self._check_prescreen()
+
         self.max_fitter = self._fit_one_model_max(gal_model,
                                                   pars,
                                                   guess=guess,
@@ -742,6 +1027,7 @@ class Bootstrapper(object):
                         psf_ntry=10,
                         ntry=1,
                         guess_from_max=False,
+                        output=None,
                         **kw):
         """
         run metacalibration
@@ -758,8 +1044,13 @@ class Bootstrapper(object):
             Optional prior to apply
         ntry: int, optional
             Number of times to retry fitting, default 1
+        output: row of a structured array, optional
+            If sent, the metacal result is also written into this row.
+            It must have the columns from records.get_metacal_schema
         """
 
+        self._check_prescreen()
+
         if extra_noise is not None or target_noise is not None:
             raise NotImplementedError("fix noise adding")
 
@@ -789,8 +1080,9 @@ class Bootstrapper(object):
             # use_psf_model and psf_shape
             # this can contain things like type= for metacal types
             metacal_pars.update(kw)
-            obs_dict_orig = metacal.get_all_metacal(self.mb_obs_list,
-                                                    **metacal_pars)
+            with get_timer(self.counters, 'metacal_images'):
+                obs_dict_orig = metacal.get_all_metacal(self.mb_obs_list,
+                                                        **metacal_pars)
 
         if False:
             import images
@@ -815,19 +1107,24 @@ class Bootstrapper(object):
             if nrand > 1 and self.verbose:
                 print("    irand: %d/%d" % (i+1,nrand))
 
-            fits = self._do_metacal_max_fits(obs_dict,
-                                             psf_model, gal_model,
-                                             pars, psf_Tguess,
-                                             prior, psf_ntry, ntry,
-                                             psf_fit_pars,
-                                             extra_noise,
-                                             guess=guess)
+            with get_timer(self.counters, 'metacal_fits'):
+                fits = self._do_metacal_max_fits(obs_dict,
+                                                 psf_model, gal_model,
+                                                 pars, psf_Tguess,
+                                                 prior, psf_ntry, ntry,
+                                                 psf_fit_pars,
+                                                 extra_noise,
+                                                 guess=guess)
             tres=self._extract_metacal_responses(fits, metacal_pars)
 
 
             reslist.append(tres)
 
         res=self._do_mean_dictlist(reslist)
+
+        if output is not None:
+            self._fill_metacal_output(output, res)
+
         res['obs_dict'] = obs_dict_orig
         self.metacal_max_res = res
 
@@ -923,9 +1220,10 @@ class Bootstrapper(object):
         get a noise image for use in degrading a high s/n image
         """
 
-        noise_image = numpy.random.normal(loc=0.0,
-                                          scale=noise,
-                                          size=dims)
+        rng=_get_rng(self.rng)
+        noise_image = rng.normal(loc=0.0,
+                                 scale=noise,
+                                 size=dims)
 
         return noise_image
 
@@ -953,7 +1251,7 @@ class Bootstrapper(object):
 
         new_obs = Observation(new_im,
                               weight=new_weight,
-                              jacobian=obs.jacobian)
+                              jacobian=obs.jacobian.get_view())
         if obs.has_psf():
             new_obs.set_psf(obs.psf)
 
@@ -1024,6 +1322,14 @@ class Bootstrapper(object):
         return res
 
 
+    def _fill_metacal_output(self, output, res, shape_type='g'):
+        """
+        write the result of _extract_metacal_responses into the row
+        """
+        npars=res['mcal_pars'].size
+        schema=records.get_metacal_schema(npars, shape_type=shape_type)
+        schema.fill(output, res)
+
     def _do_metacal_max_fits(self, obs_dict, psf_model, gal_model, pars, 
                              psf_Tguess, prior, psf_ntry, ntry, 
                              psf_fit_pars,
@@ -1043,13 +1349,21 @@ class Bootstrapper(object):
                                 use_logpars=self.use_logpars,
                                 intpars=self.intpars,
                                 find_cen=self.find_cen,
-                                verbose=self.verbose)
+                                verbose=self.verbose,
+                                rng=self.rng,
+                                instrument=self.counters is not None,
+                                psf_cache=self.psf_cache,
+                                psf_guesses=self.psf_guesses)
 
-            boot.fit_psfs(psf_model, psf_Tguess, ntry=psf_ntry, fit_pars=psf_fit_pars)
-            boot.fit_max(gal_model, pars, prior=prior, ntry=ntry,
-                         guess=guess,
-                         guess_widths=guess_widths)
-            boot.set_round_s2n()
+            try:
+                boot.fit_psfs(psf_model, psf_Tguess, ntry=psf_ntry, fit_pars=psf_fit_pars)
+                boot.fit_max(gal_model, pars, prior=prior, ntry=ntry,
+                             guess=guess,
+                             guess_widths=guess_widths)
+                boot.set_round_s2n()
+            finally:
+                if self.counters is not None:
+                    self.counters.merge(boot.counters, prefix='metacal_')
 
             # verbose can be bool or a number
             if self.verbose > 1:
@@ -1120,7 +1434,8 @@ class Bootstrapper(object):
                             ntry=1,
                             metacal_pars=None,
                             target_noise=None,
-                            extra_noise=None):
+                            extra_noise=None,
+                            output=None):
 
         """
         run metacalibration using regauss from the galsim
@@ -1140,8 +1455,14 @@ class Bootstrapper(object):
             number of tries at psf fitting with different size guess
         ntry: int
             number of tries at shear fitting with different size guess
+        output: row of a structured array, optional
+            If sent, the metacal result is also written into this row.
+            It must have the columns from records.get_metacal_schema
+            with shape_type='e'
         """
 
+        self._check_prescreen()
+
         if len(self.mb_obs_list) > 1 or len(self.mb_obs_list[0]) > 1:
             raise NotImplementedError("only a single obs for now")
 
@@ -1178,6 +1499,9 @@ class Bootstrapper(object):
 
         res['flags']=0
 
+        if output is not None:
+            self._fill_metacal_output(output, res, shape_type='e')
+
         self.metacal_regauss_res = res
 
     def _do_metacal_regauss(self,
@@ -1243,7 +1567,7 @@ class Bootstrapper(object):
         # Eric recommends trying a few different psf sigma sizes
         ok=False
         for i in xrange(ntry):
-            psf_guess_sig = sqrt(Tguess/2.0)*(1.0 + 0.1*srandu())
+            psf_guess_sig = sqrt(Tguess/2.0)*(1.0 + 0.1*srandu(rng=self.rng))
             try:
                 galsim.hsm.FindAdaptiveMom(psf_im, guess_sig=psf_guess_sig)
                 ok=True
@@ -1284,7 +1608,7 @@ class Bootstrapper(object):
 
         ok=False
         for i in xrange(ntry):
-            guess_sig = sqrt(Tguess/2.0)*(1.0 + 0.1*srandu())
+            guess_sig = sqrt(Tguess/2.0)*(1.0 + 0.1*srandu(rng=self.rng))
             try:
                 hres = galsim.hsm.EstimateShear(im,
                                                 psf_im,
@@ -1424,11 +1748,15 @@ class Bootstrapper(object):
                          intpars=self.intpars,
                          use_logpars=self.use_logpars)
 
-        runner.go(ntry=ntry)
+        with get_timer(self.counters, 'max'):
+            runner.go(ntry=ntry)
 
         fitter=runner.fitter
 
         res=fitter.get_result()
+        if self.counters is not None:
+            self.counters.count_fit('max', res,
+                                    try_results=runner.try_results)
 
         if res['flags'] != 0:
             raise BootGalFailure("failed to fit galaxy with maxlike")
@@ -1540,7 +1868,8 @@ class Bootstrapper(object):
             obs_list = mbo[i]
 
             fitter=fitting.TemplateFluxFitter(obs_list, do_psf=True, normalize_psf=normalize_psf)
-            fitter.go()
+            with get_timer(self.counters, 'psf_flux'):
+                fitter.go()
 
             res=fitter.get_result()
             tflags = res['flags']
@@ -1571,7 +1900,8 @@ class Bootstrapper(object):
             scaling='linear'
 
         if guess is not None:
-            guesser=ParsGuesser(guess, scaling=scaling, widths=widths)
+            guesser=ParsGuesser(guess, scaling=scaling, widths=widths,
+                                rng=self.rng)
         else:
             psf_T = self.mb_obs_list[0][0].psf.gmix.get_T()
 
@@ -1581,12 +1911,14 @@ class Bootstrapper(object):
             if prior is None:
                 guesser=TFluxGuesser(psf_T,
                                      pres['psf_flux'],
-                                     scaling=scaling)
+                                     scaling=scaling,
+                                     rng=self.rng)
             else:
                 guesser=TFluxAndPriorGuesser(psf_T,
                                              pres['psf_flux'],
                                              prior,
-                                             scaling=scaling)
+                                             scaling=scaling,
+                                             rng=self.rng)
         return guesser
 
 
@@ -1622,6 +1954,8 @@ class BootstrapperGaussMom(Bootstrapper):
         extra_priors is ignored here but used in composite
         """
 
+        self._check_prescreen()
+
         self.max_fitter = self._fit_one_model_max(pars,
                                                   guess=guess,
                                                   prior=prior,
@@ -1690,7 +2024,7 @@ class BootstrapperGaussMom(Bootstrapper):
 
             guess=array( [0.0, 0.0, 0.0, 0.0, psf_T, pres['psf_flux']] )
 
-        guesser=MomGuesser(guess, prior=prior)
+        guesser=MomGuesser(guess, prior=prior, rng=self.rng)
         return guesser
 
 
@@ -1726,6 +2060,8 @@ class CompositeBootstrapper(Bootstrapper):
         """
 
         assert model=='cm','model must be cm'
+        self._check_prescreen()
+
         if extra_priors is None:
             exp_prior=prior
             dev_prior=prior
@@ -1760,7 +2096,8 @@ class CompositeBootstrapper(Bootstrapper):
             
         print("    fitting fracdev")
         use_grid=pars.get('use_fracdev_grid',False)
-        fres=self._fit_fracdev(exp_fitter, dev_fitter, use_grid=use_grid)
+        with get_timer(self.counters, 'fracdev'):
+            fres=self._fit_fracdev(exp_fitter, dev_fitter, use_grid=use_grid)
 
         fracdev = fres['fracdev']
         fracdev_clipped = self._clip_fracdev(fracdev,pars)
@@ -1784,7 +2121,8 @@ class CompositeBootstrapper(Bootstrapper):
                                           TdByTe,
                                           prior=prior,
                                           use_logpars=self.use_logpars)
-                runner.go(ntry=ntry)
+                with get_timer(self.counters, 'max'):
+                    runner.go(ntry=ntry)
                 ok=True
                 break
             except GMixRangeError:
@@ -1803,6 +2141,9 @@ class CompositeBootstrapper(Bootstrapper):
                                  "indicating model problems")
 
         self.max_fitter=runner.fitter
+        if self.counters is not None:
+            self.counters.count_fit('max', self.max_fitter.get_result(),
+                                    try_results=runner.try_results)
 
         res=self.max_fitter.get_result()
         if res['flags'] != 0:
@@ -1888,7 +2229,8 @@ class CompositeBootstrapper(Bootstrapper):
                                        res['fracdev'],
                                        res['TdByTe'],
                                        prior=round_prior,
-                                       use_logpars=self.use_logpars)
+                                       use_logpars=self.use_logpars,
+                                       rng=self.rng)
 
         runner.go(ntry=ntry)
 
@@ -2049,10 +2391,11 @@ class PSFRunner(object):
     """
     wrapper to generate guesses and run the psf fitter a few times
     """
-    def __init__(self, obs, model, Tguess, lm_pars, intpars=None):
+    def __init__(self, obs, model, Tguess, lm_pars, intpars=None, rng=None):
 
         self.obs=obs
         self.intpars=intpars
+        self.rng=rng
 
         mess="psf model should be turb or gauss,got '%s'" % model
         assert model in ['turb','gauss'],mess
@@ -2061,7 +2404,19 @@ class PSFRunner(object):
         self.lm_pars=lm_pars
         self.set_guess0(Tguess)
 
-    def go(self, ntry=1):
+    def go(self, ntry=1, guess=None):
+        """
+        run the fitter, with up to ntry random guesses
+
+        parameters
+        ----------
+        ntry: int, optional
+            Number of random guesses to try, default 1
+        guess: array, optional
+            A starting guess, e.g. the result for a previous psf.  It is
+            tried first, and the random guesses are used only if that
+            fit fails
+        """
         from .fitting import LMSimple
 
         if self.intpars is not None:
@@ -2070,6 +2425,20 @@ class PSFRunner(object):
         else:
             npoints=None
 
+        self.try_results=[]
+        nwarm=0
+        if guess is not None:
+            nwarm=1
+            fitter=LMSimple(self.obs,self.model,lm_pars=self.lm_pars,npoints=npoints)
+            fitter.go(guess.copy())
+
+            res=fitter.get_result()
+            self.try_results.append(res)
+            if res['flags']==0:
+                res['ntry'] = 1
+                res['warm_start'] = True
+                self.fitter=fitter
+                return
 
         for i in xrange(ntry):
             guess=self.get_guess()
@@ -2077,18 +2446,21 @@ class PSFRunner(object):
             fitter.go(guess)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
+        res['ntry'] = nwarm+i+1
+        res['warm_start'] = False
         self.fitter=fitter
 
     def get_guess(self):
         guess=self.guess0.copy()
 
-        guess[0:0+2] + 0.01*srandu(2)
-        guess[2:2+2] + 0.1*srandu(2)
-        guess[4] = guess[4]*(1.0 + 0.1*srandu())
-        guess[5] = guess[5]*(1.0 + 0.1*srandu())
+        guess[0:0+2] + 0.01*srandu(2, rng=self.rng)
+        guess[2:2+2] + 0.1*srandu(2, rng=self.rng)
+        guess[4] = guess[4]*(1.0 + 0.1*srandu(rng=self.rng))
+        guess[5] = guess[5]*(1.0 + 0.1*srandu(rng=self.rng))
 
         return guess
 
@@ -2101,9 +2473,13 @@ class PSFRunner(object):
 class EMRunner(object):
     """
     wrapper to generate guesses and run the psf fitter a few times
+
+    em_pars are sent to GMixEM.go, e.g. {'maxiter':5000, 'tol':1.0e-6}.
+    Set 'accelerate':True to use the SQUAREM accelerated algorithm
     """
-    def __init__(self, obs, Tguess, ngauss, em_pars):
+    def __init__(self, obs, Tguess, ngauss, em_pars, rng=None):
 
+        self.rng=rng
         self.ngauss = ngauss
         self.Tguess = Tguess
         self.sigma_guess = sqrt(Tguess/2)
@@ -2123,19 +2499,48 @@ class EMRunner(object):
     def get_fitter(self):
         return self.fitter
 
-    def go(self, ntry=1):
+    def go(self, ntry=1, guess=None):
+        """
+        run the fitter, with up to ntry random guesses
+
+        parameters
+        ----------
+        ntry: int, optional
+            Number of random guesses to try, default 1
+        guess: GMix, optional
+            A starting guess, e.g. the result for a previous psf.  It is
+            tried first, and the random guesses are used only if that
+            fit fails
+        """
 
         fitter=GMixEM(self.obs)
+
+        self.try_results=[]
+        nwarm=0
+        if guess is not None:
+            nwarm=1
+            fitter.go(guess.copy(), self.sky, **self.em_pars)
+
+            res=fitter.get_result()
+            self.try_results.append(res)
+            if res['flags']==0:
+                res['ntry'] = 1
+                res['warm_start'] = True
+                self.fitter=fitter
+                return
+
         for i in xrange(ntry):
             guess=self.get_guess()
 
             fitter.go(guess, self.sky, **self.em_pars)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
-        res['ntry'] = i+1
+        res['ntry'] = nwarm+i+1
+        res['warm_start'] = False
         self.fitter=fitter
 
     def get_guess(self):
@@ -2155,12 +2560,12 @@ class EMRunner(object):
     def _get_em_guess_1gauss(self):
 
         sigma2 = self.sigma_guess**2
-        pars=array( [1.0 + 0.1*srandu(),
-                     0.1*srandu(),
-                     0.1*srandu(), 
-                     sigma2*(1.0 + 0.1*srandu()),
-                     0.2*sigma2*srandu(),
-                     sigma2*(1.0 + 0.1*srandu())] )
+        pars=array( [1.0 + 0.1*srandu(rng=self.rng),
+                     0.1*srandu(rng=self.rng),
+                     0.1*srandu(rng=self.rng), 
+                     sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
+                     0.2*sigma2*srandu(rng=self.rng),
+                     sigma2*(1.0 + 0.1*srandu(rng=self.rng))] )
 
         return GMix(pars=pars)
 
@@ -2169,18 +2574,18 @@ class EMRunner(object):
         sigma2 = self.sigma_guess**2
 
         pars=array( [_em2_pguess[0],
-                     0.1*srandu(),
-                     0.1*srandu(),
-                     _em2_fguess[0]*sigma2*(1.0 + 0.1*srandu()),
+                     0.1*srandu(rng=self.rng),
+                     0.1*srandu(rng=self.rng),
+                     _em2_fguess[0]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
                      0.0,
-                     _em2_fguess[0]*sigma2*(1.0 + 0.1*srandu()),
+                     _em2_fguess[0]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
 
                      _em2_pguess[1],
-                     0.1*srandu(),
-                     0.1*srandu(),
-                     _em2_fguess[1]*sigma2*(1.0 + 0.1*srandu()),
+                     0.1*srandu(rng=self.rng),
+                     0.1*srandu(rng=self.rng),
+                     _em2_fguess[1]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
                      0.0,
-                     _em2_fguess[1]*sigma2*(1.0 + 0.1*srandu())] )
+                     _em2_fguess[1]*sigma2*(1.0 + 0.1*srandu(rng=self.rng))] )
 
 
         return GMix(pars=pars)
@@ -2189,26 +2594,26 @@ class EMRunner(object):
 
         sigma2 = self.sigma_guess**2
 
-        pars=array( [_em3_pguess[0]*(1.0+0.1*srandu()),
-                     0.1*srandu(),
-                     0.1*srandu(),
-                     _em3_fguess[0]*sigma2*(1.0 + 0.1*srandu()),
-                     0.01*srandu(),
-                     _em3_fguess[0]*sigma2*(1.0 + 0.1*srandu()),
-
-                     _em3_pguess[1]*(1.0+0.1*srandu()),
-                     0.1*srandu(),
-                     0.1*srandu(),
-                     _em3_fguess[1]*sigma2*(1.0 + 0.1*srandu()),
-                     0.01*srandu(),
-                     _em3_fguess[1]*sigma2*(1.0 + 0.1*srandu()),
-
-                     _em3_pguess[2]*(1.0+0.1*srandu()),
-                     0.1*srandu(),
-                     0.1*srandu(),
-                     _em3_fguess[2]*sigma2*(1.0 + 0.1*srandu()),
-                     0.01*srandu(),
-                     _em3_fguess[2]*sigma2*(1.0 + 0.1*srandu())]
+        pars=array( [_em3_pguess[0]*(1.0+0.1*srandu(rng=self.rng)),
+                     0.1*srandu(rng=self.rng),
+                     0.1*srandu(rng=self.rng),
+                     _em3_fguess[0]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
+                     0.01*srandu(rng=self.rng),
+                     _em3_fguess[0]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
+
+                     _em3_pguess[1]*(1.0+0.1*srandu(rng=self.rng)),
+                     0.1*srandu(rng=self.rng),
+                     0.1*srandu(rng=self.rng),
+                     _em3_fguess[1]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
+                     0.01*srandu(rng=self.rng),
+                     _em3_fguess[1]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
+
+                     _em3_pguess[2]*(1.0+0.1*srandu(rng=self.rng)),
+                     0.1*srandu(rng=self.rng),
+                     0.1*srandu(rng=self.rng),
+                     _em3_fguess[2]*sigma2*(1.0 + 0.1*srandu(rng=self.rng)),
+                     0.01*srandu(rng=self.rng),
+                     _em3_fguess[2]*sigma2*(1.0 + 0.1*srandu(rng=self.rng))]
 
                   )
 
@@ -2219,10 +2624,11 @@ class PSFRunnerCoellip(object):
     """
     wrapper to generate guesses and run the psf fitter a few times
     """
-    def __init__(self, obs, Tguess, ngauss, lm_pars, intpars=None):
+    def __init__(self, obs, Tguess, ngauss, lm_pars, intpars=None, rng=None):
 
         self.obs=obs
         self.intpars=intpars
+        self.rng=rng
 
         self.ngauss=ngauss
         self.npars = get_coellip_npars(ngauss)
@@ -2250,7 +2656,19 @@ class PSFRunnerCoellip(object):
                                     T_prior,
                                     F_prior)
 
-    def go(self, ntry=1):
+    def go(self, ntry=1, guess=None):
+        """
+        run the fitter, with up to ntry random guesses
+
+        parameters
+        ----------
+        ntry: int, optional
+            Number of random guesses to try, default 1
+        guess: array, optional
+            A starting guess, e.g. the result for a previous psf.  It is
+            tried first, and the random guesses are used only if that
+            fit fails
+        """
         from .fitting import LMCoellip
 
         if self.intpars is not None:
@@ -2259,6 +2677,22 @@ class PSFRunnerCoellip(object):
         else:
             npoints=None
 
+        self.try_results=[]
+        nwarm=0
+        if guess is not None:
+            nwarm=1
+            fitter=LMCoellip(self.obs,self.ngauss,lm_pars=self.lm_pars, prior=self.prior,
+                             npoints=npoints)
+            fitter.go(guess.copy())
+
+            res=fitter.get_result()
+            self.try_results.append(res)
+            if res['flags']==0:
+                res['ntry'] = 1
+                res['warm_start'] = True
+                self.fitter=fitter
+                return
+
         for i in xrange(ntry):
             guess=self.get_guess()
             fitter=LMCoellip(self.obs,self.ngauss,lm_pars=self.lm_pars, prior=self.prior,
@@ -2266,48 +2700,51 @@ class PSFRunnerCoellip(object):
             fitter.go(guess)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
+        res['ntry'] = nwarm+i+1
+        res['warm_start'] = False
         self.fitter=fitter
 
     def get_guess(self):
 
         guess=numpy.zeros(self.npars)
 
-        guess[0:0+2] = 0.01*srandu(2)
-        guess[2:2+2] = 0.05*srandu(2)
+        guess[0:0+2] = 0.01*srandu(2, rng=self.rng)
+        guess[2:2+2] = 0.05*srandu(2, rng=self.rng)
 
         fac=0.01
         if self.ngauss==1:
-            guess[4] = self.Tguess*(1.0 + 0.1*srandu())
-            guess[5] = self.Fguess*(1.0 + 0.1*srandu())
+            guess[4] = self.Tguess*(1.0 + 0.1*srandu(rng=self.rng))
+            guess[5] = self.Fguess*(1.0 + 0.1*srandu(rng=self.rng))
         elif self.ngauss==2:
-            guess[4] = self.Tguess*_moffat2_fguess[0]*(1.0 + fac*srandu())
-            guess[5] = self.Tguess*_moffat2_fguess[1]*(1.0 + fac*srandu())
+            guess[4] = self.Tguess*_moffat2_fguess[0]*(1.0 + fac*srandu(rng=self.rng))
+            guess[5] = self.Tguess*_moffat2_fguess[1]*(1.0 + fac*srandu(rng=self.rng))
 
-            guess[6] = self.Fguess*_moffat2_pguess[0]*(1.0 + fac*srandu())
-            guess[7] = self.Fguess*_moffat2_pguess[1]*(1.0 + fac*srandu())
+            guess[6] = self.Fguess*_moffat2_pguess[0]*(1.0 + fac*srandu(rng=self.rng))
+            guess[7] = self.Fguess*_moffat2_pguess[1]*(1.0 + fac*srandu(rng=self.rng))
 
         elif self.ngauss==3:
-            guess[4] = self.Tguess*_moffat3_fguess[0]*(1.0 + fac*srandu())
-            guess[5] = self.Tguess*_moffat3_fguess[1]*(1.0 + fac*srandu())
-            guess[6] = self.Tguess*_moffat3_fguess[2]*(1.0 + fac*srandu())
+            guess[4] = self.Tguess*_moffat3_fguess[0]*(1.0 + fac*srandu(rng=self.rng))
+            guess[5] = self.Tguess*_moffat3_fguess[1]*(1.0 + fac*srandu(rng=self.rng))
+            guess[6] = self.Tguess*_moffat3_fguess[2]*(1.0 + fac*srandu(rng=self.rng))
 
-            guess[7] = self.Fguess*_moffat3_pguess[0]*(1.0 + fac*srandu())
-            guess[8] = self.Fguess*_moffat3_pguess[1]*(1.0 + fac*srandu())
-            guess[9] = self.Fguess*_moffat3_pguess[2]*(1.0 + fac*srandu())
+            guess[7] = self.Fguess*_moffat3_pguess[0]*(1.0 + fac*srandu(rng=self.rng))
+            guess[8] = self.Fguess*_moffat3_pguess[1]*(1.0 + fac*srandu(rng=self.rng))
+            guess[9] = self.Fguess*_moffat3_pguess[2]*(1.0 + fac*srandu(rng=self.rng))
 
         elif self.ngauss==4:
-            guess[4] = self.Tguess*_moffat4_fguess[0]*(1.0 + fac*srandu())
-            guess[5] = self.Tguess*_moffat4_fguess[1]*(1.0 + fac*srandu())
-            guess[6] = self.Tguess*_moffat4_fguess[2]*(1.0 + fac*srandu())
-            guess[7] = self.Tguess*_moffat4_fguess[3]*(1.0 + fac*srandu())
+            guess[4] = self.Tguess*_moffat4_fguess[0]*(1.0 + fac*srandu(rng=self.rng))
+            guess[5] = self.Tguess*_moffat4_fguess[1]*(1.0 + fac*srandu(rng=self.rng))
+            guess[6] = self.Tguess*_moffat4_fguess[2]*(1.0 + fac*srandu(rng=self.rng))
+            guess[7] = self.Tguess*_moffat4_fguess[3]*(1.0 + fac*srandu(rng=self.rng))
 
-            guess[8]  = self.Fguess*_moffat4_pguess[0]*(1.0 + fac*srandu())
-            guess[9]  = self.Fguess*_moffat4_pguess[1]*(1.0 + fac*srandu())
-            guess[10] = self.Fguess*_moffat4_pguess[2]*(1.0 + fac*srandu())
-            guess[11] = self.Fguess*_moffat4_pguess[3]*(1.0 + fac*srandu())
+            guess[8]  = self.Fguess*_moffat4_pguess[0]*(1.0 + fac*srandu(rng=self.rng))
+            guess[9]  = self.Fguess*_moffat4_pguess[1]*(1.0 + fac*srandu(rng=self.rng))
+            guess[10] = self.Fguess*_moffat4_pguess[2]*(1.0 + fac*srandu(rng=self.rng))
+            guess[11] = self.Fguess*_moffat4_pguess[3]*(1.0 + fac*srandu(rng=self.rng))
 
 
         else:
@@ -2381,6 +2818,8 @@ class MaxRunner(object):
 
         fitclass=self._get_lm_fitter_class()
 
+        self.try_results=[]
+
         for i in xrange(ntry):
             guess=self.guesser()
             fitter=fitclass(self.obs,
@@ -2393,6 +2832,7 @@ class MaxRunner(object):
             fitter.go(guess)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
@@ -2436,6 +2876,8 @@ class MaxRunnerGaussMom(object):
         
         fitclass=self._get_lm_fitter_class()
 
+        self.try_results=[]
+
         for i in xrange(ntry):
             guess=self.guesser()
             fitter=fitclass(self.obs,
@@ -2446,6 +2888,7 @@ class MaxRunnerGaussMom(object):
             fitter.go(guess)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
@@ -2480,6 +2923,8 @@ class MaxRunnerFixT(MaxRunner):
         from .fitting import LMSimpleFixT
         
 
+        self.try_results=[]
+
         for i in xrange(ntry):
             fitter=LMSimpleFixT(self.obs,
                                 self.model,
@@ -2495,6 +2940,7 @@ class MaxRunnerFixT(MaxRunner):
             fitter.go(guess)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
@@ -2524,6 +2970,8 @@ class MaxRunnerGOnly(MaxRunner):
         from .fitting import LMSimpleGOnly
         
 
+        self.try_results=[]
+
         for i in xrange(ntry):
             fitter=LMSimpleGOnly(self.obs,
                                  self.model,
@@ -2542,6 +2990,7 @@ class MaxRunnerGOnly(MaxRunner):
             fitter.go(guess)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
@@ -2561,7 +3010,8 @@ class RoundRunnerBase(object):
         prior=kw.get('prior',None)
         guesser=RoundParsGuesser(self.pars_sub,
                                  prior=prior,
-                                 scaling=scaling)
+                                 scaling=scaling,
+                                 rng=kw.get('rng',None))
         return guesser
 
 class MaxRunnerRound(MaxRunner,RoundRunnerBase):
@@ -2576,6 +3026,8 @@ class MaxRunnerRound(MaxRunner,RoundRunnerBase):
         self.pars_sub=roundify.get_simple_sub_pars(pars_full)
         guesser=self._get_round_guesser(**kw)
 
+        # the rng is only used by the guesser
+        kw.pop('rng',None)
         super(MaxRunnerRound,self).__init__(obs, model, max_pars, guesser,
                                             **kw)
 
@@ -2611,6 +3063,8 @@ class CompositeMaxRunner(MaxRunner):
 
         fitclass=self._get_lm_fitter_class()
 
+        self.try_results=[]
+
         for i in xrange(ntry):
             guess=self.guesser()
             fitter=fitclass(self.obs,
@@ -2623,9 +3077,11 @@ class CompositeMaxRunner(MaxRunner):
             fitter.go(guess)
 
             res=fitter.get_result()
+            self.try_results.append(res)
             if res['flags']==0:
                 break
 
+        res['ntry'] = i+1
         self.fitter=fitter
 
     def _get_lm_fitter_class(self):
@@ -2642,6 +3098,8 @@ class CompositeMaxRunnerRound(CompositeMaxRunner,RoundRunnerBase):
         self.pars_sub=roundify.get_simple_sub_pars(pars_full)
         guesser=self._get_round_guesser(**kw)
 
+        # the rng is only used by the guesser
+        kw.pop('rng',None)
         super(CompositeMaxRunnerRound,self).__init__(obs,
                                                      max_pars,
                                                      guesser,
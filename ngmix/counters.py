@@ -0,0 +1,204 @@
+"""
+Counters for timing and instrumenting the stages of processing, for
+example psf fitting, galaxy fitting and metacal image generation in the
+Bootstrapper
+
+The counters for each stage are stored in a dict, keyed by stage name,
+with entries
+    ncall: number of times the stage was timed
+    time: total wall time in seconds
+and sums of whatever was counted, e.g. nfit, nfev, ntry, numiter, npix,
+npix_eval
+
+Counters from many objects can be merged to get totals for a run.
+"""
+from __future__ import print_function
+
+import time
+import copy
+from pprint import pformat
+
+class StageCounters(object):
+    """
+    Timing and counters for processing stages
+
+    parameters
+    ----------
+    data: dict, optional
+        Initial data, e.g. as returned by get_dict()
+
+    examples
+    --------
+
+    counters=StageCounters()
+
+    with counters.timer('psf'):
+        runner.go(ntry=ntry)
+
+    counters.count_fit('psf', runner.fitter.get_result(),
+                       try_results=runner.try_results)
+
+    # totals over many objects
+    totals=StageCounters()
+    totals.merge(counters)
+    """
+    def __init__(self, data=None):
+        self._data={}
+        if data is not None:
+            self.merge(data)
+
+    def timer(self, stage):
+        """
+        get a context manager that adds the wall time spent in the
+        block to the stage
+        """
+        return _StageTimer(self, stage)
+
+    def add_time(self, stage, dt):
+        """
+        add time to the stage and increment the number of calls
+
+        parameters
+        ----------
+        stage: string
+            Name of the stage
+        dt: float
+            Time in seconds
+        """
+        entry=self._get_entry(stage)
+        entry['ncall'] += 1
+        entry['time'] += dt
+
+    def count(self, stage, **counts):
+        """
+        add to the counters for the stage
+
+        parameters
+        ----------
+        stage: string
+            Name of the stage
+        **counts:
+            Values to add, e.g. nfev=35
+        """
+        entry=self._get_entry(stage)
+        for key,val in counts.items():
+            entry[key] = entry.get(key,0) + val
+
+    def count_fit(self, stage, res, npix=None, try_results=None):
+        """
+        count the number of fits and the nfev, ntry, numiter and npix
+        from a fitter result
+
+        The number of pixels evaluated, npix_eval, is npix times the
+        number of function evaluations or EM iterations
+
+        parameters
+        ----------
+        stage: string
+            Name of the stage
+        res: dict
+            The fitter result
+        npix: int, optional
+            Number of pixels in the fit, for fitters that do not
+            put npix in the result, e.g. the EM fitter
+        try_results: list, optional
+            The results of all tries when the fit was retried, e.g. the
+            try_results from a runner, including res.  nfev, numiter and
+            npix_eval are summed over the tries, so the cost of failed
+            tries is counted.  EM fits that stop with a range error do
+            not report numiter, so they add nothing.  Default [res]
+        """
+
+        if try_results is None:
+            try_results=[res]
+
+        npix=res.get('npix',npix)
+        if npix is None:
+            npix=0
+
+        nfev=0
+        numiter=0
+        for tres in try_results:
+            nfev += tres.get('nfev',0)
+            numiter += tres.get('numiter',0)
+
+        self.count(stage,
+                   nfit=1,
+                   nfev=nfev,
+                   ntry=res.get('ntry',1),
+                   numiter=numiter,
+                   npix=npix,
+                   npix_eval=npix*(nfev+numiter))
+
+    def merge(self, other, prefix=''):
+        """
+        add the counters from another StageCounters or dict
+
+        parameters
+        ----------
+        other: StageCounters or dict
+            The counters to add
+        prefix: string, optional
+            Prefix for the stage names from other
+        """
+        if isinstance(other, StageCounters):
+            other=other._data
+
+        for stage,oentry in other.items():
+            entry=self._get_entry(prefix+stage)
+            for key,val in oentry.items():
+                entry[key] = entry.get(key,0) + val
+
+    def get_dict(self):
+        """
+        get a copy of the counters as a dict keyed by stage
+        """
+        return copy.deepcopy(self._data)
+
+    def _get_entry(self, stage):
+        entry=self._data.get(stage,None)
+        if entry is None:
+            entry={'ncall':0, 'time':0.0}
+            self._data[stage]=entry
+        return entry
+
+    def __repr__(self):
+        return pformat(self._data)
+
+def get_timer(counters, stage):
+    """
+    get a timer for the stage, or a no-op timer if counters is None
+
+    parameters
+    ----------
+    counters: StageCounters or None
+        The counters
+    stage: string
+        Name of the stage
+    """
+    if counters is None:
+        return _null_timer
+    else:
+        return counters.timer(stage)
+
+class _StageTimer(object):
+    def __init__(self, counters, stage):
+        self.counters=counters
+        self.stage=stage
+
+    def __enter__(self):
+        self.tm0=time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.counters.add_time(self.stage, time.time()-self.tm0)
+        return False
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_null_timer=_NullTimer()
@@ -3,10 +3,17 @@ Fit an image with a gaussian mixture using the EM algorithm
 """
 from __future__ import print_function
 
+try:
+    xrange = xrange
+    # We have Python 2
+except:
+    xrange = range
+    # We have Python 3
+
 import numpy
 
 from . import gmix
-from .gmix import GMix
+from .gmix import GMix, _gauss2d_dtype
 
 from . import _gmix
 
@@ -15,7 +22,8 @@ from .priors import srandu
 
 from .jacobian import Jacobian
 
-from .observation import Observation
+from .observation import Observation, get_mb_obs
+from .threads import run_chunks
 
 EM_RANGE_ERROR = 2**0
 EM_MAXITER = 2**1
@@ -31,6 +39,40 @@ def fit_em(obs, guess, **keys):
 
     return fitter
 
+def fit_em_batch(obs_list, guess, nthreads=1, **keys):
+    """
+    fit a set of observations, all with images of the same shape, with EM.
+    The fits are run together in C, see GMixEMBatch
+
+    parameters
+    ----------
+    obs_list: sequence of Observation
+        The observations to fit
+    guess: GMix or sequence of GMix
+        A single guess for all observations, or one per observation
+    nthreads: int, optional
+        Number of threads to use, default 1
+    **keys:
+        Other keywords for GMixEMBatch.go, e.g. maxiter, tol
+
+    returns
+    -------
+    fitter: GMixEMBatch
+    """
+    images=[]
+    sky=[]
+    for obs in obs_list:
+        im,tsky = prep_image(obs.image)
+        images.append(im)
+        sky.append(tsky)
+
+    jacobians=[obs.jacobian for obs in obs_list]
+
+    fitter=GMixEMBatch(images, jacobians)
+    fitter.go(guess, sky, nthreads=nthreads, **keys)
+
+    return fitter
+
 def prep_image(im0):
     """
     Prep an image to fit with EM.  Make sure there are no pixels < 0
@@ -103,7 +145,8 @@ class GMixEM(object):
             im *= (counts/im.sum())
         return im
 
-    def run_em(self, gmix_guess, sky_guess, maxiter=100, tol=1.e-6):
+    def run_em(self, gmix_guess, sky_guess, maxiter=100, tol=1.e-6,
+               accelerate=False):
         """
         Run the em algorithm from the input starting guesses
 
@@ -119,6 +162,25 @@ class GMixEM(object):
         tol: number, optional
             The tolerance in the moments that implies convergence,
             default 1.e-6
+        accelerate: bool, optional
+            If True, use the SQUAREM accelerated algorithm.  Every two em
+            steps are followed by an extrapolated jump, which is only
+            accepted if it does not decrease the likelihood.  numiter is
+            then the number of em steps taken, and the result also has
+            naccel and nreject, the number of accepted and rejected
+            jumps, and nmap, the number of em steps evaluated including
+            those abandoned after a jump out of range.  Each em step is
+            one pass over the image, so nmap is the cost of the fit.
+            For plain em nmap equals numiter, and the number of steps
+            saved is the plain numiter minus the accelerated nmap for
+            runs from the same guess.
+
+            Note the plain and accelerated algorithms stop at different
+            points on the slow approach to the maximum, so the results
+            only agree to within the convergence tolerance, and for
+            nearly degenerate mixtures (e.g. three gaussians fit to a
+            simple profile) the accelerated run can take many more em
+            steps than the plain one.  Default False
         """
 
         if hasattr(self,'_gm'):
@@ -135,14 +197,30 @@ class GMixEM(object):
         # we handle below
         flags=0
         try:
-            numiter, fdiff = _gmix.em_run(gmtmp._data,
-                                          self._obs.image,
-                                          self._obs.jacobian._data,
-                                          self._sums,
-                                          self._sky_guess,
-                                          self._counts,
-                                          self._tol,
-                                          self._maxiter)
+            if accelerate:
+                # scratch space for the accelerated algorithm
+                work=numpy.zeros(3*self._ngauss, dtype=_gauss2d_dtype)
+
+                numiter, fdiff, naccel, nreject, nmap = \
+                        _gmix.em_run_accel(gmtmp._data,
+                                           self._obs.image,
+                                           self._obs.jacobian._data,
+                                           self._sums,
+                                           work,
+                                           self._sky_guess,
+                                           self._counts,
+                                           self._tol,
+                                           self._maxiter)
+            else:
+                numiter, fdiff = _gmix.em_run(gmtmp._data,
+                                              self._obs.image,
+                                              self._obs.jacobian._data,
+                                              self._sums,
+                                              self._sky_guess,
+                                              self._counts,
+                                              self._tol,
+                                              self._maxiter)
+                nmap=numiter
 
             # we have mutated the _data elements, we want to make
             # sure the pars are propagated.  Make a new full gm
@@ -154,8 +232,13 @@ class GMixEM(object):
 
             result={'flags':flags,
                     'numiter':numiter,
+                    'nmap':nmap,
                     'fdiff':fdiff}
 
+            if accelerate:
+                result['naccel'] = naccel
+                result['nreject'] = nreject
+
         except GMixRangeError:
             # the iteration reached an invalid gaussian
             result={'flags':EM_RANGE_ERROR}
@@ -165,6 +248,173 @@ class GMixEM(object):
     # alias
     go=run_em
 
+class GMixEMBatch(object):
+    """
+    Fit a stack of images with gaussian mixtures using the EM algorithm
+
+    All iterations for all images are run in a single call to the C code,
+    which releases the GIL.  With nthreads > 1 the images are divided
+    among threads that run in parallel
+
+    parameters
+    ----------
+    images: array or sequence of arrays
+        The images, all with the same shape, which can be sent as a 3d
+        array [nimage, nrow, ncol].  As for GMixEM the images should not
+        have zero or negative pixels, see prep_image()
+    jacobians: Jacobian or sequence of Jacobian
+        A single jacobian for all images, or one per image
+    """
+    def __init__(self, images, jacobians):
+
+        images=numpy.array(images, dtype='f8')
+        if len(images.shape) != 3:
+            raise ValueError("images must be a stack of 2d images, "
+                             "got shape %s" % str(images.shape))
+
+        nimage=images.shape[0]
+
+        if isinstance(jacobians, Jacobian):
+            jacobians=[jacobians]*nimage
+
+        if len(jacobians) != nimage:
+            raise ValueError("got %d jacobians for "
+                             "%d images" % (len(jacobians), nimage))
+
+        jdata=numpy.zeros(nimage, dtype=jacobians[0]._data.dtype)
+        for i,jacob in enumerate(jacobians):
+            jdata[i] = jacob._data[0]
+
+        self._images=images
+        self._jacob_data=jdata
+        self._nimage=nimage
+        # summed as in GMixEM so the results are identical
+        self._counts=numpy.array([im.sum() for im in images])
+
+        self._gmix_list = None
+        self._result    = None
+
+    def get_gmix_list(self):
+        """
+        Get the list of gaussian mixtures from the final iteration.
+        The entries are None for fits with EM_RANGE_ERROR set
+        """
+        return self._gmix_list
+
+    def get_result(self):
+        """
+        Get some stats about the processing, a dict with arrays
+        'flags', 'numiter' and 'fdiff', with an entry for each image
+        """
+        return self._result
+
+    def run_em(self, gmix_guess, sky_guess, maxiter=100, tol=1.e-6,
+               nthreads=1):
+        """
+        Run the em algorithm from the input starting guesses
+
+        parameters
+        ----------
+        gmix_guess: GMix or sequence of GMix
+            A single starting guess for all images, or one per image.
+            All must have the same number of gaussians
+        sky_guess: number or sequence
+            A guess at the sky value, or one per image
+        maxiter: number, optional
+            The maximum number of iterations, default 100
+        tol: number, optional
+            The tolerance in the moments that implies convergence,
+            default 1.e-6
+        nthreads: int, optional
+            Number of threads to use, default 1
+        """
+
+        nimage=self._nimage
+
+        if isinstance(gmix_guess, GMix):
+            gmix_guess=[gmix_guess]*nimage
+
+        if len(gmix_guess) != nimage:
+            raise ValueError("got %d guesses for "
+                             "%d images" % (len(gmix_guess), nimage))
+
+        ngauss=len(gmix_guess[0])
+        gm_data=numpy.zeros( (nimage, ngauss), dtype=_gauss2d_dtype)
+        for i,gm in enumerate(gmix_guess):
+            if len(gm) != ngauss:
+                raise ValueError("all guesses must have the same "
+                                 "number of gaussians")
+            gm_data[i] = gm.get_data()
+
+        sky=numpy.zeros(nimage) + numpy.array(sky_guess, dtype='f8')
+
+        numiter=numpy.zeros(nimage, dtype='i8')
+        fdiff=numpy.zeros(nimage, dtype='f8')
+        status=numpy.zeros(nimage, dtype='i4')
+
+        args=(gm_data, sky, numiter, fdiff, status, tol, maxiter)
+
+        run_chunks(self._run_chunk, nimage, nthreads, args=args)
+
+        flags=numpy.zeros(nimage, dtype='i4')
+        flags[status != 0] = EM_RANGE_ERROR
+        flags[(status == 0) & (numiter >= maxiter)] = EM_MAXITER
+
+        gmix_list=[]
+        for i in xrange(nimage):
+            if status[i] != 0:
+                gmix_list.append(None)
+            else:
+                gmix_list.append( _get_gmix_from_data(gm_data[i]) )
+
+        self._gmix_list=gmix_list
+        self._result={'flags':flags,
+                      'numiter':numiter,
+                      'fdiff':fdiff}
+
+    # alias
+    go=run_em
+
+    def _run_chunk(self, beg, end, gm_data, sky, numiter, fdiff, status,
+                   tol, maxiter):
+        """
+        run the C code for images [beg,end), each chunk needs its own
+        sums for scratch space
+        """
+        sums=numpy.zeros(gm_data.shape[1], dtype=_sums_dtype)
+
+        _gmix.em_run_batch(gm_data[beg:end],
+                           self._images[beg:end],
+                           self._jacob_data[beg:end],
+                           sums,
+                           sky[beg:end],
+                           self._counts[beg:end],
+                           numiter[beg:end],
+                           fdiff[beg:end],
+                           status[beg:end],
+                           tol,
+                           maxiter)
+
+def _get_gmix_from_data(data):
+    """
+    make a GMix from the data array for a single mixture
+    """
+    return GMix(pars=_get_full_pars(data))
+
+def _get_full_pars(data):
+    """
+    full pars [p1,row1,col1,irr1,irc1,icc1,...] from a data array
+    """
+    ngauss=data.size
+    pars=numpy.zeros(ngauss*6)
+    pars[0::6] = data['p']
+    pars[1::6] = data['row']
+    pars[2::6] = data['col']
+    pars[3::6] = data['irr']
+    pars[4::6] = data['irc']
+    pars[5::6] = data['icc']
+    return pars
+
 class ApproxEMSimple(object):
     """
     Fit a set of observations with psfs/jacobians with 
@@ -172,13 +422,27 @@ class ApproxEMSimple(object):
     
     DOES NOT CONVERGE TO MAX LIKE POINT
 
+    The mixture before convolution with the psf is fit to all observations
+    at once, with the sums from all epochs and bands accumulated in the C
+    code.  The centers and covariances of the gaussians are shared by all
+    observations, while the fluxes and sky are found separately for each.
+    The mixture starts from the model and the gaussians are then free, so
+    the result is converted to the parameters of the simple model using
+    the total moments of the mixture.
+
+    This is fast, and can be used to generate guesses for a maximum
+    likelihood fit, e.g. with ParsGuesser
+
     parameters
     ----------
     mb_obs_list: MulitBandObsList
-    
+        The observations, each with a psf gmix set.  An Observation or
+        ObsList can also be sent
+    model: string
+        The simple model, e.g. 'exp'
     """
     def __init__(self, mb_obs_list, model):
-        self._obs = mb_obs_list
+        self._obs = get_mb_obs(mb_obs_list)
         self._model = model
         
     def get_result(self):
@@ -187,43 +451,163 @@ class ApproxEMSimple(object):
         """
         return self._result
 
-    def run_em(self, miniter=10, maxiter=10, tol=1.e-4, guess=None, verbose=False):
+    def get_gmix(self):
+        """
+        Get the mixture before convolution with the psf, in the
+        coordinates of the jacobians
+        """
+        return self._result['gmix']
+
+    def run_em(self, miniter=10, maxiter=100, tol=1.e-4, guess=None, verbose=False):
         """
         Run the em algorithm from the input starting guesses
 
         parameters
         ----------
         guess: array-like, optional
-            guess parameters 
+            guess parameters [cen1,cen2,g1,g2,T,flux1,flux2,...]. Only the
+            center, shape and T are used.  If not sent, the guess is round
+            and centered, with T equal to the mean psf T
         miniter: number, optional
-            minimum number of iterations, default 20
+            minimum number of iterations, default 10
         maxiter: number, optional
             The maximum number of iterations, default 100
         tol: number, optional
-            The tolerance in the parameters for ocnvergence
-            default 1.e-4
+            The tolerance in T for convergence, default 1.e-4
+        verbose: bool, optional
+            If True, print the result
         """
 
-        import emshear
-        my_guess = None
-        if guess is not None:            
-            e1,e2 = emshear.g1g2_to_e1e2(guess[2],guess[3])
-            my_guess = guess.copy()
-            my_guess[2] = e1
-            my_guess[3] = e2
+        mb_obs_list=self._obs
+        nband=len(mb_obs_list)
+
+        images=[]
+        jacobs=[]
+        psfs=[]
+        counts=[]
+        nsky=[]
+        skyfrac=[]
+        areas=[]
+        bands=[]
+        for band,obs_list in enumerate(mb_obs_list):
+            for obs in obs_list:
+                im,sky = prep_image(obs.image)
+                imcounts=im.sum()
+
+                images.append(im)
+                jacobs.append(obs.jacobian._data)
+                psfs.append(obs.get_psf_gmix().get_data())
+                counts.append(imcounts)
+                nsky.append(sky/imcounts)
+                skyfrac.append(sky*im.size/imcounts)
+                areas.append(obs.jacobian.get_scale()**2)
+                bands.append(band)
+
+        counts=numpy.array(counts)
+        nsky=numpy.array(nsky)
+        areas=numpy.array(areas)
+        bands=numpy.array(bands)
+
+        gm0=self._get_guess_gmix(guess, psfs)
+        gm_data=gm0.get_data().copy()
+
+        ngauss=gm_data.size
+        nepoch=len(images)
+        npsf_max=max([psf.size for psf in psfs])
+
+        # the mixing weights for each epoch start with the guess, and
+        # the sky has the rest of the counts
+        pguess=gm_data['p']/gm_data['p'].sum()
+        epoch_p=numpy.zeros( (nepoch, ngauss) )
+        for i in xrange(nepoch):
+            epoch_p[i,:] = pguess*max(1.0-skyfrac[i], 0.1)
+
+        # scratch space
+        conv=numpy.zeros(ngauss*npsf_max, dtype=_gauss2d_dtype)
+        sums=numpy.zeros(ngauss, dtype=_sums_dtype)
+        scratch=numpy.zeros(ngauss*npsf_max, dtype=_sums_dtype)
+
+        try:
+            numiter, fdiff = _gmix.em_run_multi(gm_data,
+                                                images,
+                                                jacobs,
+                                                psfs,
+                                                counts,
+                                                epoch_p,
+                                                nsky,
+                                                conv,
+                                                sums,
+                                                scratch,
+                                                tol,
+                                                miniter,
+                                                maxiter)
+        except GMixRangeError:
+            # the iteration reached an invalid gaussian
+            self._result={'flags':EM_RANGE_ERROR}
+            return
+
+        flags=0
+        if fdiff >= tol:
+            flags = EM_MAXITER
 
-        self._fit = emshear.EMFitSimple(self._obs,self._model,guess=my_guess)        
-        self._fit.go(maxiter,minitr=miniter,xtol=tol,verbose=verbose)
+        gm=_get_gmix_from_data(gm_data)
 
-        my_pars = self._fit.get_pars()
-        pars = my_pars.copy()
-        g1,g2 = emshear.e1e2_to_g1g2(pars[2],pars[3])
-        pars[2] = g1
-        pars[3] = g2
-        self._result={'pars':pars,'lnprob':self._fit.lnL(my_pars)}
+        row,col=gm.get_cen()
+        g1,g2,T=gm.get_g1g2T()
+
+        # the flux in each epoch, averaged over the epochs in each band
+        epoch_flux = epoch_p.sum(axis=1)*counts*areas
+
+        pars=numpy.zeros(5+nband)
+        pars[0:0+5] = row, col, g1, g2, T
+        for band in xrange(nband):
+            w,=numpy.where(bands == band)
+            pars[5+band] = epoch_flux[w].mean()
+
+        self._result={'flags':flags,
+                      'numiter':numiter,
+                      'fdiff':fdiff,
+                      'pars':pars,
+                      'lnprob':self._get_lnprob(pars),
+                      'gmix':gm}
+
+        if verbose:
+            print("    numiter:",numiter,"fdiff:",fdiff)
+            print("    pars:",pars)
 
     # alias
     go=run_em
+
+    def _get_guess_gmix(self, guess, psfs):
+        """
+        the starting mixture, from the model
+        """
+        pars=numpy.zeros(6)
+        if guess is not None:
+            pars[0:0+5] = guess[0:0+5]
+        else:
+            Tpsf=[GMix(pars=_get_full_pars(psf)).get_T() for psf in psfs]
+            pars[4] = numpy.mean(Tpsf)
+        pars[5] = 1.0
+
+        return gmix.GMixModel(pars, self._model)
+
+    def _get_lnprob(self, pars):
+        """
+        log likelihood for the simple model with the input pars
+        """
+        lnprob=0.0
+        for band,obs_list in enumerate(self._obs):
+            band_pars=numpy.zeros(6)
+            band_pars[0:0+5] = pars[0:0+5]
+            band_pars[5] = pars[5+band]
+
+            gm0=gmix.GMixModel(band_pars, self._model)
+            for obs in obs_list:
+                gm=gm0.convolve(obs.get_psf_gmix())
+                lnprob += gm.get_loglike(obs)
+
+        return lnprob
     
 _sums_dtype=[('gi','f8'),
              # scratch on a given pixel
@@ -33,6 +33,7 @@ from .priors import LOWVAL, BIGVAL
 from .gexceptions import GMixRangeError, GMixFatalError
 
 from .observation import Observation,ObsList,MultiBandObsList,get_mb_obs
+from . import records
 
 from . import stats
 
@@ -130,6 +131,18 @@ class FitterBase(object):
             raise ValueError("No result, you must run_mcmc and calc_result first")
         return self._result
 
+    def get_result_schema(self, prefix=''):
+        """
+        get a records.ResultSchema for writing the result into a row of a
+        structured array
+
+        parameters
+        ----------
+        prefix: string, optional
+            prefix for the column names
+        """
+        return records.get_max_schema(self.npars, prefix=prefix)
+
     def get_gmix(self, band=0):
         """
         Get a gaussian mixture at the fit parameter set, which
@@ -723,6 +736,18 @@ class TemplateFluxFitter(FitterBase):
                       'flux':flux,
                       'flux_err':flux_err}
 
+    def get_result_schema(self, prefix=''):
+        """
+        get a records.ResultSchema for writing the result into a row of a
+        structured array
+
+        parameters
+        ----------
+        prefix: string, optional
+            prefix for the column names
+        """
+        return records.get_template_flux_schema(prefix=prefix)
+
     def get_dof(self):
         """
         Effective def based on effective number of pixels
@@ -2107,6 +2132,13 @@ class LMComposite(LMSimple):
         self.fracdev=fracdev
         self.TdByTe=TdByTe
 
+    def get_result_schema(self, prefix=''):
+        """
+        get a records.ResultSchema for writing the result into a row of a
+        structured array, including the fracdev entries
+        """
+        return records.get_composite_schema(self.npars, prefix=prefix)
+
     def get_gmix(self, band=0):
         """
         Get a gaussian mixture at the "best" parameter set, which
@@ -29,6 +29,17 @@ class BootGalFailure(Exception):
     def __str__(self):
         return repr(self.value)
 
+class BootPrescreenFailure(BootGalFailure):
+    """
+    object failed the prescreen, see Bootstrapper.prescreen.  The
+    prescreen flags are in the flags attribute
+    """
+    def __init__(self, value, flags=0):
+         self.value = value
+         self.flags = flags
+    def __str__(self):
+        return repr(self.value)
+
 class BootPSampleFailure(Exception):
     """
     failure to bootstrap galaxy
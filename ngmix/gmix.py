@@ -1507,10 +1507,13 @@ class GMixND(object):
     Gaussian mixture in arbitrary dimensions.  A bit awkward
     in dim=1 e.g. becuase assumes means are [ndim,npars]
     """
-    def __init__(self, weights=None, means=None, covars=None, file=None):
+    def __init__(self, weights=None, means=None, covars=None, file=None,
+                 artifact=None):
 
         if file is not None:
             self.load_mixture(file)
+        elif artifact is not None:
+            self.load_artifact(artifact)
         else:
             if (weights is not None
                     and means is not None
@@ -1545,13 +1548,36 @@ class GMixND(object):
 
         self.tmp_lnprob = zeros(self.ngauss)
 
-    def fit(self, data, ngauss, n_iter=5000, min_covar=1.0e-6):
+    def fit(self, data, ngauss, n_iter=5000, min_covar=1.0e-6,
+            tol=1.0e-6, rng=None):
         """
-        data is shape
-            [npoints, ndim]
-        """
-        from sklearn.mixture import GMM
+        fit a mixture with full covariance matrices to the data using
+        expectation maximization
+
+        The means start at randomly chosen data points, with the covariance
+        of the data and equal weights.  The iteration stops when the mean
+        log likelihood per point changes by less than tol.  The result
+        is in the attributes converged, numiter and lnlike
 
+        parameters
+        ----------
+        data: array
+            Shape [npoints, ndim], or [npoints] for ndim=1
+        ngauss: int
+            Number of gaussians
+        n_iter: int, optional
+            Maximum number of iterations, default 5000
+        min_covar: float, optional
+            Added to the diagonal of the covariance matrices to keep them
+            positive definite, default 1.0e-6
+        tol: float, optional
+            Tolerance in the mean log likelihood, default 1.0e-6
+        rng: numpy RandomState or Generator, optional
+            For choosing the starting means.  If not sent, the global numpy
+            random state is used
+        """
+
+        data=numpy.asarray(data, dtype='f8')
         if len(data.shape) == 1:
             data = data[:,numpy.newaxis]
 
@@ -1559,18 +1585,15 @@ class GMixND(object):
         print("n_iter:   ",n_iter)
         print("min_covar:",min_covar)
 
-        gmm=GMM(n_components=ngauss,
-                n_iter=n_iter,
-                min_covar=min_covar,
-                covariance_type='full')
-
-        gmm.fit(data)
+        res=_fit_gmixnd_em(data, ngauss, n_iter, min_covar, tol, rng)
 
-        if not gmm.converged_:
+        if not res['converged']:
             print("DID NOT CONVERGE")
 
-        self._gmm=gmm
-        self.set_mixture(gmm.weights_, gmm.means_, gmm.covars_)
+        self.converged=res['converged']
+        self.numiter=res['numiter']
+        self.lnlike=res['lnlike']
+        self.set_mixture(res['weights'], res['means'], res['covars'])
 
     def save_mixture(self, fname):
         """
@@ -1597,6 +1620,47 @@ class GMixND(object):
             covars = fits['covars'].read()
         self.set_mixture(weights, means, covars)
 
+    def save_artifact(self, fname):
+        """
+        save the mixture and the derived quantities, such as the inverse
+        covariance matrices, to an artifact file, see the artifact module
+        """
+        from .artifact import write_artifact
+
+        print("writing gaussian mixture artifact to :",fname)
+        arrays={}
+        for name in _GMIXND_ARTIFACT_NAMES:
+            arrays[name] = getattr(self, name)
+
+        write_artifact(fname, arrays, key='GMixND')
+
+    def load_artifact(self, fname, mmap=True):
+        """
+        load the mixture and the derived quantities from an artifact file
+        written by save_artifact
+
+        parameters
+        ----------
+        fname: string
+            The file name
+        mmap: bool, optional
+            If True, the default, the arrays are memory mapped read-only,
+            so processes reading the same file share the memory
+        """
+        from .artifact import read_artifact
+
+        print("loading gaussian mixture artifact from:",fname)
+        data=read_artifact(fname, key='GMixND', mmap=mmap)
+
+        arrays=data['arrays']
+        for name in _GMIXND_ARTIFACT_NAMES:
+            setattr(self, name, arrays[name])
+
+        self.ngauss = self.weights.size
+        self.ndim = self.means.shape[1]
+
+        self.tmp_lnprob = zeros(self.ngauss)
+
     def get_lnprob_scalar(self, pars_in):
         """
         (x-xmean) icovar (x-xmean)
@@ -1629,73 +1693,82 @@ class GMixND(object):
 
     def get_lnprob_array(self, pars):
         """
-        array input
+        array input [N,ndim]
+
+        All points are evaluated at once for each gaussian, and
+        the sum over gaussians is done relative to the largest term,
+        as in get_lnprob_scalar
         """
-        dolog=1
+        pars=numpy.array(pars, dtype='f8', ndmin=2, copy=False)
+
         n=pars.shape[0]
-        lnp=zeros(n)
+        lnps=zeros( (self.ngauss, n) )
 
-        for i in xrange(n):
-            lnp[i] = self.get_lnprob_scalar(pars[i,:])
+        for i in xrange(self.ngauss):
+            xdiff = pars - self.means[i,:]
+            chi2 = ( dot(xdiff, self.icovars[i,:,:])*xdiff ).sum(axis=1)
+            lnps[i,:] = -0.5*chi2 + self.log_pnorms[i]
 
-        return lnp
+        lnpmax=lnps.max(axis=0)
+        p=exp(lnps-lnpmax).sum(axis=0)
+
+        return log(p) + lnpmax
 
     def get_prob_array(self, pars):
         """
-        array input
+        array input [N,ndim]
         """
-        dolog=0
-        n=pars.shape[0]
-        p=zeros(n)
-
-        for i in xrange(n):
-            p[i] = self.get_prob_scalar(pars[i,:])
-
-        return p
+        return exp( self.get_lnprob_array(pars) )
 
-    def sample(self, n=None):
+    def sample(self, n=None, rng=None):
         """
         sample from the gaussian mixture
+
+        The components are chosen using the cumulative distribution of
+        the weights, and the points are drawn using the Cholesky factors
+        of the covariance matrices
+
+        parameters
+        ----------
+        n: int, optional
+            Number to draw.  If not sent a single point is returned,
+            a scalar for ndim=1
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
+
+        returns
+        -------
+        samples: array
+            Shape [n, ndim]
         """
-        if not hasattr(self, '_gmm'):
-            self._make_gmm()
+
+        if rng is None:
+            rng=numpy.random
 
         if n is None:
             is_one=True
             n=1
-            if self.ndim==1:
-                is_scalar=1
         else:
             is_one=False
 
-        samples=self._gmm.sample(n)
+        ucomp=rng.uniform(size=n)
+        comp=numpy.searchsorted(self._weights_cdf, ucomp, side='right')
+        comp.clip(max=self.ngauss-1, out=comp)
+
+        z=rng.standard_normal(size=(n, self.ndim))
+
+        samples=zeros( (n, self.ndim) )
+        for i in xrange(self.ngauss):
+            w,=numpy.where(comp==i)
+            if w.size > 0:
+                samples[w,:] = self.means[i,:] + dot(z[w,:], self._chols[i,:,:].T)
 
         if is_one:
             samples = samples[0,:]
-            if is_one:
+            if self.ndim==1:
                 samples = samples[0]
         return samples
 
-
-
-    def _make_gmm(self):
-        """
-        Make a GMM object for sampling
-        """
-        from sklearn.mixture import GMM
-
-        # these numbers are not used because we set the means, etc by hand
-        ngauss=self.weights.size
-        gmm=GMM(n_components=self.ngauss,
-                n_iter=10000,
-                min_covar=1.0e-12,
-                covariance_type='full')
-        gmm.means_ = self.means.copy()
-        gmm.covars_ = self.covars.copy()
-        gmm.weights_ = self.weights.copy()
-
-        self._gmm=gmm 
-
     def _calc_icovars_and_norms(self):
         """
         Calculate the normalizations and inverse covariance matrices
@@ -1726,7 +1799,96 @@ class GMixND(object):
         self.log_pnorms = log(self.pnorms)
         self.icovars = icovars
 
+        # for sampling
+        self._chols = numpy.linalg.cholesky(self.covars)
+
+        wcdf=self.weights.cumsum()
+        self._weights_cdf = wcdf/wcdf[-1]
+
+
+
+# the attributes of a GMixND stored in an artifact file
+_GMIXND_ARTIFACT_NAMES=[
+    'weights',
+    'means',
+    'covars',
+    'norms',
+    'pnorms',
+    'log_pnorms',
+    'icovars',
+    '_chols',
+    '_weights_cdf',
+]
 
+def _fit_gmixnd_em(data, ngauss, n_iter, min_covar, tol, rng):
+    """
+    fit a full covariance mixture to data [npoints,ndim] with EM
+
+    returns a dict with weights, means, covars, converged, numiter and
+    lnlike, the mean log likelihood per point
+    """
+    from numpy import pi
+
+    if rng is None:
+        rng=numpy.random
+
+    npoints, ndim = data.shape
+    if npoints < ngauss:
+        raise ValueError("need at least ngauss=%d points, "
+                         "got %d" % (ngauss,npoints))
+
+    eye=numpy.identity(ndim)
+
+    ind=rng.choice(npoints, size=ngauss, replace=False)
+    means=data[ind,:].copy()
+    dcov=numpy.atleast_2d( numpy.cov(data, rowvar=False) ) + min_covar*eye
+    covars=numpy.array( [dcov]*ngauss )
+    weights=numpy.zeros(ngauss) + 1.0/ngauss
+
+    lnr=zeros( (npoints, ngauss) )
+    lnconst=0.5*ndim*log(2*pi)
+
+    converged=False
+    lnlike=-numpy.inf
+    for it in xrange(1,n_iter+1):
+
+        # E step: log responsibilities, normalized using log-sum-exp
+        for i in xrange(ngauss):
+            chol=numpy.linalg.cholesky(covars[i])
+            diff=data-means[i]
+            y=numpy.linalg.solve(chol, diff.T)
+            chi2=(y*y).sum(axis=0)
+            logdet=2*log(diag(chol)).sum()
+
+            lnr[:,i] = log(weights[i]) - lnconst - 0.5*logdet - 0.5*chi2
+
+        lnrmax=lnr.max(axis=1)
+        lnpx=lnrmax + log( exp(lnr-lnrmax[:,numpy.newaxis]).sum(axis=1) )
+
+        lnlike_old=lnlike
+        lnlike=lnpx.mean()
+
+        resp=exp(lnr-lnpx[:,numpy.newaxis])
+
+        # M step
+        nk=resp.sum(axis=0) + 10*numpy.finfo('f8').eps
+
+        weights=nk/npoints
+        means=dot(resp.T, data)/nk[:,numpy.newaxis]
+        for i in xrange(ngauss):
+            diff=data-means[i]
+            covars[i] = dot( (resp[:,i:i+1]*diff).T, diff)/nk[i] + min_covar*eye
+
+        if abs(lnlike-lnlike_old) < tol:
+            converged=True
+            break
+
+    return {'weights':weights,
+            'means':means,
+            'covars':covars,
+            'converged':converged,
+            'numiter':it,
+            'lnlike':lnlike}
 
 _moms_flagmap={0:'ok',
                1:'maxit',
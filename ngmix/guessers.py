@@ -3,7 +3,7 @@ import numpy
 from numpy import log
 from .fitting import print_pars
 from .gexceptions import GMixRangeError
-from .priors import srandu, LOWVAL
+from .priors import srandu, LOWVAL, _get_rng_keys
 from .shape import Shape
 
 class GuesserBase(object):
@@ -29,7 +29,7 @@ class GuesserBase(object):
 
                 if dosample:
                     print_pars(guess[j,:], front="bad guess:")
-                    guess[j,:] = prior.sample()
+                    guess[j,:] = prior.sample(**_get_rng_keys(self.rng))
                 else:
                     break
 
@@ -48,9 +48,12 @@ class TFluxGuesser(GuesserBase):
         'linear' or 'log'
     prior: optional
         If sent, "fix-up" guesses if they are not allowed by the prior
+    rng: numpy RandomState or Generator, optional
+        If not sent, the global numpy random state is used
     """
-    def __init__(self, T, fluxes, prior=None, scaling='linear'):
+    def __init__(self, T, fluxes, prior=None, scaling='linear', rng=None):
         self.T=T
+        self.rng=rng
 
         if numpy.isscalar(fluxes):
             fluxes=numpy.array(fluxes, dtype='f8', ndmin=1)
@@ -71,23 +74,23 @@ class TFluxGuesser(GuesserBase):
         np = 5+nband
 
         guess=numpy.zeros( (n, np) )
-        guess[:,0] = 0.01*srandu(n)
-        guess[:,1] = 0.01*srandu(n)
-        guess[:,2] = 0.1*srandu(n)
-        guess[:,3] = 0.1*srandu(n)
+        guess[:,0] = 0.01*srandu(n, rng=self.rng)
+        guess[:,1] = 0.01*srandu(n, rng=self.rng)
+        guess[:,2] = 0.1*srandu(n, rng=self.rng)
+        guess[:,3] = 0.1*srandu(n, rng=self.rng)
 
         if self.scaling=='linear':
-            guess[:,4] = self.T*(1.0 + 0.1*srandu(n))
+            guess[:,4] = self.T*(1.0 + 0.1*srandu(n, rng=self.rng))
 
             fluxes=self.fluxes
             for band in xrange(nband):
-                guess[:,5+band] = fluxes[band]*(1.0 + 0.1*srandu(n))
+                guess[:,5+band] = fluxes[band]*(1.0 + 0.1*srandu(n, rng=self.rng))
 
         else:
-            guess[:,4] = self.log_T + 0.1*srandu(n)
+            guess[:,4] = self.log_T + 0.1*srandu(n, rng=self.rng)
 
             for band in xrange(nband):
-                guess[:,5+band] = self.log_fluxes[band] + 0.1*srandu(n)
+                guess[:,5+band] = self.log_fluxes[band] + 0.1*srandu(n, rng=self.rng)
 
         if self.prior is not None:
             self._fix_guess(guess, self.prior)
@@ -110,8 +113,12 @@ class TFluxAndPriorGuesser(GuesserBase):
         cen, g drawn from this prior
     scaling: string
         'linear' or 'log'
+    rng: numpy RandomState or Generator, optional
+        If not sent, the global numpy random state is used
     """
-    def __init__(self, T, fluxes, prior, scaling='linear'):
+    def __init__(self, T, fluxes, prior, scaling='linear', rng=None):
+        self.rng=rng
+
         if numpy.isscalar(fluxes):
             fluxes=numpy.array(fluxes, dtype='f8', ndmin=1)
 
@@ -133,18 +140,18 @@ class TFluxAndPriorGuesser(GuesserBase):
         nband=fluxes.size
         np = 5+nband
 
-        guess = self.prior.sample(n)
+        guess = self.prior.sample(n, **_get_rng_keys(self.rng))
 
         if self.scaling=='linear':
-            guess[:,4] = self.T*(1.0 + 0.1*srandu(n))
+            guess[:,4] = self.T*(1.0 + 0.1*srandu(n, rng=self.rng))
         else:
-            guess[:,4] = self.log_T + 0.1*srandu(n)
+            guess[:,4] = self.log_T + 0.1*srandu(n, rng=self.rng)
 
         for band in xrange(nband):
             if self.scaling=='linear':
-                guess[:,5+band] = fluxes[band]*(1.0 + 0.1*srandu(n))
+                guess[:,5+band] = fluxes[band]*(1.0 + 0.1*srandu(n, rng=self.rng))
             else:
-                guess[:,5+band] = self.log_fluxes[band] + 0.1*srandu(n)
+                guess[:,5+band] = self.log_fluxes[band] + 0.1*srandu(n, rng=self.rng)
 
         self._fix_guess(guess, self.prior)
 
@@ -173,11 +180,11 @@ class TFluxAndPriorGuesser(GuesserBase):
                 if dosample:
                     print_pars(guess[j,:], front="bad guess:")
                     if itry < ntry:
-                        tguess = prior.sample()
+                        tguess = prior.sample(**_get_rng_keys(self.rng))
                         guess[j, 4:] = tguess[4:]
                     else:
                         # give up and just drawn a sample
-                        guess[j,:] = prior.sample()
+                        guess[j,:] = prior.sample(**_get_rng_keys(self.rng))
                 else:
                     break
 
@@ -185,8 +192,10 @@ class ParsGuesser(GuesserBase):
     """
     pars include g1,g2
     """
-    def __init__(self, pars, scaling='linear', prior=None, widths=None):
+    def __init__(self, pars, scaling='linear', prior=None, widths=None,
+                 rng=None):
         self.pars=pars
+        self.rng=rng
         self.scaling=scaling
         self.prior=prior
 
@@ -213,22 +222,23 @@ class ParsGuesser(GuesserBase):
         widths=self.widths
 
         guess=numpy.zeros( (n, self.np) )
-        guess[:,0] = pars[0] + widths[0]*srandu(n)
-        guess[:,1] = pars[1] + widths[1]*srandu(n)
+        guess[:,0] = pars[0] + widths[0]*srandu(n, rng=self.rng)
+        guess[:,1] = pars[1] + widths[1]*srandu(n, rng=self.rng)
 
         # prevent from getting too large
         guess_shape=get_shape_guess(pars[2],pars[3],
                                     n,
                                     widths[2:2+2],
-                                    max=0.8)
+                                    max=0.8,
+                                    rng=self.rng)
         guess[:,2]=guess_shape[:,0]
         guess[:,3]=guess_shape[:,1]
 
         for i in xrange(4,self.np):
             if self.scaling=='linear':
-                guess[:,i] = pars[i]*(1.0 + widths[i]*srandu(n))
+                guess[:,i] = pars[i]*(1.0 + widths[i]*srandu(n, rng=self.rng))
             else:
-                guess[:,i] = pars[i] + widths[i]*srandu(n)
+                guess[:,i] = pars[i] + widths[i]*srandu(n, rng=self.rng)
 
         if self.prior is not None:
             self._fix_guess(guess, self.prior)
@@ -243,8 +253,10 @@ class RoundParsGuesser(GuesserBase):
     """
     pars do not include g1,g2
     """
-    def __init__(self, pars, scaling='linear', prior=None, widths=None):
+    def __init__(self, pars, scaling='linear', prior=None, widths=None,
+                 rng=None):
         self.pars=pars
+        self.rng=rng
         self.scaling=scaling
         self.prior=prior
 
@@ -271,14 +283,14 @@ class RoundParsGuesser(GuesserBase):
         widths=self.widths
 
         guess=numpy.zeros( (n, self.np) )
-        guess[:,0] = pars[0] + widths[0]*srandu(n)
-        guess[:,1] = pars[1] + widths[1]*srandu(n)
+        guess[:,0] = pars[0] + widths[0]*srandu(n, rng=self.rng)
+        guess[:,1] = pars[1] + widths[1]*srandu(n, rng=self.rng)
 
         for i in xrange(2,self.np):
             if self.scaling=='linear':
-                guess[:,i] = pars[i]*(1.0 + widths[i]*srandu(n))
+                guess[:,i] = pars[i]*(1.0 + widths[i]*srandu(n, rng=self.rng))
             else:
-                guess[:,i] = pars[i] + widths[i]*srandu(n)
+                guess[:,i] = pars[i] + widths[i]*srandu(n, rng=self.rng)
 
         if self.prior is not None:
             self._fix_guess(guess, self.prior)
@@ -288,7 +300,7 @@ class RoundParsGuesser(GuesserBase):
 
         return guess
 
-def get_shape_guess(g1, g2, n, width, max=0.99):
+def get_shape_guess(g1, g2, n, width, max=0.99, rng=None):
     """
     Get guess, making sure in range
     """
@@ -307,8 +319,8 @@ def get_shape_guess(g1, g2, n, width, max=0.99):
 
         while True:
             try:
-                g1_offset = width[0]*srandu()
-                g2_offset = width[1]*srandu()
+                g1_offset = width[0]*srandu(rng=rng)
+                g2_offset = width[1]*srandu(rng=rng)
                 shape_new=shape.copy()
                 shape_new.shear(g1_offset, g2_offset)
                 break
@@ -324,8 +336,9 @@ class MomGuesser(GuesserBase):
     """
     pars are [cen1,cen2,M1,M2,T,I]
     """
-    def __init__(self, pars, prior=None, widths=None):
+    def __init__(self, pars, prior=None, widths=None, rng=None):
         self.pars=pars
+        self.rng=rng
         self.prior=prior
 
         self.np = pars.size
@@ -352,7 +365,7 @@ class MomGuesser(GuesserBase):
         guess=numpy.zeros( (n, self.np) )
 
         for i in xrange(self.np):
-            guess[:,i] = pars[i] + widths[i]*srandu(n)
+            guess[:,i] = pars[i] + widths[i]*srandu(n, rng=self.rng)
 
         if self.prior is not None:
             self._fix_guess(guess, self.prior)
@@ -67,7 +67,13 @@ class Jacobian(object):
     def set_cen(self, row0, col0):
         """
         reset the center
+
+        If this jacobian is a read-only view, the data are copied first
+        so the original is not modified
         """
+        if not self._data.flags.writeable:
+            self._data = self._data.copy()
+
         self._data['row0'] = row0
         self._data['col0'] = col0
 
@@ -96,6 +102,21 @@ class Jacobian(object):
                         self._data['dudcol'][0],
                         self._data['dvdrow'][0],
                         self._data['dvdcol'][0])
+    def get_view(self):
+        """
+        Get a read-only view of this jacobian, sharing the underlying data.
+        Calling set_cen on the view copies the data first, leaving this
+        jacobian untouched
+        """
+        cls=self.__class__
+        jacob=cls.__new__(cls)
+
+        data=self._data.view()
+        data.flags.writeable=False
+        jacob._data=data
+
+        return jacob
+
     def __repr__(self):
         fmt="row0: %-10.5g col0: %-10.5g dudrow: %-10.5g dudcol: %-10.5g dvdrow: %-10.5g dvdcol: %-10.5g"
         return fmt % (self._data['row0'][0],
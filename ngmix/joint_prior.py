@@ -15,7 +15,8 @@ from . import shape
 from .gexceptions import GMixRangeError
 
 from . import priors
-from .priors import LOWVAL
+from .priors import LOWVAL, _get_rng_keys
+from . import _gmix
 from . import gmix
 from .gmix import GMixND
 
@@ -43,8 +44,6 @@ class JointPriorTF(GMixND):
 
         GMixND.__init__(self, weights, means, covars)
 
-        self._make_gmm()
-
     def get_prob_scalar(self, pars, **keys):
         """
         probability for scalar input (meaning one point)
@@ -89,9 +88,16 @@ class JointPriorTF(GMixND):
 
         return lnp
 
-    def sample(self, n=None):
+    def sample(self, n=None, rng=None):
         """
         Get samples for TF
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
         if n is None:
@@ -106,7 +112,7 @@ class JointPriorTF(GMixND):
         ngood=0
         while nleft > 0:
 
-            tsamples=self._gmm.sample(nleft)
+            tsamples=GMixND.sample(self, nleft, rng=rng)
             w=self.check_bounds_array(tsamples)
 
             if w.size > 0:
@@ -172,7 +178,51 @@ class JointPriorTF(GMixND):
         return wgood
 
 
-class JointPriorSimpleHybrid(GMixND):
+class _LnProbArrayMixin(object):
+    """
+    get_lnprob_array and fill_fdiff_array for priors made of independent
+    terms
+
+    The class must define _get_lnprob_array_list(pars, **keys), returning
+    a list of log probability arrays [N], one for each term in fill_fdiff
+    and in the same order
+    """
+
+    def get_lnprob_array(self, pars, **keys):
+        """
+        log probability for array input [N,ndims]
+        """
+
+        lnp_list=self._get_lnprob_array_list(pars, **keys)
+        return _sum_lnprob_list(lnp_list)
+
+    def fill_fdiff_array(self, pars, fdiff, **keys):
+        """
+        set sqrt(-2ln(p)) ~ (model-data)/err for array input [N,ndims]
+
+        Out of range points do not raise an exception; priors that
+        support it set ln(p)=LOWVAL for those points, giving an
+        infinite fdiff
+
+        parameters
+        ----------
+        pars: array
+            Shape [N,ndims]
+        fdiff: array
+            Shape [N,nprior] or wider; the first nprior columns are set,
+            in the same order as fill_fdiff
+
+        returns
+        -------
+        nprior: int
+            The number of columns set
+        """
+
+        lnp_list=self._get_lnprob_array_list(pars, **keys)
+        return _fill_fdiff_array(lnp_list, fdiff)
+
+
+class JointPriorSimpleHybrid(_LnProbArrayMixin, GMixND):
     """
     Joint prior in g1,g2,T,F.  T and F are joint in log10 space
 
@@ -248,16 +298,19 @@ class JointPriorSimpleHybrid(GMixND):
 
         return p
 
-    def get_lnprob_array(self, pars, **keys):
+    def _get_lnprob_array_list(self, pars, **keys):
         """
-        log probability for array input [N,ndims]
+        list of log probability arrays, one for each term in fill_fdiff
         """
 
-        lnp = self.cen_prior.get_lnprob_array(pars[:,0], pars[:,1])
-        lnp += self.g_prior.get_lnprob_array2d(pars[:,2],pars[:,3])
-        lnp += self.TF_prior.get_lnprob_array(pars[:,4:4+2])
+        lnp1,lnp2=self.cen_prior.get_lnprob_array_sep(pars[:,0],pars[:,1])
 
-        return lnp
+        lnp_list=[lnp1,
+                  lnp2,
+                  self.g_prior.get_lnprob_array2d(pars[:,2],pars[:,3]),
+                  self.TF_prior.get_lnprob_array(pars[:,4:4+2])]
+
+        return lnp_list
 
     def fill_fdiff(self, pars, fdiff, **keys):
         """
@@ -285,11 +338,16 @@ class JointPriorSimpleHybrid(GMixND):
 
         return index
 
-
-
-    def sample(self, n=None):
+    def sample(self, n=None, rng=None):
         """
         Get random samples
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
         if n is None:
@@ -300,9 +358,10 @@ class JointPriorSimpleHybrid(GMixND):
 
         samples=zeros( (n,6) )
 
-        cen1,cen2 = self.cen_prior.sample(n)
-        g1,g2=self.g_prior.sample2d(n)
-        TF=self.TF_prior.sample(n)
+        rkeys=_get_rng_keys(rng)
+        cen1,cen2 = self.cen_prior.sample(n, **rkeys)
+        g1,g2=self.g_prior.sample2d(n, **rkeys)
+        TF=self.TF_prior.sample(n, **rkeys)
 
         samples[:,0] = cen1
         samples[:,1] = cen2
@@ -318,41 +377,17 @@ class JointPriorSimpleHybrid(GMixND):
 
     def check_bounds_scalar(self, pars, throw=True):
         """
-        Check bounds on T Flux
+        Check bounds on T Flux, using the bounds of the TF prior
         """
 
-        T_bounds=self.T_bounds
-        F_bounds=self.F_bounds
-
-        T=pars[4]
-        F=pars[5]
-        if (  T < T_bounds[0]
-            or T > T_bounds[1]
-            or F < F_bounds[0]
-            or F > F_bounds[1]):
-
-            if throw:
-                raise GMixRangeError("g or T or F out of range")
-            else:
-                return False
-        else:
-            return True
+        return self.TF_prior.check_bounds_scalar(pars[4:4+2], throw=throw)
 
     def check_bounds_array(self,pars):
         """
-        Check bounds on T Flux
+        Check bounds on T Flux, using the bounds of the TF prior
         """
-        T_bounds=self.T_bounds
-        F_bounds=self.F_bounds
-
-        T=pars[:,4]
-        F=pars[:,5]
 
-        wgood, = where(  (T > T_bounds[0])
-                       & (T < T_bounds[1])
-                       & (F > F_bounds[0])
-                       & (F < F_bounds[1]) )
-        return wgood
+        return self.TF_prior.check_bounds_array(pars[:,4:4+2])
 
 
 class JointPriorSersicHybrid(JointPriorSimpleHybrid):
@@ -385,7 +420,7 @@ class JointPriorSersicHybrid(JointPriorSimpleHybrid):
 
 
         self.n_prior=n_prior
-        self.logn_bounds=self.logn_bounds
+        self.logn_bounds=logn_bounds
 
     def get_lnprob_scalar(self, pars, **keys):
         """
@@ -396,17 +431,38 @@ class JointPriorSersicHybrid(JointPriorSimpleHybrid):
         lnp += self.n_prior.get_lnprob_scalar(pars[6])
         return lnp
         
-    def get_lnprob_array(self, pars, **keys):
+    def fill_fdiff(self, pars, fdiff, **keys):
         """
-        log probability for array input [N,ndims]
+        set sqrt(-2ln(p)) ~ (model-data)/err
         """
-        lnp = self.get_lnprob_array(pars, **keys)
-        lnp += self.n_prior.get_lnprob_array(pars[:,6])
-        return lnp
 
-    def sample(self, n=None):
+        index=super(JointPriorSersicHybrid,self).fill_fdiff(pars, fdiff, **keys)
+
+        lnp = self.n_prior.get_lnprob_scalar(pars[6])
+        fdiff[index] = sqrt( max(-2*lnp, 0.0) )
+        index += 1
+
+        return index
+
+    def _get_lnprob_array_list(self, pars, **keys):
+        """
+        list of log probability arrays, one for each term in fill_fdiff
+        """
+
+        lnp_list=super(JointPriorSersicHybrid,self)._get_lnprob_array_list(pars, **keys)
+        lnp_list.append( self.n_prior.get_lnprob_array(pars[:,6]) )
+        return lnp_list
+
+    def sample(self, n=None, rng=None):
         """
         Get random samples
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
         if n is None:
@@ -417,10 +473,10 @@ class JointPriorSersicHybrid(JointPriorSimpleHybrid):
 
         samples=zeros( (n,7) )
 
-        tsamples = super(JointPriorSersicHybrid,self).sample(n)
+        tsamples = super(JointPriorSersicHybrid,self).sample(n, rng=rng)
 
         samples[:,0:0+6] = tsamples
-        samples[:,6] = self.n_prior.sample(n)
+        samples[:,6] = self.n_prior.sample(n, **_get_rng_keys(rng))
 
         if is_scalar:
             samples = samples[0,:]
@@ -428,24 +484,16 @@ class JointPriorSersicHybrid(JointPriorSimpleHybrid):
 
     def check_bounds_scalar(self, pars, throw=True):
         """
-        Check bounds on T Flux
+        Check bounds on T Flux and n
         """
 
-        T_bounds=self.T_bounds
-        F_bounds=self.F_bounds
-        logn_bounds=self.logn_bounds
+        if not super(JointPriorSersicHybrid,self).check_bounds_scalar(pars, throw=throw):
+            return False
 
-        T=pars[4]
-        F=pars[5]
+        logn_bounds=self.logn_bounds
         logn=pars[6]
 
-        if (  T < T_bounds[0]
-            or T > T_bounds[1]
-            or F < F_bounds[0]
-            or F > F_bounds[1]
-            or logn < logn_bounds[0]
-            or logn > logn_bounds[1]):
-
+        if logn < logn_bounds[0] or logn > logn_bounds[1]:
             if throw:
                 raise GMixRangeError("T, F or n out of range")
             else:
@@ -455,23 +503,16 @@ class JointPriorSersicHybrid(JointPriorSimpleHybrid):
 
     def check_bounds_array(self,pars):
         """
-        Check bounds on T Flux
+        Check bounds on T Flux and n
         """
-        T_bounds=self.T_bounds
-        F_bounds=self.F_bounds
         logn_bounds=self.logn_bounds
 
-        T=pars[:,4]
-        F=pars[:,5]
-        logn=pars[:,6]
+        wgood=super(JointPriorSersicHybrid,self).check_bounds_array(pars)
 
-        wgood, = where(  (T > T_bounds[0])
-                       & (T < T_bounds[1])
-                       & (F > F_bounds[0])
-                       & (F < F_bounds[1])
-                       & (logn > logn_bounds[0])
-                       & (logn < logn_bounds[1]) )
-        return wgood
+        logn=pars[wgood,6]
+        w, = where(  (logn > logn_bounds[0])
+                   & (logn < logn_bounds[1]) )
+        return wgood[w]
 
 
 # not used currently
@@ -492,8 +533,6 @@ class JointPriorSimpleLinPars(GMixND):
 
         super(JointPriorSimpleLinPars,self).__init__(weights, means, covars)
 
-        self._make_gmm()
-
 
     def get_prob_scalar1d(self, pars, throw=False):
         """
@@ -593,9 +632,16 @@ class JointPriorSimpleLinPars(GMixND):
         return pars1d
 
 
-    def sample1d(self, n=None):
+    def sample1d(self, n=None, rng=None):
         """
         Get samples
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
         if n is None:
@@ -610,7 +656,7 @@ class JointPriorSimpleLinPars(GMixND):
         ngood=0
         while nleft > 0:
 
-            tsamples=self._gmm.sample(nleft)
+            tsamples=GMixND.sample(self, nleft, rng=rng)
             w=self.check_bounds_array(tsamples)
 
             if w.size > 0:
@@ -626,9 +672,16 @@ class JointPriorSimpleLinPars(GMixND):
             samples = samples[0,:]
         return samples
 
-    def sample2d(self, n=None):
+    def sample2d(self, n=None, rng=None):
         """
         Get samples in 2d g space
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
         if n is None:
             is_scalar=True
@@ -636,11 +689,11 @@ class JointPriorSimpleLinPars(GMixND):
         else:
             is_scalar=False
 
-        samples1d = self.sample1d(n=n)
+        samples1d = self.sample1d(n=n, rng=rng)
 
         grand=samples1d[:,0]
 
-        theta = randu(n)*2*numpy.pi
+        theta = priors._get_rng(rng).uniform(size=n)*2*numpy.pi
         twotheta = 2*theta
 
         g1rand = grand*numpy.cos(twotheta)
@@ -953,8 +1006,6 @@ class JointPriorSimpleLogPars(JointPriorSimpleLinPars):
 
         super(JointPriorSimpleLogPars,self).__init__(weights, means, covars, 0.0, 0.0)
 
-        self._make_gmm()
-
 
     def check_bounds_scalar(self, pars, throw=True):
         """
@@ -1065,7 +1116,7 @@ def make_uniform_simple_eta_sep(cen, cen_width, T_range, F_range):
     return pr
 
 
-class PriorSimpleSep(object):
+class PriorSimpleSep(_LnProbArrayMixin):
     """
     Separate priors on each parameter
 
@@ -1101,6 +1152,39 @@ class PriorSimpleSep(object):
 
         self.F_priors=F_prior
 
+        self._compiled=None
+
+    def compile(self):
+        """
+        compile the priors so that fill_fdiff and get_lnprob_scalar are
+        evaluated in a single call to the C code
+
+        This is only possible if all the priors are supported by
+        priors.compile_priors, otherwise the python code is used.
+        The current state of the priors is copied, so compile again if the
+        priors are modified
+
+        returns
+        -------
+        True if the priors were compiled
+        """
+        self._compiled=priors.compile_priors( self._get_prior_list() )
+        return self._compiled is not None
+
+    def _get_prior_list(self):
+        """
+        list of (prior, index of first parameter, kind) in the order
+        used by fill_fdiff, see priors.compile_priors
+        """
+        plist=[(self.cen_prior,0,'sep'),
+               (self.g_prior,2,'2d'),
+               (self.T_prior,4,'1d')]
+
+        for i in xrange(self.nband):
+            plist.append( (self.F_priors[i], 5+i, '1d') )
+
+        return plist
+
     def get_widths(self, n=10000):
         """
         estimate the width in each dimension
@@ -1135,6 +1219,10 @@ class PriorSimpleSep(object):
         log probability for scalar input (meaning one point)
         """
 
+        if self._compiled is not None:
+            pars=numpy.asarray(pars, dtype='f8')
+            return _gmix.prior_get_lnprob_scalar(self._compiled, pars)
+
         lnp = self.cen_prior.get_lnprob_scalar(pars[0],pars[1])
         lnp += self.g_prior.get_lnprob_scalar2d(pars[2],pars[3])
         lnp += self.T_prior.get_lnprob_scalar(pars[4], **keys)
@@ -1152,6 +1240,10 @@ class PriorSimpleSep(object):
         """
         set sqrt(-2ln(p)) ~ (model-data)/err
         """
+
+        if self._compiled is not None:
+            return _gmix.prior_fill_fdiff(self._compiled, pars, fdiff)
+
         index=0
 
         #fdiff[index] = self.cen_prior.get_lnprob_scalar(pars[0],pars[1])
@@ -1190,26 +1282,38 @@ class PriorSimpleSep(object):
 
         return p
 
-    def get_lnprob_array(self, pars, **keys):
+    def _get_lnprob_array_list(self, pars, **keys):
         """
-        log probability for array input [N,ndims]
+        list of log probability arrays, one for each term in fill_fdiff
         """
 
-        lnp = self.cen_prior.get_lnprob_array(pars[:,0], pars[:,1])
-        lnp += self.g_prior.get_lnprob_array2d(pars[:,2],pars[:,3])
-        lnp += self.T_prior.get_lnprob_array(pars[:,4])
+        lnp1,lnp2=self.cen_prior.get_lnprob_array_sep(pars[:,0],pars[:,1])
+
+        lnp_list=[lnp1,
+                  lnp2,
+                  self.g_prior.get_lnprob_array2d(pars[:,2],pars[:,3]),
+                  self.T_prior.get_lnprob_array(pars[:,4])]
 
         for i in xrange(self.nband):
             F_prior=self.F_priors[i]
-            lnp += F_prior.get_lnprob_array(pars[:,5+i])
+            lnp_list.append( F_prior.get_lnprob_array(pars[:,5+i]) )
 
-        return lnp
+        return lnp_list
 
-    def sample(self, n=None, **unused_keys):
+    def sample(self, n=None, rng=None, **unused_keys):
         """
         Get random samples
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
+        rkeys=_get_rng_keys(rng)
+
         if n is None:
             is_scalar=True
             n=1
@@ -1218,9 +1322,9 @@ class PriorSimpleSep(object):
 
         samples=zeros( (n,5+self.nband) )
 
-        cen1,cen2 = self.cen_prior.sample(n)
-        g1,g2=self.g_prior.sample2d(n)
-        T=self.T_prior.sample(n)
+        cen1,cen2 = self.cen_prior.sample(n, **rkeys)
+        g1,g2=self.g_prior.sample2d(n, **rkeys)
+        T=self.T_prior.sample(n, **rkeys)
 
         samples[:,0] = cen1
         samples[:,1] = cen2
@@ -1230,7 +1334,7 @@ class PriorSimpleSep(object):
 
         for i in xrange(self.nband):
             F_prior=self.F_priors[i]
-            F=F_prior.sample(n)
+            F=F_prior.sample(n, **rkeys)
             samples[:,5+i] = F
 
         if is_scalar:
@@ -1264,11 +1368,34 @@ class PriorCoellipSame(PriorSimpleSep):
 
         self.ngauss=ngauss
 
+    def _get_prior_list(self):
+        """
+        list of (prior, index of first parameter, kind) in the order
+        used by fill_fdiff, see priors.compile_priors
+        """
+        ngauss=self.ngauss
+
+        plist=[(self.cen_prior,0,'sep'),
+               (self.g_prior,2,'2d')]
+
+        for i in xrange(ngauss):
+            plist.append( (self.T_prior, 4+i, '1d') )
+
+        F_prior=self.F_priors[0]
+        for i in xrange(ngauss):
+            plist.append( (F_prior, 4+ngauss+i, '1d') )
+
+        return plist
+
     def get_lnprob_scalar(self, pars, **keys):
         """
         log probability for scalar input (meaning one point)
         """
 
+        if self._compiled is not None:
+            pars=numpy.asarray(pars, dtype='f8')
+            return _gmix.prior_get_lnprob_scalar(self._compiled, pars)
+
         ngauss=self.ngauss
 
         lnp = self.cen_prior.get_lnprob_scalar(pars[0],pars[1])
@@ -1288,6 +1415,9 @@ class PriorCoellipSame(PriorSimpleSep):
         set sqrt(-2ln(p)) ~ (model-data)/err
         """
 
+        if self._compiled is not None:
+            return _gmix.prior_fill_fdiff(self._compiled, pars, fdiff)
+
         ngauss=self.ngauss
 
         index=0
@@ -1319,6 +1449,27 @@ class PriorCoellipSame(PriorSimpleSep):
 
         return index
 
+    def _get_lnprob_array_list(self, pars, **keys):
+        """
+        list of log probability arrays, one for each term in fill_fdiff
+        """
+
+        ngauss=self.ngauss
+
+        lnp1,lnp2=self.cen_prior.get_lnprob_array_sep(pars[:,0],pars[:,1])
+
+        lnp_list=[lnp1,
+                  lnp2,
+                  self.g_prior.get_lnprob_array2d(pars[:,2],pars[:,3])]
+
+        for i in xrange(ngauss):
+            lnp_list.append( self.T_prior.get_lnprob_array(pars[:,4+i]) )
+
+        F_prior=self.F_priors[0]
+        for i in xrange(ngauss):
+            lnp_list.append( F_prior.get_lnprob_array(pars[:,4+ngauss+i]) )
+
+        return lnp_list
 
 
 class PriorSimpleSepRound(PriorSimpleSep):
@@ -1351,6 +1502,21 @@ class PriorSimpleSepRound(PriorSimpleSep):
 
         self.F_priors=F_prior
 
+        self._compiled=None
+
+    def _get_prior_list(self):
+        """
+        list of (prior, index of first parameter, kind) in the order
+        used by fill_fdiff, see priors.compile_priors
+        """
+        plist=[(self.cen_prior,0,'sep'),
+               (self.T_prior,2,'1d')]
+
+        for i in xrange(self.nband):
+            plist.append( (self.F_priors[i], 3+i, '1d') )
+
+        return plist
+
     def get_widths(self, n=10000):
         """
         estimate the width in each dimension
@@ -1370,6 +1536,10 @@ class PriorSimpleSepRound(PriorSimpleSep):
         log probability for scalar input (meaning one point)
         """
 
+        if self._compiled is not None:
+            pars=numpy.asarray(pars, dtype='f8')
+            return _gmix.prior_get_lnprob_scalar(self._compiled, pars)
+
         lnp = self.cen_prior.get_lnprob_scalar(pars[0],pars[1])
         lnp += self.T_prior.get_lnprob_scalar(pars[2], **keys)
 
@@ -1383,6 +1553,10 @@ class PriorSimpleSepRound(PriorSimpleSep):
         """
         set sqrt(-2ln(p)) ~ (model-data)/err
         """
+
+        if self._compiled is not None:
+            return _gmix.prior_fill_fdiff(self._compiled, pars, fdiff)
+
         index=0
 
         #fdiff[index] = self.cen_prior.get_lnprob_scalar(pars[0],pars[1])
@@ -1409,25 +1583,37 @@ class PriorSimpleSepRound(PriorSimpleSep):
 
         return index
 
-    def get_lnprob_array(self, pars, **keys):
+    def _get_lnprob_array_list(self, pars, **keys):
         """
-        log probability for array input [N,ndims]
+        list of log probability arrays, one for each term in fill_fdiff
         """
 
-        lnp = self.cen_prior.get_lnprob_array(pars[:,0], pars[:,1])
-        lnp += self.T_prior.get_lnprob_array(pars[:,2])
+        lnp1,lnp2=self.cen_prior.get_lnprob_array_sep(pars[:,0],pars[:,1])
+
+        lnp_list=[lnp1,
+                  lnp2,
+                  self.T_prior.get_lnprob_array(pars[:,2])]
 
         for i in xrange(self.nband):
             F_prior=self.F_priors[i]
-            lnp += F_prior.get_lnprob_array(pars[:,3+i])
+            lnp_list.append( F_prior.get_lnprob_array(pars[:,3+i]) )
 
-        return lnp
+        return lnp_list
 
-    def sample(self, n=None, **unused_keys):
+    def sample(self, n=None, rng=None, **unused_keys):
         """
         Get random samples
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
+        rkeys=_get_rng_keys(rng)
+
         if n is None:
             is_scalar=True
             n=1
@@ -1436,9 +1622,9 @@ class PriorSimpleSepRound(PriorSimpleSep):
 
         samples=zeros( (n,3+self.nband) )
 
-        cen1,cen2 = self.cen_prior.sample(n)
-        g1,g2=self.g_prior.sample2d(n)
-        T=self.T_prior.sample(n)
+        cen1,cen2 = self.cen_prior.sample(n, **rkeys)
+        g1,g2=self.g_prior.sample2d(n, **rkeys)
+        T=self.T_prior.sample(n, **rkeys)
 
         samples[:,0] = cen1
         samples[:,1] = cen2
@@ -1446,7 +1632,7 @@ class PriorSimpleSepRound(PriorSimpleSep):
 
         for i in xrange(self.nband):
             F_prior=self.F_priors[i]
-            F=F_prior.sample(n)
+            F=F_prior.sample(n, **rkeys)
             samples[:,3+i] = F
 
         if is_scalar:
@@ -1464,7 +1650,7 @@ class PriorSimpleSepRound(PriorSimpleSep):
         rep='\n'.join(reps)
         return rep
 
-class PriorSimpleSepFixT(object):
+class PriorSimpleSepFixT(_LnProbArrayMixin):
     """
     Separate priors on each parameter
 
@@ -1579,25 +1765,37 @@ class PriorSimpleSepFixT(object):
 
         return p
 
-    def get_lnprob_array(self, pars, **keys):
+    def _get_lnprob_array_list(self, pars, **keys):
         """
-        log probability for array input [N,ndims]
+        list of log probability arrays, one for each term in fill_fdiff
         """
 
-        lnp = self.cen_prior.get_lnprob_array(pars[:,0], pars[:,1])
-        lnp += self.g_prior.get_lnprob_array2d(pars[:,2],pars[:,3])
+        lnp1,lnp2=self.cen_prior.get_lnprob_array_sep(pars[:,0],pars[:,1])
+
+        lnp_list=[lnp1,
+                  lnp2,
+                  self.g_prior.get_lnprob_array2d(pars[:,2],pars[:,3])]
 
         for i in xrange(self.nband):
             F_prior=self.F_priors[i]
-            lnp += F_prior.get_lnprob_array(pars[:,5+i])
+            lnp_list.append( F_prior.get_lnprob_array(pars[:,4+i]) )
 
-        return lnp
+        return lnp_list
 
-    def sample(self, n=None, **unused_keys):
+    def sample(self, n=None, rng=None, **unused_keys):
         """
         Get random samples
+
+        parameters
+        ----------
+        n: int, optional
+            Number to generate, default a single sample
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
+        rkeys=_get_rng_keys(rng)
+
         if n is None:
             is_scalar=True
             n=1
@@ -1606,8 +1804,8 @@ class PriorSimpleSepFixT(object):
 
         samples=zeros( (n,5+self.nband) )
 
-        cen1,cen2 = self.cen_prior.sample(n)
-        g1,g2=self.g_prior.sample2d(n)
+        cen1,cen2 = self.cen_prior.sample(n, **rkeys)
+        g1,g2=self.g_prior.sample2d(n, **rkeys)
 
         samples[:,0] = cen1
         samples[:,1] = cen2
@@ -1616,7 +1814,7 @@ class PriorSimpleSepFixT(object):
 
         for i in xrange(self.nband):
             F_prior=self.F_priors[i]
-            F=F_prior.sample(n)
+            F=F_prior.sample(n, **rkeys)
             samples[:,4+i] = F
 
         if is_scalar:
@@ -1634,7 +1832,7 @@ class PriorSimpleSepFixT(object):
         rep='\n'.join(reps)
         return rep
 
-class PriorMomSep(object):
+class PriorMomSep(_LnProbArrayMixin):
     """
     Separate priors on each parameter
 
@@ -1740,22 +1938,22 @@ class PriorMomSep(object):
 
         return p
 
-    def get_lnprob_array(self, pars, **keys):
+    def _get_lnprob_array_list(self, pars, **keys):
         """
-        log probability for array input [N,ndims]
+        list of log probability arrays, one for each term in fill_fdiff
         """
 
-        lnp  = self.cen1_prior.get_lnprob_array2d(pars[:,0])
-        lnp += self.cen2_prior.get_lnprob_array2d(pars[:,1])
-        lnp += self.M1_prior.get_lnprob_array(pars[:,2])
-        lnp += self.M2_prior.get_lnprob_array(pars[:,3])
-        lnp += self.T_prior.get_lnprob_array(pars[:,4])
+        lnp_list=[self.cen1_prior.get_lnprob_array(pars[:,0]),
+                  self.cen2_prior.get_lnprob_array(pars[:,1]),
+                  self.M1_prior.get_lnprob_array(pars[:,2]),
+                  self.M2_prior.get_lnprob_array(pars[:,3]),
+                  self.T_prior.get_lnprob_array(pars[:,4])]
 
         for i in xrange(self.nband):
             F_prior=self.F_priors[i]
-            lnp += F_prior.get_lnprob_array(pars[:,5+i])
+            lnp_list.append( F_prior.get_lnprob_array(pars[:,5+i]) )
 
-        return lnp
+        return lnp_list
 
     def __repr__(self):
         reps=[]
@@ -1771,4 +1969,27 @@ class PriorMomSep(object):
         rep='\n'.join(reps)
         return rep
 
+def _sum_lnprob_list(lnp_list):
+    """
+    sum a list of log probability arrays
+    """
+    lnp = lnp_list[0].copy()
+    for tlnp in lnp_list[1:]:
+        lnp += tlnp
+    return lnp
+
+def _fill_fdiff_array(lnp_list, fdiff):
+    """
+    set the columns of fdiff [N,nprior] to sqrt(-2ln(p)) for a list of
+    log probability arrays, returning the number of columns set
+    """
+    nprior=len(lnp_list)
+
+    for i,lnp in enumerate(lnp_list):
+        fdiff[:,i] = lnp
+
+    chi2 = -2*fdiff[:,0:nprior]
+    chi2.clip(min=0.0, max=None, out=chi2)
+    fdiff[:,0:nprior] = sqrt(chi2)
 
+    return nprior
@@ -0,0 +1,317 @@
+"""
+Lookup tables for functions that are expensive to evaluate, such as some
+of the priors
+
+A function is tabulated on a regular 1d or 2d grid, and evaluated by
+linear or bilinear interpolation.  The maximum interpolation error is
+estimated when the table is made, by comparing to the function evaluated
+at the centers of the grid cells.
+
+The tables are kept in a cache keyed on a string that identifies the
+function, so each table is only computed once per process.  A table can
+also be written to a file, so it can be shared between processes; if the
+file already exists it is read rather than computing the table again.
+
+examples
+--------
+
+prior=GPriorMErf2(pars)
+prior.set_lut()
+print(prior.get_lut().maxerr)
+
+# share the table through a file
+prior.set_lut(fname='/path/to/gprior-lut.npz')
+"""
+from __future__ import print_function
+
+import os
+import numpy
+
+_lut_cache={}
+
+class LookupTable1D(object):
+    """
+    A function tabulated on a regular grid in x, evaluated by linear
+    interpolation
+
+    parameters
+    ----------
+    xmin: float
+        Minimum of the range
+    xmax: float
+        Maximum of the range
+    vals: array
+        The function evaluated at numpy.linspace(xmin, xmax, vals.size)
+    maxerr: float, optional
+        Estimated maximum error of the interpolation
+    """
+    def __init__(self, xmin, xmax, vals, maxerr=None):
+        self.xmin=float(xmin)
+        self.xmax=float(xmax)
+        self.vals=numpy.array(vals, dtype='f8', copy=True)
+        self.maxerr=maxerr
+
+        self.npoints=self.vals.size
+        if self.npoints < 2:
+            raise ValueError("need at least 2 points, got %d" % self.npoints)
+
+        self.dx=(self.xmax-self.xmin)/(self.npoints-1)
+        self.dxinv=1.0/self.dx
+
+        # python floats are faster for scalar lookups
+        self._vals_list=self.vals.tolist()
+
+    def get_scalar(self, x):
+        """
+        interpolated value for a scalar in [xmin,xmax], not checked
+        """
+        fi=(x-self.xmin)*self.dxinv
+        i=int(fi)
+        if i > self.npoints-2:
+            i=self.npoints-2
+
+        frac=fi-i
+        vals=self._vals_list
+        v0=vals[i]
+        return v0 + frac*(vals[i+1]-v0)
+
+    def get_array(self, x):
+        """
+        interpolated values for an array in [xmin,xmax], not checked
+        """
+        fi=(numpy.asarray(x, dtype='f8')-self.xmin)*self.dxinv
+        i=fi.astype('i8')
+        i.clip(min=0, max=self.npoints-2, out=i)
+
+        frac=fi-i
+        v0=self.vals[i]
+        return v0 + frac*(self.vals[i+1]-v0)
+
+class LookupTable2D(object):
+    """
+    A function tabulated on a regular grid in x,y, evaluated by bilinear
+    interpolation
+
+    parameters
+    ----------
+    xmin, xmax: float
+        Range in x
+    ymin, ymax: float
+        Range in y
+    vals: array
+        Array shape [nx,ny] with the function evaluated on
+        numpy.linspace(xmin, xmax, nx) and numpy.linspace(ymin, ymax, ny)
+    maxerr: float, optional
+        Estimated maximum error of the interpolation
+    """
+    def __init__(self, xmin, xmax, ymin, ymax, vals, maxerr=None):
+        self.xmin=float(xmin)
+        self.xmax=float(xmax)
+        self.ymin=float(ymin)
+        self.ymax=float(ymax)
+        self.vals=numpy.array(vals, dtype='f8', copy=True)
+        self.maxerr=maxerr
+
+        if len(self.vals.shape) != 2:
+            raise ValueError("vals must be 2d")
+
+        self.nx, self.ny = self.vals.shape
+        if self.nx < 2 or self.ny < 2:
+            raise ValueError("need at least 2 points in "
+                             "each dimension, got %s" % (self.vals.shape,))
+
+        self.dxinv=(self.nx-1)/(self.xmax-self.xmin)
+        self.dyinv=(self.ny-1)/(self.ymax-self.ymin)
+
+        self._vals_list=self.vals.tolist()
+
+    def get_scalar(self, x, y):
+        """
+        interpolated value for a scalar point in the range, not checked
+        """
+        fi=(x-self.xmin)*self.dxinv
+        fj=(y-self.ymin)*self.dyinv
+
+        i=int(fi)
+        if i > self.nx-2:
+            i=self.nx-2
+        j=int(fj)
+        if j > self.ny-2:
+            j=self.ny-2
+
+        fx=fi-i
+        fy=fj-j
+
+        row0=self._vals_list[i]
+        row1=self._vals_list[i+1]
+
+        v0 = row0[j] + fy*(row0[j+1]-row0[j])
+        v1 = row1[j] + fy*(row1[j+1]-row1[j])
+        return v0 + fx*(v1-v0)
+
+    def get_array(self, x, y):
+        """
+        interpolated values for arrays of points in the range, not checked
+        """
+        fi=(numpy.asarray(x, dtype='f8')-self.xmin)*self.dxinv
+        fj=(numpy.asarray(y, dtype='f8')-self.ymin)*self.dyinv
+
+        i=fi.astype('i8')
+        i.clip(min=0, max=self.nx-2, out=i)
+        j=fj.astype('i8')
+        j.clip(min=0, max=self.ny-2, out=j)
+
+        fx=fi-i
+        fy=fj-j
+
+        vals=self.vals
+        v0 = vals[i,j]   + fy*(vals[i,j+1]-vals[i,j])
+        v1 = vals[i+1,j] + fy*(vals[i+1,j+1]-vals[i+1,j])
+        return v0 + fx*(v1-v0)
+
+def make_lut1d(func, xmin, xmax, npoints, key, fname=None):
+    """
+    Get a LookupTable1D for the function, from the cache or the file if
+    possible, otherwise by evaluating the function
+
+    parameters
+    ----------
+    func: callable
+        Function of an array of x values; it must be finite over the range
+    xmin, xmax: float
+        The range of the table
+    npoints: int
+        Number of points in the table
+    key: string
+        Identifies the function and its parameters; tables with the same
+        key are shared
+    fname: string, optional
+        File in which to store the table.  If it exists the table is read
+        from it
+    """
+
+    key='%s xmin=%r xmax=%r npoints=%d' % (key, xmin, xmax, npoints)
+
+    lut=_lut_cache.get(key, None)
+    if lut is not None:
+        return lut
+
+    data=_read_lut(fname, key)
+    if data is not None:
+        lut=LookupTable1D(xmin, xmax, data['vals'], maxerr=float(data['maxerr']))
+    else:
+        x=numpy.linspace(xmin, xmax, npoints)
+        vals=_eval_finite(func, x)
+        lut=LookupTable1D(xmin, xmax, vals)
+
+        xmid=0.5*(x[1:]+x[:-1])
+        truth=_eval_finite(func, xmid)
+        lut.maxerr=numpy.abs(lut.get_array(xmid)-truth).max()
+
+        _write_lut(fname, key, lut)
+
+    _lut_cache[key] = lut
+    return lut
+
+def make_lut2d(func, xmin, xmax, ymin, ymax, npoints, key, fname=None):
+    """
+    Get a LookupTable2D for the function, from the cache or the file if
+    possible, otherwise by evaluating the function
+
+    parameters
+    ----------
+    func: callable
+        Function of arrays of x and y values; it must be finite over the range
+    xmin, xmax: float
+        The range of the table in x
+    ymin, ymax: float
+        The range of the table in y
+    npoints: int or sequence
+        Number of points in the table in each dimension.  If a scalar, the
+        same number is used for both
+    key: string
+        Identifies the function and its parameters; tables with the same
+        key are shared
+    fname: string, optional
+        File in which to store the table.  If it exists the table is read
+        from it
+    """
+
+    nx, ny = numpy.broadcast_to(npoints, 2)
+    nx, ny = int(nx), int(ny)
+
+    key='%s xmin=%r xmax=%r ymin=%r ymax=%r npoints=%d,%d' % \
+            (key, xmin, xmax, ymin, ymax, nx, ny)
+
+    lut=_lut_cache.get(key, None)
+    if lut is not None:
+        return lut
+
+    data=_read_lut(fname, key)
+    if data is not None:
+        lut=LookupTable2D(xmin, xmax, ymin, ymax, data['vals'],
+                          maxerr=float(data['maxerr']))
+    else:
+        x=numpy.linspace(xmin, xmax, nx)
+        y=numpy.linspace(ymin, ymax, ny)
+
+        xg, yg = numpy.meshgrid(x, y, indexing='ij')
+        vals=_eval_finite(func, xg.ravel(), yg.ravel()).reshape(nx, ny)
+        lut=LookupTable2D(xmin, xmax, ymin, ymax, vals)
+
+        xmid=0.5*(x[1:]+x[:-1])
+        ymid=0.5*(y[1:]+y[:-1])
+        xg, yg = numpy.meshgrid(xmid, ymid, indexing='ij')
+        xg=xg.ravel()
+        yg=yg.ravel()
+        truth=_eval_finite(func, xg, yg)
+        lut.maxerr=numpy.abs(lut.get_array(xg, yg)-truth).max()
+
+        _write_lut(fname, key, lut)
+
+    _lut_cache[key] = lut
+    return lut
+
+def clear_cache():
+    """
+    remove all tables from the cache
+    """
+    _lut_cache.clear()
+
+def _eval_finite(func, *args):
+    """
+    evaluate the function, requiring the result be finite
+    """
+    vals=numpy.array(func(*args), dtype='f8', ndmin=1)
+    if not numpy.all(numpy.isfinite(vals)):
+        raise ValueError("function is not finite over the range of the table")
+    return vals
+
+def _read_lut(fname, key):
+    """
+    read the table data if the file exists, checking the key matches
+    """
+    if fname is None or not os.path.exists(fname):
+        return None
+
+    with numpy.load(fname) as data:
+        fkey=str(data['key'])
+        if fkey != key:
+            raise ValueError("table in file '%s' has key '%s', "
+                             "expected '%s'" % (fname, fkey, key))
+
+        return {'vals':data['vals'], 'maxerr':data['maxerr']}
+
+def _write_lut(fname, key, lut):
+    """
+    write the table; a temporary file is renamed so that processes reading
+    the file never see a partial table
+    """
+    if fname is None:
+        return
+
+    tmpname='%s.%d.tmp' % (fname, os.getpid())
+    with open(tmpname, 'wb') as fobj:
+        numpy.savez(fobj, key=key, vals=lut.vals, maxerr=lut.maxerr)
+
+    os.rename(tmpname, fname)
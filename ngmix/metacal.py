@@ -11,12 +11,12 @@ from numpy import zeros, ones, newaxis, sqrt, diag, dot, linalg, array
 from numpy import median, where
 from .jacobian import Jacobian, UnitJacobian
 from .observation import Observation, ObsList, MultiBandObsList
+from .observation import get_readonly_view
 from .shape import Shape
 
-try:
-    import galsim
-except ImportError:
-    pass
+# galsim is slow to import, so it is only imported when the first
+# Metacal object is created; see _import_galsim
+galsim=None
 
 LANCZOS_PARS_DEFAULT={'order':5, 'conserve_dc':True, 'tol':1.0e-4}
 
@@ -118,6 +118,7 @@ class Metacal(object):
     """
 
     def __init__(self, obs, **kw):
+        _import_galsim()
 
         self.obs=obs
 
@@ -147,20 +148,7 @@ class Metacal(object):
         """
         types=kw.get('types',METACAL_TYPES)
 
-        shdict={}
-
-        # galshear keys
-        shdict['1m']=Shape(-step,  0.0)
-        shdict['1p']=Shape( step,  0.0)
-
-        shdict['2m']=Shape(0.0, -step)
-        shdict['2p']=Shape(0.0,  step)
-
-        # psfshear keys
-        keys=list(shdict.keys())
-        for key in keys:
-            pkey = '%s_psf' % key
-            shdict[pkey] = shdict[key].copy()
+        shdict=_get_shear_dict(step)
 
         odict={}
 
@@ -176,6 +164,65 @@ class Metacal(object):
 
         return odict
 
+    def get_all_images(self, step, psf_images, images, **kw):
+        """
+        Draw all combinations of metacal images into the input arrays,
+        without creating new Observations
+
+        parameters
+        ----------
+        step: float
+            The shear step value to use for metacal
+        psf_images: dict
+            Keyed by type, each a 2d array with the shape of the
+            psf image, to be filled
+        images: dict
+            Keyed by type, each a 2d array with the shape of the
+            image, to be filled
+        types: list
+            Types to get.  Default is given in METACAL_TYPES
+        """
+        types=kw.get('types',METACAL_TYPES)
+
+        shdict=_get_shear_dict(step)
+
+        for type in types:
+            sh=shdict[type]
+
+            psf_im = galsim.Image(psf_images[type], wcs=self.gs_wcs)
+            im     = galsim.Image(images[type], wcs=self.gs_wcs)
+
+            if 'psf' in type:
+                psf_type='psf_shear'
+                im_shear=None
+            else:
+                psf_type='gal_shear'
+                im_shear=sh
+
+            tmp, newpsf_obj = self.get_target_psf(sh, psf_type, image=psf_im)
+            self.get_target_image(newpsf_obj, shear=im_shear, image=im)
+
+    def set_obs(self, obs):
+        """
+        Set a new observation, re-using the pixel and interpolant
+        setup.  The new observation must have the same pixel scale
+        as the original one
+
+        parameters
+        ----------
+        obs: Observation
+            The new observation, with a psf set
+        """
+        if not obs.has_psf():
+            raise ValueError("observation must have a psf observation set")
+
+        if obs.jacobian.get_scale() != self.pixel_scale:
+            raise ValueError("new observation has pixel scale %g, "
+                             "expected %g" % (obs.jacobian.get_scale(),
+                                              self.pixel_scale))
+        self.obs=obs
+        self.jacobian=obs.jacobian
+        self._set_data()
 
     def get_obs_galshear(self, shear, get_unsheared=False):
         """
@@ -237,7 +284,7 @@ class Metacal(object):
         return newobs
 
 
-    def get_target_psf(self, shear, type):
+    def get_target_psf(self, shear, type, image=None):
         """
         get galsim object for the dilated, possibly sheared, psf
 
@@ -249,6 +296,8 @@ class Metacal(object):
             Type of psf target.  For type='gal_shear', the psf is just dilated to
             deal with noise amplification.  For type='psf_shear' the psf is also
             sheared for calculating Rpsf
+        image: galsim image, optional
+            Draw into this image rather than a new one
 
         returns
         -------
@@ -263,7 +312,10 @@ class Metacal(object):
             # eric remarked that he thought we should shear the pixelized version
             psf_grown = psf_grown.shear(g1=shear.g1, g2=shear.g2)
 
-        psf_grown_image = galsim.ImageD(self.psf_dims[1], self.psf_dims[0])
+        if image is None:
+            psf_grown_image = galsim.ImageD(self.psf_dims[1], self.psf_dims[0])
+        else:
+            psf_grown_image = image
 
         # TODO not general, using just pixel scale
         psf_grown.drawImage(image=psf_grown_image,
@@ -281,7 +333,7 @@ class Metacal(object):
 
         return psf_grown_interp
 
-    def get_target_image(self, psf_obj, shear=None):
+    def get_target_image(self, psf_obj, shear=None, image=None):
         """
         get the target image, convolved with the specified psf
         and possibly sheared
@@ -293,6 +345,8 @@ class Metacal(object):
             or surface brightness profile
         shear: ngmix.Shape, optional
             The shear to apply
+        image: galsim image, optional
+            Draw into this image rather than a new one
 
         returns
         -------
@@ -307,7 +361,10 @@ class Metacal(object):
 
         # Draw reconvolved, sheared image to an ImageD object, and return.
         # pixel is already in the psf
-        newim = galsim.ImageD(self.im_dims[1], self.im_dims[0])
+        if image is None:
+            newim = galsim.ImageD(self.im_dims[1], self.im_dims[0])
+        else:
+            newim = image
         imconv.drawImage(image=newim,
                          method='no_pixel',
                          scale=self.pixel_scale)
@@ -433,17 +490,22 @@ class Metacal(object):
     def _make_obs(self, im, psf_im):
         """
         inputs are galsim objects
+
+        The weight maps, bitmask and jacobians are shared with the original
+        observation as read-only views, since they are the same for all
+        metacal types
         """
 
         obs=self.obs
 
         psf_obs = Observation(psf_im.array,
-                              weight=obs.psf.weight.copy(),
-                              jacobian=obs.psf.jacobian.copy())
+                              weight=get_readonly_view(obs.psf.weight),
+                              jacobian=obs.psf.jacobian.get_view())
 
         newobs=Observation(im.array,
-                           jacobian=obs.jacobian.copy(),
-                           weight=obs.weight.copy(),
+                           jacobian=obs.jacobian.get_view(),
+                           weight=get_readonly_view(obs.weight),
+                           bmask=get_readonly_view(obs.bmask),
                            psf=psf_obs)
         return newobs
 
@@ -497,6 +559,132 @@ class MetacalAnalyticPSF(Metacal):
 
 
 
+def get_all_metacal_stack(images, psf_images,
+                          step=0.01,
+                          weights=None,
+                          jacobian=None,
+                          psf_jacobian=None,
+                          **kw):
+    """
+    Get all combinations of metacal images for a stack of same-sized
+    stamps, as is natural for MEDS-style cutouts which come in a few fixed
+    sizes
+
+    The wcs, pixel and interpolant setup is done once and re-used for all
+    stamps, and the images are drawn directly into the output arrays
+
+    parameters
+    ----------
+    images: array
+        [N, nrow, ncol] stack of images
+    psf_images: array
+        [N, psf_nrow, psf_ncol] stack of psf images
+    step: float
+        The shear step value to use for metacal
+    weights: array, optional
+        [N, nrow, ncol] stack of weight maps, used to set the noise level.
+        Default is unit weight
+    jacobian: Jacobian, optional
+        Jacobian for the images. All images must have the same pixel
+        scale.  Default is a UnitJacobian
+    psf_jacobian: Jacobian, optional
+        Jacobian for the psf images, default is jacobian
+    types: list
+        Types to get.  Default is given in METACAL_TYPES
+
+    returns
+    -------
+    A dictionary keyed by metacal type, see get_all_metacal.  Each
+    entry is a dict with 'image' holding a [N, nrow, ncol] array of
+    metacal images and 'psf_image' holding a [N, psf_nrow, psf_ncol]
+    array of target psf images
+    """
+
+    images=numpy.asarray(images, dtype='f8')
+    psf_images=numpy.asarray(psf_images, dtype='f8')
+    if len(images.shape) != 3 or len(psf_images.shape) != 3:
+        raise ValueError("images and psf_images must be 3d stacks")
+
+    nobj=images.shape[0]
+    if psf_images.shape[0] != nobj:
+        raise ValueError("got %d images but %d psf "
+                         "images" % (nobj, psf_images.shape[0]))
+
+    if weights is not None:
+        weights=numpy.asarray(weights, dtype='f8')
+        if weights.shape != images.shape:
+            raise ValueError("weights must have same shape as images")
+
+    if jacobian is None:
+        jacobian=UnitJacobian(0.0, 0.0)
+    if psf_jacobian is None:
+        psf_jacobian=jacobian
+
+    types=kw.get('types',METACAL_TYPES)
+
+    odict={}
+    for type in types:
+        odict[type] = {
+            'image':zeros(images.shape),
+            'psf_image':zeros(psf_images.shape),
+        }
+
+    mc=None
+    for i in xrange(nobj):
+        if weights is not None:
+            weight=weights[i]
+        else:
+            weight=None
+
+        psf_obs=Observation(psf_images[i], jacobian=psf_jacobian)
+        obs=Observation(images[i],
+                        weight=weight,
+                        jacobian=jacobian,
+                        psf=psf_obs)
+
+        if mc is None:
+            mc=Metacal(obs)
+        else:
+            mc.set_obs(obs)
+
+        psf_outputs={}
+        outputs={}
+        for type in types:
+            psf_outputs[type] = odict[type]['psf_image'][i]
+            outputs[type]     = odict[type]['image'][i]
+
+        mc.get_all_images(step, psf_outputs, outputs, types=types)
+
+    return odict
+
+def _import_galsim():
+    """
+    import galsim into the module namespace
+    """
+    global galsim
+    import galsim
+
+def _get_shear_dict(step):
+    """
+    get the shears for each metacal type
+    """
+    shdict={}
+
+    # galshear keys
+    shdict['1m']=Shape(-step,  0.0)
+    shdict['1p']=Shape( step,  0.0)
+
+    shdict['2m']=Shape(0.0, -step)
+    shdict['2p']=Shape(0.0,  step)
+
+    # psfshear keys
+    keys=list(shdict.keys())
+    for key in keys:
+        pkey = '%s_psf' % key
+        shdict[pkey] = shdict[key].copy()
+
+    return shdict
+
 def _do_dilate(obj, shear):
     """
     obj could be an interpolated image or a galsim object
@@ -820,6 +1008,7 @@ def _init_mb_obs_list_dict(keys):
 
 
 def test():
+    import galsim
     import images
     import fitsio
     import os
@@ -914,6 +1103,7 @@ test-psf-mcal-psfshear-0.00-0.01.fits
 """     )
 
 def _get_sim_obs(s1, s2, g1=0.2, g2=0.1, r50=3.0, r50_psf=1.8):
+    import galsim
 
     dims=32,32
 
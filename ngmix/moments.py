@@ -1,7 +1,17 @@
 from __future__ import print_function
+
+try:
+    xrange = xrange
+    # We have Python 2
+except:
+    xrange = range
+    # We have Python 3
+
+import os
 import numpy
 from ._gmix import GMixRangeError
 from . import shape
+from .threads import run_chunks
 
 def sigma_to_fwhm(sigma):
     """
@@ -739,6 +749,205 @@ class OldDeriv(object):
 
 
 
+class TemplateIndex(object):
+    """
+    A regular grid over some of the template parameters, used to find the
+    templates inside a box, such as the one bounding the nsigma ellipsoid
+    of a likelihood
+
+    The templates are sorted by grid cell, so the templates in a range of
+    cells are found without looking at the others
+
+    parameters
+    ----------
+    templates: array
+        Shape [ntemplates, npars]
+    dims: sequence, optional
+        The parameters to index, default [0,1,2,3,4] for the center, M1,
+        M2 and T
+    nper: float, optional
+        Mean number of templates per cell, default 16
+    maxfrac: float, optional
+        If a box covers more than this fraction of the cells or of the
+        templates, get_candidates returns None, meaning all templates
+        should be used.  Default 0.25
+    rows, cens: arrays, optional
+        If sent, template i is templates[rows[i]] with the center
+        replaced by cens[i], as used by PQRMomTemplatesBase
+    """
+    def __init__(self,
+                 templates,
+                 dims=[0,1,2,3,4],
+                 nper=16,
+                 maxfrac=0.25,
+                 rows=None,
+                 cens=None):
+
+        self.templates=templates
+        self.rows=rows
+        self.cens=cens
+        self.dims=list(dims)
+        self.maxfrac=maxfrac
+
+        if rows is None:
+            npoints=templates.shape[0]
+        else:
+            npoints=rows.size
+        self.npoints=npoints
+
+        ndim=len(self.dims)
+
+        nbin=int( (npoints/float(nper))**(1.0/ndim) )
+        nbin=max(nbin,1)
+
+        self.nbin=nbin
+        self.shape=(nbin,)*ndim
+        self.ncell=nbin**ndim
+
+        self.lows=numpy.zeros(ndim)
+        self.highs=numpy.zeros(ndim)
+        self.binv=numpy.zeros(ndim)
+
+        coords=numpy.zeros( (ndim, npoints), dtype='i8')
+        for i,dim in enumerate(self.dims):
+            vals=self.get_values(dim)
+            low,high=vals.min(), vals.max()
+
+            self.lows[i]=low
+            self.highs[i]=high
+            if high > low:
+                self.binv[i] = nbin/(high-low)
+            else:
+                self.binv[i] = 1.0
+
+            coords[i,:] = self._get_bins(vals, i)
+
+        cellids=numpy.ravel_multi_index(coords, self.shape)
+
+        self.order=cellids.argsort(kind='mergesort')
+
+        counts=numpy.bincount(cellids, minlength=self.ncell)
+        self.starts=numpy.zeros(self.ncell+1, dtype='i8')
+        self.starts[1:] = counts.cumsum()
+
+    def get_candidates(self, lows, highs):
+        """
+        get the templates with all the indexed parameters inside the box
+
+        parameters
+        ----------
+        lows, highs: arrays
+            The box, for each of the indexed parameters
+
+        returns
+        -------
+        index: array or None
+            The template indices, sorted.  None if the box covers more
+            than maxfrac of the cells or templates, in which case it is
+            faster to use all templates
+        """
+
+        ranges=[]
+        ncell_box=1
+        for i in xrange(len(self.dims)):
+            if highs[i] < self.lows[i] or lows[i] > self.highs[i]:
+                return numpy.zeros(0, dtype='i8')
+
+            b0,b1 = self._get_bins(numpy.array([lows[i], highs[i]]), i)
+            ranges.append( numpy.arange(b0,b1+1) )
+            ncell_box *= (b1-b0+1)
+
+        if ncell_box > self.maxfrac*self.ncell:
+            return None
+
+        grids=numpy.meshgrid(*ranges, indexing='ij')
+        cellids=numpy.ravel_multi_index([g.ravel() for g in grids], self.shape)
+
+        starts=self.starts[cellids]
+        lengths=self.starts[cellids+1]-starts
+
+        ntot=lengths.sum()
+        if ntot == 0:
+            return numpy.zeros(0, dtype='i8')
+        elif ntot > self.maxfrac*self.npoints:
+            return None
+
+        # positions of all the templates in these cells in the sorted order
+        offsets = lengths.cumsum()-lengths
+        pos = numpy.arange(ntot) - numpy.repeat(offsets-starts, lengths)
+
+        index=self.order[pos]
+
+        # exact cut on the box
+        keep=numpy.ones(index.size, dtype=bool)
+        for i,dim in enumerate(self.dims):
+            vals=self.get_values(dim, index=index)
+            keep &= (vals >= lows[i]) & (vals <= highs[i])
+
+        index=index[keep]
+        index.sort()
+        return index
+
+    def get_values(self, dim, index=None):
+        """
+        get parameter dim for all templates, or those in the index
+        """
+        if self.rows is None:
+            if index is None:
+                return self.templates[:,dim]
+            else:
+                return self.templates[index,dim]
+
+        if dim < 2:
+            if index is None:
+                return self.cens[:,dim]
+            else:
+                return self.cens[index,dim]
+        else:
+            if index is None:
+                return self.templates[self.rows,dim]
+            else:
+                return self.templates[self.rows[index],dim]
+
+    def get_grid_data(self):
+        """
+        the grid as a tuple of contiguous arrays, as used by the C code
+        """
+        return (numpy.array(self.dims, dtype='i8'),
+                self.lows,
+                self.highs,
+                self.binv,
+                self.nbin,
+                numpy.ascontiguousarray(self.order, dtype='i8'),
+                self.starts,
+                float(self.maxfrac))
+
+    def _get_bins(self, vals, i):
+        """
+        grid bins in dimension i, clipped to the grid
+        """
+        bins=numpy.floor( (vals-self.lows[i])*self.binv[i] ).astype('i8')
+        bins.clip(min=0, max=self.nbin-1, out=bins)
+        return bins
+
+# shear derivatives of the templates, keyed by the template content
+# and the settings used to calculate them
+_deriv_cache={}
+
+def clear_deriv_cache():
+    """
+    remove all template shear derivatives from the cache
+    """
+    _deriv_cache.clear()
+
+def _update_hash(h, arr):
+    """
+    add the shape and content of the array to the hash
+    """
+    arr=numpy.ascontiguousarray(arr, dtype='f8')
+    h.update( str(arr.shape).encode('utf-8') )
+    h.update( arr.tobytes() )
+
 class PQRMomTemplatesBase(object):
     """
     calculate pqr from the input moments and a
@@ -747,7 +956,32 @@ class PQRMomTemplatesBase(object):
 
     random centers will be randomly placed in 
     a radius 
+
+    The randomized templates are not stored.  Template i is row rows[i] of
+    the trimmed input templates, with the center replaced by cens[i].  The
+    shear derivatives are calculated for the trimmed templates only, and
+    are kept in a cache keyed on the content of the templates, so they are
+    shared by all instances with the same templates.  Use get_templates()
+    to get the full set of randomized templates
+
+    With use_index=True, the default, a TemplateIndex is built the first
+    time calc_pqr is run, and only the templates inside the box bounding
+    the nsigma ellipsoid of the likelihood are sent to the C code.  The
+    results are the same as using all templates
+
+    The trimmed templates, the rows and centers, and the shear derivatives
+    can be stored in an artifact file, see the artifact module.  If the artifact
+    keyword is sent and the file exists, these are memory mapped from the
+    file rather than computed, so many processes can share them.  If the
+    file does not exist it is written.  Note the random centers are then
+    the same for all processes using the file.  The input templates can
+    be None when reading an existing file, otherwise they must match those
+    used to write the file
     """
+
+    # the attributes stored in an artifact file
+    _artifact_names=['templates','rows','cens','Qderiv','Rderiv']
+
     def __init__(self,
                  templates,
                  cen_dist, # pdf for cen prior
@@ -757,6 +991,8 @@ class PQRMomTemplatesBase(object):
                  neff_max=100.0,
                  shear_expand=None,
                  h=1.0e-6, # when numerical deriv. are used
+                 artifact=None,
+                 use_index=True,
                 ):
 
         self.seed=numpy.random.randint(0,1000000)
@@ -769,14 +1005,185 @@ class PQRMomTemplatesBase(object):
         self.nmin=nmin
         self.neff_max=neff_max
 
+        self.use_index=use_index
+        self._index=None
+
         self.shear_expand=shear_expand
+        # as sent, since _prep_pqr may set a default
+        self._shear_expand_input=shear_expand
         self.h=h
         self.h2inv  = 1./(2.*h)
         self.hsqinv = 1./h**2
 
+        if artifact is not None and os.path.exists(artifact):
+            self._load_artifact(artifact)
+        else:
+            self._set_templates()
+            self._prep_pqr()
+
+            if artifact is not None:
+                self.save_artifact(artifact)
+
+    def save_artifact(self, fname):
+        """
+        write the templates and their shear derivatives to an
+        artifact file
+        """
+        from .artifact import write_artifact
+
+        print("writing template artifact to:",fname)
+        arrays={}
+        for name in self._artifact_names:
+            arr=getattr(self, name)
+            if arr is not None:
+                arrays[name] = arr
+
+        meta={'shear_expand':self.shear_expand}
+        write_artifact(fname, arrays, key=self._get_artifact_key(), meta=meta)
+
+    def _load_artifact(self, fname):
+        """
+        memory map the templates and shear derivatives from the file
+        """
+        from .artifact import read_artifact
+
+        if self.templates_orig is None:
+            key=None
+        else:
+            key=self._get_artifact_key()
+
+        print("loading template artifact from:",fname)
+        data=read_artifact(fname, key=key)
+
+        arrays=data['arrays']
+        for name in self._artifact_names:
+            setattr(self, name, arrays.get(name,None))
 
-        self._set_templates()
-        self._prep_pqr()
+        self.shear_expand=data['meta']['shear_expand']
+
+    def _get_artifact_key(self):
+        """
+        identifies the input templates and the settings that determine
+        the stored arrays
+        """
+        import hashlib
+
+        h=hashlib.sha1()
+        _update_hash(h, self.templates_orig)
+
+        cen_dist=self.cen_dist
+        if hasattr(cen_dist, '__dict__'):
+            cen_desc=sorted( vars(cen_dist).items() )
+        else:
+            cen_desc=None
+
+        settings=(self.__class__.__name__,
+                  self._artifact_names,
+                  self.nrand_cen,
+                  self._shear_expand_input,
+                  self.h,
+                  cen_dist.__class__.__name__,
+                  cen_desc)
+        h.update( repr(settings).encode('utf-8') )
+
+        return h.hexdigest()
+
+    def get_ntemplates(self):
+        """
+        get the number of templates, including the randomized centers
+        """
+        if self.rows is None:
+            return self.templates.shape[0]
+        else:
+            return self.rows.size
+
+    def get_templates(self):
+        """
+        get the full set of templates, with the randomized centers.  This
+        is a new array unless nrand_cen <= 1
+        """
+        if self.rows is None:
+            return self.templates
+
+        templates=self.templates[self.rows]
+        templates[:,0:2] = self.cens
+        return templates
+
+    def _get_rows(self):
+        """
+        the template rows, also when the templates are used as is
+        """
+        if self.rows is None:
+            return numpy.arange(self.templates.shape[0])
+        else:
+            return self.rows
+
+    def get_index(self):
+        """
+        get the TemplateIndex, building it if needed.  None if
+        use_index is False
+        """
+        if self.use_index and self._index is None:
+            print("building template index")
+            self._index=TemplateIndex(self.templates,
+                                      rows=self.rows,
+                                      cens=self.cens)
+
+        return self._index
+
+    def _get_candidates(self):
+        """
+        get the indices of the templates that can be within nsigma of
+        the likelihood, or None to use all templates
+        """
+        index=self.get_index()
+        if index is None:
+            return None
+
+        # the nsigma ellipsoid is inside the box of half width
+        # nsigma*sqrt(cov_ii); expand a bit for round off
+        dist=self.dist
+        cov=numpy.linalg.inv(dist.icov)
+        var=numpy.diag(cov)
+        if not numpy.all(numpy.isfinite(var)) or numpy.any(var < 0):
+            return None
+
+        dims=index.dims
+        width = 1.001*self.nsigma*numpy.sqrt(var[dims])
+        mean=dist.mean[dims]
+
+        return index.get_candidates(mean-width, mean+width)
+
+    def _get_batch_boxes(self, means, icovs):
+        """
+        get the grid data and the boxes [nobj,2,nidx] bounding the nsigma
+        ellipsoids of the likelihoods, the same as _get_candidates.  The
+        boxes are nan where all templates should be used
+
+        returns (None,None) if the index is not used
+        """
+        index=self.get_index()
+        if index is None:
+            return None, None
+
+        dims=index.dims
+
+        covs=numpy.linalg.inv(icovs)
+        var=numpy.diagonal(covs, axis1=1, axis2=2)
+        bad = ~numpy.all(numpy.isfinite(var) & (var >= 0), axis=1)
+
+        var=var[:,dims].copy()
+        var[bad,:] = 0.0
+
+        width = 1.001*self.nsigma*numpy.sqrt(var)
+        mean=means[:,dims]
+
+        boxes=numpy.zeros( (means.shape[0], 2, len(dims)) )
+        boxes[:,0,:] = mean-width
+        boxes[:,1,:] = mean+width
+        boxes[bad,:,:] = numpy.nan
+
+        return index.get_grid_data(), boxes
 
     def _set_templates(self):
         """
@@ -808,7 +1215,8 @@ class PQRMomTemplatesBase(object):
 
         w=w[w2]
 
-        templates_keep = templates_orig[w,:]
+        # note this will guarantee correct byte ordering for C code
+        templates_keep = numpy.array(templates_orig[w,:], dtype='f8')
 
         nkeep,ndim = templates_keep.shape
 
@@ -818,33 +1226,78 @@ class PQRMomTemplatesBase(object):
         if nrand_cen <= 1:
             print("using input templates as is")
             # assuming they already have the random centers
-            templates = templates_keep
+            rows = None
+            cens = None
         else:
-            print("replicating translated centers")
+            print("randomizing centers")
             print("total templates:",ntot)
 
-            # note this will guarantee correct byte ordering for C code
-            templates = numpy.zeros( (ntot, ndim) )
+            cens = numpy.zeros( (ntot, 2) )
 
             cen_dist = self.cen_dist
             for irand in xrange(nrand_cen):
                 beg=irand*nkeep
                 end=(irand+1)*nkeep
 
-                # replicate the moments
-                templates[beg:end,:] = templates_keep[:,:]
-
                 # randomized centers
                 cen1,cen2 = cen_dist.sample2d(nkeep)
-                templates[beg:end,0] = cen1
-                templates[beg:end,1] = cen2
+                cens[beg:end,0] = cen1
+                cens[beg:end,1] = cen2
 
+            # the same permutation as shuffling the replicated templates
             print("shuffling")
-            numpy.random.shuffle(templates)
+            perm=numpy.arange(ntot, dtype='i8')
+            numpy.random.shuffle(perm)
 
-        self.templates = templates
+            rows = perm % nkeep
+            cens = cens[perm]
+
+        self.templates = templates_keep
+        self.rows = rows
+        self.cens = cens
 
     def _prep_pqr(self):
+        """
+        set the shear derivatives of the templates, from the cache
+        if possible
+        """
+
+        key=self._get_deriv_key()
+
+        derivs=_deriv_cache.get(key, None)
+        if derivs is None:
+            derivs=self._calc_derivs()
+            for arr in derivs.values():
+                arr.flags.writeable=False
+
+            _deriv_cache[key] = derivs
+        else:
+            print("using cached shear derivatives")
+
+        for name,arr in derivs.items():
+            setattr(self, name, arr)
+
+    def _get_deriv_key(self):
+        """
+        identifies the templates and the settings that determine the
+        shear derivatives
+        """
+        import hashlib
+
+        h=hashlib.sha1()
+        _update_hash(h, self.templates)
+
+        settings=(self.__class__.__name__,
+                  self.shear_expand,
+                  self.h)
+        h.update( repr(settings).encode('utf-8') )
+
+        return h.hexdigest()
+
+    def _calc_derivs(self):
+        """
+        calculate the derivatives of the templates with respect to shear
+        """
 
         if self.shear_expand is not None:
             raise ValueError("shear_expand not yet supported")
@@ -896,11 +1349,10 @@ class PQRMomTemplatesBase(object):
         Rderiv[:,1,1,1] = deriv.d2M2ds2ds2z()
         Rderiv[:,2,1,1] = deriv.d2Tds2ds2z()
 
-        self.Qderiv = Qderiv
-        self.Rderiv = Rderiv
-
         del deriv
 
+        return {'Qderiv':Qderiv, 'Rderiv':Rderiv}
+
 class PQRMomTemplatesGauss(PQRMomTemplatesBase):
     """
     calculate pqr from the input moments and a
@@ -938,6 +1390,8 @@ class PQRMomTemplatesGauss(PQRMomTemplatesBase):
         #nmin = self.nmin
         #neff_max = self.neff_max
 
+        candidates=self._get_candidates()
+
         nuse,neff=mvn_calc_pqr_templates(dist.mean,
                                          dist.icov,
                                          ierrors,
@@ -946,8 +1400,11 @@ class PQRMomTemplatesGauss(PQRMomTemplatesBase):
                                          nmin,
                                          neff_max,
                                          self.templates,
+                                         self.rows,
+                                         self.cens,
                                          self.Qderiv,
                                          self.Rderiv,
+                                         candidates,
                                          self.seed,
                                          P,Q,R)
 
@@ -966,6 +1423,124 @@ class PQRMomTemplatesGauss(PQRMomTemplatesBase):
                       'nuse':nuse,
                       'neff':neff}
 
+    def get_batch_result(self):
+        """
+        get the result dict.  You need to run calc_pqr_batch first
+        """
+        return self._batch_result
+
+    def calc_pqr_batch(self, moms, mom_covs, nthreads=1):
+        """
+        calculate pqr sums for many objects, looping over the objects
+        in the C code.  The results are the same as running calc_pqr
+        for each object
+
+        The C code does not use random numbers; the templates were
+        shuffled when they were set, so the objects can be run in any
+        order.  With nthreads > 1 the objects are divided among threads
+        that run in parallel; the C code releases the GIL
+
+        parameters
+        ----------
+        moms: array
+            Shape [nobj, npars]
+        mom_covs: array
+            Shape [nobj, npars, npars]
+        nthreads: int, optional
+            Number of threads to use, default 1
+
+        returns
+        -------
+        result: dict
+            With entries P[nobj], Q[nobj,2], R[nobj,2,2], nuse[nobj]
+            and neff[nobj], as well as the input moms and mom_covs
+        """
+        from numpy import sqrt, pi
+
+        moms=numpy.array(moms, dtype='f8', ndmin=2, copy=True)
+        mom_covs=numpy.array(mom_covs, dtype='f8', ndmin=3, copy=True)
+
+        nobj,ndim=moms.shape
+        if mom_covs.shape != (nobj,ndim,ndim):
+            raise ValueError("moms have shape %s but mom_covs "
+                             "have shape %s" % (moms.shape,mom_covs.shape))
+
+        # the same as MultivariateNormal, for each object
+        icovs=numpy.linalg.inv(mom_covs)
+        dets=numpy.linalg.det(mom_covs)
+        norms=1.0/sqrt( (2.0*pi)**ndim * dets )
+
+        grid,boxes=self._get_batch_boxes(moms, icovs)
+
+        P=numpy.zeros(nobj)
+        Q=numpy.zeros( (nobj,2) )
+        R=numpy.zeros( (nobj,2,2) )
+        nuse=numpy.zeros(nobj, dtype='i8')
+        neff=numpy.zeros(nobj)
+
+        args=(moms, icovs, norms, grid, boxes, P, Q, R, nuse, neff)
+
+        run_chunks(self._run_pqr_chunk, nobj, nthreads, args=args)
+
+        neff /= self.nrand_cen
+
+        self._batch_result={'moms':moms,
+                            'mom_covs':mom_covs,
+                            'P':P,
+                            'Q':Q,
+                            'R':R,
+                            'nuse':self._scale_nuse(nuse),
+                            'neff':neff}
+        return self._batch_result
+
+    def _run_pqr_chunk(self, beg, end, means, icovs, norms, grid, boxes,
+                       P, Q, R, nuse, neff):
+        """
+        run objects [beg,end) for calc_pqr_batch.  Slices along the first
+        axis are still contiguous, and the outputs are written in place
+        """
+        if boxes is not None:
+            boxes=boxes[beg:end]
+
+        self._run_pqr_batch(means[beg:end],
+                            icovs[beg:end],
+                            norms[beg:end],
+                            grid,
+                            boxes,
+                            P[beg:end],
+                            Q[beg:end],
+                            R[beg:end],
+                            nuse[beg:end],
+                            neff[beg:end])
+
+    def _run_pqr_batch(self, means, icovs, norms, grid, boxes,
+                       P, Q, R, nuse, neff):
+        """
+        run the C code for calc_pqr_batch
+        """
+        from ._gmix import mvn_calc_pqr_templates_batch
+
+        mvn_calc_pqr_templates_batch(means,
+                                     icovs,
+                                     norms,
+                                     self.nsigma,
+                                     self.nmin*self.nrand_cen,
+                                     self.neff_max*self.nrand_cen,
+                                     self.templates,
+                                     self.rows,
+                                     self.cens,
+                                     self.Qderiv,
+                                     self.Rderiv,
+                                     grid,
+                                     boxes,
+                                     P,Q,R,nuse,neff)
+
+    def _scale_nuse(self, nuse):
+        """
+        nuse per center, as in calc_pqr
+        """
+        return nuse/self.nrand_cen
+
     def get_slow_result(self):
         """
         get the result dict.  You need to run calc_pqr first
@@ -987,7 +1562,8 @@ class PQRMomTemplatesGauss(PQRMomTemplatesBase):
         self._set_likelihood(mom,mom_cov)
 
         dist=self.dist
-        likes = dist.get_prob(self.templates, nsigma=self.nsigma)
+        templates=self.get_templates()
+        likes = dist.get_prob(templates, nsigma=self.nsigma)
 
         Pmax = likes.max()
 
@@ -999,8 +1575,8 @@ class PQRMomTemplatesGauss(PQRMomTemplatesBase):
 
         Qderiv=self.Qderiv
         Rderiv=self.Rderiv
+        rows=self._get_rows()
 
-        templates=self.templates
         n=templates.shape[0]
 
         mean=dist.mean[2:2+3]
@@ -1013,8 +1589,8 @@ class PQRMomTemplatesGauss(PQRMomTemplatesBase):
             if like > 0:
                 nuse += 1
                 datamu=templates[i,2:2+3]
-                Qd=Qderiv[i,:,:]
-                Rd=Rderiv[i,:,:,:]
+                Qd=Qderiv[rows[i],:,:]
+                Rd=Rderiv[rows[i],:,:,:]
 
                 xdiff = mean-datamu
 
@@ -1087,6 +1663,11 @@ class PQRMomTemplatesGaussFull(PQRMomTemplatesGauss):
     Assumes multi-variate gaussian for the likelihoods
     """
 
+    _artifact_names=['templates','rows','cens',
+                     'sheared_p0','sheared_m0',
+                     'sheared_0p','sheared_0m',
+                     'sheared_pp','sheared_mm']
+
     def calc_pqr(self, mom, mom_cov):
         """
         calculate pqr sums assuming multivariate gaussian likelihood,
@@ -1109,6 +1690,8 @@ class PQRMomTemplatesGaussFull(PQRMomTemplatesGauss):
         nmin = self.nmin*self.nrand_cen
         neff_max = self.neff_max*self.nrand_cen
 
+        candidates=self._get_candidates()
+
         nuse,neff=mvn_calc_pqr_templates_full(dist.mean,
                                               dist.icov,
                                               dist.norm,
@@ -1116,12 +1699,15 @@ class PQRMomTemplatesGaussFull(PQRMomTemplatesGauss):
                                               nmin,
                                               neff_max,
                                               self.templates,
+                                              self.rows,
+                                              self.cens,
                                               self.sheared_p0,
                                               self.sheared_m0,
                                               self.sheared_0p,
                                               self.sheared_0m,
                                               self.sheared_pp,
                                               self.sheared_mm,
+                                              candidates,
                                               self.h,
                                               self.seed,
                                               P,Q,R)
@@ -1143,6 +1729,39 @@ class PQRMomTemplatesGaussFull(PQRMomTemplatesGauss):
                       'neff':neff}
 
 
+    def _run_pqr_batch(self, means, icovs, norms, grid, boxes,
+                       P, Q, R, nuse, neff):
+        """
+        run the C code for calc_pqr_batch
+        """
+        from ._gmix import mvn_calc_pqr_templates_full_batch
+
+        mvn_calc_pqr_templates_full_batch(means,
+                                          icovs,
+                                          norms,
+                                          self.nsigma,
+                                          self.nmin*self.nrand_cen,
+                                          self.neff_max*self.nrand_cen,
+                                          self.templates,
+                                          self.rows,
+                                          self.cens,
+                                          self.sheared_p0,
+                                          self.sheared_m0,
+                                          self.sheared_0p,
+                                          self.sheared_0m,
+                                          self.sheared_pp,
+                                          self.sheared_mm,
+                                          grid,
+                                          boxes,
+                                          self.h,
+                                          P,Q,R,nuse,neff)
+
+    def _scale_nuse(self, nuse):
+        """
+        nuse per center, as in calc_pqr
+        """
+        return nuse//self.nrand_cen
+
     def _prep_pqr(self):
         """
         store the sheared moments
@@ -1151,6 +1770,13 @@ class PQRMomTemplatesGaussFull(PQRMomTemplatesGauss):
         if self.shear_expand is None:
             self.shear_expand = [0.0, 0.0]
 
+        super(PQRMomTemplatesGaussFull,self)._prep_pqr()
+
+    def _calc_derivs(self):
+        """
+        calculate the sheared moments of the templates
+        """
+
         print("expanding about shear:",self.shear_expand)
 
         s1,s2 = self.shear_expand
@@ -1207,12 +1833,12 @@ class PQRMomTemplatesGaussFull(PQRMomTemplatesGauss):
         sheared_mm[:,1] = tM2
         sheared_mm[:,2] = tT
 
-        self.sheared_p0 = sheared_p0
-        self.sheared_m0 = sheared_m0
-        self.sheared_0p = sheared_0p
-        self.sheared_0m = sheared_0m
-        self.sheared_pp = sheared_pp
-        self.sheared_mm = sheared_mm
+        return {'sheared_p0':sheared_p0,
+                'sheared_m0':sheared_m0,
+                'sheared_0p':sheared_0p,
+                'sheared_0m':sheared_0m,
+                'sheared_pp':sheared_pp,
+                'sheared_mm':sheared_mm}
 
 
 
@@ -1270,13 +1896,7 @@ def test_pqr_moments(ntemplate=10000, seed=None, cen_radius=2.0, nrand_cen=100,
 
     numpy.random.seed(seed)
 
-    mean=array([0.15, -0.052, -1.96, 2.86, 4.85, 92.0])
-    cov=array([[+6.790897e-03, +1.451707e-03,  +1.860157e-03,  -1.059367e-03,  -1.901166e-03,  -1.461303e-03],
-               [+1.451707e-03, +4.352388e-03,  +6.346465e-04,  +3.439475e-04,  +5.323073e-04,  +6.906006e-03],
-               [+1.860157e-03,  +6.346465e-04,  +1.867478e-01,  -2.282856e-02,  -6.030356e-02,  -5.251863e-02],
-               [-1.059367e-03,  +3.439475e-04,  -2.282856e-02,  +2.054771e-01,  +1.194138e-01,  +3.461798e-01],
-               [-1.901166e-03,  +5.323073e-04,  -6.030356e-02,  +1.194138e-01,  +2.243873e-01,  +1.039051e+00],
-               [-1.461303e-03,  +6.906006e-03,  -5.251863e-02,  +3.461798e-01,  +1.039051e+00,  +1.063436e+01]])
+    mean, cov = _get_test_mean_cov()
 
     mvn = MultivariateNormal(mean, cov)
 
@@ -1328,13 +1948,7 @@ def test_pqr_moments_full(ntemplate=10000, seed=None, cen_radius=2.0, nrand_cen=
 
     numpy.random.seed(seed)
 
-    mean=array([0.15, -0.052, -1.96, 2.86, 4.85, 92.0])
-    cov=array([[+6.790897e-03, +1.451707e-03,  +1.860157e-03,  -1.059367e-03,  -1.901166e-03,  -1.461303e-03],
-               [+1.451707e-03, +4.352388e-03,  +6.346465e-04,  +3.439475e-04,  +5.323073e-04,  +6.906006e-03],
-               [+1.860157e-03,  +6.346465e-04,  +1.867478e-01,  -2.282856e-02,  -6.030356e-02,  -5.251863e-02],
-               [-1.059367e-03,  +3.439475e-04,  -2.282856e-02,  +2.054771e-01,  +1.194138e-01,  +3.461798e-01],
-               [-1.901166e-03,  +5.323073e-04,  -6.030356e-02,  +1.194138e-01,  +2.243873e-01,  +1.039051e+00],
-               [-1.461303e-03,  +6.906006e-03,  -5.251863e-02,  +3.461798e-01,  +1.039051e+00,  +1.063436e+01]])
+    mean, cov = _get_test_mean_cov()
 
     mvn = MultivariateNormal(mean, cov)
 
@@ -1361,3 +1975,142 @@ def test_pqr_moments_full(ntemplate=10000, seed=None, cen_radius=2.0, nrand_cen=
     print("nuse",pqr_res['nuse'])
     print("neff:",pqr_res['neff'])
     print("time: ",tm)
+
+def _get_test_mean_cov():
+    """
+    moments and covariance used for the pqr tests
+    """
+    from numpy import array
+
+    mean=array([0.15, -0.052, -1.96, 2.86, 4.85, 92.0])
+    cov=array([[+6.790897e-03, +1.451707e-03,  +1.860157e-03,  -1.059367e-03,  -1.901166e-03,  -1.461303e-03],
+               [+1.451707e-03, +4.352388e-03,  +6.346465e-04,  +3.439475e-04,  +5.323073e-04,  +6.906006e-03],
+               [+1.860157e-03,  +6.346465e-04,  +1.867478e-01,  -2.282856e-02,  -6.030356e-02,  -5.251863e-02],
+               [-1.059367e-03,  +3.439475e-04,  -2.282856e-02,  +2.054771e-01,  +1.194138e-01,  +3.461798e-01],
+               [-1.901166e-03,  +5.323073e-04,  -6.030356e-02,  +1.194138e-01,  +2.243873e-01,  +1.039051e+00],
+               [-1.461303e-03,  +6.906006e-03,  -5.251863e-02,  +3.461798e-01,  +1.039051e+00,  +1.063436e+01]])
+
+    return mean, cov
+
+def test_pqr_index(ntemplate=10000, nobj=10, seed=4101, cen_radius=0.1,
+                   covfacs=[0.1, 1.0]):
+    """
+    check that using the template index gives results identical to using
+    all templates, for Gauss and GaussFull, with and without random
+    centers and early stopping.  Also compare to calc_pqr_slow where
+    possible
+
+    The likelihood covariance is scaled by each of covfacs; for small
+    values the index removes most of the templates, for large values the
+    sums stop early at neff_max
+    """
+    from .priors import MultivariateNormal, ZDisk2D
+
+    numpy.random.seed(seed)
+
+    mean, cov = _get_test_mean_cov()
+
+    mvn = MultivariateNormal(mean, cov)
+    templates = mvn.sample(ntemplate)
+    moms = mvn.sample(nobj)
+
+    cen_dist = ZDisk2D(cen_radius)
+
+    for cls in [PQRMomTemplatesGauss, PQRMomTemplatesGaussFull]:
+        for nrand_cen in [1,10]:
+            for neff_max in [100.0, 1.0e9]:
+                _test_pqr_index_one(cls, templates, moms, cov, covfacs,
+                                    cen_dist, nrand_cen, neff_max, seed)
+
+def _test_pqr_index_one(cls, templates, moms, cov, covfacs,
+                        cen_dist, nrand_cen, neff_max, seed):
+    """
+    compare pqr with and without the index for one configuration
+    """
+
+    # same seed so the random centers are the same
+    numpy.random.seed(seed)
+    pqrt_index = cls(templates, cen_dist, nrand_cen,
+                     neff_max=neff_max, use_index=True)
+    numpy.random.seed(seed)
+    pqrt_all = cls(templates, cen_dist, nrand_cen,
+                   neff_max=neff_max, use_index=False)
+
+    for covfac in covfacs:
+        mom_cov = covfac*cov
+
+        for mom in moms:
+            pqrt_index.calc_pqr(mom, mom_cov)
+            pqrt_all.calc_pqr(mom, mom_cov)
+
+            res_index = pqrt_index.get_result()
+            res_all = pqrt_all.get_result()
+
+            for name in ['P','Q','R','nuse','neff']:
+                # neff is nan when no templates are used
+                v1, v2 = res_index[name], res_all[name]
+                same = (v1==v2) | (numpy.isnan(v1) & numpy.isnan(v2))
+                assert numpy.all(same),"mismatch in '%s'" % name
+
+            # the slow code has no early stop, and a different
+            # calculation of Q and R
+            if cls is PQRMomTemplatesGauss and neff_max==1.0e9:
+                pqrt_all.calc_pqr_slow(mom, mom_cov)
+                slow_res = pqrt_all.get_slow_result()
+
+                assert numpy.allclose(res_all['P'],slow_res['P']),\
+                        "mismatch in slow 'P'"
+                # scaled with the same division as calc_pqr
+                nuse=slow_res['nuse']/nrand_cen
+                assert res_all['nuse']==nuse,\
+                        "mismatch in slow 'nuse'"
+
+    print("%s nrand_cen: %d neff_max: %g index matches" % \
+          (cls.__name__, nrand_cen, neff_max))
+
+def test_pqr_batch(ntemplate=10000, nobj=20, seed=4102, cen_radius=0.1,
+                   nrand_cen=10, covfacs=[0.1, 1.0]):
+    """
+    check that calc_pqr_batch gives results identical to calc_pqr on each
+    object, for one and multiple threads, for Gauss and GaussFull
+
+    Half the objects use each of the likelihood covariances cov*covfacs
+    """
+    from .priors import MultivariateNormal, ZDisk2D
+
+    numpy.random.seed(seed)
+
+    mean, cov = _get_test_mean_cov()
+
+    mvn = MultivariateNormal(mean, cov)
+    templates = mvn.sample(ntemplate)
+    moms = mvn.sample(nobj)
+
+    mom_covs = numpy.zeros( (nobj, cov.shape[0], cov.shape[1]) )
+    for i in xrange(nobj):
+        mom_covs[i] = covfacs[i % len(covfacs)]*cov
+
+    cen_dist = ZDisk2D(cen_radius)
+
+    for cls in [PQRMomTemplatesGauss, PQRMomTemplatesGaussFull]:
+        for neff_max in [100.0, 1.0e9]:
+            pqrt = cls(templates, cen_dist, nrand_cen, neff_max=neff_max)
+
+            results=[]
+            for i in xrange(nobj):
+                pqrt.calc_pqr(moms[i], mom_covs[i])
+                results.append( pqrt.get_result() )
+
+            for nthreads in [1,4]:
+                bres = pqrt.calc_pqr_batch(moms, mom_covs, nthreads=nthreads)
+
+                for name in ['P','Q','R','nuse','neff']:
+                    for i in xrange(nobj):
+                        # neff is nan when no templates are used
+                        v1, v2 = bres[name][i], results[i][name]
+                        same = (v1==v2) | (numpy.isnan(v1) & numpy.isnan(v2))
+                        assert numpy.all(same),\
+                                "mismatch in '%s' for %d" % (name,i)
+
+                print("%s neff_max: %g nthreads: %d batch matches" % \
+                      (cls.__name__, neff_max, nthreads))
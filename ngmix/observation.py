@@ -438,6 +438,27 @@ class MultiBandObsList(list):
         assert isinstance(obs_list,ObsList),"obs_list should be of type ObsList"
         super(MultiBandObsList,self).__setitem__(index, obs_list)
 
+def get_readonly_view(arr):
+    """
+    Get a read-only view of the input array, sharing the underlying data
+
+    Observations made from the same data, such as the metacal observations,
+    can share weight maps and bitmasks this way.  Attempts to modify the
+    view in place will raise a ValueError; instead make a copy and set
+    it, e.g. with Observation.set_weight
+
+    parameters
+    ----------
+    arr: ndarray or None
+        The array for which to get a view.  If None, None is returned
+    """
+    if arr is None:
+        return None
+
+    view=arr.view()
+    view.flags.writeable=False
+    return view
+
 def get_mb_obs(obs_in):
     """
     convert the input to a MultiBandObsList
@@ -331,6 +331,176 @@ def calc_pqr_sums(P,Q,R):
 
     return P_sum, Q_sum, Cinv_sum
 
+class PQRAccumulator(object):
+    """
+    Accumulate the sums from calc_pqr_sums over chunks of P,Q,R, keeping
+    only the running sums in memory
+
+    Accumulators for different parts of the data, for example from
+    different processes or files, can be merged, and the shear
+    is then calculated with combine_pqr_sums
+
+    parameters
+    ----------
+    P_sum: float, optional
+        Starting sum of P
+    Q_sum: array, optional
+        Starting sum of Q/P, shape [2]
+    Cinv_sum: array, optional
+        Starting sum of QQ/P**2 - R/P, shape [2,2]
+    nobj: int, optional
+        Number of objects in the starting sums
+    chunksize: int, optional
+        The input arrays are processed in chunks of at most this
+        many objects, to limit the size of temporary arrays.  Default
+        1000000
+
+    The first four parameters are the entries returned by get_state(),
+    so an accumulator can be restored from a saved state
+
+        numpy.savez(fname, **acc.get_state())
+        ...
+        data=numpy.load(fname)
+        acc=PQRAccumulator(**data)
+
+    examples
+    --------
+
+    acc=PQRAccumulator()
+    for P,Q,R in chunks:
+        acc.add(P,Q,R)
+
+    acc.merge(other_acc)
+    g1g2, C = acc.get_shear()
+    """
+    def __init__(self,
+                 P_sum=0.0,
+                 Q_sum=None,
+                 Cinv_sum=None,
+                 nobj=0,
+                 chunksize=1000000):
+
+        if chunksize < 1:
+            raise ValueError("chunksize must be >= 1, got %s" % chunksize)
+
+        self.chunksize=int(chunksize)
+
+        self.P_sum=numpy.float64(P_sum)
+
+        self.Q_sum=zeros(2)
+        if Q_sum is not None:
+            self.Q_sum[:] = Q_sum
+
+        self.Cinv_sum=zeros( (2,2) )
+        if Cinv_sum is not None:
+            self.Cinv_sum[:,:] = Cinv_sum
+
+        self.nobj=int(nobj)
+
+    def add(self, P, Q, R):
+        """
+        add a chunk of P,Q,R to the sums
+
+        parameters
+        ----------
+        P: array[nobj]
+            Prior times jacobian
+        Q: array[nobj,2]
+            gradient of P with respect to shear
+        R: array[nobj,2,2]
+            gradient of gradient
+        """
+
+        P=numpy.asarray(P)
+        Q=numpy.asarray(Q)
+        R=numpy.asarray(R)
+
+        n=P.size
+        if Q.shape != (n,2) or R.shape != (n,2,2):
+            raise ValueError("expected P[n], Q[n,2], R[n,2,2], got shapes "
+                             "%s %s %s" % (P.shape,Q.shape,R.shape))
+
+        nbad=(P <= 0).sum()
+        if nbad != 0:
+            raise ValueError('Found P <= 0: %s/%s' % (nbad,n) )
+
+        for beg in xrange(0, n, self.chunksize):
+            end=min(beg+self.chunksize, n)
+            self._add_chunk(P[beg:end], Q[beg:end], R[beg:end])
+
+        self.nobj += n
+
+    def add_chunks(self, chunks):
+        """
+        add P,Q,R from a sequence or generator of (P,Q,R) tuples
+        """
+        for P,Q,R in chunks:
+            self.add(P,Q,R)
+
+    def merge(self, *others):
+        """
+        add the sums from other accumulators
+        """
+        for other in others:
+            self.P_sum += other.P_sum
+            self.Q_sum += other.Q_sum
+            self.Cinv_sum += other.Cinv_sum
+            self.nobj += other.nobj
+
+    def get_sums(self):
+        """
+        get copies of P_sum, Q_sum, Cinv_sum, as returned by calc_pqr_sums
+        """
+        return self.P_sum, self.Q_sum.copy(), self.Cinv_sum.copy()
+
+    def get_state(self):
+        """
+        get a dict with the sums and the number of objects, as accepted
+        by the constructor
+        """
+        return {'P_sum':self.P_sum,
+                'Q_sum':self.Q_sum.copy(),
+                'Cinv_sum':self.Cinv_sum.copy(),
+                'nobj':self.nobj}
+
+    def get_shear(self):
+        """
+        get the shear and covariance matrix from the sums,
+        using combine_pqr_sums
+        """
+        if self.nobj == 0:
+            raise ValueError("no objects have been added")
+
+        P_sum, Q_sum, Cinv_sum = self.get_sums()
+        return combine_pqr_sums(P_sum, Q_sum, Cinv_sum)
+
+    def _add_chunk(self, P, Q, R):
+        """
+        add the sums for a chunk, the same as in calc_pqr_sums
+        """
+        P=P.astype('f8', copy=False)
+
+        Pinv = 1/P
+        P2inv = Pinv*Pinv
+
+        Q1=Q[:,0]
+        Q2=Q[:,1]
+
+        # QQ/P**2 - R/P
+        Cinv_sum=self.Cinv_sum
+        Cinv_sum[0,0] += (Q1*Q1*P2inv - R[:,0,0]*Pinv).sum()
+        Cinv_sum[0,1] += (Q1*Q2*P2inv - R[:,0,1]*Pinv).sum()
+        Cinv_sum[1,0] += (Q2*Q1*P2inv - R[:,1,0]*Pinv).sum()
+        Cinv_sum[1,1] += (Q2*Q2*P2inv - R[:,1,1]*Pinv).sum()
+
+        self.P_sum += P.sum()
+
+        self.Q_sum[0] += (Q1*Pinv).sum()
+        self.Q_sum[1] += (Q2*Pinv).sum()
+
+    def __repr__(self):
+        return 'PQRAccumulator(nobj=%d)' % self.nobj
+
 def combine_pqr_sums(P_sum, Q_sum, Cinv_sum):
     """
     Combine the sums from calc_pqr_sums to
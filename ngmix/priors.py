@@ -362,7 +362,7 @@ class GPriorBase(object):
 
         return P*J
 
-    def sample2d_pj(self, nrand, s1, s2):
+    def sample2d_pj(self, nrand, s1, s2, rng=None):
         """
         Get random g1,g2 values from an approximate
         sheared distribution
@@ -371,8 +371,12 @@ class GPriorBase(object):
         ----------
         nrand: int
             Number to generate
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
+        rng=_get_rng(rng)
+
         maxval2d = self.get_prob_scalar2d(0.0,0.0)
         g1,g2=numpy.zeros(nrand),numpy.zeros(nrand)
 
@@ -381,12 +385,12 @@ class GPriorBase(object):
         while ngood < nrand:
 
             # generate on cube [-1,1,h]
-            g1rand=srandu(nleft)
-            g2rand=srandu(nleft)
+            g1rand=srandu(nleft, rng=rng)
+            g2rand=srandu(nleft, rng=rng)
 
             # a bit of padding since we are modifying the distribution
             fac=1.3
-            h = fac*maxval2d*randu(nleft)
+            h = fac*maxval2d*rng.uniform(size=nleft)
 
             pjvals = self.get_pj(g1rand,g2rand,s1,s2)
             
@@ -401,7 +405,7 @@ class GPriorBase(object):
 
 
 
-    def sample1d(self, nrand, maxguess=0.1):
+    def sample1d(self, nrand, maxguess=0.1, rng=None, use_table=False):
         """
         Get random |g| from the 1d distribution
 
@@ -411,8 +415,20 @@ class GPriorBase(object):
         ----------
         nrand: int
             Number to generate
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
+        use_table: bool, optional
+            If True, draw from a tabulated inverse cdf rather than using
+            rejection sampling.  The table is created on first use and
+            kept until the parameters of the prior are changed, see
+            set_sample_table.  Default False.
         """
 
+        rng=_get_rng(rng)
+
+        if use_table:
+            return self._sample1d_table(nrand, rng)
+
         if not hasattr(self,'maxval1d'):
             self.set_maxval1d(maxguess=maxguess)
 
@@ -429,10 +445,10 @@ class GPriorBase(object):
         while ngood < nrand:
 
             # generate total g in [0,gmax)
-            grand = gmax*randu(nleft)
+            grand = gmax*rng.uniform(size=nleft)
 
             # now the height from [0,maxval)
-            h = maxval1d*randu(nleft)
+            h = maxval1d*rng.uniform(size=nleft)
 
             pvals = self.get_prob_array1d(grand)
 
@@ -444,8 +460,56 @@ class GPriorBase(object):
    
         return g
 
+    def set_sample_table(self, npoints=10001):
+        """
+        Tabulate the cumulative distribution of |g| in [0,gmax), for
+        drawing samples with sample1d(use_table=True)
 
-    def sample2d(self, nrand=None, maxguess=0.1):
+        The cdf is integrated with the trapezoid rule on a regular grid,
+        and samples are drawn by linear interpolation in the inverse.
+        This is done automatically on first use with the default number
+        of points
+
+        parameters
+        ----------
+        npoints: int, optional
+            Number of points in the table, default 10001
+        """
+
+        # don't go right up to the end, as for rejection sampling
+        gmax=self.gmax - 1.0e-4
+
+        gvals=numpy.linspace(0.0, gmax, npoints)
+        pvals=self.get_prob_array1d(gvals)
+
+        cdf=zeros(npoints)
+        cdf[1:] = ( 0.5*(pvals[1:]+pvals[:-1])*numpy.diff(gvals) ).cumsum()
+
+        if cdf[-1] <= 0.0:
+            raise GMixRangeError("prior integrates to zero")
+
+        cdf *= 1.0/cdf[-1]
+
+        self._sample_table=(cdf, gvals)
+
+    def _clear_sample_table(self):
+        """
+        the table is no longer valid after the parameters change
+        """
+        self._sample_table=None
+
+    def _sample1d_table(self, nrand, rng):
+        """
+        draw |g| using the inverse cdf table
+        """
+        if getattr(self, '_sample_table', None) is None:
+            self.set_sample_table()
+
+        cdf, gvals = self._sample_table
+
+        return numpy.interp(rng.uniform(size=nrand), cdf, gvals)
+
+    def sample2d(self, nrand=None, maxguess=0.1, rng=None, use_table=False):
         """
         Get random g1,g2 values by first drawing
         from the 1-d distribution
@@ -454,6 +518,11 @@ class GPriorBase(object):
         ----------
         nrand: int
             Number to generate
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
+        use_table: bool, optional
+            If True, draw |g| from a tabulated inverse cdf, see sample1d.
+            Default False.
         """
 
         if nrand is None:
@@ -462,8 +531,13 @@ class GPriorBase(object):
         else:
             is_scalar=False
 
-        grand=self.sample1d(nrand,maxguess=maxguess)
-        theta = randu(nrand)*2*numpy.pi
+        if use_table:
+            grand=self.sample1d(nrand, use_table=True, **_get_rng_keys(rng))
+        else:
+            grand=self.sample1d(nrand,maxguess=maxguess,**_get_rng_keys(rng))
+
+        rng=_get_rng(rng)
+        theta = rng.uniform(size=nrand)*2*numpy.pi
         twotheta = 2*theta
         g1rand = grand*numpy.cos(twotheta)
         g2rand = grand*numpy.sin(twotheta)
@@ -474,7 +548,7 @@ class GPriorBase(object):
 
         return g1rand, g2rand
 
-    def sample2d_brute(self, nrand):
+    def sample2d_brute(self, nrand, rng=None):
         """
         Get random g1,g2 values using 2-d brute
         force method
@@ -483,8 +557,12 @@ class GPriorBase(object):
         ----------
         nrand: int
             Number to generate
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
+        rng=_get_rng(rng)
+
         maxval2d = self.get_prob_scalar2d(0.0,0.0)
         g1,g2=numpy.zeros(nrand),numpy.zeros(nrand)
 
@@ -493,11 +571,11 @@ class GPriorBase(object):
         while ngood < nrand:
             
             # generate on cube [-1,1,h]
-            g1rand=srandu(nleft)
-            g2rand=srandu(nleft)
+            g1rand=srandu(nleft, rng=rng)
+            g2rand=srandu(nleft, rng=rng)
 
             # a bit of padding since we are modifying the distribution
-            h = maxval2d*randu(nleft)
+            h = maxval2d*rng.uniform(size=nleft)
 
             vals = self.get_prob_array2d(g1rand,g2rand)
 
@@ -1384,12 +1462,17 @@ class GPriorBA(GPriorBase):
         self.hhalf=0.5*self.h
         self.hinv = 1./self.h
 
-    def sample1d(self, nrand, maxguess=None):
+    def sample1d(self, nrand, maxguess=None, rng=None, use_table=False):
+
+        if use_table:
+            return super(GPriorBA,self).sample1d(nrand, use_table=True,
+                                                 **_get_rng_keys(rng))
 
         if maxguess is None:
-            maxguess= self.sigma + 0.0001*srandu(),
+            maxguess= self.sigma + 0.0001*srandu(rng=rng),
 
-        return super(GPriorBA,self).sample1d(nrand, maxguess=maxguess)
+        return super(GPriorBA,self).sample1d(nrand, maxguess=maxguess,
+                                             **_get_rng_keys(rng))
 
     def set_pars(self, pars):
         """
@@ -1408,6 +1491,8 @@ class GPriorBA(GPriorBase):
         self.sig2inv = 1./self.sig2
         self.sig4inv = 1./self.sig4
 
+        self._clear_sample_table()
+
     def get_lnprob_scalar2d(self, g1, g2):
         """
         Get the 2d log prob for the input g value
@@ -1832,15 +1917,16 @@ def _gprior1d_exp_scalar(A, a, g0sq, gmax, g, gsq, output):
 
 
 class FlatPriorBase(object):
-    def sample(self, n=None):
-        from numpy.random import random as randu
+    def sample(self, n=None, rng=None):
+        rng=_get_rng(rng)
+
         if n is None:
             is_scalar=True
             n=1
         else:
             is_scalar=False
 
-        rvals = self.minval + (self.maxval-self.minval)*randu(n)
+        rvals = self.minval + (self.maxval-self.minval)*rng.uniform(size=n)
 
         if is_scalar:
             rvals=rvals[0]
@@ -1866,6 +1952,28 @@ class FlatPrior(FlatPriorBase):
                                  "[%s,%s]" % (val, self.minval, self.maxval))
         return retval
 
+    def get_prob_array(self, vals):
+        """
+        probability for array input, 1 in the range and 0 outside
+        """
+        vals=array(vals, dtype='f8', ndmin=1, copy=False)
+
+        p=zeros(vals.size)
+        w,=where( (vals >= self.minval) & (vals <= self.maxval) )
+        p[w] = 1.0
+        return p
+
+    def get_lnprob_array(self, vals):
+        """
+        log probability for array input, 0 in the range and LOWVAL outside
+        """
+        vals=array(vals, dtype='f8', ndmin=1, copy=False)
+
+        lnp=zeros(vals.size) + LOWVAL
+        w,=where( (vals >= self.minval) & (vals <= self.maxval) )
+        lnp[w] = 0.0
+        return lnp
+
 class TwoSidedErf(object):
     """
     A two-sided error function that evaluates to 1 in the middle, zero at
@@ -1943,11 +2051,13 @@ class TwoSidedErf(object):
             lnp[w] = numpy.log( p[w] )
         return lnp
 
-    def sample(self, nrand=None):
+    def sample(self, nrand=None, rng=None):
         """
         draw random samples; not perfect, only goes from
         -5,5 sigma past each side
         """
+        rng=_get_rng(rng)
+
         if nrand is None:
             nrand=1
             is_scalar=True
@@ -1962,10 +2072,10 @@ class TwoSidedErf(object):
         ngood=0
         nleft=nrand
         while ngood < nrand:
-            randx=numpy.random.uniform(low=xmin, high=xmax, size=nleft)
+            randx=rng.uniform(low=xmin, high=xmax, size=nleft)
 
             pvals=self.get_prob_array(randx)
-            randy=numpy.random.uniform(size=nleft)
+            randy=rng.uniform(size=nleft)
 
             w,=where(randy < pvals)
             if w.size > 0:
@@ -2002,6 +2112,8 @@ class GPriorGreat3Exp(GPriorBase):
         self.g0 = pars[2]
         self.g0_sq = self.g0**2
 
+        self._clear_sample_table()
+
     def get_prob_scalar2d(self, g1, g2):
         """
         Get the 2d prob for the input g value
@@ -2149,6 +2261,8 @@ class GPriorGreatDES(GPriorGreat3Exp):
         self.index=pars[3]
         #self.index2=pars[4]
 
+        self._clear_sample_table()
+
     def _get_prob2d(self, g):
         """
         no error checking
@@ -2221,6 +2335,8 @@ class GPriorGreatDES2(GPriorGreat3Exp):
         self.g0sq = self.g0**2
         self.gmax = 1.0
 
+        self._clear_sample_table()
+
     def _get_prob2d(self, g):
         """
         no error checking
@@ -2293,6 +2409,8 @@ class GPriorGreatDESNoExp(GPriorGreat3Exp):
 
         self.index=pars[2]
 
+        self._clear_sample_table()
+
     def _get_prob2d(self, g):
         """
         no error checking
@@ -2496,6 +2614,11 @@ class GPriorM(GPriorBase):
 
 
 class GPriorMErf(GPriorBase):
+
+    # lookup table settings, see set_lut
+    _lut_conf=None
+    _lut=None
+
     def __init__(self, pars=None):
         """
         [A, a, g0, gmax, gsigma]
@@ -2516,6 +2639,103 @@ class GPriorMErf(GPriorBase):
 
         self.gmax = 1.0
 
+        self._clear_sample_table()
+        self._lut=None
+
+    def set_lut(self, npoints=10001, gmax=0.999, fname=None):
+        """
+        Evaluate the prior by interpolating ln(p) tabulated on a regular
+        grid in |g|, for both the scalar and array methods
+
+        Values of |g| between gmax and 1 are evaluated exactly.  The
+        table is made on first use, and again if the parameters are
+        changed with set_pars.  Tables for the same parameters are shared
+        within the process, and can be shared between processes through
+        a file, see the lut module.  The estimated maximum error of the
+        interpolation in ln(p) is get_lut().maxerr
+
+        parameters
+        ----------
+        npoints: int, optional
+            Number of points in the table, default 10001
+        gmax: float, optional
+            Maximum |g| in the table, default 0.999.  ln(p) must be finite
+            over [0,gmax]
+        fname: string, optional
+            File in which to store the table
+        """
+        self._lut_conf={'npoints':npoints, 'gmax':gmax, 'fname':fname}
+        self._lut=None
+
+    def clear_lut(self):
+        """
+        go back to evaluating the prior exactly
+        """
+        self._lut_conf=None
+        self._lut=None
+
+    def get_lut(self):
+        """
+        get the LookupTable1D for ln(p) without the 2*pi*g, or None if
+        set_lut has not been called
+        """
+        if self._lut_conf is not None and self._lut is None:
+            from .lut import make_lut1d
+
+            conf=self._lut_conf
+            self._lut=make_lut1d(self._get_lnprob_nocheck_array,
+                                 0.0,
+                                 conf['gmax'],
+                                 conf['npoints'],
+                                 self._get_lut_key(),
+                                 fname=conf['fname'])
+        return self._lut
+
+    def _get_lut_key(self):
+        """
+        identifies the prior for sharing lookup tables
+        """
+        return '%s A=%r a=%r g0=%r gmax=%r gsigma=%r' % \
+                (self.__class__.__name__, self.A, self.a, self.g0,
+                 self.gmax_func, self.gsigma)
+
+    def _get_lnprob_nocheck_array(self, g):
+        """
+        ln(p) without the 2*pi*g, used to make the lookup table
+        """
+        return log(self._get_prob_nocheck_array(g))
+
+    def _get_prob_lut_scalar(self, g):
+        """
+        prob without the 2*pi*g, interpolated in the lookup table if
+        it is set
+        """
+        lut=self.get_lut()
+        if lut is not None and g <= lut.xmax:
+            return math.exp(lut.get_scalar(g))
+        else:
+            return self._get_prob_nocheck_scalar(g)
+
+    def _get_prob_lut_array(self, g):
+        """
+        prob without the 2*pi*g, interpolated in the lookup table if
+        it is set. Must be an array
+        """
+        lut=self.get_lut()
+        if lut is None:
+            return self._get_prob_nocheck_array(g)
+
+        p=zeros(g.size)
+
+        inlut = g <= lut.xmax
+        p[inlut] = exp(lut.get_array(g[inlut]))
+
+        w,=where(~inlut)
+        if w.size > 0:
+            p[w] = self._get_prob_nocheck_array(g[w])
+
+        return p
+
     def get_prob_scalar1d(self, g):
         """
         Get the prob for the input g value
@@ -2537,13 +2757,19 @@ class GPriorMErf(GPriorBase):
         if g < 0.0 or g >= 1.0:
             raise GMixRangeError("g out of range")
 
-        return self._get_prob_nocheck_scalar(g)
+        return self._get_prob_lut_scalar(g)
 
     def get_lnprob_scalar2d(self, g1, g2):
         """
         Get the 2d log prob for the input g1,g2 values
         """
-        
+
+        lut=self.get_lut()
+        if lut is not None:
+            g = math.sqrt(g1*g1 + g2*g2)
+            if g <= lut.xmax:
+                return lut.get_scalar(g)
+
         p=self.get_prob_scalar2d(g1,g2)
         return log(p)
 
@@ -2573,7 +2799,7 @@ class GPriorMErf(GPriorBase):
         p=zeros(g1.size)
         w,=where( (g >= 0.0) & (g < 1.0) )
         if w.size > 0:
-            p[w]=self._get_prob_nocheck_array(g[w])
+            p[w]=self._get_prob_lut_array(g[w])
         return p
 
 
@@ -2591,7 +2817,7 @@ class GPriorMErf(GPriorBase):
         lnp=zeros(g1.size)+LOWVAL
         w,=where( (g >= 0.0) & (g < 1.0) )
         if w.size > 0:
-            p=self._get_prob_nocheck_array(g[w])
+            p=self._get_prob_lut_array(g[w])
             lnp[w] = log(p)
         return lnp
 
@@ -2601,13 +2827,13 @@ class GPriorMErf(GPriorBase):
         """
         With the 2*pi*g
         """
-        return 2*pi*g*self._get_prob_nocheck_scalar(g)
+        return 2*pi*g*self._get_prob_lut_scalar(g)
 
     def _get_prob_nocheck_prefac_array(self, g):
         """
         With the 2*pi*g, must be an array
         """
-        return 2*pi*g*self._get_prob_nocheck_array(g)
+        return 2*pi*g*self._get_prob_lut_array(g)
 
     def _get_prob_nocheck_scalar(self, g):
         """
@@ -2697,6 +2923,9 @@ class GPriorMErf2(GPriorMErf):
         self.gmax = 1.0
         self.a=4500.0
 
+        self._clear_sample_table()
+        self._lut=None
+
     def _get_prob_nocheck_scalar(self, g):
         """
         workhorse function, must be scalar. Error checking
@@ -2819,14 +3048,39 @@ class Normal(_gmix.Normal):
     def __init__(self, cen, sigma):
         self.cen=cen
         self.sigma=sigma
+        self.s2inv=1.0/sigma**2
         self.ndim=1
         super(Normal,self).__init__(cen, sigma)
 
-    def sample(self, *args):
+    def get_lnprob_array(self, x):
+        """
+        log probability for array input
+        """
+        x=array(x, dtype='f8', ndmin=1, copy=False)
+        diff = self.cen-x
+        return -0.5*diff*diff*self.s2inv
+
+    def get_prob_array(self, x):
+        """
+        probability for array input
+        """
+        return exp( self.get_lnprob_array(x) )
+
+    def sample(self, *args, **keys):
         """
         Get samples.  Send no args to get a scalar.
+
+        Send rng= for a numpy RandomState or Generator, otherwise
+        the global numpy random state is used
         """
-        rand=self.cen + self.sigma*numpy.random.randn(*args)
+        rng=_get_rng(keys.get('rng',None))
+
+        if len(args) == 0:
+            size=None
+        else:
+            size=args
+
+        rand=self.cen + self.sigma*rng.standard_normal(size=size)
         return rand
 
 class LogNormal(object):
@@ -2929,17 +3183,15 @@ class LogNormal(object):
         return numpy.exp(lnp)
 
 
-    def sample(self, nrand=None):
+    def sample(self, nrand=None, rng=None):
         """
         Get nrand random deviates from the distribution
 
         If z is drawn from a normal random distribution, then exp(logmean+logsigma*z)
         is drawn from lognormal
         """
-        if nrand is None:
-            z=numpy.random.randn()
-        else:
-            z=numpy.random.randn(nrand)
+        rng=_get_rng(rng)
+        z=rng.standard_normal(size=nrand)
         return numpy.exp(self.logmean + self.logsigma*z)
 
     def sample_brute(self, nrand=None, maxval=None):
@@ -3045,7 +3297,7 @@ class MultivariateLogNormal(object):
         lnprob = self.get_lnprob_scalar(x)
         return exp(lnprob)
 
-    def sample(self, n=None):
+    def sample(self, n=None, rng=None):
         """
         sample from the distribution
 
@@ -3053,6 +3305,8 @@ class MultivariateLogNormal(object):
         ----------
         n: int, optional
             Number of points to generate from the distribution
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
 
         returns
         -------
@@ -3060,7 +3314,7 @@ class MultivariateLogNormal(object):
             If n is None or 1, a 1-d array is returned, else a [N, ndim]
             array is returned
         """
-        rl = self.log_dist.rvs(n)
+        rl = self.log_dist.rvs(n, random_state=rng)
         numpy.exp(rl,rl)
 
         return rl
@@ -3156,14 +3410,14 @@ class MVNMom(object):
         self.ndim=mean.size
         self._set_offsets()
 
-    def sample(self, n=None):
+    def sample(self, n=None, rng=None):
         if n is None:
             is_scalar=True
             n=1
         else:
             is_scalar=False
 
-        r=self.mvn.sample(n=n)
+        r=self.mvn.sample(n=n, rng=rng)
 
         cen_offsets=self.cen_offsets
         M1=self.mean[2]
@@ -3392,7 +3646,7 @@ class MultivariateNormal(object):
 
         return x
 
-    def sample(self, n=None):
+    def sample(self, n=None, rng=None):
         """
         sample from the distribution
 
@@ -3400,6 +3654,8 @@ class MultivariateNormal(object):
         ----------
         n: int, optional
             Number of points to generate from the distribution
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
 
         returns
         -------
@@ -3410,7 +3666,7 @@ class MultivariateNormal(object):
         if not hasattr(self,'dist'):
             self._set_scipy_dist()
 
-        return self._dist.rvs(n)
+        return self._dist.rvs(n, random_state=rng)
 
     def _set_scipy_dist(self):
         """
@@ -3454,36 +3710,39 @@ class BFracBase(object):
     """
     Base class for bulge fraction distribution
     """
-    def sample(self, nrand=None):
+    def sample(self, nrand=None, rng=None):
         if nrand is None:
-            return self.sample_one()
+            return self.sample_one(rng=rng)
         else:
-            return self.sample_many(nrand)
+            return self.sample_many(nrand, rng=rng)
 
-    def sample_one(self):
+    def sample_one(self, rng=None):
+        rng=_get_rng(rng)
         while True:
-            t=numpy.random.random()
+            t=rng.uniform()
             if t < self.bd_frac:
-                r=self.bd_sigma*randn()
+                r=self.bd_sigma*rng.standard_normal()
             else:
-                r=1.0 + self.dev_sigma*randn()
+                r=1.0 + self.dev_sigma*rng.standard_normal()
             if r >= 0.0 and r <= 1.0:
                 break
         return r
 
-    def sample_many(self, nrand):
+    def sample_many(self, nrand, rng=None):
+        rng=_get_rng(rng)
+
         r=numpy.zeros(nrand)-9999
         ngood=0
         nleft=nrand
         while ngood < nrand:
             tr=numpy.zeros(nleft)
 
-            tmpu=randu(nleft)
+            tmpu=rng.uniform(size=nleft)
             w,=numpy.where( tmpu < self.bd_frac )
             if w.size > 0:
-                tr[0:w.size] = self.bd_loc  + self.bd_sigma*randn(w.size)
+                tr[0:w.size] = self.bd_loc  + self.bd_sigma*rng.standard_normal(w.size)
             if w.size < nleft:
-                tr[w.size:]  = self.dev_loc + self.dev_sigma*randn(nleft-w.size)
+                tr[w.size:]  = self.dev_loc + self.dev_sigma*rng.standard_normal(nleft-w.size)
 
             wg,=numpy.where( (tr >= 0.0) & (tr <= 1.0) )
 
@@ -3588,8 +3847,9 @@ class TruncatedGaussian(object):
 
         return lnp
 
-    def sample(self, nrand=1):
-        from numpy.random import normal
+    def sample(self, nrand=1, rng=None):
+        rng=_get_rng(rng)
+
         if nrand is None:
             is_scalar=True
             nrand=1
@@ -3602,7 +3862,7 @@ class TruncatedGaussian(object):
         nleft=nrand
         while ngood < nrand:
             
-            tvals = normal(loc=self.mean, scale=self.sigma, size=nleft)
+            tvals = rng.normal(loc=self.mean, scale=self.sigma, size=nleft)
 
             w,=numpy.where( (tvals > self.minval) & (tvals < self.maxval) )
             if w.size > 0:
@@ -3631,18 +3891,20 @@ class TruncatedGaussianPolar(object):
         self.maxval=maxval
         self.maxval2=maxval**2
 
-    def sample(self, nrand):
+    def sample(self, nrand, rng=None):
         """
         Sample from truncated gaussian
         """
+        rng=_get_rng(rng)
+
         x1=numpy.zeros(nrand)
         x2=numpy.zeros(nrand)
 
         nleft=nrand
         ngood=0
         while nleft > 0:
-            r1=self.mean1 + self.sigma1*randn(nleft)
-            r2=self.mean2 + self.sigma2*randn(nleft)
+            r1=self.mean1 + self.sigma1*rng.standard_normal(nleft)
+            r2=self.mean2 + self.sigma2*rng.standard_normal(nleft)
 
             rsq=r1**2 + r2**2
 
@@ -3699,11 +3961,11 @@ class Student(object):
 
         self.tdist = scipy.stats.t(1.0, loc=mean, scale=sigma)
 
-    def sample(self, nrand):
+    def sample(self, nrand, rng=None):
         """
         Draw samples from the distribution
         """
-        return self.tdist.rvs(nrand)
+        return self.tdist.rvs(nrand, random_state=rng)
 
     def get_lnprob_array(self, x):
         """
@@ -3714,7 +3976,7 @@ class Student(object):
     get_lnprob_scalar=get_lnprob_array
 
 class StudentPositive(Student):
-    def sample(self, nrand):
+    def sample(self, nrand, rng=None):
         """
         Draw samples from the distribution
         """
@@ -3723,7 +3985,7 @@ class StudentPositive(Student):
         nleft=nrand
         ngood=0
         while nleft > 0:
-            r = super(StudentPositive,self).sample(nleft)
+            r = super(StudentPositive,self).sample(nleft, rng=rng)
 
             w,=numpy.where(r > 0.0)
             nkeep=w.size
@@ -3777,12 +4039,12 @@ class Student2D(object):
         self.tdist1 = Student(mean1, sigma1)
         self.tdist2 = Student(mean2, sigma2)
 
-    def sample(self, nrand):
+    def sample(self, nrand, rng=None):
         """
         Draw samples from the distribution
         """
-        r1 = self.tdist1.sample(nrand)
-        r2 = self.tdist2.sample(nrand)
+        r1 = self.tdist1.sample(nrand, rng=rng)
+        r2 = self.tdist2.sample(nrand, rng=rng)
 
         return r1, r2
 
@@ -3813,7 +4075,7 @@ class TruncatedStudentPolar(Student2D):
         self.maxval=maxval
         self.maxval2=maxval**2
 
-    def sample(self, nrand):
+    def sample(self, nrand, rng=None):
         """
         Sample from truncated gaussian
         """
@@ -3823,7 +4085,7 @@ class TruncatedStudentPolar(Student2D):
         nleft=nrand
         ngood=0
         while nleft > 0:
-            r1,r2 = super(TruncatedStudentPolar,self).sample(nleft)
+            r1,r2 = super(TruncatedStudentPolar,self).sample(nleft, rng=rng)
 
             rsq=r1**2 + r2**2
 
@@ -3888,18 +4150,46 @@ class CenPrior(_gmix.Normal2D):
         self.sigma1 = sigma1
         self.sigma2 = sigma2
 
+        self.s2inv1 = 1.0/sigma1**2
+        self.s2inv2 = 1.0/sigma2**2
+
         super(CenPrior,self).__init__(cen1,cen2,sigma1,sigma2)
 
-    def sample(self, n=None):
+    def get_lnprob_array_sep(self, x1, x2):
+        """
+        log probability for array input, separately for each dimension
+        """
+        x1=array(x1, dtype='f8', ndmin=1, copy=False)
+        x2=array(x2, dtype='f8', ndmin=1, copy=False)
+
+        d1 = self.cen1-x1
+        d2 = self.cen2-x2
+        lnp1 = -0.5*d1*d1*self.s2inv1
+        lnp2 = -0.5*d2*d2*self.s2inv2
+
+        return lnp1, lnp2
+
+    def get_lnprob_array(self, x1, x2):
+        """
+        log probability for array input
+        """
+        lnp1, lnp2 = self.get_lnprob_array_sep(x1, x2)
+        return lnp1 + lnp2
+
+    def get_prob_array(self, x1, x2):
+        """
+        probability for array input
+        """
+        return exp( self.get_lnprob_array(x1, x2) )
+
+    def sample(self, n=None, rng=None):
         """
         Get a single sample or arrays
         """
-        if n is None:
-            rand1=self.cen1 + self.sigma1*numpy.random.randn()
-            rand2=self.cen2 + self.sigma2*numpy.random.randn()
-        else:
-            rand1=self.cen1 + self.sigma1*numpy.random.randn(n)
-            rand2=self.cen2 + self.sigma2*numpy.random.randn(n)
+        rng=_get_rng(rng)
+
+        rand1=self.cen1 + self.sigma1*rng.standard_normal(size=n)
+        rand2=self.cen2 + self.sigma2*rng.standard_normal(size=n)
 
         return rand1, rand2
     sample2d=sample
@@ -3981,10 +4271,11 @@ class TruncatedSimpleGauss2D(object):
         lnp = self.get_lnprob(p1, p2)
         return numpy.exp(lnp)
 
-    def sample(self, nrand=None):
+    def sample(self, nrand=None, rng=None):
         """
         Get nrand random deviates from the distribution
         """
+        rng=_get_rng(rng)
 
         if nrand is None:
             is_scalar=True
@@ -3999,8 +4290,8 @@ class TruncatedSimpleGauss2D(object):
         nleft=nrand
         while ngood < nrand:
             
-            rvals1=self.cen1 + self.sigma1*randn(nleft)
-            rvals2=self.cen2 + self.sigma2*randn(nleft)
+            rvals1=self.cen1 + self.sigma1*rng.standard_normal(nleft)
+            rvals2=self.cen2 + self.sigma2*rng.standard_normal(nleft)
 
             rsq = rvals1**2 + rvals2**2
 
@@ -4027,6 +4318,11 @@ class TFluxPriorCosmosBase(object):
     """
     T is in arcsec**2
     """
+
+    # lookup table settings, see set_lut
+    _lut_conf=None
+    _lut=None
+
     def __init__(self,
                  T_bounds=[1.e-6,100.0],
                  flux_bounds=[1.e-6,100.0]):
@@ -4046,6 +4342,81 @@ class TFluxPriorCosmosBase(object):
         self.T_bounds    = array(T_bounds, dtype='f8')
         self.flux_bounds = array(flux_bounds,dtype='f8')
 
+        self._lut=None
+
+    def set_lut(self, npoints=801, fname=None):
+        """
+        Evaluate ln(p) by bilinear interpolation in a table over
+        log10(T) and log10(flux) within the bounds, for both
+        get_lnprob_one and get_lnprob_many
+
+        The table is made on first use, and again if the bounds are
+        changed.  Tables for the same prior are shared within the
+        process, and can be shared between processes through a file, see
+        the lut module.  The estimated maximum error of the interpolation
+        in ln(p) is get_lut().maxerr
+
+        parameters
+        ----------
+        npoints: int or sequence, optional
+            Number of points in the table in each dimension, default 801
+        fname: string, optional
+            File in which to store the table
+        """
+        self._lut_conf={'npoints':npoints, 'fname':fname}
+        self._lut=None
+
+    def clear_lut(self):
+        """
+        go back to evaluating the prior exactly
+        """
+        self._lut_conf=None
+        self._lut=None
+
+    def get_lut(self):
+        """
+        get the LookupTable2D for ln(p) in log10(T), log10(flux), or None
+        if set_lut has not been called
+        """
+        if self._lut_conf is not None and self._lut is None:
+            from .lut import make_lut2d
+
+            conf=self._lut_conf
+            logT_bounds=numpy.log10(self.T_bounds)
+            logflux_bounds=numpy.log10(self.flux_bounds)
+
+            self._lut=make_lut2d(self._get_lnprob_log_array,
+                                 logT_bounds[0],
+                                 logT_bounds[1],
+                                 logflux_bounds[0],
+                                 logflux_bounds[1],
+                                 conf['npoints'],
+                                 self.__class__.__name__,
+                                 fname=conf['fname'])
+        return self._lut
+
+    def _get_lnprob_log_array(self, logT, logflux):
+        """
+        ln(p) in the log10 variables, used to make the lookup table.  The
+        sum over gaussians is done with the log-sum-exp, so the result is
+        finite far from the means
+        """
+        ngauss=self.weights.size
+
+        lnps=zeros( (logT.size, ngauss) )
+        for i in xrange(ngauss):
+            cov=self.covars[i]
+            det=cov[0,0]*cov[1,1] - cov[0,1]*cov[1,0]
+
+            u=logT-self.means[i,0]
+            v=logflux-self.means[i,1]
+            chi2=(cov[1,1]*u*u - 2*cov[0,1]*u*v + cov[0,0]*v*v)/det
+
+            lnps[:,i] = log(self.weights[i]/(2*pi*sqrt(det))) - 0.5*chi2
+
+        lnpmax=lnps.max(axis=1)
+        return lnpmax + log( exp(lnps - lnpmax[:,newaxis]).sum(axis=1) )
+
 
     def get_flux_mode(self):
         return self.flux_mode
@@ -4077,7 +4448,7 @@ class TFluxPriorCosmosBase(object):
 
         logvals = numpy.log10( T_and_flux )
         
-        return self.gmm.score(logvals)
+        return self.gmm.get_lnprob_array(logvals)
 
     def get_lnprob_many(self, T_and_flux):
         """
@@ -4087,6 +4458,21 @@ class TFluxPriorCosmosBase(object):
         n=T_and_flux.shape[0]
         lnp=numpy.zeros(n)
 
+        lut=self.get_lut()
+        if lut is not None:
+            T=T_and_flux[:,0]
+            flux=T_and_flux[:,1]
+
+            lnp[:] = LOWVAL
+            w,=numpy.where(  (T >= self.T_bounds[0])
+                           & (T <= self.T_bounds[1])
+                           & (flux >= self.flux_bounds[0])
+                           & (flux <= self.flux_bounds[1]) )
+            if w.size > 0:
+                lnp[w] = lut.get_array(numpy.log10(T[w]),
+                                       numpy.log10(flux[w]))
+            return lnp
+
         for i in xrange(n):
             lnp[i] = self.get_lnprob_one(T_and_flux[i,:])
 
@@ -4109,13 +4495,24 @@ class TFluxPriorCosmosBase(object):
         if flux < flux_bounds[0] or flux > flux_bounds[1]:
             return LOWVAL
 
+        lut=self.get_lut()
+        if lut is not None:
+            return lut.get_scalar(math.log10(T), math.log10(flux))
+
         logpars=numpy.log10(T_and_flux)
 
-        return self.gmix.get_loglike_rowcol(logpars[0], logpars[1])
+        return log( self.gmix(logpars[0], logpars[1]) )
 
-    def sample(self, n):
+    def sample(self, n, rng=None):
         """
         Sample the linear variables
+
+        parameters
+        ----------
+        n: int
+            Number to generate
+        rng: numpy RandomState or Generator, optional
+            If not sent, the global numpy random state is used
         """
 
         T_bounds = self.T_bounds
@@ -4125,7 +4522,7 @@ class TFluxPriorCosmosBase(object):
         nleft=n
         ngood=0
         while nleft > 0:
-            tsamples=self.gmm.sample(nleft)
+            tsamples=self.gmm.sample(nleft, rng=rng)
             tlin_samples = 10.0**tsamples
 
             Tvals = tlin_samples[:,0]
@@ -4144,22 +4541,11 @@ class TFluxPriorCosmosBase(object):
 
     def make_gmm(self):
         """
-        Make a GMM object from the inputs
+        Make a GMixND object from the inputs, for sampling
         """
-        from sklearn.mixture import GMM
-        # we will over-ride values, pars here shouldn't matter except
-        # for consistency
-
-        ngauss=self.weights.size
-        gmm=GMM(n_components=ngauss,
-                n_iter=JOINT_N_ITER,
-                min_covar=JOINT_MIN_COVAR,
-                covariance_type=JOINT_COVARIANCE_TYPE)
-        gmm.means_ = self.means
-        gmm.covars_ = self.covars
-        gmm.weights_ = self.weights
+        from .gmix import GMixND
 
-        self.gmm=gmm 
+        self.gmm=GMixND(self.weights, self.means, self.covars)
 
     def make_gmix(self):
         """
@@ -4372,11 +4758,38 @@ def _2gauss_prob_array(means, ivars, weights, vals, output):
 '''
 
 
-def srandu(num=None):
+def srandu(num=None, rng=None):
     """
     Generate random numbers in the symmetric distribution [-1,1]
+
+    parameters
+    ----------
+    num: int, optional
+        Number to generate, default a scalar
+    rng: numpy RandomState or Generator, optional
+        If not sent, the global numpy random state is used
+    """
+    rng=_get_rng(rng)
+    return 2*(rng.uniform(size=num)-0.5)
+
+def _get_rng(rng):
+    """
+    the global numpy random state is used if rng is None
+    """
+    if rng is None:
+        return numpy.random
+    else:
+        return rng
+
+def _get_rng_keys(rng):
     """
-    return 2*(numpy.random.random(num)-0.5)
+    keywords for sample methods; rng is only sent when it is not None, so
+    priors that do not support it can still be used
+    """
+    if rng is None:
+        return {}
+    else:
+        return {'rng':rng}
 
 
 
@@ -4384,6 +4797,34 @@ class GPriorCosmosSersicSpline(GPriorMErf):
     def __init__(self):
         self.gmax=1.0
 
+    def _get_lut_key(self):
+        """
+        identifies the prior for sharing lookup tables
+        """
+        return self.__class__.__name__
+
+    def _get_lnprob_nocheck_array(self, g):
+        """
+        ln(p) without the 2*pi*g, used to make the lookup table.  The
+        spline is divided by 2*pi*g, so the value at g=0 is taken
+        from a small g
+        """
+        g=g.clip(min=1.0e-6)
+        return log(self._get_prob_nocheck(g))
+
+    def _get_prob_nocheck_scalar(self, g):
+        """
+        no error checking, this does not include the 2*pi*g
+        """
+        return self._get_prob_nocheck(g)[0]
+
+    def _get_prob_nocheck_array(self, g):
+        """
+        no error checking, must be an array.  This does not include
+        the 2*pi*g
+        """
+        return self._get_prob_nocheck(g)
+
     def _get_prob_nocheck(self, g):
         """
         Remove the 2*pi*g
@@ -4463,18 +4904,20 @@ class ZDisk2D(_gmix.ZDisk2D):
 
         super(ZDisk2D,self).__init__(radius)
 
-    def sample1d(self, n=None):
+    def sample1d(self, n=None, rng=None):
         """
         Get samples in 1-d radius
         """
 
+        rng=_get_rng(rng)
+
         if n is None:
             n=1
             is_scalar=True
         else:
             is_scalar=False
 
-        r2 = self.radius_sq*randu(n)
+        r2 = self.radius_sq*rng.uniform(size=n)
 
         r = sqrt(r2)
 
@@ -4483,19 +4926,21 @@ class ZDisk2D(_gmix.ZDisk2D):
 
         return r
 
-    def sample2d(self, n=None):
+    def sample2d(self, n=None, rng=None):
         """
         Get samples.  Send no args to get a scalar.
         """
+        rng=_get_rng(rng)
+
         if n is None:
             n=1
             is_scalar=True
         else:
             is_scalar=False
 
-        radius=self.sample1d(n)
+        radius=self.sample1d(n, rng=rng)
 
-        theta=2.0*numpy.pi*randu(n)
+        theta=2.0*numpy.pi*rng.uniform(size=n)
 
         x=radius*cos(theta)
         y=radius*sin(theta)
@@ -4519,6 +4964,20 @@ class ZDisk2D(_gmix.ZDisk2D):
         super(ZDisk2D,self).get_prob_array2d(x,y,out)
         return out
 
+    def get_lnprob_array2d(self, x, y):
+        """
+        log probability, 0.0 inside disk, LOWVAL outside
+
+        does not raise an exception
+        """
+        x=numpy.array(x, dtype='f8', ndmin=1, copy=False)
+        y=numpy.array(y, dtype='f8', ndmin=1, copy=False)
+
+        lnp=numpy.zeros(x.size) + LOWVAL
+        w,=numpy.where( (x*x + y*y) < self.radius_sq )
+        lnp[w] = 0.0
+        return lnp
+
 
 class ZDisk2DErf(object):
     """
@@ -4664,3 +5123,103 @@ class UDisk2DCut(object):
         x=sqrt(x1**2 + x2**2)
         return self.get_lnprob_array1d(x)
 
+
+
+# codes must match those in _gmix.h
+_PRIOR_NORMAL=1
+_PRIOR_NORMAL2D=2
+_PRIOR_GPRIOR_BA=3
+_PRIOR_TWOSIDED_ERF=4
+_PRIOR_FLAT=5
+_PRIOR_LOGNORMAL=6
+_PRIOR_ZDISK2D=7
+
+_prior_comp_dtype=[('type','i4'),
+                   ('index','i4'),
+                   ('pars','f8',4)]
+
+def compile_priors(prior_list):
+    """
+    pack a set of priors into an array that can be evaluated in a single
+    call to the C code, see _gmix.prior_fill_fdiff and
+    _gmix.prior_get_lnprob_scalar
+
+    The supported priors are CenPrior, Normal, GPriorBA, TwoSidedErf,
+    FlatPrior, LogNormal and ZDisk2D.  Subclasses are not supported, since
+    they may change the calculation
+
+    The current state of the priors is copied, so the priors must be
+    compiled again if they are modified
+
+    parameters
+    ----------
+    prior_list: list
+        list of (prior, index, kind) where index is the position of the
+        first parameter to which the prior applies.  kind is 'sep' for a
+        CenPrior, producing a separate entry for each dimension as in
+        get_lnprob_scalar_sep, '2d' for GPriorBA and ZDisk2D as evaluated by
+        get_lnprob_scalar2d, or '1d' for the others
+
+    returns
+    -------
+    comps: array or None
+        The compiled priors, or None if any of the priors is not supported
+    """
+
+    comps=zeros(len(prior_list), dtype=_prior_comp_dtype)
+
+    for i,(prior,index,kind) in enumerate(prior_list):
+        comp=comps[i]
+        comp['index'] = index
+
+        ptype=type(prior)
+        if kind=='sep':
+            if ptype is not CenPrior:
+                return None
+        elif kind=='2d':
+            if ptype is not GPriorBA and ptype is not ZDisk2D:
+                return None
+        elif kind=='1d':
+            if ptype is CenPrior or ptype is GPriorBA or ptype is ZDisk2D:
+                return None
+        else:
+            raise ValueError("bad prior kind: '%s'" % kind)
+
+        if ptype is Normal:
+            comp['type'] = _PRIOR_NORMAL
+            comp['pars'][0:2] = [prior.cen, 1.0/(prior.sigma*prior.sigma)]
+
+        elif ptype is CenPrior:
+            comp['type'] = _PRIOR_NORMAL2D
+            comp['pars'][:] = [prior.cen1,
+                               prior.cen2,
+                               1.0/(prior.sigma1*prior.sigma1),
+                               1.0/(prior.sigma2*prior.sigma2)]
+
+        elif ptype is GPriorBA:
+            comp['type'] = _PRIOR_GPRIOR_BA
+            comp['pars'][0] = prior.sig2inv
+
+        elif ptype is TwoSidedErf:
+            comp['type'] = _PRIOR_TWOSIDED_ERF
+            comp['pars'][:] = [prior.minval,
+                               prior.width_at_min,
+                               prior.maxval,
+                               prior.width_at_max]
+
+        elif ptype is FlatPrior:
+            comp['type'] = _PRIOR_FLAT
+            comp['pars'][0:2] = [prior.minval, prior.maxval]
+
+        elif ptype is LogNormal:
+            comp['type'] = _PRIOR_LOGNORMAL
+            comp['pars'][0:2] = [prior.logmean, prior.logivar]
+
+        elif ptype is ZDisk2D:
+            comp['type'] = _PRIOR_ZDISK2D
+            comp['pars'][0] = prior.radius*prior.radius
+
+        else:
+            return None
+
+    return comps
@@ -0,0 +1,254 @@
+"""
+Cache psf fits keyed on the content of the psf observation, and remember
+previous psf fits to use as starting guesses
+
+In multi-epoch processing the same psf image, for example one coadd psf or
+a psf model evaluated at a nearby position, is often attached to many
+objects.  A PSFFitCache can be sent to the Bootstrapper so that each
+distinct psf is only fit once.
+
+The key is a hash of the psf image, weight map and jacobian, together with
+the psf model and the fitting settings.  The cache holds a limited number
+of fits, and the least recently used fit is dropped when it is full.
+
+examples
+--------
+
+cache=PSFFitCache(maxsize=1000)
+
+for obs in obs_list:
+    boot=Bootstrapper(obs, psf_cache=cache)
+    boot.fit_psfs('em3', 4.0)
+    ...
+
+print(cache.get_stats())
+
+The psfs from the same exposure or ccd vary smoothly, so the last successful
+fit is a good starting point for the next psf.  A PSFGuessRegistry sent to
+the Bootstrapper holds the last fit for each exposure, identified by an
+entry in the psf meta data
+
+guesses=PSFGuessRegistry(meta_key='expnum')
+
+for obs in obs_list:
+    boot=Bootstrapper(obs, psf_guesses=guesses)
+    boot.fit_psfs('em3', 4.0)
+    ...
+"""
+from __future__ import print_function
+
+import hashlib
+from collections import OrderedDict
+
+import numpy
+
+class PSFFitCache(object):
+    """
+    A bounded cache of psf fitters, with least recently used eviction
+
+    The Bootstrapper draws the random guesses for a cached psf fit from
+    get_rng(key) rather than its own generator, so the fit for a given psf
+    is the same no matter which object it was first seen with, and the
+    results do not depend on the order in which objects are processed
+
+    parameters
+    ----------
+    maxsize: int, optional
+        Maximum number of fits to hold, default 1000
+    """
+    def __init__(self, maxsize=1000):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1, got %s" % maxsize)
+
+        self.maxsize=maxsize
+        self.clear()
+
+    def clear(self):
+        """
+        remove all fits and reset the counters
+        """
+        self._data=OrderedDict()
+        self.nhit=0
+        self.nmiss=0
+        self.nevict=0
+
+    def get_key(self, psf_obs, psf_model, Tguess, ntry, fit_pars, **kw):
+        """
+        get the key for a psf fit
+
+        parameters
+        ----------
+        psf_obs: Observation
+            The psf observation
+        psf_model: string
+            The psf model, e.g. 'em3' or 'gauss'
+        Tguess: float
+            Guess for T
+        ntry: int
+            Number of tries
+        fit_pars: dict or None
+            Fitting parameters
+        **kw:
+            Other settings that affect the fit, e.g. intpars
+
+        returns
+        -------
+        key: string
+            The hex digest
+        """
+        h=hashlib.sha1()
+
+        for arr in [psf_obs.image, psf_obs.weight, psf_obs.jacobian._data]:
+            arr=numpy.ascontiguousarray(arr)
+            h.update( str( (arr.shape, arr.dtype.str) ).encode('utf-8') )
+            h.update( arr.tobytes() )
+
+        settings=(psf_model, Tguess, ntry, _get_sorted(fit_pars), _get_sorted(kw))
+        h.update( repr(settings).encode('utf-8') )
+
+        return h.hexdigest()
+
+    def get_rng(self, key):
+        """
+        get a numpy RandomState seeded from the key
+        """
+        return numpy.random.RandomState( int(key[0:8], 16) )
+
+    def get(self, key):
+        """
+        get the fitter for the key, or None if it is not in the cache
+
+        The hit and miss counters are updated
+        """
+        fitter=self._data.pop(key, None)
+        if fitter is None:
+            self.nmiss += 1
+        else:
+            self.nhit += 1
+            # put back as the most recently used
+            self._data[key] = fitter
+
+        return fitter
+
+    def put(self, key, fitter):
+        """
+        add a fitter to the cache, dropping the least recently used
+        fit if the cache is full
+        """
+        if key in self._data:
+            del self._data[key]
+
+        self._data[key] = fitter
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.nevict += 1
+
+    def get_stats(self):
+        """
+        get a dict with the number of hits, misses and evictions,
+        and the current size
+        """
+        return {'nhit':self.nhit,
+                'nmiss':self.nmiss,
+                'nevict':self.nevict,
+                'size':len(self._data),
+                'maxsize':self.maxsize}
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return 'PSFFitCache(%s)' % self.get_stats()
+
+def _get_sorted(pars):
+    """
+    dicts as sorted lists of items, so the key does not depend on
+    the order of insertion
+    """
+    if isinstance(pars, dict):
+        return [(k, _get_sorted(pars[k])) for k in sorted(pars)]
+    else:
+        return pars
+
+class PSFGuessRegistry(object):
+    """
+    The last successful psf fit for each exposure and psf model, to be
+    used as the starting guess for the next psf fit
+
+    The Bootstrapper tries the previous solution first, and only uses the
+    random guesses if that fit fails.  For em models the solution is the
+    GMix, for the other models it is the parameter array
+
+    Note the fits then depend on the order in which the objects are
+    processed
+
+    parameters
+    ----------
+    meta_key: string, optional
+        The psfs are grouped by psf_obs.meta[meta_key], e.g. an exposure or
+        ccd id.  If None, or the entry is missing from the meta data, all
+        psfs are in a single group
+    """
+    def __init__(self, meta_key=None):
+        self.meta_key=meta_key
+        self.clear()
+
+    def clear(self):
+        """
+        remove all solutions and reset the counters
+        """
+        self._data={}
+        self.nhit=0
+        self.nmiss=0
+
+    def get_key(self, psf_obs, psf_model):
+        """
+        get the key for a psf observation and model
+        """
+        group=None
+        if self.meta_key is not None:
+            group=psf_obs.meta.get(self.meta_key, None)
+
+        return (group, psf_model)
+
+    def get(self, key):
+        """
+        get a copy of the solution for the key, or None if there is none
+
+        The hit and miss counters are updated
+        """
+        guess=self._data.get(key, None)
+        if guess is None:
+            self.nmiss += 1
+            return None
+        else:
+            self.nhit += 1
+            return guess.copy()
+
+    def put(self, key, guess):
+        """
+        set the solution for the key, replacing any previous one
+        """
+        self._data[key] = guess.copy()
+
+    def get_stats(self):
+        """
+        get a dict with the number of hits and misses, and the number
+        of solutions held
+        """
+        return {'nhit':self.nhit,
+                'nmiss':self.nmiss,
+                'size':len(self._data)}
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return 'PSFGuessRegistry(%s)' % self.get_stats()
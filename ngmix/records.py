@@ -0,0 +1,275 @@
+"""
+Write fitter and bootstrapper results into rows of numpy structured arrays
+
+At catalog scale it is much cheaper to write each object's results into a
+row of a preallocated structured array than to keep the result dicts
+around and convert them to a table at the end.  A ResultSchema describes
+which entries of a result dict are copied into which columns.
+
+examples
+--------
+
+schema=fitter.get_result_schema()
+data=schema.make_array(nobj)
+
+for i in xrange(nobj):
+    ...
+    fitter.go(guess)
+    schema.fill(data[i], fitter.get_result())
+"""
+from __future__ import print_function
+
+import numpy
+
+DEFVAL=-9999.0
+
+class ResultSchema(object):
+    """
+    Describe the mapping from a result dict to columns of a structured array
+
+    parameters
+    ----------
+    fields: list
+        List of (key, dtype) or (key, dtype, shape) for entries in the result
+        dict.  The column name is prefix+key.  An integer shape n is taken
+        as (n,), so the column is an array even when n is 1, e.g. a single
+        band
+    prefix: string, optional
+        prefix for the column names
+    """
+    def __init__(self, fields, prefix=''):
+        self.prefix=prefix
+
+        self._fields=[]
+        for field in fields:
+            key=field[0]
+            name='%s%s' % (prefix, key)
+            if len(field) == 3:
+                shape=field[2]
+                if isinstance(shape, (int, numpy.integer)):
+                    shape=(shape,)
+                dt = (name, field[1], shape)
+            else:
+                dt = (name, field[1])
+
+            self._fields.append( (key, name, dt) )
+
+    def get_dtype(self):
+        """
+        get the descriptor, a list of (name, dtype[, shape]) that
+        can be used to construct a numpy dtype
+        """
+        return [f[2] for f in self._fields]
+
+    def get_names(self):
+        """
+        get the column names
+        """
+        return [f[1] for f in self._fields]
+
+    def make_array(self, n):
+        """
+        make a structured array with the columns for this schema,
+        with default values set
+
+        parameters
+        ----------
+        n: int
+            number of rows
+        """
+        data=numpy.zeros(n, dtype=self.get_dtype())
+        self.set_defaults(data)
+        return data
+
+    def set_defaults(self, data):
+        """
+        set default values in the columns for this schema.  Floating
+        point columns are set to DEFVAL, others to zero
+
+        parameters
+        ----------
+        data: structured array or row
+            Must have columns for this schema
+        """
+        for key,name,dt in self._fields:
+            if data[name].dtype.kind == 'f':
+                data[name] = DEFVAL
+            else:
+                data[name] = 0
+
+    def fill(self, row, res):
+        """
+        copy the entries from the result dict into the row.  Entries
+        missing from the result are left unchanged
+
+        parameters
+        ----------
+        row: row of a structured array
+            Must have the columns for this schema
+        res: dict
+            The result dict
+        """
+        for key,name,dt in self._fields:
+            if key in res:
+                row[name] = res[key]
+
+    def __add__(self, other):
+        """
+        combine with another schema
+        """
+        new=ResultSchema([])
+        new._fields = self._fields + other._fields
+        return new
+
+def get_max_schema(npars, prefix=''):
+    """
+    get a schema for the result of a max like fitter such as LMSimple
+
+    parameters
+    ----------
+    npars: int
+        Number of parameters in the fit
+    prefix: string, optional
+        prefix for the column names
+    """
+    fields=[
+        ('flags','i4'),
+        ('nfev','i4'),
+        ('ntry','i4'),
+        ('pars','f8',npars),
+        ('pars_err','f8',npars),
+        ('pars_cov','f8',(npars,npars)),
+        ('g','f8',2),
+        ('g_cov','f8',(2,2)),
+        ('s2n_w','f8'),
+        ('lnprob','f8'),
+        ('chi2per','f8'),
+        ('dof','f8'),
+    ]
+
+    return ResultSchema(fields, prefix=prefix)
+
+def get_template_flux_schema(prefix=''):
+    """
+    get a schema for the result of the TemplateFluxFitter
+
+    parameters
+    ----------
+    prefix: string, optional
+        prefix for the column names
+    """
+    fields=[
+        ('flags','i4'),
+        ('flux','f8'),
+        ('flux_err','f8'),
+        ('chi2per','f8'),
+        ('dof','f8'),
+    ]
+    return ResultSchema(fields, prefix=prefix)
+
+def get_composite_schema(npars, prefix=''):
+    """
+    get a schema for the result of the composite model fit, including the
+    fracdev entries set by the CompositeBootstrapper
+
+    parameters
+    ----------
+    npars: int
+        Number of parameters in the fit
+    prefix: string, optional
+        prefix for the column names
+    """
+    fields=[
+        ('fracdev','f8'),
+        ('fracdev_noclip','f8'),
+        ('fracdev_err','f8'),
+        ('fracdev_nfev','i4'),
+        ('TdByTe','f8'),
+    ]
+    schema=get_max_schema(npars, prefix=prefix)
+    return schema + ResultSchema(fields, prefix=prefix)
+
+def get_round_schema(prefix=''):
+    """
+    get a schema for the result of Bootstrapper.set_round_s2n
+
+    parameters
+    ----------
+    prefix: string, optional
+        prefix for the column names
+    """
+    fields=[
+        ('flags','i4'),
+        ('s2n_r','f8'),
+        ('T_r','f8'),
+        ('psf_T_r','f8'),
+    ]
+    return ResultSchema(fields, prefix=prefix)
+
+def get_prescreen_schema(prefix=''):
+    """
+    get a schema for the result of Bootstrapper.prescreen
+
+    parameters
+    ----------
+    prefix: string, optional
+        prefix for the column names
+    """
+    fields=[
+        ('flags','i4'),
+        ('s2n','f8'),
+        ('coverage','f8'),
+        ('T','f8'),
+        ('psf_T','f8'),
+        ('Tratio','f8'),
+    ]
+    return ResultSchema(fields, prefix=prefix)
+
+def get_psf_flux_schema(nband, prefix=''):
+    """
+    get a schema for the result of Bootstrapper.fit_gal_psf_flux
+
+    parameters
+    ----------
+    nband: int
+        Number of bands
+    prefix: string, optional
+        prefix for the column names
+    """
+    fields=[
+        ('flags','i4',nband),
+        ('psf_flux','f8',nband),
+        ('psf_flux_err','f8',nband),
+    ]
+    return ResultSchema(fields, prefix=prefix)
+
+def get_metacal_schema(npars, shape_type='g', prefix=''):
+    """
+    get a schema for the metacal result, as produced by
+    Bootstrapper._extract_metacal_responses
+
+    parameters
+    ----------
+    npars: int
+        Number of parameters in the fit
+    shape_type: string, optional
+        'g' for the max like fits, 'e' for regauss
+    prefix: string, optional
+        prefix for the column names
+    """
+    fields=[
+        ('mcal_pars','f8',npars),
+        ('mcal_pars_cov','f8',(npars,npars)),
+        ('mcal_%s' % shape_type,'f8',2),
+        ('mcal_%s_cov' % shape_type,'f8',(2,2)),
+        ('mcal_R','f8',(2,2)),
+        ('mcal_Rpsf','f8',2),
+        ('mcal_%spsf' % shape_type,'f8',2),
+        ('mcal_s2n_r','f8'),
+        ('mcal_T_r','f8'),
+        ('mcal_psf_T_r','f8'),
+        ('mcal_pars_noshear','f8',npars),
+        ('c','f8',2),
+        ('s2n_simple','f8'),
+    ]
+    return ResultSchema(fields, prefix=prefix)
@@ -1,8 +1,10 @@
 import numpy
 from .observation import Observation,ObsList,MultiBandObsList
+from .observation import get_readonly_view
+from .priors import _get_rng
 
 
-def get_round_mb_obs_list(mb_obs_list_in, sim_image=True):
+def get_round_mb_obs_list(mb_obs_list_in, sim_image=True, rng=None):
     """
     Get roundified version of the MultiBandObsList
 
@@ -12,18 +14,21 @@ def get_round_mb_obs_list(mb_obs_list_in, sim_image=True):
 
     By default the image is simulated to have the round model convolved with
     the round psf, and noise is added according to the weight map.
+
+    Send rng= for a numpy RandomState or Generator to use for the
+    noise, otherwise the global numpy random state is used
     """
 
 
     mb_obs_list=MultiBandObsList()
     for obs_list in mb_obs_list_in:
-        new_obs_list = get_round_obs_list(obs_list,sim_image=sim_image)
+        new_obs_list = get_round_obs_list(obs_list,sim_image=sim_image,rng=rng)
         mb_obs_list.append( new_obs_list )
 
     return mb_obs_list
 
 
-def get_round_obs_list(obs_list_in, sim_image=True):
+def get_round_obs_list(obs_list_in, sim_image=True, rng=None):
     """
     Get roundified version of the ObsList
 
@@ -33,16 +38,19 @@ def get_round_obs_list(obs_list_in, sim_image=True):
 
     By default the image is simulated to have the round model convolved with
     the round psf, and noise is added according to the weight map.
+
+    Send rng= for a numpy RandomState or Generator to use for the
+    noise, otherwise the global numpy random state is used
     """
 
     obs_list=ObsList()
     for obs in obs_list_in:
-        new_obs = get_round_obs(obs,sim_image=sim_image)
+        new_obs = get_round_obs(obs,sim_image=sim_image,rng=rng)
         obs_list.append( new_obs )
 
     return obs_list
 
-def get_round_obs(obs_in, sim_image=True):
+def get_round_obs(obs_in, sim_image=True, rng=None):
     """
     Get roundified version of the observation.
 
@@ -52,6 +60,9 @@ def get_round_obs(obs_in, sim_image=True):
 
     By default the image is simulated to have the round model convolved with
     the round psf, and noise is added according to the weight map.
+
+    Send rng= for a numpy RandomState or Generator to use for the
+    noise, otherwise the global numpy random state is used
     """
 
     assert obs_in.has_gmix(),"observation must have a gmix set"
@@ -70,9 +81,11 @@ def get_round_obs(obs_in, sim_image=True):
     gm_round = gm0_round.convolve(psf_round)
 
 
-    weight = obs_in.weight.copy()
+    # the weight map and jacobians are not modified, share them
+    weight = get_readonly_view(obs_in.weight)
     if sim_image:
-        noise_image = numpy.random.normal(size=weight.shape)
+        rng=_get_rng(rng)
+        noise_image = rng.normal(size=weight.shape)
         w=numpy.where(weight > 0)
 
         if w[0].size > 0:
@@ -85,15 +98,15 @@ def get_round_obs(obs_in, sim_image=True):
         psf_imuse = psf_round.make_image(obs_in.psf.image.shape,
                                          jacobian=obs_in.psf.jacobian)
     else:
-        imuse=obs_in.image.copy()
-        psf_imuse=obs_in.psf.image.copy()
+        imuse=get_readonly_view(obs_in.image)
+        psf_imuse=get_readonly_view(obs_in.psf.image)
 
     psf_obs = Observation(psf_imuse,
-                          jacobian=obs_in.psf.jacobian,
+                          jacobian=obs_in.psf.jacobian.get_view(),
                           gmix=psf_round)
     obs=Observation(imuse,
                     weight=weight,
-                    jacobian=obs_in.jacobian,
+                    jacobian=obs_in.jacobian.get_view(),
                     gmix=gm_round0,
                     psf=psf_obs)
 
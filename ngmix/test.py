@@ -5263,3 +5263,524 @@ class MoffatFitter(object):
 
 
 
+
+def _run_batch_checkpoint(config, obslist, fname, nproc, interval):
+    from .batch import BatchBootstrapper
+
+    batch=BatchBootstrapper(config, nproc=nproc, chunksize=2)
+    batch.go_records(obslist, len(obslist),
+                     checkpoint_file=fname,
+                     checkpoint_interval=interval)
+
+def test_batch_checkpoint(nobj=40, nproc=1, interval=5, seed=31415, noise=0.1,
+                          psf_noise=1.0e-4):
+    """
+    kill a checkpointed batch run partway through, resume it, and check
+    the result is identical to an uninterrupted run
+    """
+    import os
+    import time
+    import tempfile
+    import multiprocessing
+    from .batch import BatchBootstrapper, read_checkpoint
+
+    numpy.random.seed(seed)
+
+    dims=[25,25]
+    cen=[12.0, 12.0]
+    j=UnitJacobian(cen[0],cen[1])
+
+    gm_psf=gmix.GMixModel([0.0, 0.0, 0.0, 0.0, 4.0, 1.0], 'gauss')
+    im_psf=gm_psf.make_image(dims, jacobian=j)
+
+    obslist=[]
+    for i in xrange(nobj):
+        pars=[0.0, 0.0, 0.2*srandu(), 0.2*srandu(), 4.0, 100.0]
+        gm=gmix.GMixModel(pars, 'exp').convolve(gm_psf)
+
+        im=gm.make_image(dims, jacobian=j)
+        im += noise*numpy.random.randn(im.size).reshape(im.shape)
+        wt=zeros(im.shape) + 1./noise**2
+
+        # the psf needs noise, or the LM fit covariance is singular
+        tim_psf=im_psf + psf_noise*numpy.random.randn(im.size).reshape(im.shape)
+        wt_psf=zeros(im.shape) + 1./psf_noise**2
+
+        psf_obs=Observation(tim_psf, weight=wt_psf, jacobian=j)
+        obs=Observation(im, weight=wt, jacobian=j, psf=psf_obs)
+        obslist.append(obs)
+
+    config={
+        'psf_model':'gauss',
+        'psf_Tguess':4.0,
+        'gal_model':'exp',
+        'max_pars':{'method':'lm', 'lm_pars':{'maxfev':4000}},
+        'ntry':2,
+        'seed':seed,
+    }
+
+    print("running without interruption")
+    batch=BatchBootstrapper(config, nproc=nproc, chunksize=2)
+    data0=batch.go_records(obslist, nobj)
+
+    # make sure we are comparing real fits rather than default values
+    w,=numpy.where(data0['flags']==0)
+    print("%d/%d objects succeeded" % (w.size,nobj))
+    assert w.size > 0.9*nobj,"too many failures: %d/%d" % (nobj-w.size,nobj)
+    assert numpy.all(data0['max_pars'][w] != -9999),"default pars found"
+
+    tmpdir=tempfile.mkdtemp()
+    fname=os.path.join(tmpdir, 'checkpoint.npz')
+
+    print("running with checkpoints to",fname)
+    proc=multiprocessing.Process(
+        target=_run_batch_checkpoint,
+        args=(config, obslist, fname, nproc, interval),
+    )
+    proc.start()
+
+    while not os.path.exists(fname) and proc.is_alive():
+        time.sleep(0.01)
+
+    proc.terminate()
+    proc.join()
+
+    data, done = read_checkpoint(fname)
+    ndone=done.sum()
+    print("killed after %d/%d objects" % (ndone,nobj))
+    if ndone == nobj:
+        print("warning: run finished before it was killed, "
+              "try more objects")
+
+    print("resuming")
+    data1=batch.go_records(obslist, nobj, checkpoint_file=fname)
+
+    for name in data0.dtype.names:
+        assert numpy.all(data0[name] == data1[name]),"mismatch in '%s'" % name
+
+    os.remove(fname)
+    os.rmdir(tmpdir)
+
+    print("resumed run identical to uninterrupted run")
+
+class _LinAlgErrorPrior(object):
+    """
+    a prior that fails like a prior with a singular covariance matrix
+    """
+    def sample(self, *args, **keys):
+        raise numpy.linalg.LinAlgError("Singular matrix")
+
+def test_batch_numerical_error(seed=9175, noise=0.1, psf_noise=1.0e-4):
+    """
+    check numerical errors are flagged per object rather than
+    stopping the run
+    """
+    from .batch import get_batch_config, process_one, BATCH_NUMERICAL_ERROR
+
+    numpy.random.seed(seed)
+
+    dims=[25,25]
+    cen=[12.0, 12.0]
+    j=UnitJacobian(cen[0],cen[1])
+
+    gm_psf=gmix.GMixModel([0.0, 0.0, 0.0, 0.0, 4.0, 1.0], 'gauss')
+    im_psf=gm_psf.make_image(dims, jacobian=j)
+    im_psf += psf_noise*numpy.random.randn(im_psf.size).reshape(dims)
+    wt_psf=zeros(dims) + 1./psf_noise**2
+
+    pars=[0.0, 0.0, 0.1, 0.0, 4.0, 100.0]
+    gm=gmix.GMixModel(pars, 'exp').convolve(gm_psf)
+    im=gm.make_image(dims, jacobian=j)
+    im += noise*numpy.random.randn(im.size).reshape(dims)
+    wt=zeros(dims) + 1./noise**2
+
+    psf_obs=Observation(im_psf, weight=wt_psf, jacobian=j)
+    obs=Observation(im, weight=wt, jacobian=j, psf=psf_obs)
+
+    config=get_batch_config({
+        'psf_model':'gauss',
+        'psf_Tguess':4.0,
+        'gal_model':'exp',
+        'max_pars':{'method':'lm', 'lm_pars':{'maxfev':4000}},
+        'prior':_LinAlgErrorPrior(),
+    })
+
+    res=process_one(obs, config, seed=seed)
+    print("flags:",res['flags'],"errmsg:",res['errmsg'])
+    assert res['flags']==BATCH_NUMERICAL_ERROR
+    assert 'LinAlgError' in res['errmsg']
+
+def test_em_accelerate(ntrial=10, ngauss=3, T=4.0, noise=1.0e-5,
+                       maxiter=5000, tol=1.0e-6, Ttol=1.0e-2, seed=8712):
+    """
+    check that plain and SQUAREM accelerated EM converge to the same T
+
+    The two algorithms stop at different points on the slow approach to
+    the maximum likelihood, so the results only agree within a tolerance
+    """
+    from . import em
+
+    numpy.random.seed(seed)
+
+    dims=[25,25]
+    cen=[12.0, 12.0]
+    j=UnitJacobian(cen[0],cen[1])
+
+    for i in xrange(ntrial):
+        pars=[0.0, 0.0, 0.1*srandu(), 0.1*srandu(), T*(1.0 + 0.1*srandu()), 1.0]
+        gm0=gmix.GMixModel(pars, 'turb')
+
+        im=gm0.make_image(dims, jacobian=j)
+        im += noise*numpy.random.randn(im.size).reshape(im.shape)
+
+        imsky,sky=em.prep_image(im)
+        obs=Observation(imsky, jacobian=j)
+
+        guess=guess_em_ngauss(ngauss, pars[4])
+
+        fitter=em.GMixEM(obs)
+
+        fitter.go(guess, sky, maxiter=maxiter, tol=tol)
+        res=fitter.get_result()
+        assert res['flags']==0,"plain em failed: %s" % res['flags']
+        Tplain=fitter.get_gmix().get_T()
+
+        fitter.go(guess, sky, maxiter=maxiter, tol=tol, accelerate=True)
+        res_accel=fitter.get_result()
+        assert res_accel['flags']==0,"accelerated em failed: %s" % res_accel['flags']
+        Taccel=fitter.get_gmix().get_T()
+
+        frac=abs(Taccel/Tplain-1)
+        print("T: %g %g  frac diff: %g  numiter: %d %d  nmap: %d %d" % \
+              (Tplain,Taccel,frac,res['numiter'],res_accel['numiter'],
+               res['nmap'],res_accel['nmap']))
+
+        assert frac < Ttol,"T differs by %g" % frac
+        assert res['nmap']==res['numiter']
+        assert res_accel['nmap'] >= res_accel['numiter']
+
+    print("accelerated em agrees with plain em")
+
+def test_em_batch(nobj=30, ngauss=2, T=4.0, noise=1.0e-3, ibad=7,
+                  maxiter=1000, tol=1.0e-6, seed=1911):
+    """
+    check that GMixEMBatch gives results identical to running GMixEM on
+    each stamp, for one and multiple threads.  One guess is placed far
+    off the stamp so that fit fails with EM_RANGE_ERROR, and some fits
+    will stop at maxiter
+    """
+    from . import em
+
+    numpy.random.seed(seed)
+
+    dims=[25,25]
+    cen=[12.0, 12.0]
+    j=UnitJacobian(cen[0],cen[1])
+
+    psf_pars=[0.0, 0.0, 0.0, 0.0, 4.0, 1.0]
+    psf=gmix.GMixModel(psf_pars, 'gauss')
+
+    obs_list=[]
+    guesses=[]
+    for i in xrange(nobj):
+        pars=[0.5*srandu(), 0.5*srandu(), 0.2*srandu(), 0.2*srandu(),
+              T*(1.0 + 0.2*srandu()), 1.0]
+        gm=gmix.GMixModel(pars, 'exp').convolve(psf)
+
+        im=gm.make_image(dims, jacobian=j)
+        im += noise*numpy.random.randn(im.size).reshape(im.shape)
+        obs_list.append( Observation(im, jacobian=j) )
+
+        guess=guess_em_ngauss(ngauss, pars[4])
+        if i==ibad:
+            guess.get_data()['row'] += 100.0
+        guesses.append(guess)
+
+    flags=numpy.zeros(nobj, dtype='i4')
+    numiter=numpy.zeros(nobj, dtype='i8')
+    gm_list=[]
+    for i in xrange(nobj):
+        fitter=em.fit_em(obs_list[i], guesses[i], maxiter=maxiter, tol=tol)
+        res=fitter.get_result()
+        flags[i] = res['flags']
+        if res['flags'] & em.EM_RANGE_ERROR == 0:
+            numiter[i] = res['numiter']
+            gm_list.append( fitter.get_gmix() )
+        else:
+            gm_list.append(None)
+
+    # some fits may also stop at maxiter, which is compared as well
+    wbad,=numpy.where(flags & em.EM_RANGE_ERROR != 0)
+    assert list(wbad)==[ibad],"expected a single failure for %d" % ibad
+
+    for nthreads in [1,4]:
+        fitter=em.fit_em_batch(obs_list, guesses, nthreads=nthreads,
+                               maxiter=maxiter, tol=tol)
+        res=fitter.get_result()
+        bgm_list=fitter.get_gmix_list()
+
+        assert numpy.all(res['flags']==flags),"mismatch in 'flags'"
+
+        w,=numpy.where(flags & em.EM_RANGE_ERROR == 0)
+        assert numpy.all(res['numiter'][w]==numiter[w]),"mismatch in 'numiter'"
+
+        for i in xrange(nobj):
+            if gm_list[i] is None:
+                assert bgm_list[i] is None,"expected no gmix for %d" % i
+            else:
+                pars=gm_list[i].get_full_pars()
+                bpars=bgm_list[i].get_full_pars()
+                assert numpy.all(pars==bpars),"mismatch in pars for %d" % i
+
+        print("nthreads: %d batch em identical to GMixEM" % nthreads)
+
+def test_approx_em_simple(nepoch=4, noise=0.01, seed=4133):
+    """
+    fit a simulated multi-epoch exp object with ApproxEMSimple using the
+    default iteration settings
+
+    The algorithm does not converge to the maximum likelihood point, so
+    the size is only recovered to about 10 percent
+    """
+    from . import em
+
+    numpy.random.seed(seed)
+
+    dims=[33,33]
+    pars=array([0.1, -0.2, 0.2, -0.1, 16.0, 100.0])
+
+    obs_list=ObsList()
+    for i in xrange(nepoch):
+        cen=(dims[0]-1.0)/2.0 + 0.5*srandu(2)
+        j=UnitJacobian(cen[0], cen[1])
+
+        psf_pars=[0.0, 0.0, 0.05*srandu(), 0.05*srandu(),
+                  4.0*(1.0 + 0.1*srandu()), 1.0]
+        gm_psf=gmix.GMixModel(psf_pars, 'turb')
+        gm=gmix.GMixModel(pars, 'exp').convolve(gm_psf)
+
+        im=gm.make_image(dims, jacobian=j)
+        im += noise*numpy.random.randn(im.size).reshape(dims)
+        wt=zeros(dims) + 1.0/noise**2
+
+        im_psf=gm_psf.make_image(dims, jacobian=j)
+        psf_obs=Observation(im_psf, jacobian=j, gmix=gm_psf)
+
+        obs_list.append( Observation(im, weight=wt, jacobian=j, psf=psf_obs) )
+
+    fitter=em.ApproxEMSimple(obs_list, 'exp')
+    fitter.go()
+    res=fitter.get_result()
+
+    print("flags:",res['flags'],"numiter:",res['numiter'])
+    print("true pars:",pars)
+    print("fit pars: ",res['pars'])
+
+    assert res['flags']==0,"em failed: %s" % res['flags']
+
+    fpars=res['pars']
+    assert numpy.all(numpy.abs(fpars[0:0+4]-pars[0:0+4]) < 0.02),\
+            "center or shape not recovered"
+    assert abs(fpars[4]/pars[4]-1) < 0.1,"T not recovered"
+    assert abs(fpars[5]/pars[5]-1) < 0.03,"flux not recovered"
+
+def test_compiled_priors(ntrial=1000, seed=2718):
+    """
+    check that the compiled priors give the same fill_fdiff and
+    get_lnprob_scalar as the python code, for random parameters within the
+    range of the priors
+    """
+    from . import priors
+
+    numpy.random.seed(seed)
+
+    def make_cen():
+        return priors.CenPrior(0.0, 0.0, 0.1, 0.2)
+
+    def make_sep():
+        return joint_prior.PriorSimpleSep(
+            make_cen(),
+            priors.GPriorBA(0.3),
+            priors.TwoSidedErf(-10.0, 1.0, 1.0e6, 1.0e5),
+            [priors.LogNormal(100.0, 30.0), priors.Normal(10.0, 3.0)],
+        )
+
+    def make_sep_flat():
+        return joint_prior.PriorSimpleSep(
+            make_cen(),
+            priors.ZDisk2D(1.0),
+            priors.FlatPrior(-10.0, 1.0e6),
+            priors.FlatPrior(-0.97, 1.0e9),
+        )
+
+    def make_round():
+        return joint_prior.PriorSimpleSepRound(
+            make_cen(),
+            priors.LogNormal(4.0, 1.0),
+            priors.Normal(10.0, 3.0),
+        )
+
+    def make_coellip():
+        return joint_prior.PriorCoellipSame(
+            3,
+            make_cen(),
+            priors.GPriorBA(0.2),
+            priors.Normal(4.0, 2.0),
+            priors.LogNormal(10.0, 3.0),
+        )
+
+    def get_cen_g():
+        g=0.9*numpy.random.random()
+        theta=2*numpy.pi*numpy.random.random()
+        return [0.3*srandu(), 0.3*srandu(),
+                g*numpy.cos(theta), g*numpy.sin(theta)]
+
+    def get_sep_pars():
+        return get_cen_g() + [100.0*numpy.random.random(),
+                              50.0 + 100.0*numpy.random.random(),
+                              10.0 + 5.0*srandu()]
+
+    def get_sep_flat_pars():
+        return get_cen_g() + [1.0e3*numpy.random.random(),
+                              1.0e3*numpy.random.random()]
+
+    def get_round_pars():
+        return [0.3*srandu(), 0.3*srandu(),
+                4.0 + 3.0*numpy.random.random(),
+                10.0 + 5.0*srandu()]
+
+    def get_coellip_pars():
+        return get_cen_g() + list(4.0 + 3.0*srandu(3)) \
+                           + list(10.0 + 5.0*numpy.random.random(3))
+
+    tests=[('sep',make_sep,get_sep_pars),
+           ('sep_flat',make_sep_flat,get_sep_flat_pars),
+           ('round',make_round,get_round_pars),
+           ('coellip',make_coellip,get_coellip_pars)]
+
+    for name,maker,get_pars in tests:
+        prior=maker()
+        cprior=maker()
+        assert cprior.compile(),"could not compile '%s'" % name
+
+        for i in xrange(ntrial):
+            pars=array(get_pars(), dtype='f8')
+
+            fdiff=zeros(20)
+            cfdiff=zeros(20)
+            n=prior.fill_fdiff(pars, fdiff)
+            cn=cprior.fill_fdiff(pars, cfdiff)
+
+            assert cn==n,"mismatch in fdiff size for '%s'" % name
+            assert numpy.allclose(cfdiff, fdiff, rtol=1.0e-12, atol=1.0e-15),\
+                    "mismatch in fdiff for '%s'" % name
+
+            lnp=prior.get_lnprob_scalar(pars)
+            clnp=cprior.get_lnprob_scalar(pars)
+            assert numpy.allclose(clnp, lnp, rtol=1.0e-12, atol=1.0e-15),\
+                    "mismatch in lnprob for '%s'" % name
+
+        print("compiled '%s' prior matches python" % name)
+
+def test_prior_sample_rng(n=100, seed=8123):
+    """
+    check that sampling joint priors with an rng is reproducible and does
+    not use the global random state, also for component priors that
+    sample using scipy or by rejection
+    """
+    from . import priors
+
+    cen_prior=priors.TruncatedSimpleGauss2D(0.0, 0.0, 0.1, 0.1, 0.5)
+    g_prior=priors.GPriorBA(0.3)
+    T_prior=priors.TruncatedGaussian(4.0, 1.0, 0.0, 10.0)
+    F_priors=[priors.StudentPositive(100.0, 10.0),
+              priors.BFrac(),
+              priors.LogNormal(100.0, 30.0)]
+
+    prior=joint_prior.PriorSimpleSep(cen_prior, g_prior, T_prior, F_priors)
+
+    numpy.random.seed(seed)
+    state=numpy.random.get_state()
+
+    s1=prior.sample(n, rng=numpy.random.RandomState(seed))
+    s2=prior.sample(n, rng=numpy.random.RandomState(seed))
+
+    assert numpy.all(s1==s2),"samples with the same rng differ"
+
+    state_after=numpy.random.get_state()
+    assert numpy.all(state[1]==state_after[1]) and state[2]==state_after[2],\
+            "global random state was used"
+
+    print("joint prior samples are reproducible with rng")
+
+def test_run_chunks(n=100, nthreads=4, ibad=57):
+    """
+    check that threads.run_chunks covers the full range, and that an
+    exception in one of the threads is raised in the caller
+    """
+    from .threads import run_chunks
+
+    def fill(beg, end, output):
+        output[beg:end] = numpy.arange(beg, end)
+
+    def fail(beg, end):
+        if beg <= ibad < end:
+            raise MemoryError("failed for chunk [%d,%d)" % (beg,end))
+
+    for nt in [1,nthreads]:
+        output=zeros(n, dtype='i8') - 1
+        run_chunks(fill, n, nt, args=(output,))
+        assert numpy.all(output==numpy.arange(n)),"range not covered"
+
+        try:
+            run_chunks(fail, n, nt)
+            raised=False
+        except MemoryError:
+            raised=True
+
+        assert raised,"exception not raised for nthreads=%d" % nt
+
+    print("run_chunks covers the range and raises errors")
+
+def test_counters_retries(seed=1291, noise=1.0e-4):
+    """
+    check that the counters include the cost of failed tries.  A psf fit
+    is started from a bad guess, which fails before the random guesses
+    are tried
+    """
+    from .bootstrap import PSFRunner
+    from .counters import StageCounters
+
+    numpy.random.seed(seed)
+
+    dims=[25,25]
+    j=UnitJacobian(12.0, 12.0)
+
+    gm=gmix.GMixModel([0.0, 0.0, 0.0, 0.0, 4.0, 1.0], 'gauss')
+    im=gm.make_image(dims, jacobian=j)
+    im += noise*numpy.random.randn(im.size).reshape(im.shape)
+    wt=zeros(im.shape) + 1./noise**2
+
+    obs=Observation(im, weight=wt, jacobian=j)
+
+    runner=PSFRunner(obs, 'gauss', 4.0, {'maxfev':4000},
+                     rng=numpy.random.RandomState(seed))
+
+    bad_guess=array([0.0, 0.0, 0.0, 0.0, -4.0, 1.0])
+    runner.go(ntry=2, guess=bad_guess)
+
+    res=runner.fitter.get_result()
+    assert res['flags']==0,"fit failed"
+    assert len(runner.try_results) > 1,"expected a failed try"
+
+    counters=StageCounters()
+    counters.count_fit('psf', res, try_results=runner.try_results)
+    data=counters.get_dict()['psf']
+
+    nfev=sum([tres['nfev'] for tres in runner.try_results])
+    assert data['nfev']==nfev,"nfev not summed over tries"
+    assert data['nfev'] > res['nfev'],"failed tries not counted"
+    assert data['npix_eval']==im.size*nfev,"npix_eval not summed over tries"
+
+    print("counted %d function evaluations over %d tries, "
+          "%d in the final fit" % (nfev, len(runner.try_results), res['nfev']))
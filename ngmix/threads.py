@@ -0,0 +1,74 @@
+"""
+Run a function over chunks of a range of objects in parallel threads
+
+This is useful when the work for each chunk is done in C code that
+releases the GIL, such as GMixEMBatch and calc_pqr_batch
+
+examples
+--------
+
+def run_chunk(beg, end, data, output):
+    output[beg:end] = expensive_c_function(data[beg:end])
+
+run_chunks(run_chunk, data.shape[0], 4, args=(data, output))
+"""
+from __future__ import print_function
+
+try:
+    xrange = xrange
+    # We have Python 2
+except:
+    xrange = range
+    # We have Python 3
+
+import numpy
+
+def run_chunks(func, n, nthreads, args=()):
+    """
+    run func(beg, end, *args) for contiguous chunks [beg,end) covering
+    the range [0,n), each in its own thread
+
+    If any of the calls raise an exception, it is raised again once all
+    the threads have finished
+
+    parameters
+    ----------
+    func: callable
+        Called as func(beg, end, *args)
+    n: int
+        The number of objects
+    nthreads: int
+        The number of threads.  If 1 the function is called for the full
+        range in the calling thread.  At most n threads are used
+    args: tuple, optional
+        Extra arguments for func
+    """
+
+    nthreads=max(1, min(nthreads, n))
+    if nthreads == 1:
+        func(0, n, *args)
+        return
+
+    import threading
+
+    bounds=numpy.linspace(0, n, nthreads+1).astype('i8')
+    errors=[None]*nthreads
+
+    def run_one(i):
+        try:
+            func(bounds[i], bounds[i+1], *args)
+        except BaseException as err:
+            errors[i] = err
+
+    threads=[]
+    for i in xrange(nthreads):
+        t=threading.Thread(target=run_one, args=(i,))
+        t.start()
+        threads.append(t)
+
+    for t in threads:
+        t.join()
+
+    for err in errors:
+        if err is not None:
+            raise err